@@ -0,0 +1,140 @@
+"""
+Benchmark del archivo columnar de sesiones: espacio ocupado por las
+interacciones en la base de datos frente a los archivos, y tiempo de lectura
+completa de una sesión desde la tabla y desde su archivo.
+
+Uso:
+    python -m benchmarks.bench_archive [--sessions N] [--events N] [--dir DIR]
+"""
+
+import argparse
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from random import Random
+from time import perf_counter
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session as DatabaseSession
+
+from benchmarks.common import BASE_TIME, event_message
+from database.archive import archive_ended_sessions, open_session_archive
+from database.base import Base
+from database.migrations import upgrade
+from database.models import Interaction, InteractionRow, Session
+from database.strings import (
+    StringInterner,
+    interaction_values,
+    row_details,
+    select_interactions,
+)
+
+
+def populate(session: DatabaseSession, sessions: int, events: int) -> None:
+    rng = Random(0)
+    strings = StringInterner()
+    for number in range(sessions):
+        session_id = f"session-{number}"
+        session.add(
+            Session(
+                id=session_id,
+                start_time=BASE_TIME,
+                end_time=BASE_TIME + timedelta(hours=2),
+            )
+        )
+        rows = []
+        for index in range(events):
+            message = event_message(rng, index)["message"]
+            rows.append(
+                InteractionRow(
+                    message["event"],
+                    BASE_TIME + timedelta(milliseconds=50 * index),
+                    message["details"],
+                    session_id,
+                )
+            )
+        session.execute(
+            Interaction.__table__.insert(), interaction_values(session, rows, strings)
+        )
+        session.commit()
+        strings.commit()
+
+
+def database_size(session: DatabaseSession) -> int:
+    session.execute(text("VACUUM"))
+    page_count: int = session.execute(text("PRAGMA page_count")).scalar_one()
+    page_size: int = session.execute(text("PRAGMA page_size")).scalar_one()
+    return page_count * page_size
+
+
+def read_table(session: DatabaseSession, session_id: str) -> float:
+    started = perf_counter()
+    for row in session.execute(
+        select_interactions(Interaction.id, Interaction.time, Interaction.type)
+        .where(Interaction.session_id == session_id)
+        .order_by(Interaction.time, Interaction.id)
+    ):
+        row_details(row)
+    return perf_counter() - started
+
+
+def read_archive(session: DatabaseSession, session_id: str) -> float:
+    started = perf_counter()
+    archive = open_session_archive(session, session_id)
+    assert archive is not None
+    for _ in archive.events():
+        pass
+    return perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--events", type=int, default=50_000, help="Eventos por sesión")
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help="Directorio de la base de datos (temporal por defecto)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        engine = create_engine(f"sqlite:///{Path(directory) / 'bench-archive.db'}")
+        Base.metadata.create_all(engine)
+        upgrade(engine)
+        archive_directory = Path(directory) / "archive"
+
+        with DatabaseSession(engine) as session:
+            populate(session, args.sessions, args.events)
+            total = args.sessions * args.events
+            before = database_size(session)
+            table_time = read_table(session, "session-0")
+
+            started = perf_counter()
+            archived = archive_ended_sessions(session, archive_directory)
+            archive_time = perf_counter() - started
+            after = database_size(session)
+            archive_size = sum(record.size for record in archived)
+            read_archive(session, "session-0")
+            archive_read_time = read_archive(session, "session-0")
+
+        print(
+            f"{total:,} interactions in {args.sessions} sessions, archived in {archive_time:.1f} s\n"
+        )
+        print(f"{'storage':<28}{'bytes':>14}{'bytes/event':>14}")
+        print(f"{'database before':<28}{before:>14,}{before / total:>14.1f}")
+        print(f"{'database after (vacuumed)':<28}{after:>14,}")
+        print(f"{'archives':<28}{archive_size:>14,}{archive_size / total:>14.1f}")
+        print(f"{'ratio':<28}{(before - after) / archive_size:>13.1f}x\n")
+        print(f"{'full session read':<28}{'ms':>14}{'events/s':>14}")
+        print(
+            f"{'table':<28}{1000 * table_time:>14.1f}{args.events / table_time:>14,.0f}"
+        )
+        print(
+            f"{'archive':<28}{1000 * archive_read_time:>14.1f}{args.events / archive_read_time:>14,.0f}"
+        )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Prueba de carga del WebSocket de ingesta.
+
+Arranca el servidor en un proceso aparte, abre `--connections` conexiones
+simultáneas desde un único cliente asíncrono, inicia una sesión en cada una y
+envía `--events` eventos por conexión. Informa de las conexiones mantenidas,
+los eventos procesados por segundo y la memoria (RSS) e hilos del proceso
+servidor con todas las conexiones abiertas y tras la carga.
+
+Uso:
+    python -m benchmarks.bench_async [--server async|flask] [--connections N] [--events N]
+
+El modo `flask` mide la ruta `/ws` de `flask_sock` (un hilo por conexión) y el
+modo `async` el servidor de `webchronicle.async_server`.
+"""
+
+import argparse
+import asyncio
+import os
+from json import dumps
+from time import perf_counter
+
+from benchmarks.common import (
+    HOST,
+    AsyncClient,
+    free_port,
+    message_stream,
+    process_status,
+    session_message,
+    start_server,
+)
+
+
+async def run_client(
+    client: AsyncClient, index: int, frames: list[str], start: asyncio.Event
+) -> None:
+    await client.send(dumps(session_message(f"bench-async-{index}", "start")))
+    await start.wait()
+    for frame in frames:
+        await client.send(frame)
+    # El servidor procesa los mensajes de cada conexión en orden, así que la
+    # respuesta de error a una trama inválida marca el final del procesamiento.
+    await client.send("sentinel")
+    while '"error"' not in await client.receive():
+        pass
+
+
+async def load(pid: int, port: int, connections: int, events: int) -> None:
+    frames = message_stream(events)
+    clients = []
+    for _ in range(connections):
+        clients.append(await AsyncClient.connect(HOST, port))
+
+    await asyncio.sleep(0.5)
+    idle_rss, idle_threads = process_status(pid)
+    print(f"connections held       {len(clients):>10,}")
+    print(f"idle server RSS        {idle_rss:>10,.1f} MiB  ({idle_threads} threads)")
+
+    start = asyncio.Event()
+    tasks = [
+        asyncio.create_task(run_client(client, index, frames, start))
+        for index, client in enumerate(clients)
+    ]
+    await asyncio.sleep(0.1)
+    started = perf_counter()
+    start.set()
+    await asyncio.gather(*tasks)
+    elapsed = perf_counter() - started
+
+    loaded_rss, loaded_threads = process_status(pid)
+    total = connections * events
+    print(f"events processed       {total:>10,}")
+    print(f"throughput             {total / elapsed:>10,.0f} events/s")
+    print(
+        f"loaded server RSS      {loaded_rss:>10,.1f} MiB  ({loaded_threads} threads)"
+    )
+
+    await asyncio.gather(*(client.close() for client in clients))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--server", choices=["async", "flask"], default="async")
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--events", type=int, default=200)
+    args = parser.parse_args()
+
+    port = free_port()
+    process = start_server(args.server, port)
+    try:
+        print(
+            f"server                 {args.server:>10}  (pid {process.pid}, {os.cpu_count()} CPUs)"
+        )
+        asyncio.run(load(process.pid, port, args.connections, args.events))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
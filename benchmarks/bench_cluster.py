@@ -0,0 +1,65 @@
+"""
+Escalado de la ingesta multiproceso (`webchronicle.cluster`) con el número de
+workers.
+
+Repite la prueba de carga de `bench_load` con el servidor multiproceso para
+cada número de workers indicado y compara los eventos confirmados por segundo
+con los de un único worker. Cada navegador simulado indica su sesión al
+conectarse, por lo que el enrutador reparte las conexiones entre los workers
+según su sesión.
+
+Solo puede escalar hasta el número de núcleos de la máquina, menos el que
+ocupa el proceso escritor, y mientras este no sea el cuello de botella.
+
+Uso:
+    python -m benchmarks.bench_cluster [--workers 1,2,4] [--browsers N] [--events N]
+        [--batch N] [--dir DIR]
+"""
+
+import argparse
+import os
+
+from benchmarks.bench_load import make_browsers, run_load
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--workers", default="1,2,4", help="Números de workers a comparar"
+    )
+    parser.add_argument("--browsers", type=int, default=64)
+    parser.add_argument(
+        "--events", type=int, default=2_000, help="Eventos sintéticos por navegador"
+    )
+    parser.add_argument(
+        "--batch", type=int, default=10, help="Eventos por mensaje 'batch'"
+    )
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help="Directorio de la base de datos (temporal por defecto)",
+    )
+    args = parser.parse_args()
+
+    browsers = make_browsers(args.browsers, args.events, args.batch)
+    print(
+        f"{args.browsers} browsers, {args.browsers * args.events:,} events, {os.cpu_count()} CPUs"
+    )
+    print(
+        f"{'workers':>8}{'events/s':>12}{'speedup':>10}{'committed':>12}{'server CPU':>14}"
+    )
+    baseline = None
+    for workers in [int(value) for value in args.workers.split(",")]:
+        for browser in browsers:
+            browser.sent = []
+        result = run_load("cluster", browsers, 0, args.timeout, args.dir, workers)
+        baseline = baseline or result.throughput
+        print(
+            f"{workers:>8}{result.throughput:>12,.0f}{result.throughput / baseline:>9.2f}x"
+            f"{result.committed:>12,}{result.cpu / result.elapsed:>9.2f} cores"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""
+Prueba de carga de extremo a extremo de la ingesta con navegadores simulados.
+
+Arranca el servidor en un proceso aparte sobre un fichero SQLite temporal y
+simula `--browsers` navegadores concurrentes, cada uno con su propia conexión
+al WebSocket `/ws`: inicia una sesión, envía las dimensiones de la ventana, sus
+eventos y eventos de pestañas (sintéticos o de una grabación) al ritmo indicado
+y termina la sesión. Un hilo consulta mientras tanto los totales de eventos de
+cada sesión en la base de datos (`session_stats`) para saber cuándo se ha
+confirmado cada evento, de lo que se obtiene la latencia de extremo a extremo
+desde el envío hasta el commit.
+
+Informa de los eventos confirmados por segundo, los percentiles de latencia y
+el uso de CPU y memoria (RSS) del servidor. No necesita acceso a la red.
+
+Uso:
+    python -m benchmarks.bench_load [--server async|flask|cluster] [--workers N]
+        [--browsers N] [--events N] [--rate N] [--batch N] [--replay FILE] [--dir DIR]
+
+`--replay` lee una grabación en formato NDJSON, un mensaje `{type, message}`
+del protocolo por línea, que cada navegador reproduce con su propio
+identificador de sesión.
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+from json import dumps, loads
+from pathlib import Path
+from random import Random
+from statistics import quantiles
+from time import perf_counter, sleep
+from typing import Any, NamedTuple
+
+from benchmarks.common import (
+    HOST,
+    AsyncClient,
+    child_processes,
+    event_message,
+    free_port,
+    process_cpu_time,
+    process_status,
+    session_message,
+    start_server,
+    tab_message,
+)
+from database.base import DATABASE_URI_ENV
+
+# Intervalo de consulta de los eventos confirmados, que fija la resolución de
+# las latencias medidas
+POLL_INTERVAL = 0.005
+
+
+def interaction_count(message: dict[str, Any]) -> int:
+    """
+    Número de interacciones que guarda el servidor para un mensaje.
+    """
+    match message.get("type"):
+        case "event_logged" | "tab_event":
+            return 1 if "details" in message["message"] else 0
+        case "batch":
+            return sum(
+                interaction_count(entry) for entry in message["message"]["messages"]
+            )
+        case _:
+            return 0
+
+
+def synthetic_messages(
+    seed: int, events: int, tab_ratio: float = 0.02
+) -> list[dict[str, Any]]:
+    rng = Random(seed)
+    return [
+        tab_message(rng, index)
+        if rng.random() < tab_ratio
+        else event_message(rng, index)
+        for index in range(events)
+    ]
+
+
+def recorded_messages(path: Path) -> list[dict[str, Any]]:
+    """
+    Lee una grabación, descartando sus mensajes de inicio y fin de sesión, que
+    cada navegador simulado envía con su propio identificador.
+    """
+    messages = []
+    with open(path) as recording:
+        for line in recording:
+            if line.strip():
+                message = loads(line)
+                if message.get("type") != "session_state_changed":
+                    messages.append(message)
+    return messages
+
+
+def batch_messages(
+    messages: list[dict[str, Any]], batch_size: int
+) -> list[dict[str, Any]]:
+    """
+    Agrupa los eventos consecutivos en mensajes "batch" de `batch_size`
+    eventos, como hace la extensión.
+    """
+    if batch_size <= 1:
+        return messages
+    grouped: list[dict[str, Any]] = []
+    pending: list[dict[str, Any]] = []
+    for message in messages:
+        if message.get("type") in ("event_logged", "tab_event"):
+            pending.append(message)
+            if len(pending) < batch_size:
+                continue
+        if pending:
+            grouped.append({"type": "batch", "message": {"messages": pending}})
+            pending = []
+        if message.get("type") not in ("event_logged", "tab_event"):
+            grouped.append(message)
+    if pending:
+        grouped.append({"type": "batch", "message": {"messages": pending}})
+    return grouped
+
+
+class Browser:
+    """
+    Navegador simulado: los mensajes que envía y el momento de envío de cada
+    una de sus interacciones.
+    """
+
+    def __init__(self, session_id: str, messages: list[dict[str, Any]]) -> None:
+        self.session_id = session_id
+        self.frames = [
+            (dumps(message), interaction_count(message))
+            for message in [
+                session_message(session_id, "start"),
+                {"type": "window_data", "message": {"width": 1920, "height": 1080}},
+                *messages,
+                session_message(session_id, "end", len(messages)),
+            ]
+        ]
+        self.expected = sum(count for _, count in self.frames)
+        self.sent: list[float] = []
+
+    async def run(self, port: int, rate: float, start: asyncio.Event) -> None:
+        # La sesión en la consulta fija el worker del servidor multiproceso
+        client = await AsyncClient.connect(HOST, port, f"/ws?session={self.session_id}")
+        await start.wait()
+        interval = 1 / rate if rate else 0.0
+        next_send = perf_counter()
+        for frame, count in self.frames:
+            if interval:
+                await asyncio.sleep(max(0.0, next_send - perf_counter()))
+                next_send += interval * max(count, 1)
+            await client.send(frame)
+            self.sent.extend([perf_counter()] * count)
+        await client.close()
+
+
+def server_rss(pid: int) -> float:
+    """
+    Memoria residente, en MiB, del servidor y de sus procesos hijos.
+    """
+    total = 0.0
+    for process in [pid, *child_processes(pid)]:
+        try:
+            total += process_status(process)[0]
+        except FileNotFoundError:
+            pass
+    return total
+
+
+class CommitMonitor(threading.Thread):
+    """
+    Hilo que consulta periódicamente los eventos confirmados de cada sesión y
+    la memoria del servidor.
+    """
+
+    def __init__(self, path: Path, pid: int) -> None:
+        super().__init__(daemon=True)
+        self.path = path
+        self.pid = pid
+        self.observations: dict[str, list[tuple[float, int]]] = {}
+        self.peak_rss = 0.0
+        self.finished = threading.Event()
+
+    def run(self) -> None:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        last: dict[str, int] = {}
+        while not self.finished.is_set():
+            try:
+                rows = connection.execute(
+                    "SELECT session_id, event_count FROM session_stats"
+                ).fetchall()
+            except sqlite3.OperationalError:
+                rows = []
+            moment = perf_counter()
+            for session_id, count in rows:
+                if last.get(session_id) != count:
+                    last[session_id] = count
+                    self.observations.setdefault(session_id, []).append((moment, count))
+            self.peak_rss = max(self.peak_rss, server_rss(self.pid))
+            sleep(POLL_INTERVAL)
+        connection.close()
+
+    def committed(self, session_id: str) -> int:
+        observations = self.observations.get(session_id)
+        return observations[-1][1] if observations else 0
+
+    def latencies(self, browser: Browser) -> list[float]:
+        """
+        Latencia de cada interacción del navegador: desde su envío hasta la
+        primera consulta en la que aparece confirmada.
+        """
+        result = []
+        observations = iter(self.observations.get(browser.session_id, []))
+        moment, count = next(observations, (0.0, 0))
+        for index, sent in enumerate(browser.sent, start=1):
+            while count < index:
+                moment, count = next(observations)
+            result.append(moment - sent)
+        return result
+
+
+async def load(port: int, browsers: list[Browser], rate: float) -> float:
+    start = asyncio.Event()
+    tasks = [
+        asyncio.create_task(browser.run(port, rate, start)) for browser in browsers
+    ]
+    await asyncio.sleep(0.5)
+    started = perf_counter()
+    start.set()
+    await asyncio.gather(*tasks)
+    return started
+
+
+class LoadResult(NamedTuple):
+    """
+    Resultado de una prueba de carga.
+
+    Atributos:
+    ------------
+    committed: int
+        Interacciones confirmadas.
+    total: int
+        Interacciones enviadas.
+    send_time: float
+        Tiempo, en segundos, que se ha tardado en enviarlas.
+    elapsed: float
+        Tiempo, en segundos, hasta que se han confirmado.
+    latencies: list[float]
+        Latencia de cada interacción confirmada, en segundos.
+    cpu: float
+        Tiempo de CPU, en segundos, consumido por el servidor.
+    peak_rss: float
+        Memoria residente máxima del servidor, en MiB.
+    """
+
+    committed: int
+    total: int
+    send_time: float
+    elapsed: float
+    latencies: list[float]
+    cpu: float
+    peak_rss: float
+
+    @property
+    def throughput(self) -> float:
+        return self.committed / self.elapsed
+
+
+def run_load(
+    server: str,
+    browsers: list[Browser],
+    rate: float,
+    timeout: float,
+    directory: str | None = None,
+    workers: int = 1,
+) -> LoadResult:
+    """
+    Arranca el servidor sobre una base de datos temporal, ejecuta la carga de
+    los navegadores y espera a que se confirmen sus interacciones.
+    """
+    total = sum(browser.expected for browser in browsers)
+    with tempfile.TemporaryDirectory(dir=directory) as temporary:
+        path = Path(temporary) / "bench-load.db"
+        os.environ[DATABASE_URI_ENV] = f"sqlite:///{path}"
+        port = free_port()
+        process = start_server(server, port, workers)
+        monitor = CommitMonitor(path, process.pid)
+        try:
+            monitor.start()
+            cpu_before = process_cpu_time(process.pid)
+            started = asyncio.run(load(port, browsers, rate))
+            sent = perf_counter()
+
+            deadline = sent + timeout
+            while perf_counter() < deadline and any(
+                monitor.committed(browser.session_id) < browser.expected
+                for browser in browsers
+            ):
+                sleep(POLL_INTERVAL)
+            finished = perf_counter()
+            cpu = process_cpu_time(process.pid) - cpu_before
+            monitor.finished.set()
+            monitor.join()
+        finally:
+            process.terminate()
+            process.wait()
+
+    committed = sum(
+        min(monitor.committed(browser.session_id), browser.expected)
+        for browser in browsers
+    )
+    latencies = [
+        latency
+        for browser in browsers
+        if monitor.committed(browser.session_id) >= browser.expected
+        for latency in monitor.latencies(browser)
+    ]
+    return LoadResult(
+        committed,
+        total,
+        sent - started,
+        finished - started,
+        latencies,
+        cpu,
+        monitor.peak_rss,
+    )
+
+
+def make_browsers(
+    count: int, events: int, batch: int, replay: Path | None = None
+) -> list[Browser]:
+    recording = recorded_messages(replay) if replay else None
+    return [
+        Browser(
+            f"bench-load-{index}",
+            batch_messages(
+                recording
+                if recording is not None
+                else synthetic_messages(index, events),
+                batch,
+            ),
+        )
+        for index in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--server", choices=["async", "flask", "cluster"], default="async"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Procesos del servidor 'cluster'"
+    )
+    parser.add_argument("--browsers", type=int, default=50)
+    parser.add_argument(
+        "--events", type=int, default=1_000, help="Eventos sintéticos por navegador"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="Eventos por segundo de cada navegador (0: sin límite)",
+    )
+    parser.add_argument(
+        "--batch", type=int, default=1, help="Eventos por mensaje 'batch'"
+    )
+    parser.add_argument(
+        "--replay", type=Path, default=None, help="Grabación NDJSON a reproducir"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=120,
+        help="Espera máxima a que se confirmen los eventos",
+    )
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help="Directorio de la base de datos (temporal por defecto)",
+    )
+    args = parser.parse_args()
+
+    browsers = make_browsers(args.browsers, args.events, args.batch, args.replay)
+    result = run_load(
+        args.server, browsers, args.rate, args.timeout, args.dir, args.workers
+    )
+
+    server = (
+        f"{args.server} ({args.workers} workers)"
+        if args.server == "cluster"
+        else args.server
+    )
+    print(f"server                 {server:>10}  ({os.cpu_count()} CPUs)")
+    print(f"browsers               {args.browsers:>10,}")
+    print(f"events committed       {result.committed:>10,} of {result.total:,}")
+    print(f"send time              {result.send_time:>10.2f} s")
+    print(f"throughput             {result.throughput:>10,.0f} events/s")
+    if len(result.latencies) > 1:
+        percentiles = quantiles(result.latencies, n=100)
+        for label, value in (
+            ("p50", percentiles[49]),
+            ("p99", percentiles[98]),
+            ("max", max(result.latencies)),
+        ):
+            print(f"commit latency {label}     {1000 * value:>10.1f} ms")
+    print(
+        f"server CPU             {result.cpu:>10.2f} s  ({result.cpu / result.elapsed:.2f} cores)"
+    )
+    print(f"server peak RSS        {result.peak_rss:>10,.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
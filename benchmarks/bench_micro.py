@@ -0,0 +1,175 @@
+"""
+Micro-benchmarks de las funciones de la ruta de recepción de mensajes:
+validación (`is_valid_message`), análisis de las marcas de tiempo
+(`parse_timestamp`, frente al `dateutil` usado antes), conversión de eventos en interacciones del
+búfer (`add_interaction`), registro de visitas de los eventos de pestañas
+(`process_tab_event`) y procesamiento completo de una trama en una conexión
+(`handle_frame`), con las métricas habilitadas y deshabilitadas para medir el
+coste de la instrumentación.
+
+Uso:
+    python -m benchmarks.bench_micro [--messages N] [--save FILE] [--compare FILE] [--tolerance F]
+
+`--save` guarda los resultados en JSON y `--compare` los compara con unos
+guardados previamente, terminando con error si alguna función es más lenta
+que la referencia en más de `--tolerance` (por defecto, un 25 %). Las
+referencias solo son comparables en la misma máquina.
+"""
+
+import argparse
+import json
+import sys
+from json import loads
+from random import Random
+from time import perf_counter
+from typing import Callable
+
+from dateutil.parser import parse as parse_date  # type: ignore[import-untyped]
+
+from benchmarks.common import message_stream, quiet, tab_message
+from database.timestamps import parse_timestamp
+from webchronicle.app import (
+    app,
+    flush_policy,
+    is_valid_message,
+    process_tab_event,
+    site_visits,
+)
+from webchronicle.connection import RecordingConnection, add_interaction
+from webchronicle.ingestion import (
+    FlushPolicy,
+    FlushStats,
+    IngestionWriter,
+    InteractionBuffer,
+)
+from webchronicle.metrics import registry
+
+
+def best_of(function: Callable[[], object], repeat: int = 5) -> float:
+    """
+    Mejor tiempo, en segundos, de ejecutar `function`.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        function()
+        timings.append(perf_counter() - started)
+    return min(timings)
+
+
+def bench_is_valid_message(frames: list[str]) -> float:
+    def run() -> None:
+        for frame in frames:
+            is_valid_message(frame)
+
+    return best_of(run)
+
+
+def bench_parse(frames: list[str], parse: Callable[[str], object]) -> float:
+    timestamps = [loads(frame)["message"]["timestamp"] for frame in frames]
+
+    def run() -> None:
+        for timestamp in timestamps:
+            parse(timestamp)
+
+    return best_of(run)
+
+
+def bench_add_interaction(frames: list[str]) -> float:
+    messages = [loads(frame)["message"] for frame in frames]
+    # Sin umbrales alcanzables, para medir solo la conversión y el búfer
+    policy = FlushPolicy(
+        max_events=len(messages) + 1, max_bytes=1 << 62, max_age_ms=1 << 62
+    )
+
+    def run() -> None:
+        buffer = InteractionBuffer(policy)
+        for message in messages:
+            add_interaction(message, "bench-micro", buffer, 200)
+
+    return best_of(run)
+
+
+def bench_process_tab_event(count: int) -> float:
+    rng = Random(0)
+    messages = [tab_message(rng, index)["message"] for index in range(count)]
+
+    def run() -> None:
+        for message in messages:
+            process_tab_event(message, "bench-micro")
+        # Las visitas se acumulan en el agregador global hasta el volcado
+        site_visits.rollback()
+
+    return best_of(run)
+
+
+def bench_handle_frame(frames: list[str], metrics_enabled: bool) -> float:
+    def run() -> None:
+        # Las operaciones se encolan en un escritor que no llega a aplicarlas
+        sink = IngestionWriter(app, lambda batch: None, max_queue_size=len(frames) + 1)
+        connection = RecordingConnection(
+            lambda frame: None, sink, flush_policy(), FlushStats()
+        )
+        connection.session_id = "bench-micro"
+        for frame in frames:
+            connection.handle_frame(frame)
+
+    registry.enabled = metrics_enabled
+    try:
+        return best_of(run)
+    finally:
+        registry.enabled = True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument(
+        "--save", default=None, help="Fichero JSON en el que guardar los resultados"
+    )
+    parser.add_argument(
+        "--compare", default=None, help="Resultados de referencia con los que comparar"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    frames = message_stream(args.messages)
+    with quiet():
+        elapsed = {
+            "is_valid_message": bench_is_valid_message(frames),
+            "dateutil_parse": bench_parse(frames, parse_date),
+            "parse_timestamp": bench_parse(frames, parse_timestamp),
+            "add_interaction": bench_add_interaction(frames),
+            "process_tab_event": bench_process_tab_event(args.messages),
+            "handle_frame": bench_handle_frame(frames, metrics_enabled=True),
+            "handle_frame_nometrics": bench_handle_frame(frames, metrics_enabled=False),
+        }
+    results = {name: 1e9 * seconds / args.messages for name, seconds in elapsed.items()}
+
+    reference = None
+    if args.compare:
+        with open(args.compare) as file:
+            reference = json.load(file)
+
+    print(f"{'function':<24}{'ns/call':>10}{'calls/s':>14}{'reference':>12}")
+    regressions = []
+    for name, nanoseconds in results.items():
+        line = f"{name:<24}{nanoseconds:>10,.0f}{1e9 / nanoseconds:>14,.0f}"
+        if reference and name in reference:
+            change = nanoseconds / reference[name] - 1
+            line += f"{change:>+11.0%}"
+            if change > args.tolerance:
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if regressions:
+        sys.exit(
+            f"Slower than the reference by more than {args.tolerance:.0%}: {', '.join(regressions)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark del decodificado de mensajes del WebSocket.
+
+Compara, por mensaje, el camino anterior (validación con `loads`, segundo
+`loads` en el manejador y `sleep(1e-3)` al final de cada iteración) con el
+decodificador de una sola pasada de `webchronicle.protocol`, y mide los
+mensajes por segundo que procesa una única conexión contra un servidor local,
+opcionalmente agrupando los eventos en mensajes "batch" de `--batch` eventos.
+
+Uso:
+    python -m benchmarks.bench_protocol [--messages N] [--batch N]
+
+Para medir el throughput de extremo a extremo de otra revisión basta con
+ejecutar el mismo comando sobre ella: el modo `e2e` solo depende del protocolo.
+"""
+
+import argparse
+from json import JSONDecodeError, dumps, loads
+from time import perf_counter, sleep
+from typing import Callable
+
+from simple_websocket import Client
+
+from benchmarks.common import message_stream, quiet, serve, session_message
+from webchronicle.protocol import JSON_BACKEND, decode_message
+
+
+def legacy_receive(frame: str, pause: bool) -> dict | None:
+    # Reproducción del bucle original: `is_valid_message`, segundo `loads` y
+    # pausa fija al final de cada iteración.
+    try:
+        message = loads(frame)
+    except JSONDecodeError:
+        return None
+    if not isinstance(message, dict) or "type" not in message:
+        return None
+    if not isinstance(message["type"], str) or not isinstance(
+        message.get("message"), dict
+    ):
+        return None
+    message = loads(frame)
+    if pause:
+        sleep(1e-3)
+    return message
+
+
+def rate(count: int, elapsed: float) -> str:
+    return f"{count / elapsed:>12,.0f} msg/s"
+
+
+def best_of(
+    function: Callable[[str], object], frames: list[str], repeat: int = 3
+) -> float:
+    """
+    Mejor tiempo, en segundos, de aplicar `function` a todas las tramas.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        for frame in frames:
+            function(frame)
+        timings.append(perf_counter() - started)
+    return min(timings)
+
+
+def bench_decode(frames: list[str]) -> None:
+    elapsed = best_of(lambda frame: legacy_receive(frame, pause=False), frames)
+    print(f"legacy decode (double parse)      {rate(len(frames), elapsed)}")
+
+    sample = frames[: min(len(frames), 1_000)]
+    elapsed = best_of(lambda frame: legacy_receive(frame, pause=True), sample, repeat=1)
+    print(f"legacy loop (double parse + sleep){rate(len(sample), elapsed)}")
+
+    elapsed = best_of(decode_message, frames)
+    print(f"single-pass decode ({JSON_BACKEND:<7})     {rate(len(frames), elapsed)}")
+
+
+def batch_frames(frames: list[str], batch_size: int) -> list[str]:
+    """
+    Agrupa las tramas en mensajes "batch" de `batch_size` eventos.
+    """
+    if batch_size <= 1:
+        return frames
+    return [
+        dumps(
+            {
+                "type": "batch",
+                "message": {
+                    "messages": [loads(frame) for frame in frames[i : i + batch_size]]
+                },
+            }
+        )
+        for i in range(0, len(frames), batch_size)
+    ]
+
+
+def bench_end_to_end(frames: list[str], batch_size: int = 1) -> None:
+    from webchronicle.app import app
+
+    events = len(frames)
+    frames = batch_frames(frames, batch_size)
+
+    with quiet(), serve(app) as url:
+        client = Client.connect(f"{url}/ws")
+        client.receive()
+        client.send(dumps(session_message("bench-protocol", "start")))
+
+        started = perf_counter()
+        for frame in frames:
+            client.send(frame)
+        # El servidor procesa los mensajes en orden, así que la respuesta de
+        # error a una trama inválida marca el final del procesamiento.
+        client.send("sentinel")
+        while '"error"' not in client.receive():
+            pass
+        elapsed = perf_counter() - started
+        client.close()
+
+    label = (
+        f"end-to-end, batches of {batch_size}"
+        if batch_size > 1
+        else "end-to-end, one connection"
+    )
+    print(f"{label:<34}{rate(events, elapsed)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--mode", choices=["decode", "e2e", "all"], default="all")
+    parser.add_argument("--batch", type=int, default=1)
+    args = parser.parse_args()
+
+    frames = message_stream(args.messages)
+    if args.mode in ("decode", "all"):
+        bench_decode(frames)
+    if args.mode in ("e2e", "all"):
+        bench_end_to_end(frames, args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Benchmark de las consultas de las páginas de eventos, reproducción, sesiones y
+sitios sobre un conjunto de datos sintético de varios millones de
+interacciones, antes y después de aplicar las migraciones de índices.
+
+Uso:
+    python -m benchmarks.bench_queries [--rows N] [--sessions N] [--sites N] [--dir DIR]
+"""
+
+import argparse
+import sqlite3
+import tempfile
+from datetime import timedelta
+from json import dumps
+from pathlib import Path
+from random import Random
+from time import perf_counter
+from typing import Iterator
+
+from sqlalchemy import Engine, Select, create_engine, func, select, text
+
+from benchmarks.common import BASE_TIME, event_message
+from database.base import Base
+from database.migrations import upgrade
+from database.models import (
+    Interaction,
+    Session,
+    SessionEventCount,
+    VisitedSite,
+    site_sessions,
+)
+from database.timestamps import to_epoch_us
+
+
+def populate(path: Path, rows: int, sessions: int, sites: int) -> None:
+    """
+    Genera el conjunto de datos directamente con `sqlite3`, sin índices
+    secundarios, como lo tendría una base de datos anterior a la migración.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(connection)
+    engine.dispose()
+
+    rng = Random(0)
+    sqlite_connection = sqlite3.connect(path)
+    sqlite_connection.execute("PRAGMA journal_mode=WAL")
+    sqlite_connection.execute("PRAGMA synchronous=OFF")
+
+    sqlite_connection.executemany(
+        'INSERT INTO "Sessions" (id, start_time) VALUES (?, ?)',
+        (
+            (
+                f"session-{index}",
+                to_epoch_us(BASE_TIME + timedelta(minutes=rng.randint(0, 500_000))),
+            )
+            for index in range(sessions)
+        ),
+    )
+    sqlite_connection.executemany(
+        "INSERT INTO visited_sites (url, visit_count, first_visit, last_visit) VALUES (?, ?, ?, ?)",
+        (
+            (
+                f"https://site{index}.example.com/",
+                rng.randint(1, 10_000),
+                to_epoch_us(BASE_TIME),
+                to_epoch_us(BASE_TIME),
+            )
+            for index in range(sites)
+        ),
+    )
+    sqlite_connection.executemany(
+        "INSERT OR IGNORE INTO site_sessions (site_id, session_id) VALUES (?, ?)",
+        (
+            (rng.randint(1, sites), f"session-{rng.randrange(sessions)}")
+            for _ in range(sessions * 10)
+        ),
+    )
+
+    # Las sesiones se graban de forma concurrente, por lo que sus interacciones
+    # quedan intercaladas en la tabla.
+    def interactions() -> Iterator[tuple[str, str, int, str]]:
+        for index in range(rows):
+            message = event_message(rng, index)["message"]
+            yield (
+                message["event"],
+                dumps(message["details"]),
+                to_epoch_us(BASE_TIME + timedelta(milliseconds=50 * index)),
+                f"session-{index % sessions}",
+            )
+
+    sqlite_connection.executemany(
+        'INSERT INTO "Interactions" (type, details, time, session_id) VALUES (?, ?, ?, ?)',
+        interactions(),
+    )
+    sqlite_connection.commit()
+    sqlite_connection.close()
+
+
+def queries(sessions: int, sites: int) -> dict[str, Select]:
+    session_id = f"session-{sessions // 2}"
+    return {
+        "view_events / play_session": select(Interaction)
+        .where(Interaction.session_id == session_id)
+        .order_by(Interaction.time, Interaction.id),
+        "events count per session": select(func.count())
+        .select_from(Interaction)
+        .where(Interaction.session_id == session_id),
+        "sessions_index (latest 50)": select(Session)
+        .order_by(Session.start_time.desc())
+        .limit(50),
+        "sessions_index (site filter)": select(Session)
+        .join(site_sessions)
+        .where(site_sessions.c.site_id == sites // 2),
+        "sites of a session": select(VisitedSite)
+        .join(site_sessions)
+        .where(site_sessions.c.session_id == session_id),
+        "sites_page (top 50)": select(VisitedSite)
+        .order_by(VisitedSite.visit_count.desc())
+        .limit(50),
+        # Totales por tipo de todas las sesiones, recorriendo las interacciones
+        # o leyendo los agregados (vacíos antes de la migración)
+        "event totals (Interactions)": select(
+            Interaction.session_id, Interaction.type, func.count()
+        ).group_by(Interaction.session_id, Interaction.type),
+        "event totals (aggregates)": select(SessionEventCount),
+    }
+
+
+def measure(
+    engine: Engine, statements: dict[str, Select], repeat: int = 3
+) -> dict[str, float]:
+    timings = {}
+    with engine.connect() as connection:
+        for label, statement in statements.items():
+            best = float("inf")
+            for _ in range(repeat):
+                started = perf_counter()
+                connection.execute(statement).all()
+                best = min(best, perf_counter() - started)
+            timings[label] = best
+    return timings
+
+
+def plans(engine: Engine, statements: dict[str, Select]) -> dict[str, str]:
+    result = {}
+    with engine.connect() as connection:
+        for label, statement in statements.items():
+            compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+            rows = connection.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+            result[label] = "; ".join(row[-1] for row in rows)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--sessions", type=int, default=2_000)
+    parser.add_argument("--sites", type=int, default=20_000)
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help="Directorio de la base de datos (temporal por defecto)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = Path(directory) / "bench-queries.db"
+        started = perf_counter()
+        populate(path, args.rows, args.sessions, args.sites)
+        print(
+            f"{args.rows:,} interactions, {args.sessions:,} sessions, {args.sites:,} sites "
+            f"generated in {perf_counter() - started:.1f} s"
+        )
+
+        engine = create_engine(f"sqlite:///{path}")
+        statements = queries(args.sessions, args.sites)
+        before, before_plans = measure(engine, statements), plans(engine, statements)
+
+        started = perf_counter()
+        upgrade(engine)
+        print(f"migrations applied in {perf_counter() - started:.1f} s\n")
+        after, after_plans = measure(engine, statements), plans(engine, statements)
+
+        print(f"{'query':<30}{'before':>12}{'after':>12}{'speedup':>10}")
+        for label in statements:
+            print(
+                f"{label:<30}{1000 * before[label]:>10.2f}ms{1000 * after[label]:>10.2f}ms"
+                f"{before[label] / after[label]:>9.0f}x"
+            )
+        print()
+        for label in statements:
+            print(
+                f"{label}\n  before: {before_plans[label]}\n  after:  {after_plans[label]}"
+            )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark de los fotogramas clave de reproducción sobre una sesión larga:
+coste de generarlos en la ruta de escritura y tiempo de salto a puntos
+aleatorios de la sesión con y sin fotogramas clave.
+
+Uso:
+    python -m benchmarks.bench_replay [--events N] [--every N] [--seeks N] [--dir DIR]
+"""
+
+import argparse
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from random import Random
+from statistics import mean, quantiles
+from time import perf_counter
+from typing import Any
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session as DatabaseSession
+
+from benchmarks.common import BASE_TIME, event_message
+from database.base import Base
+from database.keyframes import KeyframeBuilder, load_state
+from database.models import Interaction, InteractionRow, Session
+from database.strings import StringInterner, interaction_values
+from database.timestamps import naive_utc
+
+SESSION_ID = "bench-replay"
+
+
+def session_rows(events: int) -> list[InteractionRow]:
+    rng = Random(0)
+    rows = []
+    for index in range(events):
+        message: dict[str, Any]
+        if index % 200 == 0:
+            message = {
+                "event": "tab_updated",
+                "details": {"tabId": 1, "url": f"https://site{index}.example.com/"},
+            }
+        else:
+            message = event_message(rng, index)["message"]
+        rows.append(
+            InteractionRow(
+                message["event"],
+                BASE_TIME + timedelta(milliseconds=50 * index),
+                message["details"],
+                SESSION_ID,
+            )
+        )
+    return rows
+
+
+def record(
+    path: Path, rows: list[InteractionRow], builder: KeyframeBuilder | None, batch: int
+) -> float:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with DatabaseSession(engine) as session:
+        session.add(Session(id=SESSION_ID, start_time=BASE_TIME))
+        session.commit()
+
+        strings = StringInterner()
+        started = perf_counter()
+        for start in range(0, len(rows), batch):
+            chunk = rows[start : start + batch]
+            if builder is not None:
+                builder.record(session, chunk)
+            session.execute(
+                Interaction.__table__.insert(),
+                interaction_values(session, chunk, strings),
+            )
+            if builder is not None:
+                builder.flush(session)
+            session.commit()
+            strings.commit()
+            if builder is not None:
+                builder.commit()
+        elapsed = perf_counter() - started
+    engine.dispose()
+    return elapsed
+
+
+def seek(
+    path: Path, rows: list[InteractionRow], seeks: int
+) -> tuple[list[float], list[int]]:
+    rng = Random(1)
+    engine = create_engine(f"sqlite:///{path}")
+    timings, deltas = [], []
+    moments = [naive_utc(row.time) for row in rows if row.time is not None]
+    with DatabaseSession(engine) as session:
+        for _ in range(seeks):
+            moment = rng.choice(moments)
+            started = perf_counter()
+            _, applied, _, _ = load_state(session, SESSION_ID, until=moment)
+            timings.append(perf_counter() - started)
+            deltas.append(applied)
+    engine.dispose()
+    return timings, deltas
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument(
+        "--every", type=int, default=500, help="Eventos entre fotogramas clave"
+    )
+    parser.add_argument("--seeks", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=1_000)
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help="Directorio de las bases de datos (temporal por defecto)",
+    )
+    args = parser.parse_args()
+
+    rows = session_rows(args.events)
+    times = [row.time for row in rows if row.time is not None]
+    duration = times[-1] - times[0]
+    print(
+        f"{args.events:,} events, {duration} of recording, keyframe every {args.every} events\n"
+    )
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        plain, keyed = Path(directory) / "plain.db", Path(directory) / "keyframes.db"
+        plain_time = record(plain, rows, None, args.batch)
+        keyed_time = record(
+            keyed,
+            rows,
+            KeyframeBuilder(every_events=args.every, every_ms=3_600_000),
+            args.batch,
+        )
+        print(f"{'write path':<20}{'events/s':>12}")
+        print(f"{'without keyframes':<20}{args.events / plain_time:>12,.0f}")
+        print(f"{'with keyframes':<20}{args.events / keyed_time:>12,.0f}\n")
+
+        print(f"{'seek':<20}{'mean':>10}{'p99':>10}{'events':>10}")
+        for label, path in (("from start", plain), ("from keyframe", keyed)):
+            timings, deltas = seek(path, rows, args.seeks)
+            p99 = quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+            print(
+                f"{label:<20}{1000 * mean(timings):>8.2f}ms{1000 * p99:>8.2f}ms{mean(deltas):>10,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
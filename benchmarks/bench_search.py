@@ -0,0 +1,180 @@
+"""
+Benchmark del índice de búsqueda entre sesiones: coste de mantenerlo al
+escribir y tiempo de las búsquedas de sesiones por elemento, etiqueta, URL y
+tipo de evento, recorriendo las interacciones o leyendo el índice.
+
+Los eventos de cada sesión se generan sobre un conjunto limitado de elementos
+y páginas compartido por todas ellas, como al navegar por un mismo sitio.
+
+Uso:
+    python -m benchmarks.bench_search [--events N] [--sessions N] [--elements N] [--dir DIR]
+"""
+
+import argparse
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from random import Random
+from time import perf_counter
+
+from sqlalchemy import Select, create_engine, func, select
+from sqlalchemy.orm import Session as DatabaseSession
+
+from benchmarks.common import BASE_TIME, event_message, tab_message, xpath
+from database.base import Base
+from database.models import Interaction, InteractionRow, InternedString, Session
+from database.search_index import SearchIndexAggregator
+from database.strings import StringInterner, interaction_values
+from webchronicle.search import SearchQuery, search_statement
+
+BATCH_SIZE = 1_000
+
+
+def generate_rows(events: int, sessions: int, elements: int) -> list[InteractionRow]:
+    """
+    Interacciones de las sesiones, intercaladas como si se grabaran a la vez.
+    """
+    rng = Random(0)
+    paths = [xpath(rng) for _ in range(elements)]
+    rows = []
+    for index in range(events):
+        if index % 50 == 0:
+            message = tab_message(rng, index)["message"]
+            message["details"]["url"] = (
+                f"https://site{rng.randrange(elements // 10)}.example.com/"
+            )
+        else:
+            message = event_message(rng, index)["message"]
+            if "path" in message["details"]:
+                message["details"]["path"] = rng.choice(paths)
+        rows.append(
+            InteractionRow(
+                message["event"],
+                BASE_TIME + timedelta(milliseconds=50 * index),
+                message["details"],
+                f"session-{index % sessions}",
+            )
+        )
+    return rows
+
+
+def record(
+    path: Path, rows: list[InteractionRow], sessions: int, indexed: bool
+) -> float:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    strings, search_index = StringInterner(), SearchIndexAggregator()
+    with DatabaseSession(engine) as session:
+        session.add_all(
+            Session(id=f"session-{index}", start_time=BASE_TIME)
+            for index in range(sessions)
+        )
+        session.commit()
+
+        started = perf_counter()
+        for start in range(0, len(rows), BATCH_SIZE):
+            chunk = rows[start : start + BATCH_SIZE]
+            session.execute(
+                Interaction.__table__.insert(),
+                interaction_values(session, chunk, strings),
+            )
+            if indexed:
+                search_index.record(chunk)
+                search_index.flush(session, strings)
+            session.commit()
+            strings.commit()
+        elapsed = perf_counter() - started
+    engine.dispose()
+    return elapsed
+
+
+def scan_statement(query: SearchQuery) -> Select:
+    """
+    Misma búsqueda que `search_statement`, pero recorriendo las interacciones
+    con los índices de `Interactions`.
+    """
+    if query.field == "type":
+        condition = Interaction.type == query.value
+    else:
+        column = getattr(Interaction, f"{query.field}_id")
+        condition = (
+            column
+            == select(InternedString.id)
+            .where(InternedString.value == query.value)
+            .scalar_subquery()
+        )
+    last_time = func.max(Interaction.time)
+    statement = select(
+        Interaction.session_id, func.count(), func.min(Interaction.time), last_time
+    ).where(condition)
+    if query.type:
+        statement = statement.where(Interaction.type == query.type)
+    return statement.group_by(Interaction.session_id).order_by(
+        last_time.desc(), Interaction.session_id
+    )
+
+
+def measure(path: Path, statement: Select, repeat: int = 5) -> tuple[float, int]:
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as connection:
+        best, rows = float("inf"), 0
+        for _ in range(repeat):
+            started = perf_counter()
+            rows = len(connection.execute(statement.limit(50)).all())
+            best = min(best, perf_counter() - started)
+    engine.dispose()
+    return best, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=1_000)
+    parser.add_argument(
+        "--elements", type=int, default=2_000, help="Elementos distintos de las páginas"
+    )
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help="Directorio de las bases de datos (temporal por defecto)",
+    )
+    args = parser.parse_args()
+
+    rows = generate_rows(args.events, args.sessions, args.elements)
+    element = next(row.details["path"] for row in rows if row.type == "click")
+    url = next(row.details["url"] for row in rows if "url" in row.details)
+    print(
+        f"{args.events:,} events, {args.sessions:,} sessions, {args.elements:,} elements\n"
+    )
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        print(f"{'write path':<22}{'events/s':>12}")
+        paths = {}
+        for indexed in (False, True):
+            label = "with search index" if indexed else "without index"
+            paths[indexed] = Path(directory) / f"{label}.db"
+            elapsed = record(paths[indexed], rows, args.sessions, indexed)
+            print(f"{label:<22}{args.events / elapsed:>12,.0f}")
+
+        queries = {
+            "clicked element": SearchQuery("path", element, type="click"),
+            "typed into INPUT": SearchQuery("target", "INPUT", type="input"),
+            "visited URL": SearchQuery("url", url),
+            "scrolled": SearchQuery("type", "scroll"),
+        }
+        print(
+            f"\n{'sessions that...':<22}{'Interactions':>14}{'search index':>14}{'speedup':>10}"
+        )
+        for label, query in queries.items():
+            scan, scan_rows = measure(paths[True], scan_statement(query))
+            lookup, lookup_rows = measure(
+                paths[True], search_statement(query, max_terms=1_000)
+            )
+            assert scan_rows == lookup_rows
+            print(
+                f"{label:<22}{1000 * scan:>12.2f}ms{1000 * lookup:>12.2f}ms{scan / lookup:>9.0f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark del throughput de ingesta según la configuración de almacenamiento.
+
+Aplica la misma carga de operaciones (inicio de sesión, volcados de
+interacciones de `--flush` eventos y eventos de pestañas) mediante la etapa de
+ingesta sobre una base de datos en memoria y sobre un fichero SQLite con
+distintos modos de diario y sincronización. Con `--batch 1` cada operación se
+confirma en su propia transacción, que es el caso en el que más pesa la
+sincronización con el disco.
+
+Uso:
+    python -m benchmarks.bench_storage [--events N] [--flush N] [--batch N] [--uri URI]
+
+`--uri` añade a la comparación otra base de datos, por ejemplo un servidor
+PostgreSQL (`postgresql://usuario@localhost/webchronicle`).
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+from random import Random
+from time import perf_counter
+
+from dateutil.parser import parse as parse_date  # type: ignore[import-untyped]
+from flask import Flask
+
+from benchmarks.common import event_message, quiet, tab_message
+from database.base import MEMORY_DATABASE_URI, configure_sqlite, db, engine_options
+from database.models import InteractionRow
+from webchronicle.ingestion import IngestionWriter, WriteOperation
+
+
+def build_operations(
+    events: int, flush: int, sessions: int = 10
+) -> list[WriteOperation]:
+    """
+    Genera la carga de escritura que produciría la etapa de ingesta para
+    `events` eventos repartidos entre `sessions` sesiones.
+    """
+    rng = Random(0)
+    operations = [
+        WriteOperation(
+            "session_start",
+            f"bench-storage-{index}",
+            parse_date("2025-01-01T12:00:00Z"),
+        )
+        for index in range(sessions)
+    ]
+    for start in range(0, events, flush):
+        session_id = f"bench-storage-{(start // flush) % sessions}"
+        rows = []
+        for index in range(start, min(start + flush, events)):
+            message = event_message(rng, index)["message"]
+            rows.append(
+                InteractionRow(
+                    message["event"],
+                    parse_date(message["timestamp"]),
+                    message["details"],
+                    session_id,
+                )
+            )
+        operations.append(WriteOperation("interactions", session_id, rows))
+        operations.append(
+            WriteOperation(
+                "tab_event",
+                session_id,
+                tab_message(rng, start, "tab_updated")["message"],
+            )
+        )
+    return operations
+
+
+def make_app(uri: str, journal_mode: str, synchronous: str) -> Flask:
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(uri)
+    db.init_app(app)
+    with app.app_context():
+        configure_sqlite(db.engine, journal_mode=journal_mode, synchronous=synchronous)
+        db.create_all()
+    return app
+
+
+def run(
+    label: str | None,
+    app: Flask,
+    operations: list[WriteOperation],
+    batch_size: int,
+    events: int,
+) -> None:
+    from webchronicle.app import apply_operations
+
+    writer = IngestionWriter(
+        app, apply_operations, max_queue_size=len(operations), batch_size=batch_size
+    )
+    for operation in operations:
+        writer.submit(operation)
+
+    with quiet():
+        started = perf_counter()
+        writer.drain()
+        elapsed = perf_counter() - started
+
+    if label is not None:
+        print(
+            f"{label:<32}{events / elapsed:>12,.0f} events/s{1000 * elapsed:>10,.0f} ms"
+        )
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=50_000)
+    parser.add_argument("--flush", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=1_000)
+    parser.add_argument("--uri", default=None)
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help="Directorio de los ficheros SQLite (temporal por defecto)",
+    )
+    args = parser.parse_args()
+
+    operations = build_operations(args.events, args.flush)
+    print(
+        f"{len(operations):,} operations, {args.events:,} events, batches of {args.batch}"
+    )
+
+    # Ejecución descartada para que la primera medida no pague la importación
+    # de los módulos ni la compilación de las sentencias.
+    run(
+        None,
+        make_app(MEMORY_DATABASE_URI, "MEMORY", "OFF"),
+        operations,
+        args.batch,
+        args.events,
+    )
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        modes = [("memory", MEMORY_DATABASE_URI, "MEMORY", "OFF")]
+        for journal_mode, synchronous in [
+            ("DELETE", "FULL"),
+            ("WAL", "FULL"),
+            ("WAL", "NORMAL"),
+        ]:
+            path = Path(directory) / f"{journal_mode}-{synchronous}.db"
+            modes.append(
+                (
+                    f"file {journal_mode}, sync={synchronous}",
+                    f"sqlite:///{path}",
+                    journal_mode,
+                    synchronous,
+                )
+            )
+        if args.uri:
+            modes.append((args.uri.split(":", 1)[0], args.uri, "WAL", "NORMAL"))
+
+        for label, uri, journal_mode, synchronous in modes:
+            run(
+                label,
+                make_app(uri, journal_mode, synchronous),
+                operations,
+                args.batch,
+                args.events,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark del almacenamiento normalizado de las interacciones: espacio
+ocupado, throughput de escritura y consulta de los clics sobre un elemento,
+guardando los detalles en JSON o normalizados con las cadenas internadas.
+
+Los eventos se generan sobre un conjunto limitado de elementos y páginas,
+como ocurre al navegar por un mismo sitio, en lugar de con una XPath distinta
+por evento.
+
+Uso:
+    python -m benchmarks.bench_strings [--events N] [--elements N] [--dir DIR]
+"""
+
+import argparse
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from random import Random
+from time import perf_counter
+
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import Session as DatabaseSession
+
+from benchmarks.common import BASE_TIME, event_message, tab_message, xpath
+from database.base import Base
+from database.models import Interaction, InteractionRow, InternedString, Session
+from database.strings import StringInterner, interaction_values
+
+SESSION_ID = "bench-strings"
+BATCH_SIZE = 1_000
+
+
+def session_rows(events: int, elements: int) -> list[InteractionRow]:
+    rng = Random(0)
+    paths = [xpath(rng) for _ in range(elements)]
+    rows = []
+    for index in range(events):
+        if index % 50 == 0:
+            message = tab_message(rng, index)["message"]
+        else:
+            message = event_message(rng, index)["message"]
+            if "path" in message["details"]:
+                message["details"]["path"] = rng.choice(paths)
+        rows.append(
+            InteractionRow(
+                message["event"],
+                BASE_TIME + timedelta(milliseconds=50 * index),
+                message["details"],
+                SESSION_ID,
+            )
+        )
+    return rows
+
+
+def record(
+    path: Path, rows: list[InteractionRow], strings: StringInterner | None
+) -> tuple[float, int]:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with DatabaseSession(engine) as session:
+        session.add(Session(id=SESSION_ID, start_time=BASE_TIME))
+        session.commit()
+
+        started = perf_counter()
+        for start in range(0, len(rows), BATCH_SIZE):
+            chunk = rows[start : start + BATCH_SIZE]
+            session.execute(
+                Interaction.__table__.insert(),
+                interaction_values(session, chunk, strings),
+            )
+            session.commit()
+            if strings is not None:
+                strings.commit()
+        elapsed = perf_counter() - started
+
+        session.execute(text("VACUUM"))
+        page_count: int = session.execute(text("PRAGMA page_count")).scalar_one()
+        page_size: int = session.execute(text("PRAGMA page_size")).scalar_one()
+    engine.dispose()
+    return elapsed, page_count * page_size
+
+
+def element_clicks(
+    path: Path, element: str, normalized: bool, repeat: int = 20
+) -> float:
+    engine = create_engine(f"sqlite:///{path}")
+    if normalized:
+        query = (
+            select(func.count())
+            .select_from(Interaction)
+            .join(InternedString, InternedString.id == Interaction.path_id)
+            .where(InternedString.value == element, Interaction.type == "click")
+        )
+    else:
+        query = (
+            select(func.count())
+            .select_from(Interaction)
+            .where(
+                func.json_extract(Interaction.raw_details, "$.path") == element,
+                Interaction.type == "click",
+            )
+        )
+    with DatabaseSession(engine) as session:
+        started = perf_counter()
+        for _ in range(repeat):
+            session.execute(query).scalar()
+        elapsed = (perf_counter() - started) / repeat
+    engine.dispose()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument(
+        "--elements", type=int, default=500, help="Elementos distintos de las páginas"
+    )
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help="Directorio de las bases de datos (temporal por defecto)",
+    )
+    args = parser.parse_args()
+
+    rows = session_rows(args.events, args.elements)
+    element = next(row.details["path"] for row in rows if row.type == "click")
+    print(f"{args.events:,} events over {args.elements} elements\n")
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        print(
+            f"{'details':<14}{'events/s':>12}{'bytes/event':>14}{'element query':>16}"
+        )
+        for label, strings in (("JSON", None), ("normalised", StringInterner())):
+            path = Path(directory) / f"{label}.db"
+            elapsed, size = record(path, rows, strings)
+            query_time = element_clicks(path, element, strings is not None)
+            print(
+                f"{label:<14}{args.events / elapsed:>12,.0f}{size / args.events:>14.1f}"
+                f"{1000 * query_time:>14.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Utilidades compartidas por los benchmarks: generación de mensajes sintéticos
+con el formato que emite la extensión y arranque de un servidor local.
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from json import dumps
+from random import Random
+from time import sleep
+from typing import Any, Iterator
+
+from flask import Flask
+from werkzeug.serving import make_server
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import (
+    AcceptConnection,
+    CloseConnection,
+    Ping,
+    RejectConnection,
+    Request,
+    TextMessage,
+)
+
+from database.base import DATABASE_URI_ENV, MEMORY_DATABASE_URI
+
+# Salvo que se indique otra en el entorno, los benchmarks usan una base de datos
+# en memoria para que cada ejecución parta de cero. Debe fijarse antes de
+# importar `webchronicle.app`, también en los servidores lanzados como
+# subprocesos, que heredan el entorno.
+os.environ.setdefault(DATABASE_URI_ENV, MEMORY_DATABASE_URI)
+
+BASE_TIME = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+TAGS = ["BUTTON", "A", "INPUT", "DIV", "SPAN", "TEXTAREA"]
+HOST = "127.0.0.1"
+
+
+def isoformat(moment: datetime) -> str:
+    """
+    Formatea una fecha igual que `new Date().toISOString()` en la extensión.
+    """
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def xpath(rng: Random, depth: int = 12) -> str:
+    return (
+        "/html/body"
+        + "".join(f"/div[{rng.randint(1, 5)}]" for _ in range(depth))
+        + f"/{rng.choice(TAGS).lower()}"
+    )
+
+
+def event_message(rng: Random, index: int) -> dict[str, Any]:
+    """
+    Genera un mensaje `event_logged` representativo (click, keydown o scroll).
+    """
+    timestamp = isoformat(BASE_TIME + timedelta(milliseconds=50 * index))
+    kind = rng.random()
+    if kind < 0.5:
+        details: dict[str, Any] = {
+            "path": xpath(rng),
+            "target": rng.choice(TAGS),
+            "x": rng.randint(0, 1920),
+            "y": rng.randint(0, 1080),
+        }
+        event = "click"
+    elif kind < 0.85:
+        details = {
+            "path": xpath(rng),
+            "target": "INPUT",
+            "key": rng.choice("abcdefghijklmnopqrstuvwxyz"),
+            "modAlt": False,
+            "modCtrl": False,
+            "modShift": rng.random() < 0.1,
+            "modMeta": False,
+        }
+        event = "input"
+    else:
+        details = {"x": 0, "y": rng.randint(0, 20_000)}
+        event = "scroll"
+
+    return {
+        "type": "event_logged",
+        "message": {"timestamp": timestamp, "event": event, "details": details},
+    }
+
+
+def tab_message(rng: Random, index: int, event: str = "tab_updated") -> dict[str, Any]:
+    timestamp = isoformat(BASE_TIME + timedelta(milliseconds=50 * index))
+    return {
+        "type": "tab_event",
+        "message": {
+            "timestamp": timestamp,
+            "event": event,
+            "details": {
+                "tabId": rng.randint(1, 10),
+                "url": f"https://site{rng.randint(1, 50)}.example.com/page/{rng.randint(1, 200)}",
+            },
+        },
+    }
+
+
+def session_message(session_id: str, action: str, index: int = 0) -> dict[str, Any]:
+    timestamp = isoformat(BASE_TIME + timedelta(milliseconds=50 * index))
+    return {
+        "type": "session_state_changed",
+        "message": {"timestamp": timestamp, "sessionId": session_id, "action": action},
+    }
+
+
+def message_stream(count: int, seed: int = 0, tab_ratio: float = 0.02) -> list[str]:
+    """
+    Genera `count` tramas de eventos ya serializadas, con una proporción
+    `tab_ratio` de eventos de pestañas.
+    """
+    rng = Random(seed)
+    return [
+        dumps(
+            tab_message(rng, index)
+            if rng.random() < tab_ratio
+            else event_message(rng, index)
+        )
+        for index in range(count)
+    ]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind: str, port: int, workers: int = 1) -> subprocess.Popen:
+    if kind == "async":
+        command = [
+            "-m",
+            "webchronicle.async_server",
+            "--host",
+            HOST,
+            "--port",
+            str(port),
+        ]
+    elif kind == "cluster":
+        command = [
+            "-m",
+            "webchronicle.cluster",
+            "--host",
+            HOST,
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+        ]
+    else:
+        command = [
+            "-m",
+            "flask",
+            "--app",
+            "webchronicle.app",
+            "run",
+            "--host",
+            HOST,
+            "--port",
+            str(port),
+        ]
+
+    process = subprocess.Popen(
+        [sys.executable, *command],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(200):
+        try:
+            socket.create_connection((HOST, port), timeout=0.1).close()
+            return process
+        except OSError:
+            sleep(0.05)
+    process.kill()
+    raise RuntimeError("Server did not start")
+
+
+def process_status(pid: int) -> tuple[float, int]:
+    """
+    Memoria residente, en MiB, y número de hilos de un proceso (solo Linux).
+    """
+    rss, threads = 0.0, 0
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) / 1024
+            elif line.startswith("Threads:"):
+                threads = int(line.split()[1])
+    return rss, threads
+
+
+def process_cpu_time(pid: int) -> float:
+    """
+    Tiempo de CPU, en segundos, consumido por un proceso y por sus procesos
+    hijos (solo Linux).
+    """
+    total = 0.0
+    for process in [pid, *child_processes(pid)]:
+        try:
+            with open(f"/proc/{process}/stat") as stat:
+                # El nombre del proceso puede contener espacios, por lo que los
+                # campos se cuentan desde el paréntesis que lo cierra
+                fields = stat.read().rsplit(")", 1)[1].split()
+        except FileNotFoundError:
+            continue
+        total += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return total
+
+
+def child_processes(pid: int) -> list[int]:
+    """
+    Procesos hijos de un proceso (solo Linux).
+    """
+    children: list[int] = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as file:
+            children.extend(int(child) for child in file.read().split())
+    return children
+
+
+@contextmanager
+def quiet() -> Iterator[None]:
+    """
+    Descarta la salida estándar (los `print` del servidor) durante la medida.
+    """
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+@contextmanager
+def serve(app: Flask, host: str = "127.0.0.1", port: int = 0) -> Iterator[str]:
+    """
+    Arranca la aplicación en un servidor local en segundo plano.
+
+    Returns:
+    ---------
+    Iterator[str]
+        URL base del WebSocket de ingesta (`ws://host:puerto`).
+    """
+    server = make_server(host, port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"ws://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+class AsyncClient:
+    """
+    Cliente WebSocket mínimo sobre `asyncio` y `wsproto`, con el que un único
+    proceso puede mantener miles de conexiones abiertas sin un hilo por cada
+    una.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        stream: asyncio.StreamWriter,
+        protocol: WSConnection,
+    ) -> None:
+        self.reader = reader
+        self.stream = stream
+        self.protocol = protocol
+        self.subprotocol: str | None = None
+        self.received: asyncio.Queue[str] = asyncio.Queue()
+        self._reader_task: asyncio.Task | None = None
+
+    @classmethod
+    async def connect(
+        cls,
+        host: str,
+        port: int,
+        path: str = "/ws",
+        subprotocols: list[str] | None = None,
+    ) -> "AsyncClient":
+        reader, stream = await asyncio.open_connection(host, port)
+        client = cls(reader, stream, WSConnection(ConnectionType.CLIENT))
+        stream.write(
+            client.protocol.send(
+                Request(
+                    host=f"{host}:{port}", target=path, subprotocols=subprotocols or []
+                )
+            )
+        )
+        while client._reader_task is None:
+            data = await reader.read(64 * 1024)
+            if not data:
+                raise ConnectionError("Connection closed during handshake")
+            client.protocol.receive_data(data)
+            client._handle_events()
+        return client
+
+    def _handle_events(self) -> bool:
+        for event in self.protocol.events():
+            match event:
+                case AcceptConnection():
+                    self.subprotocol = event.subprotocol
+                    self._reader_task = asyncio.create_task(self._read())
+                case RejectConnection():
+                    raise ConnectionError(event.status_code)
+                case TextMessage():
+                    self.received.put_nowait(event.data)
+                case Ping():
+                    self.stream.write(self.protocol.send(event.response()))
+                case CloseConnection():
+                    return False
+        return True
+
+    async def _read(self) -> None:
+        # Se consume todo lo que envía el servidor para que el cierre del
+        # socket no descarte datos pendientes de leer.
+        while data := await self.reader.read(64 * 1024):
+            self.protocol.receive_data(data)
+            if not self._handle_events():
+                return
+
+    async def send(self, text: str) -> None:
+        self.stream.write(self.protocol.send(TextMessage(data=text)))
+        await self.stream.drain()
+
+    async def receive(self) -> str:
+        return await self.received.get()
+
+    async def close(self) -> None:
+        try:
+            self.stream.write(self.protocol.send(CloseConnection(code=1000)))
+            await self.stream.drain()
+            if self._reader_task is not None:
+                await asyncio.wait_for(self._reader_task, 5)
+        except (ConnectionError, TimeoutError):
+            pass
+        finally:
+            self.stream.close()
@@ -0,0 +1,306 @@
+"""
+Agregados materializados de las interacciones.
+
+Los listados de sesiones y sitios muestran totales (eventos por tipo de cada
+sesión, duración, sesiones por sitio) que calculados sobre `Interactions`
+obligarían a recorrer todos los eventos. En su lugar se guardan en
+`session_stats`, `session_event_counts` y `visited_sites.session_count`, que la
+ruta de escritura mantiene de forma incremental.
+
+Para recalcularlos a partir de las interacciones guardadas y de los archivos de
+las sesiones archivadas (por ejemplo, tras importar datos):
+
+    python -m database.aggregates [URI]
+"""
+
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from threading import Lock
+from typing import Iterable
+
+from sqlalchemy import ColumnElement, create_engine, delete, func, insert, select
+from sqlalchemy.orm import Session as DatabaseSession
+
+from .base import DATABASE_URI_ENV, Base, dialect_insert, greatest, least
+from .models import (
+    ArchivedSession,
+    Interaction,
+    InteractionRow,
+    SessionEventCount,
+    SessionStats,
+)
+from .site_visits import UPSERT_CHUNK_SIZE, update_session_counts
+from .timestamps import naive_utc
+
+
+class PendingStats:
+    """
+    Interacciones de una sesión acumuladas desde el último volcado.
+
+    Atributos:
+    ------------
+    event_count: int
+        Número de interacciones pendientes de sumar.
+    first_event: datetime
+        Primera de las interacciones pendientes.
+    last_event: datetime
+        Última de las interacciones pendientes.
+    types: Counter[str]
+        Número de interacciones pendientes de cada tipo.
+    """
+
+    __slots__ = ("event_count", "first_event", "last_event", "types")
+
+    def __init__(self, timestamp: datetime) -> None:
+        self.event_count = 0
+        self.first_event = timestamp
+        self.last_event = timestamp
+        self.types: Counter[str] = Counter()
+
+
+class SessionStatsAggregator:
+    """
+    Agregador en memoria de los totales de las interacciones de cada sesión.
+
+    Igual que `SiteVisitAggregator`, acumula las interacciones de un lote de
+    operaciones y las vuelca de una vez mediante upserts que suman los nuevos
+    totales a los guardados, por lo que el coste de mantener los agregados
+    depende del número de sesiones y tipos del lote, no del de eventos. Si la
+    transacción falla, `rollback` descarta lo acumulado y el llamante debe
+    volver a registrarlo.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._pending: dict[str, PendingStats] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, rows: Iterable[InteractionRow]) -> None:
+        """
+        Registra un bloque de interacciones que se van a insertar.
+
+        Parámetros:
+        ------------
+        rows: Iterable[InteractionRow]
+            Interacciones del bloque.
+        """
+        with self._lock:
+            for row in rows:
+                if row.time is None:
+                    continue
+                timestamp = naive_utc(row.time)
+                pending = self._pending.get(row.session_id)
+                if pending is None:
+                    pending = self._pending[row.session_id] = PendingStats(timestamp)
+                pending.event_count += 1
+                pending.first_event = min(pending.first_event, timestamp)
+                pending.last_event = max(pending.last_event, timestamp)
+                pending.types[row.type] += 1
+
+    def flush(self, session: DatabaseSession) -> int:
+        """
+        Escribe los totales acumulados en la transacción de la sesión
+        recibida, sin confirmarla.
+
+        Parámetros:
+        ------------
+        session: DatabaseSession
+            Sesión de SQLAlchemy sobre la que escribir.
+
+        Returns:
+        ---------
+        int
+            Número de sesiones actualizadas.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        stats = SessionStats.__table__
+        items = list(pending.items())
+        for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+            statement = dialect_insert(session, stats).values(
+                [
+                    {
+                        "session_id": session_id,
+                        "event_count": totals.event_count,
+                        "first_event": totals.first_event,
+                        "last_event": totals.last_event,
+                    }
+                    for session_id, totals in items[start : start + UPSERT_CHUNK_SIZE]
+                ]
+            )
+            excluded = statement.excluded
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[stats.c.session_id],
+                    set_={
+                        "event_count": stats.c.event_count + excluded.event_count,
+                        "first_event": least(stats.c.first_event, excluded.first_event),
+                        "last_event": greatest(stats.c.last_event, excluded.last_event),
+                    },
+                )
+            )
+
+        counts = SessionEventCount.__table__
+        rows = [
+            {"session_id": session_id, "type": event, "count": count}
+            for session_id, totals in items
+            for event, count in totals.types.items()
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            statement = dialect_insert(session, counts).values(
+                rows[start : start + UPSERT_CHUNK_SIZE]
+            )
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[counts.c.session_id, counts.c.type],
+                    set_={"count": counts.c.count + statement.excluded.count},
+                )
+            )
+        return len(pending)
+
+    def commit(self) -> None:
+        """
+        No mantiene cachés, por lo que no hay nada que incorporar; existe para
+        que el agregador se use igual que los demás de la ruta de escritura.
+        """
+
+    def rollback(self) -> None:
+        """
+        Descarta los totales acumulados.
+        """
+        with self._lock:
+            self._pending = {}
+
+
+def rebuild_aggregates(session: DatabaseSession, include_archived: bool = True) -> int:
+    """
+    Recalcula todos los agregados en la transacción de la sesión recibida,
+    sin confirmarla.
+
+    Los totales de las sesiones con interacciones en la base de datos se
+    calculan mediante una consulta agrupada por sesión y tipo; los de las
+    sesiones archivadas, que ya no tienen interacciones en la tabla, leyendo
+    sus archivos.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que escribir.
+    include_archived: bool
+        Si se recalculan también las sesiones archivadas. Si no, se conservan
+        sus totales guardados.
+
+    Returns:
+    ---------
+    int
+        Número de sesiones con agregados.
+    """
+    archived = select(ArchivedSession.session_id)
+    stats, counts = SessionStats.__table__, SessionEventCount.__table__
+    if include_archived:
+        session.execute(delete(stats))
+        session.execute(delete(counts))
+    else:
+        session.execute(delete(stats).where(stats.c.session_id.not_in(archived)))
+        session.execute(delete(counts).where(counts.c.session_id.not_in(archived)))
+
+    aggregate_interactions(session, Interaction.session_id.not_in(archived))
+
+    if include_archived:
+        # Importado aquí porque `database.archive` depende de las migraciones,
+        # que a su vez usan esta función
+        from .archive import open_session_archive
+
+        aggregator = SessionStatsAggregator()
+        for session_id in session.scalars(archived).all():
+            archive = open_session_archive(session, session_id)
+            if archive is None:
+                continue
+            aggregator.record(
+                InteractionRow(event.type, event.time, None, session_id)
+                for event in archive.events()
+            )
+            aggregator.flush(session)
+
+    update_session_counts(session)
+    return session.scalar(select(func.count()).select_from(stats)) or 0
+
+
+def aggregate_interactions(
+    session: DatabaseSession, condition: ColumnElement[bool]
+) -> None:
+    """
+    Inserta, sin confirmar la transacción, los totales de las sesiones de las
+    interacciones guardadas que cumplen la condición, que no deben tener ya
+    totales guardados.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que escribir.
+    condition: ColumnElement[bool]
+        Condición sobre `Interaction` de las interacciones a sumar.
+    """
+    session.execute(
+        insert(SessionEventCount.__table__).from_select(
+            ["session_id", "type", "count"],
+            select(Interaction.session_id, Interaction.type, func.count())
+            .where(condition)
+            .group_by(Interaction.session_id, Interaction.type),
+        )
+    )
+    session.execute(
+        insert(SessionStats.__table__).from_select(
+            ["session_id", "event_count", "first_event", "last_event"],
+            select(
+                Interaction.session_id,
+                func.count(),
+                func.min(Interaction.time),
+                func.max(Interaction.time),
+            )
+            .where(condition)
+            .group_by(Interaction.session_id),
+        )
+    )
+
+
+def rebuild_session_aggregates(session: DatabaseSession, session_id: str) -> None:
+    """
+    Recalcula, sin confirmar la transacción, los totales de una sesión a
+    partir de sus interacciones guardadas (por ejemplo, tras borrar parte de
+    ellas).
+    """
+    session.execute(
+        delete(SessionStats.__table__).where(SessionStats.session_id == session_id)
+    )
+    session.execute(
+        delete(SessionEventCount.__table__).where(
+            SessionEventCount.session_id == session_id
+        )
+    )
+    aggregate_interactions(session, Interaction.session_id == session_id)
+
+
+if __name__ == "__main__":
+    uri = sys.argv[1] if len(sys.argv) > 1 else os.environ.get(DATABASE_URI_ENV)
+    if uri is None:
+        sys.exit(
+            f"Usage: python -m database.aggregates URI (or set {DATABASE_URI_ENV})"
+        )
+
+    from .migrations import upgrade
+
+    engine = create_engine(uri)
+    Base.metadata.create_all(engine)
+    upgrade(engine)
+    with DatabaseSession(engine) as session:
+        sessions = rebuild_aggregates(session)
+        session.commit()
+    print(f"Rebuilt the aggregates of {sessions} sessions.")
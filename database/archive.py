@@ -0,0 +1,651 @@
+"""
+Archivo columnar de las sesiones terminadas.
+
+Las interacciones de una sesión terminada no vuelven a modificarse, por lo que
+pueden moverse de la tabla `Interactions` a un fichero compacto de solo
+lectura. El fichero se divide en segmentos de `SEGMENT_SIZE` eventos, cada uno
+comprimido por separado y con sus columnas contiguas:
+
+- momentos: microsegundos desde el evento anterior (enteros de 64 bits),
+- identificadores: diferencia con el identificador anterior,
+- tipos: índice en el diccionario de tipos del fichero,
+- detalles: JSON en el que cada cadena se sustituye por su índice (en base 36)
+  en la tabla de cadenas del fichero, de forma que las XPath, etiquetas y URL
+  repetidas se guardan una sola vez.
+
+Al final del fichero se guarda la cabecera (JSON comprimido con la sesión, los
+diccionarios y la posición y el rango de tiempo de cada segmento), seguida de
+su posición y de `MAGIC`. El fichero se lee mediante `mmap` y solo se
+descomprimen los segmentos que solapan con el intervalo pedido.
+
+Para archivar las sesiones terminadas de una base de datos:
+
+    python -m database.archive DIRECTORY [URI] [--min-age-hours H]
+"""
+
+import argparse
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterable, Iterator, cast
+
+from sqlalchemy import CursorResult, Engine, create_engine, delete, func, select
+from sqlalchemy.orm import Session as DatabaseSession
+
+from .base import DATABASE_URI_ENV, Base
+from .migrations import upgrade
+from .models import ArchivedSession, EventRecord, Interaction, Session
+from .strings import row_details, select_interactions
+
+MAGIC = b"WCARCH01"
+SEGMENT_SIZE = 4_096
+COMPRESSION_LEVEL = 6
+# Interacciones borradas por sentencia al podar la tabla
+PRUNE_BATCH_SIZE = 5_000
+# Segmentos descomprimidos que se mantienen en memoria por archivo
+DECODED_SEGMENTS = 8
+
+TRAILER = struct.Struct("<Q8s")
+SEGMENT_HEADER = struct.Struct("<I")
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class StringTable:
+    """
+    Tabla de cadenas internadas de un archivo.
+    """
+
+    def __init__(self) -> None:
+        self.strings: list[str] = []
+        self._ids: dict[str, int] = {}
+
+    def intern(self, value: Any) -> Any:
+        """
+        Sustituye recursivamente las cadenas de un valor JSON por su índice en
+        la tabla, codificado en base 36. Las claves de los objetos se
+        mantienen.
+        """
+        if isinstance(value, str):
+            index = self._ids.get(value)
+            if index is None:
+                index = self._ids[value] = len(self.strings)
+                self.strings.append(value)
+            return _base36(index)
+        if isinstance(value, dict):
+            return {key: self.intern(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.intern(item) for item in value]
+        return value
+
+
+def _base36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if not number:
+            return encoded
+
+
+def _resolve(value: Any, strings: list[str]) -> Any:
+    if isinstance(value, str):
+        return strings[int(value, 36)]
+    if isinstance(value, dict):
+        return {key: _resolve(item, strings) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, strings) for item in value]
+    return value
+
+
+class ArchiveWriter:
+    """
+    Escritor de un archivo de sesión. Los eventos deben añadirse en orden
+    cronológico (y por identificador dentro de un mismo momento).
+    """
+
+    def __init__(self, path: Path, session_id: str) -> None:
+        self.path = path
+        self.session_id = session_id
+        self.base_time: datetime | None = None
+        self.event_count = 0
+        self.types: dict[str, int] = {}
+        self.strings = StringTable()
+        self.segments: list[dict[str, int]] = []
+        self._file = open(path, "wb")
+        self._reset_segment()
+
+    def _reset_segment(self) -> None:
+        self._times = array("q")
+        self._ids = array("q")
+        self._types = array("I")
+        self._details: list[Any] = []
+        self._first_us = 0
+        self._last_us = 0
+        self._last_id = 0
+
+    def add(self, id: int, time: datetime, type: str, details: Any) -> None:
+        if self.base_time is None:
+            self.base_time = time
+        time_us = (time - self.base_time) // timedelta(microseconds=1)
+        if not self._times:
+            self._first_us = self._last_us = time_us
+            self._last_id = 0
+
+        self._times.append(time_us - self._last_us)
+        self._ids.append(id - self._last_id)
+        self._types.append(self.types.setdefault(type, len(self.types)))
+        self._details.append(self.strings.intern(details))
+        self._last_us, self._last_id = time_us, id
+        self.event_count += 1
+
+        if len(self._times) >= SEGMENT_SIZE:
+            self._write_segment()
+
+    def _write_segment(self) -> None:
+        if not self._times:
+            return
+        payload = b"".join(
+            (
+                SEGMENT_HEADER.pack(len(self._times)),
+                _little_endian(self._times),
+                _little_endian(self._ids),
+                _little_endian(self._types),
+                json.dumps(self._details, separators=(",", ":")).encode(),
+            )
+        )
+        data = zlib.compress(payload, COMPRESSION_LEVEL)
+        self.segments.append(
+            {
+                "offset": self._file.tell(),
+                "length": len(data),
+                "count": len(self._times),
+                "first_us": self._first_us,
+                "last_us": self._last_us,
+            }
+        )
+        self._file.write(data)
+        self._reset_segment()
+
+    def close(self) -> int:
+        """
+        Escribe el último segmento y la cabecera y sincroniza el fichero con
+        el disco.
+
+        Returns:
+        ---------
+        int
+            Tamaño del fichero en bytes.
+        """
+        self._write_segment()
+        header = {
+            "session_id": self.session_id,
+            "base_time": self.base_time.isoformat() if self.base_time else None,
+            "event_count": self.event_count,
+            "types": sorted(self.types, key=self.types.__getitem__),
+            "strings": self.strings.strings,
+            "segments": self.segments,
+        }
+        header_offset = self._file.tell()
+        self._file.write(zlib.compress(json.dumps(header).encode(), COMPRESSION_LEVEL))
+        self._file.write(TRAILER.pack(header_offset, MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return self.path.stat().st_size
+
+
+class SessionArchive:
+    """
+    Archivo de sesión abierto para lectura mediante `mmap`.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        """
+        Raises:
+        ---------
+        ValueError
+            Si el fichero no es un archivo de sesión válido.
+        """
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < TRAILER.size:
+            raise ValueError(f"Not a session archive: {path}")
+        header_offset, magic = TRAILER.unpack_from(
+            self._map, len(self._map) - TRAILER.size
+        )
+        if magic != MAGIC:
+            raise ValueError(f"Not a session archive: {path}")
+
+        header = json.loads(
+            zlib.decompress(self._map[header_offset : len(self._map) - TRAILER.size])
+        )
+        self.session_id: str = header["session_id"]
+        self.base_time = (
+            datetime.fromisoformat(header["base_time"]) if header["base_time"] else None
+        )
+        self.event_count: int = header["event_count"]
+        self.types: list[str] = header["types"]
+        self.strings: list[str] = header["strings"]
+        self.segments: list[dict[str, int]] = header["segments"]
+        # Los archivos abiertos se comparten entre los hilos de la aplicación
+        # (ver `open_archive`), por lo que el orden de la caché se protege con
+        # un cerrojo; la descompresión se hace fuera de él.
+        self._decoded: OrderedDict[int, list[EventRecord]] = OrderedDict()
+        self._lock = Lock()
+
+    def close(self) -> None:
+        self._map.close()
+
+    def _segment(self, index: int) -> list[EventRecord]:
+        with self._lock:
+            events = self._decoded.get(index)
+            if events is not None:
+                self._decoded.move_to_end(index)
+                return events
+
+        segment = self.segments[index]
+        payload = zlib.decompress(
+            self._map[segment["offset"] : segment["offset"] + segment["length"]]
+        )
+        (count,) = SEGMENT_HEADER.unpack_from(payload)
+        position = SEGMENT_HEADER.size
+        columns = []
+        for typecode in ("q", "q", "I"):
+            length = count * array(typecode).itemsize
+            columns.append(
+                _from_little_endian(typecode, payload[position : position + length])
+            )
+            position += length
+        times, ids, types = columns
+        details = json.loads(payload[position:])
+
+        # Solo hay segmentos si se escribió algún evento, y con él la base
+        assert self.base_time is not None
+        events = []
+        time_us = segment["first_us"] - times[0]
+        id = 0
+        for index_in_segment in range(count):
+            time_us += times[index_in_segment]
+            id += ids[index_in_segment]
+            events.append(
+                EventRecord(
+                    id,
+                    self.base_time + timedelta(microseconds=time_us),
+                    self.types[types[index_in_segment]],
+                    _resolve(details[index_in_segment], self.strings),
+                )
+            )
+
+        with self._lock:
+            self._decoded[index] = events
+            if len(self._decoded) > DECODED_SEGMENTS:
+                self._decoded.popitem(last=False)
+        return events
+
+    def events(
+        self,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        include_end: bool = False,
+    ) -> Iterator[EventRecord]:
+        """
+        Recorre en orden cronológico los eventos del archivo, descomprimiendo
+        solo los segmentos que solapan con el intervalo.
+
+        Parámetros:
+        ------------
+        start: datetime | None
+            Momento a partir del cual incluir eventos (inclusive).
+        end: datetime | None
+            Momento hasta el cual incluir eventos.
+        include_end: bool
+            Si se incluyen los eventos del momento `end`.
+        """
+        if self.base_time is None:
+            return
+        start_us = (
+            None
+            if start is None
+            else (start - self.base_time) // timedelta(microseconds=1)
+        )
+        end_us = (
+            None if end is None else (end - self.base_time) // timedelta(microseconds=1)
+        )
+
+        for index, segment in enumerate(self.segments):
+            if start_us is not None and segment["last_us"] < start_us:
+                continue
+            if end_us is not None and (
+                segment["first_us"] > end_us
+                or (segment["first_us"] == end_us and not include_end)
+            ):
+                break
+            for event in self._segment(index):
+                if start is not None and event.time < start:
+                    continue
+                if end is not None and (
+                    event.time > end or (event.time == end and not include_end)
+                ):
+                    return
+                yield event
+
+
+@lru_cache(maxsize=64)
+def open_archive(path: str) -> SessionArchive:
+    """
+    Abre un archivo de sesión, reutilizando los ya abiertos.
+    """
+    return SessionArchive(path)
+
+
+def open_session_archive(
+    session: DatabaseSession, session_id: str
+) -> SessionArchive | None:
+    """
+    Abre el archivo de una sesión, o devuelve `None` si no está archivada.
+    """
+    archived = session.get(ArchivedSession, session_id)
+    return None if archived is None else open_archive(archived.path)
+
+
+def archive_path(directory: Path, session_id: str) -> Path:
+    # Los identificadores de sesión los genera el cliente, por lo que no se
+    # usan directamente como nombre de fichero.
+    return directory / f"{sha256(session_id.encode()).hexdigest()[:32]}.wca"
+
+
+def write_archive(
+    path: Path, session_id: str, events: Iterable[EventRecord]
+) -> ArchiveWriter:
+    """
+    Escribe un archivo de sesión con los eventos recibidos, en orden
+    cronológico, y lo sustituye de forma atómica por el que hubiera en `path`.
+
+    Returns:
+    ---------
+    ArchiveWriter
+        Escritor ya cerrado, con el número de eventos escritos.
+    """
+    temporary = path.with_suffix(".tmp")
+    writer = ArchiveWriter(temporary, session_id)
+    try:
+        for event in events:
+            writer.add(*event)
+    finally:
+        writer.close()
+    os.replace(temporary, path)
+    return writer
+
+
+def archive_session(
+    session: DatabaseSession, session_id: str, directory: Path
+) -> ArchivedSession | None:
+    """
+    Archiva las interacciones de una sesión terminada y poda la tabla
+    `Interactions`.
+
+    El fichero se escribe y se sincroniza con el disco antes de registrarlo en
+    `archived_sessions`; desde ese momento las lecturas usan el archivo y las
+    interacciones se borran por lotes, confirmando cada uno para no bloquear
+    la escritura de las sesiones en grabación.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que operar.
+    session_id: str
+        Sesión a archivar.
+    directory: Path
+        Directorio de los archivos.
+
+    Returns:
+    ---------
+    ArchivedSession | None
+        Registro del archivo, o `None` si la sesión no existe o no ha
+        terminado.
+    """
+    recorded = session.get(Session, session_id)
+    if recorded is None or recorded.end_time is None:
+        return None
+
+    archived = session.get(ArchivedSession, session_id)
+    if archived is None:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = archive_path(directory, session_id)
+        rows = session.execute(
+            select_interactions(Interaction.id, Interaction.time, Interaction.type)
+            .where(Interaction.session_id == session_id)
+            .order_by(Interaction.time, Interaction.id)
+            .execution_options(yield_per=SEGMENT_SIZE)
+        )
+        writer = write_archive(
+            path,
+            session_id,
+            (EventRecord(row.id, row.time, row.type, row_details(row)) for row in rows),
+        )
+
+        archived = ArchivedSession(
+            session_id=session_id,
+            path=str(path.resolve()),
+            event_count=writer.event_count,
+            size=path.stat().st_size,
+            archived_at=datetime.now(timezone.utc).replace(tzinfo=None),
+        )
+        session.add(archived)
+        session.commit()
+
+    prune_session(session, session_id)
+    return archived
+
+
+def late_interactions(
+    session: DatabaseSession, archive: SessionArchive
+) -> list[EventRecord]:
+    """
+    Interacciones de una sesión archivada que siguen en la tabla
+    `Interactions` y no están en su archivo, por ejemplo porque llegaron tras
+    archivarla al retomarse la sesión. Las que sí están en el archivo son las
+    que quedaron sin podar si se interrumpió el proceso.
+    """
+    # Sin interacciones, el mínimo y el máximo son NULL
+    condition = Interaction.session_id == archive.session_id
+    first, last = cast(
+        tuple[datetime | None, datetime | None],
+        session.execute(
+            select(func.min(Interaction.time), func.max(Interaction.time)).where(
+                condition
+            )
+        ).one(),
+    )
+    if first is None:
+        return []
+
+    # Se comparan también los momentos, ya que algunas bases de datos pueden
+    # reutilizar los identificadores de las interacciones podadas
+    archived = {
+        (event.id, event.time)
+        for event in archive.events(first, last, include_end=True)
+    }
+    rows = session.execute(
+        select_interactions(Interaction.id, Interaction.time, Interaction.type)
+        .where(condition)
+        .order_by(Interaction.time, Interaction.id)
+        .execution_options(yield_per=SEGMENT_SIZE)
+    )
+    return [
+        EventRecord(row.id, row.time, row.type, row_details(row))
+        for row in rows
+        if (row.id, row.time) not in archived
+    ]
+
+
+def rearchive_session(
+    session: DatabaseSession, archived: ArchivedSession
+) -> ArchivedSession | None:
+    """
+    Añade al archivo de una sesión las interacciones que llegaron después de
+    archivarla, reescribiéndolo, y confirma la transacción.
+
+    Returns:
+    ---------
+    ArchivedSession | None
+        Registro del archivo actualizado, o `None` si no había interacciones
+        nuevas.
+    """
+    # Se abre aparte del archivo compartido por `open_archive`, que se sigue
+    # leyendo hasta que se sustituye
+    archive = SessionArchive(archived.path)
+    try:
+        late = late_interactions(session, archive)
+        if not late:
+            return None
+        writer = write_archive(
+            Path(archived.path),
+            archived.session_id,
+            heapq.merge(
+                archive.events(), late, key=lambda event: (event.time, event.id)
+            ),
+        )
+    finally:
+        archive.close()
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    archived.event_count = writer.event_count
+    archived.size = Path(archived.path).stat().st_size
+    archived.archived_at = now
+    recorded = session.get(Session, archived.session_id)
+    if recorded is not None:
+        recorded.modified_time = now
+    session.commit()
+    open_archive.cache_clear()
+    return archived
+
+
+def prune_session(session: DatabaseSession, session_id: str) -> int:
+    """
+    Borra por lotes las interacciones de una sesión archivada.
+
+    Returns:
+    ---------
+    int
+        Número de interacciones borradas.
+    """
+    deleted = 0
+    while True:
+        ids = (
+            select(Interaction.id)
+            .where(Interaction.session_id == session_id)
+            .limit(PRUNE_BATCH_SIZE)
+        )
+        result = cast(
+            CursorResult[Any],
+            session.execute(
+                delete(Interaction)
+                .where(Interaction.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            ),
+        )
+        session.commit()
+        deleted += result.rowcount
+        if result.rowcount < PRUNE_BATCH_SIZE:
+            return deleted
+
+
+def archive_ended_sessions(
+    session: DatabaseSession, directory: Path, min_age: timedelta = timedelta(0)
+) -> list[ArchivedSession]:
+    """
+    Archiva las sesiones terminadas hace al menos `min_age` que aún no lo
+    están. Las ya archivadas que conserven interacciones se podan (por
+    ejemplo, si se interrumpió el proceso), reescribiendo antes su archivo si
+    alguna no estaba en él, para no perder los eventos que lleguen tras
+    archivar una sesión que se retoma.
+
+    Returns:
+    ---------
+    list[ArchivedSession]
+        Sesiones archivadas o reescritas.
+    """
+    # Las horas se guardan en UTC sin zona horaria
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - min_age
+    pending = session.scalars(
+        select(Session.id)
+        .outerjoin(ArchivedSession, ArchivedSession.session_id == Session.id)
+        .where(
+            Session.end_time.is_not(None),
+            Session.end_time <= cutoff,
+            ArchivedSession.session_id.is_(None),
+        )
+    ).all()
+    archived = [
+        archive_session(session, session_id, directory) for session_id in pending
+    ]
+
+    for record in session.scalars(
+        select(ArchivedSession).where(
+            select(Interaction.id)
+            .where(Interaction.session_id == ArchivedSession.session_id)
+            .exists()
+        )
+    ).all():
+        archived.append(rearchive_session(session, record))
+        prune_session(session, record.session_id)
+    return [record for record in archived if record is not None]
+
+
+def archive_database(
+    engine: Engine, directory: Path, min_age: timedelta = timedelta(0)
+) -> list[ArchivedSession]:
+    with DatabaseSession(engine) as session:
+        return archive_ended_sessions(session, directory, min_age)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Archive the interactions of ended sessions"
+    )
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("uri", nargs="?", default=os.environ.get(DATABASE_URI_ENV))
+    parser.add_argument("--min-age-hours", type=float, default=0)
+    args = parser.parse_args()
+    if args.uri is None:
+        sys.exit(
+            f"Usage: python -m database.archive DIRECTORY URI (or set {DATABASE_URI_ENV})"
+        )
+
+    engine = create_engine(args.uri)
+    Base.metadata.create_all(engine)
+    upgrade(engine)
+    for record in archive_database(
+        engine, args.directory, timedelta(hours=args.min_age_hours)
+    ):
+        print(
+            f"Archived session {record.session_id}: {record.event_count} events, {record.size} bytes"
+        )
+    print("All ended sessions are archived.")
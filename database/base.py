@@ -1,8 +1,21 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
+from typing import TYPE_CHECKING, Any, ClassVar
+
+from sqlalchemy import Engine, Table, case, create_engine, event, make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 
+# Variable de entorno con la URI de la base de datos. Por defecto se usa un
+# fichero SQLite en la carpeta `instance` de la aplicación.
+DATABASE_URI_ENV = "WEBCHRONICLE_DATABASE_URI"
+DEFAULT_DATABASE_URI = "sqlite:///webchronicle.db"
+MEMORY_DATABASE_URI = "sqlite:///:memory:"
+
+# Dialectos admitidos: los upserts de los agregados (`dialect_insert`) y
+# algunas migraciones usan SQL específico de cada uno
+SUPPORTED_DIALECTS = ("sqlite", "postgresql")
+
 
 class Base(DeclarativeBase):
     pass
@@ -10,11 +23,173 @@ class Base(DeclarativeBase):
 
 db: SQLAlchemy = SQLAlchemy(model_class=Base)
 
+if TYPE_CHECKING:
+    from flask_sqlalchemy.model import Model as QueryModel
+
+    # `db.Model` se crea al instanciar la extensión, por lo que los
+    # analizadores estáticos no lo reconocen como clase base de los modelos.
+    class Model(Base, QueryModel):
+        __abstract__ = True
+        __table__: ClassVar[Table]
+
+else:
+    Model = db.Model
+
+
+def is_memory_database(uri: str) -> bool:
+    """
+    Indica si la URI corresponde a una base de datos SQLite en memoria.
+    """
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(
+    uri: str, busy_timeout_ms: int = 5000, pool_size: int = 10
+) -> dict[str, Any]:
+    """
+    Opciones del motor de SQLAlchemy adecuadas para la base de datos indicada,
+    teniendo en cuenta que escriben en ella tanto el hilo de ingesta como los
+    hilos que atienden las peticiones.
+
+    Parámetros:
+    ------------
+    uri: str
+        URI de la base de datos.
+    busy_timeout_ms: int
+        Tiempo máximo, en milisegundos, que una conexión de SQLite espera a que
+        se libere el bloqueo de escritura antes de fallar.
+    pool_size: int
+        Número de conexiones mantenidas abiertas en el pool.
 
-def initialize_database():
+    Returns:
+    ---------
+    dict[str, Any]
+        Opciones a pasar a `create_engine` (`SQLALCHEMY_ENGINE_OPTIONS`).
+    """
+    if is_memory_database(uri):
+        # Flask-SQLAlchemy ya comparte una única conexión entre todos los hilos
+        return {}
+
+    if make_url(uri).get_backend_name() == "sqlite":
+        return {
+            "pool_size": pool_size,
+            "connect_args": {
+                "timeout": busy_timeout_ms / 1000,
+                "check_same_thread": False,
+            },
+        }
+
+    return {
+        "pool_size": pool_size,
+        "max_overflow": 2 * pool_size,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+
+
+def configure_sqlite(
+    engine: Engine,
+    journal_mode: str = "WAL",
+    synchronous: str = "NORMAL",
+    busy_timeout_ms: int = 5000,
+    auto_vacuum: str = "INCREMENTAL",
+) -> None:
+    """
+    Configura cada nueva conexión de SQLite del motor. En modo WAL las lecturas
+    no bloquean al escritor y, con `synchronous=NORMAL`, solo se sincroniza el
+    disco en los checkpoints en lugar de en cada transacción. No tiene efecto
+    sobre otros motores de base de datos ni sobre bases de datos en memoria.
+
+    Parámetros:
+    ------------
+    engine: Engine
+        Motor a configurar, antes de abrir su primera conexión.
+    journal_mode: str
+        Modo del diario de SQLite ("WAL", "DELETE"...).
+    synchronous: str
+        Nivel de sincronización con el disco ("NORMAL", "FULL"...).
+    busy_timeout_ms: int
+        Tiempo máximo de espera por el bloqueo de escritura.
+    auto_vacuum: str
+        Modo de recuperación del espacio libre ("INCREMENTAL", "NONE"...).
+        Solo se aplica al crear la base de datos o al reescribirla con VACUUM
+        (ver `database.retention`).
+    """
+    if engine.dialect.name != "sqlite" or is_memory_database(str(engine.url)):
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA auto_vacuum={auto_vacuum}")
+        cursor.close()
+
+
+def check_dialect(engine: Engine) -> None:
+    """
+    Comprueba que la base de datos es de uno de los dialectos admitidos.
+
+    Raises:
+    ---------
+    NotImplementedError
+        Si el dialecto no está admitido.
+    """
+    dialect = engine.dialect.name
+    if dialect not in SUPPORTED_DIALECTS:
+        raise NotImplementedError(
+            f"Unsupported database '{dialect}': use one of "
+            f"{', '.join(SUPPORTED_DIALECTS)}"
+        )
+
+
+def dialect_insert(session: Session, table: Any) -> Any:
+    """
+    Sentencia INSERT del dialecto de la sesión, necesaria para los upserts
+    (`ON CONFLICT` es específico de cada dialecto).
+
+    Raises:
+    ---------
+    NotImplementedError
+        Si el dialecto no admite upserts.
+    """
+    match session.get_bind().dialect.name:
+        case "sqlite":
+            return sqlite.insert(table)
+        case "postgresql":
+            return postgresql.insert(table)
+        case dialect:
+            raise NotImplementedError(f"Upserts are not supported on '{dialect}'")
+
+
+def least(left: Any, right: Any) -> Any:
+    """
+    Menor de dos expresiones, para los upserts que acumulan mínimos (SQLite y
+    PostgreSQL no comparten el nombre de la función).
+    """
+    return case((right < left, right), else_=left)
+
+
+def greatest(left: Any, right: Any) -> Any:
+    """
+    Mayor de dos expresiones, para los upserts que acumulan máximos.
+    """
+    return case((right > left, right), else_=left)
+
+
+def initialize_database(uri: str = MEMORY_DATABASE_URI) -> None:
     """
     Inicializa la base de datos creando todas las tablas definidas en los modelos.
+
+    Parámetros:
+    ------------
+    uri: str
+        URI de la base de datos, en memoria por defecto.
     """
-    engine = create_engine("sqlite:///:memory:")
+    engine = create_engine(uri, **engine_options(uri))
+    configure_sqlite(engine)
     Base.metadata.create_all(bind=engine)
-    db.session = scoped_session(sessionmaker(bind=engine))
+    db.session = scoped_session(sessionmaker(bind=engine))  # type: ignore[arg-type]
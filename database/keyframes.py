@@ -0,0 +1,301 @@
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session as DatabaseSession
+
+from .archive import SessionArchive
+from .models import Interaction, InteractionRow, Keyframe
+from .strings import row_details, select_interactions
+from .timestamps import naive_utc
+
+# Filas que se leen de cada vez al reconstruir el estado desde la base de datos
+REPLAY_CHUNK_SIZE = 1_000
+
+
+def apply_event(state: dict[str, Any], event: str, details: Any) -> None:
+    """
+    Aplica un evento al estado de la reproducción: la pestaña activa (posición
+    del cambio de pestaña en la sesión y su URL), el desplazamiento y el tamaño
+    de la ventana. El resto de eventos no modifican el estado.
+
+    Parámetros:
+    ------------
+    state: dict[str, Any]
+        Estado a actualizar.
+    event: str
+        Tipo del evento.
+    details: Any
+        Detalles del evento.
+    """
+    if not isinstance(details, dict):
+        return
+
+    match event:
+        case "tab_created" | "tab_updated":
+            state["tab"] = state.get("tab", -1) + 1
+            state["url"] = details.get("url")
+        case "scroll":
+            state["scroll"] = {"x": details.get("x"), "y": details.get("y")}
+        case "resize":
+            state["window"] = {
+                "width": details.get("width"),
+                "height": details.get("height"),
+            }
+
+
+def load_state(
+    session: DatabaseSession,
+    session_id: str,
+    until: datetime | None = None,
+    archive: SessionArchive | None = None,
+) -> tuple[Keyframe | None, int, datetime | None, dict[str, Any]]:
+    """
+    Reconstruye el estado de la reproducción de una sesión a partir del último
+    fotograma clave y los eventos posteriores.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que consultar.
+    session_id: str
+        Sesión grabada cuyo estado se reconstruye.
+    until: datetime | None
+        Momento hasta el que aplicar eventos (inclusive), o `None` para
+        aplicarlos todos.
+    archive: SessionArchive | None
+        Archivo de la sesión, si está archivada, del que leer los eventos.
+
+    Returns:
+    ---------
+    tuple[Keyframe | None, int, datetime | None, dict[str, Any]]
+        Fotograma clave de partida, número de eventos aplicados sobre él,
+        momento del último evento aplicado y estado resultante.
+    """
+    keyframe_query = select(Keyframe).where(Keyframe.session_id == session_id)
+    events_query = (
+        select_interactions(Interaction.time, Interaction.type)
+        .where(Interaction.session_id == session_id)
+        .order_by(Interaction.time, Interaction.id)
+        .execution_options(yield_per=REPLAY_CHUNK_SIZE)
+    )
+    if until is not None:
+        keyframe_query = keyframe_query.where(Keyframe.time <= until)
+        events_query = events_query.where(Interaction.time <= until)
+
+    keyframe = session.execute(
+        keyframe_query.order_by(
+            Keyframe.time.desc(), Keyframe.event_offset.desc()
+        ).limit(1)
+    ).scalar()
+    state: dict[str, Any] = {}
+    last_time = None
+    if keyframe is not None:
+        state = dict(keyframe.state)
+        events_query = events_query.where(Interaction.time >= keyframe.time)
+
+    if archive is not None:
+        events: Any = (
+            (event.time, event.type, event.details)
+            for event in archive.events(
+                keyframe.time if keyframe is not None else None, until, include_end=True
+            )
+        )
+    else:
+        events = (
+            (row.time, row.type, row_details(row))
+            for row in session.execute(events_query)
+        )
+
+    applied = 0
+    for time, event, details in events:
+        apply_event(state, event, details)
+        last_time = time
+        applied += 1
+    return keyframe, applied, last_time, state
+
+
+class SessionProgress:
+    """
+    Estado de la reproducción de una sesión que se está grabando.
+
+    Atributos:
+    ------------
+    state: dict[str, Any]
+        Estado tras aplicar todos los eventos recibidos.
+    events: int
+        Número de eventos recibidos.
+    last_time: datetime | None
+        Momento del último evento recibido.
+    keyframe_offset: int
+        Número de eventos anteriores al último fotograma clave.
+    keyframe_time: datetime | None
+        Momento del último fotograma clave, o del primer evento si aún no hay
+        ninguno.
+    """
+
+    __slots__ = ("state", "events", "last_time", "keyframe_offset", "keyframe_time")
+
+    def __init__(self) -> None:
+        self.state: dict[str, Any] = {}
+        self.events = 0
+        self.last_time: datetime | None = None
+        self.keyframe_offset = 0
+        self.keyframe_time: datetime | None = None
+
+
+class KeyframeBuilder:
+    """
+    Constructor incremental de los fotogramas clave de reproducción.
+
+    Mantiene en memoria el estado de la reproducción de cada sesión que se está
+    grabando y, a medida que se escriben sus interacciones, genera un
+    fotograma clave cada `every_events` eventos o `every_ms` milisegundos. Un
+    fotograma clave con momento `t` contiene el estado tras aplicar todos los
+    eventos anteriores a `t`, de forma que para saltar a cualquier punto basta
+    con aplicarle los eventos desde `t`. Se asume que los eventos de una sesión
+    se reciben en orden cronológico, como los envía la extensión.
+
+    Igual que `SiteVisitAggregator`, los fotogramas se escriben en la
+    transacción del lote (`flush`) y se descartan si se deshace (`rollback`);
+    en ese caso el estado de las sesiones afectadas se reconstruye desde la
+    base de datos la próxima vez que se reciban sus eventos.
+    """
+
+    def __init__(self, every_events: int = 500, every_ms: int = 30_000) -> None:
+        """
+        Parámetros:
+        ------------
+        every_events: int
+            Número máximo de eventos entre dos fotogramas clave.
+        every_ms: int
+            Tiempo máximo, en milisegundos, entre dos fotogramas clave.
+        """
+        self.every_events = every_events
+        self.every = timedelta(milliseconds=every_ms)
+        self._lock = Lock()
+        self._sessions: dict[str, SessionProgress] = {}
+        self._pending: list[dict[str, Any]] = []
+        self._touched: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, session: DatabaseSession, rows: list[InteractionRow]) -> None:
+        """
+        Aplica al estado de sus sesiones las interacciones que se van a
+        escribir, generando los fotogramas clave que correspondan. Debe
+        llamarse antes de insertarlas, ya que el estado de una sesión que no
+        está en memoria se reconstruye desde la base de datos.
+
+        Parámetros:
+        ------------
+        session: DatabaseSession
+            Sesión de SQLAlchemy de la transacción del lote.
+        rows: list[InteractionRow]
+            Interacciones a escribir.
+        """
+        with self._lock:
+            for row in rows:
+                if row.time is None:
+                    continue
+                # Las fechas se guardan en UTC sin zona horaria
+                time = naive_utc(row.time)
+                progress = self._sessions.get(row.session_id)
+                if progress is None:
+                    progress = self._sessions[row.session_id] = self._load(
+                        session, row.session_id
+                    )
+                self._touched.add(row.session_id)
+
+                if progress.keyframe_time is None:
+                    progress.keyframe_time = time
+                # Solo se genera un fotograma clave entre eventos de distinto
+                # momento, para que contenga todos los anteriores a él.
+                elif (
+                    progress.last_time is not None
+                    and time > progress.last_time
+                    and (
+                        progress.events - progress.keyframe_offset >= self.every_events
+                        or time - progress.keyframe_time >= self.every
+                    )
+                ):
+                    self._pending.append(
+                        {
+                            "session_id": row.session_id,
+                            "event_offset": progress.events,
+                            "time": time,
+                            "state": dict(progress.state),
+                        }
+                    )
+                    progress.keyframe_offset = progress.events
+                    progress.keyframe_time = time
+
+                apply_event(progress.state, row.type, row.details)
+                progress.events += 1
+                progress.last_time = time
+
+    def flush(self, session: DatabaseSession) -> int:
+        """
+        Escribe los fotogramas clave generados en la transacción de la sesión
+        recibida, sin confirmarla.
+
+        Returns:
+        ---------
+        int
+            Número de fotogramas clave escritos.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            session.execute(insert(Keyframe), pending)
+        return len(pending)
+
+    def commit(self) -> None:
+        """
+        Confirma el estado de las sesiones actualizadas en la transacción.
+        """
+        with self._lock:
+            self._touched = set()
+
+    def rollback(self) -> None:
+        """
+        Descarta los fotogramas pendientes y el estado de las sesiones
+        actualizadas en la transacción que se acaba de deshacer.
+        """
+        with self._lock:
+            for session_id in self._touched:
+                self._sessions.pop(session_id, None)
+            self._pending, self._touched = [], set()
+
+    def forget_session(self, session_id: str) -> None:
+        """
+        Libera el estado de una sesión que ha terminado.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    @staticmethod
+    def _load(session: DatabaseSession, session_id: str) -> SessionProgress:
+        progress = SessionProgress()
+        keyframe, applied, last_time, progress.state = load_state(session, session_id)
+        progress.events = applied
+        progress.last_time = last_time
+        if keyframe is not None:
+            progress.events += keyframe.event_offset
+            progress.keyframe_offset = keyframe.event_offset
+            progress.keyframe_time = keyframe.time
+            progress.last_time = last_time or keyframe.time
+        else:
+            progress.keyframe_time = (
+                None
+                if last_time is None
+                else session.execute(
+                    select(Interaction.time)
+                    .where(Interaction.session_id == session_id)
+                    .order_by(Interaction.time)
+                    .limit(1)
+                ).scalar()
+            )
+        return progress
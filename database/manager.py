@@ -1,8 +1,13 @@
-from typing import Self
+from typing import Self, Sequence
 
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import scoped_session
 
+from .base import check_dialect
+from .migrations import upgrade
+from .models import Interaction, InteractionRow
+from .strings import StringInterner, interaction_values
+
 
 class DatabaseManager:
     _instance = None
@@ -10,10 +15,19 @@ class DatabaseManager:
     def __new__(cls, db: SQLAlchemy) -> Self:
         """
         Singleton que permite la gestión de la base de datos.
+
+        Raises:
+        ---------
+        NotImplementedError
+            Si la base de datos no es de un dialecto admitido.
         """
         if cls._instance is None:
+            # Se comprueba antes de crear nada, ya que las escrituras fallarían
+            # después con la base de datos a medio crear
+            check_dialect(db.engine)
             cls._instance = super().__new__(cls)
             db.create_all()
+            upgrade(db.engine)
         return cls._instance
 
     def get_session(self, db: SQLAlchemy) -> scoped_session:
@@ -22,3 +36,38 @@ class DatabaseManager:
         datos.
         """
         return db.session
+
+    def bulk_insert_interactions(
+        self,
+        db: SQLAlchemy,
+        rows: Sequence[InteractionRow],
+        strings: StringInterner | None = None,
+    ) -> int:
+        """
+        Inserta un lote de interacciones mediante una única sentencia INSERT
+        de Core ejecutada con `executemany`, sin pasar por la unidad de
+        trabajo ni el mapa de identidades del ORM. No confirma la transacción.
+
+        Parámetros:
+        ------------
+        db: SQLAlchemy
+            Instancia de la base de datos sobre la que insertar.
+        rows: Sequence[InteractionRow]
+            Interacciones a insertar.
+        strings: StringInterner | None
+            Caché de cadenas internadas. Si se indica, los detalles de los
+            eventos habituales se guardan normalizados.
+
+        Returns:
+        ---------
+        int
+            Número de interacciones insertadas.
+        """
+        if not rows:
+            return 0
+
+        db.session.execute(
+            Interaction.__table__.insert(),
+            interaction_values(db.session(), rows, strings),
+        )
+        return len(rows)
@@ -0,0 +1,319 @@
+"""
+Migraciones del esquema de la base de datos.
+
+`db.create_all()` crea las tablas que faltan, pero no modifica las existentes,
+por lo que los cambios sobre tablas ya creadas (nuevos índices, columnas...) se
+aplican mediante migraciones numeradas. La versión aplicada se guarda en la
+tabla `schema_version`.
+
+Las migraciones deben poder ejecutarse también sobre una base de datos recién
+creada por `create_all`, que ya tiene el esquema actual.
+
+La aplicación aplica las migraciones pendientes al arrancar. Para migrar otra
+base de datos (las rutas relativas de SQLite lo son al directorio actual):
+
+    python -m database.migrations [URI]
+"""
+
+import os
+import sys
+from typing import Callable, Iterable, NamedTuple
+
+from sqlalchemy import (
+    Column,
+    Connection,
+    Engine,
+    Integer,
+    MetaData,
+    Table,
+    create_engine,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.orm import Session as DatabaseSession
+from sqlalchemy.schema import CreateColumn
+
+from .aggregates import rebuild_aggregates
+from .base import DATABASE_URI_ENV, Base
+from .models import (
+    ArchivedSession,
+    Interaction,
+    InternedString,
+    Keyframe,
+    SearchPosting,
+    Session,
+    SessionEventCount,
+    SessionStats,
+    VisitedSite,
+)
+from .search_index import rebuild_search_index
+
+schema_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    schema_metadata,
+    Column("version", Integer, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    """
+    Migración del esquema.
+
+    Atributos:
+    ------------
+    version: int
+        Versión del esquema tras aplicar la migración.
+    description: str
+        Descripción breve del cambio.
+    apply: Callable[[Connection], None]
+        Función que aplica el cambio dentro de la transacción recibida.
+    """
+
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def add_missing_columns(connection: Connection, table: Table) -> None:
+    """
+    Añade a una tabla existente las columnas del modelo que le falten.
+    """
+    existing = {
+        column["name"] for column in inspect(connection).get_columns(table.name)
+    }
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        definition = str(CreateColumn(column).compile(dialect=connection.dialect))
+        for foreign_key in column.foreign_keys:
+            definition = f'{definition} REFERENCES "{foreign_key.column.table.name}" ({foreign_key.column.name})'
+        connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {definition}'))
+
+
+# Índices que crea la migración 1. No se obtienen de los modelos porque los
+# índices añadidos después pueden usar columnas que aún no existen en la
+# versión 1 del esquema (por ejemplo, `path_id`, que añade la migración 4)
+QUERY_INDEXES = (
+    ("ix_interactions_session_time", "Interactions", ("session_id", "time")),
+    ("ix_sessions_start_time", "Sessions", ("start_time",)),
+    ("ix_visited_sites_visit_count", "visited_sites", ("visit_count",)),
+    ("ix_site_sessions_session_id", "site_sessions", ("session_id",)),
+)
+
+
+def create_indexes(
+    connection: Connection, indexes: Iterable[tuple[str, str, tuple[str, ...]]]
+) -> None:
+    for name, table, columns in indexes:
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        connection.execute(
+            text(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({quoted})')
+        )
+
+
+def add_query_indexes(connection: Connection) -> None:
+    create_indexes(connection, QUERY_INDEXES)
+
+
+def add_keyframes(connection: Connection) -> None:
+    Keyframe.__table__.create(connection, checkfirst=True)
+
+
+def add_archived_sessions(connection: Connection) -> None:
+    ArchivedSession.__table__.create(connection, checkfirst=True)
+
+
+def add_normalized_details(connection: Connection) -> None:
+    InternedString.__table__.create(connection, checkfirst=True)
+
+    # Las filas existentes conservan sus detalles en JSON, que se siguen
+    # leyendo correctamente, por lo que basta con añadir las columnas vacías
+    add_missing_columns(connection, Interaction.__table__)
+    create_indexes(
+        connection,
+        [
+            ("ix_interactions_path", "Interactions", ("path_id",)),
+            ("ix_interactions_url", "Interactions", ("url_id",)),
+        ],
+    )
+
+
+def add_aggregates(connection: Connection) -> None:
+    SessionStats.__table__.create(connection, checkfirst=True)
+    SessionEventCount.__table__.create(connection, checkfirst=True)
+    add_missing_columns(connection, VisitedSite.__table__)
+
+    # Los totales de las sesiones ya archivadas requieren leer sus archivos,
+    # por lo que se recalculan aparte con `python -m database.aggregates`
+    with DatabaseSession(bind=connection) as session:
+        rebuild_aggregates(session, include_archived=False)
+
+
+# Columnas `EpochMicroseconds`, antes `DateTime`, que convierte cada migración.
+# Igual que los índices de la migración 1, no se obtienen de los modelos para
+# que cada migración convierta solo las columnas que existen en su versión.
+INTERACTION_TIMESTAMPS = (
+    ("Interactions", "time"),
+    ("keyframes", "time"),
+    ("session_stats", "first_event"),
+    ("session_stats", "last_event"),
+)
+SESSION_TIMESTAMPS = (
+    ("Sessions", "start_time"),
+    ("Sessions", "end_time"),
+    ("visited_sites", "first_visit"),
+    ("visited_sites", "last_visit"),
+    ("archived_sessions", "archived_at"),
+)
+
+
+def convert_timestamps(
+    connection: Connection, columns: Iterable[tuple[str, str]]
+) -> None:
+    """
+    Convierte las fechas de las columnas indicadas a microsegundos desde 1970.
+    Las columnas conservan su nombre, por lo que sus índices siguen sirviendo.
+    """
+    dialect = connection.dialect.name
+    for table, name in columns:
+        if dialect == "sqlite":
+            # SQLite guarda las fechas como texto "AAAA-MM-DD HH:MM:SS.ffffff" y
+            # acepta enteros en cualquier columna, por lo que basta con
+            # convertir los valores que sigan siendo texto
+            connection.execute(
+                text(
+                    f'UPDATE "{table}" SET "{name}" = '
+                    f"CAST(strftime('%s', \"{name}\") AS INTEGER) * 1000000 "
+                    f'+ CAST(substr("{name}", 21, 6) AS INTEGER) '
+                    f"WHERE typeof(\"{name}\") = 'text'"
+                )
+            )
+        elif dialect == "postgresql":
+            types = {
+                info["name"]: info["type"]
+                for info in inspect(connection).get_columns(table)
+            }
+            if not isinstance(types[name], Integer):
+                connection.execute(
+                    text(
+                        f'ALTER TABLE "{table}" ALTER COLUMN "{name}" TYPE BIGINT '
+                        f'USING CAST(EXTRACT(EPOCH FROM "{name}") * 1000000 AS BIGINT)'
+                    )
+                )
+        else:
+            raise NotImplementedError(
+                f"Timestamp conversion is not supported for {dialect}"
+            )
+
+
+def integer_timestamps(connection: Connection) -> None:
+    convert_timestamps(connection, INTERACTION_TIMESTAMPS)
+
+
+def integer_session_timestamps(connection: Connection) -> None:
+    convert_timestamps(connection, SESSION_TIMESTAMPS)
+
+
+def null_empty_details(connection: Connection) -> None:
+    # Los detalles vacíos se guardaban como el JSON 'null' en lugar de NULL
+    connection.execute(
+        text(
+            'UPDATE "Interactions" SET details = NULL '
+            "WHERE CAST(details AS TEXT) = 'null'"
+        )
+    )
+
+
+def add_session_modified_time(connection: Connection) -> None:
+    add_missing_columns(connection, Session.__table__)
+
+
+def add_search_index(connection: Connection) -> None:
+    SearchPosting.__table__.create(connection, checkfirst=True)
+
+    # Igual que los agregados, las entradas de las sesiones archivadas se
+    # calculan aparte con `python -m database.search_index`
+    with DatabaseSession(bind=connection) as session:
+        rebuild_search_index(session, include_archived=False)
+
+
+MIGRATIONS = [
+    Migration(1, "Indexes for the event, session and site listings", add_query_indexes),
+    Migration(2, "Replay keyframes table", add_keyframes),
+    Migration(3, "Archived sessions table", add_archived_sessions),
+    Migration(
+        4, "Interned strings and normalised interaction details", add_normalized_details
+    ),
+    Migration(5, "Session and site aggregates", add_aggregates),
+    Migration(6, "Integer epoch-microsecond timestamps", integer_timestamps),
+    Migration(7, "Cross-session search index", add_search_index),
+    Migration(
+        8,
+        "Integer epoch-microsecond session and site times",
+        integer_session_timestamps,
+    ),
+    Migration(9, "SQL NULL for empty interaction details", null_empty_details),
+    Migration(10, "Session modification time", add_session_modified_time),
+]
+
+
+def current_version(connection: Connection) -> int:
+    """
+    Versión del esquema de la base de datos, 0 si nunca se ha migrado.
+    """
+    schema_version.create(connection, checkfirst=True)
+    version = connection.execute(select(schema_version.c.version)).scalar()
+    return version or 0
+
+
+def upgrade(engine: Engine) -> list[Migration]:
+    """
+    Aplica, en orden y cada una en su propia transacción, las migraciones
+    pendientes.
+
+    Parámetros:
+    ------------
+    engine: Engine
+        Motor de la base de datos a migrar.
+
+    Returns:
+    ---------
+    list[Migration]
+        Migraciones aplicadas.
+    """
+    applied = []
+    for migration in MIGRATIONS:
+        with engine.begin() as connection:
+            version = current_version(connection)
+            if migration.version <= version:
+                continue
+
+            migration.apply(connection)
+            if version == 0:
+                connection.execute(
+                    schema_version.insert().values(version=migration.version)
+                )
+            else:
+                connection.execute(
+                    schema_version.update().values(version=migration.version)
+                )
+        applied.append(migration)
+    return applied
+
+
+if __name__ == "__main__":
+    uri = sys.argv[1] if len(sys.argv) > 1 else os.environ.get(DATABASE_URI_ENV)
+    if uri is None:
+        sys.exit(
+            f"Usage: python -m database.migrations URI (or set {DATABASE_URI_ENV})"
+        )
+
+    # Igual que al arrancar la aplicación, se crean antes las tablas que falten
+    engine = create_engine(uri)
+    Base.metadata.create_all(engine)
+    for migration in upgrade(engine):
+        print(f"Applied migration {migration.version}: {migration.description}")
+    print("Database schema is up to date.")
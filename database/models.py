@@ -1,8 +1,26 @@
-from typing import Any, Generator
-from sqlalchemy import JSON, Column, Integer, String, DateTime, ForeignKey, Table
-from sqlalchemy.orm import relationship
+from typing import Any, Generator, NamedTuple, Optional
+from sqlalchemy import (
+    JSON,
+    Column,
+    Integer,
+    String,
+    ForeignKey,
+    Index,
+    Table,
+    func,
+    select,
+)
+from sqlalchemy.orm import (
+    DynamicMapped,
+    Mapped,
+    column_property,
+    mapped_column,
+    relationship,
+)
 from datetime import datetime
-from .base import db
+from .base import Model, db
+from .normalized import VALUE_COLUMNS, denormalize_details, normalize_details
+from .timestamps import EpochMicroseconds
 
 
 # Tabla de asociación para la relación muchos a muchos entre sitios y sesiones
@@ -11,24 +29,33 @@ site_sessions = Table(
     db.Model.metadata,
     Column("site_id", Integer, ForeignKey("visited_sites.id"), primary_key=True),
     Column("session_id", String, ForeignKey("Sessions.id"), primary_key=True),
+    # La clave primaria ya cubre las búsquedas por sitio; este índice cubre
+    # las búsquedas de los sitios de una sesión.
+    Index("ix_site_sessions_session_id", "session_id"),
 )
 
 
-class VisitedSite(db.Model):
+class VisitedSite(Model):
     """
     Modelo para almacenar información sobre los sitios visitados y su frecuencia.
     """
 
     __tablename__ = "visited_sites"
+    __table_args__ = (Index("ix_visited_sites_visit_count", "visit_count"),)
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    url = Column(String, nullable=False, unique=True)
-    visit_count = Column(Integer, default=1, nullable=False)
-    first_visit = Column(DateTime, nullable=False)
-    last_visit = Column(DateTime, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    url: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    visit_count: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+    # Número de sesiones distintas que han visitado el sitio, mantenido al
+    # insertar las relaciones de `site_sessions`
+    session_count: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    first_visit: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+    last_visit: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
 
     # Relación muchos a muchos con sesiones
-    sessions = relationship(
+    sessions: Mapped[list["Session"]] = relationship(
         "Session", secondary=site_sessions, back_populates="visited_sites"
     )
 
@@ -36,25 +63,58 @@ class VisitedSite(db.Model):
         return f"<VisitedSite(id={self.id}, url={self.url}, visits={self.visit_count})>"
 
 
-class Session(db.Model):
+class Session(Model):
     __tablename__ = "Sessions"
+    __table_args__ = (Index("ix_sessions_start_time", "start_time"),)
 
-    id = Column(String, primary_key=True)
-    start_time = Column(DateTime, nullable=False)
-    end_time = Column(DateTime, nullable=True)
-    window_width = Column(Integer, nullable=True)
-    window_height = Column(Integer, nullable=True)
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    start_time: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+    end_time: Mapped[Optional[datetime]] = mapped_column(
+        EpochMicroseconds, nullable=True
+    )
+    window_width: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    window_height: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Último cambio de las interacciones de la sesión ajeno a la grabación (al
+    # recortarla la retención o al añadir a su archivo interacciones tardías),
+    # del que depende la validación de las respuestas en caché
+    modified_time: Mapped[Optional[datetime]] = mapped_column(
+        EpochMicroseconds, nullable=True
+    )
 
-    # Relación uno a muchos con interacciones
-    interactions = relationship("Interaction", back_populates="session")
+    # Relación uno a muchos con interacciones. Una sesión puede tener millones,
+    # por lo que la colección nunca se carga entera: se consulta al recorrerla.
+    interactions: DynamicMapped["Interaction"] = relationship(
+        "Interaction",
+        back_populates="session",
+        lazy="dynamic",
+        order_by="(Interaction.time, Interaction.id)",
+    )
 
     # Nueva relación muchos a muchos con sitios visitados
-    visited_sites = relationship(
+    visited_sites: Mapped[list["VisitedSite"]] = relationship(
         "VisitedSite", secondary=site_sessions, back_populates="sessions"
     )
 
+    # Número de sitios visitados, calculado con una subconsulta solo si se pide
+    # mediante `undefer` para no cargar la colección
+    site_count = column_property(
+        select(func.count())
+        .where(site_sessions.c.session_id == id)
+        .correlate_except(site_sessions)
+        .scalar_subquery(),
+        deferred=True,
+    )
+
+    # Agregados de las interacciones de la sesión (ver `database.aggregates`)
+    stats: Mapped[Optional["SessionStats"]] = relationship(
+        "SessionStats", uselist=False, viewonly=True
+    )
+    event_counts: Mapped[list["SessionEventCount"]] = relationship(
+        "SessionEventCount", viewonly=True, order_by="SessionEventCount.count.desc()"
+    )
+
     def register_user_interaction(
-        self, eventType: str, eventDetails: JSON
+        self, eventType: str, eventDetails: Any
     ) -> "Interaction":
         """
         Registra una interacción de un usuario en una web en la sesión actual.
@@ -137,16 +197,235 @@ class Session(db.Model):
         return f"<Session(id={self.id}, start_time={self.start_time}, end_time={self.end_time})>"
 
 
-class Interaction(db.Model):
+class InternedString(Model):
+    """
+    Cadena repetida por muchas interacciones (XPath, etiqueta o URL), guardada
+    una sola vez y referenciada por su id.
+    """
+
+    __tablename__ = "strings"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    value: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+
+    def __repr__(self) -> str:
+        return f"<InternedString(id={self.id}, value={self.value})>"
+
+
+class Interaction(Model):
     __tablename__ = "Interactions"
+    # Las interacciones siempre se consultan por sesión y en orden cronológico;
+    # los índices por elemento y URL permiten los análisis entre sesiones.
+    __table_args__ = (
+        Index("ix_interactions_session_time", "session_id", "time"),
+        Index("ix_interactions_path", "path_id"),
+        Index("ix_interactions_url", "url_id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    type: Mapped[str] = mapped_column(String, nullable=False)
+    # Microsegundos desde 1970 en UTC (ver `database.timestamps`)
+    time: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("Sessions.id"), nullable=False
+    )
+
+    # Los campos de los eventos habituales se guardan normalizados (ver
+    # `database.normalized`); la columna `details` solo conserva el resto.
+    # `none_as_null` guarda `None` como NULL de SQL y no como el JSON 'null',
+    # de forma que los filtros `IS NULL` distinguen las filas sin detalles
+    raw_details: Mapped[Any] = mapped_column(
+        "details", JSON(none_as_null=True), nullable=True
+    )
+    x: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    y: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    width: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    height: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    key: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    modifiers: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    tab_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    path_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("strings.id"), nullable=True
+    )
+    target_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("strings.id"), nullable=True
+    )
+    url_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("strings.id"), nullable=True
+    )
+
+    session: Mapped["Session"] = relationship("Session", back_populates="interactions")
+    path: Mapped[Optional[InternedString]] = relationship(
+        InternedString, foreign_keys=[path_id], lazy="joined"
+    )
+    target: Mapped[Optional[InternedString]] = relationship(
+        InternedString, foreign_keys=[target_id], lazy="joined"
+    )
+    url: Mapped[Optional[InternedString]] = relationship(
+        InternedString, foreign_keys=[url_id], lazy="joined"
+    )
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    type = Column(String, nullable=False)
-    details = Column(JSON, nullable=True)
-    time = Column(DateTime, nullable=False)
-    session_id = Column(String, ForeignKey("Sessions.id"), nullable=False)
+    @property
+    def details(self) -> Any:
+        """
+        Detalles de la interacción, reconstruidos a partir de las columnas
+        normalizadas.
+        """
+        values = {column: getattr(self, column) for column in VALUE_COLUMNS}
+        strings = {
+            field: string.value if string is not None else None
+            for field, string in (
+                ("path", self.path),
+                ("target", self.target),
+                ("url", self.url),
+            )
+        }
+        return denormalize_details(self.type, values, strings, self.raw_details)
 
-    session = relationship("Session", back_populates="interactions")
+    @details.setter
+    def details(self, details: Any) -> None:
+        # Las interacciones creadas mediante el ORM no internan cadenas, por lo
+        # que los campos de texto se mantienen en el JSON.
+        values, strings, rest = normalize_details(self.type, details)
+        if strings:
+            values, rest = dict.fromkeys(VALUE_COLUMNS), details
+        for column, value in values.items():
+            setattr(self, column, value)
+        self.path = self.target = self.url = None
+        self.raw_details = rest
 
     def __repr__(self) -> str:
         return f"<Interaction(id={self.id}, type={self.type}, details={self.details}, time={self.time})"
+
+
+class Keyframe(Model):
+    """
+    Estado completo de la reproducción de una sesión en un momento dado, que
+    permite saltar a cualquier punto aplicando solo los eventos posteriores.
+    """
+
+    __tablename__ = "keyframes"
+    __table_args__ = (Index("ix_keyframes_session_time", "session_id", "time"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("Sessions.id"), nullable=False
+    )
+    # Número de eventos de la sesión anteriores al fotograma clave
+    event_offset: Mapped[int] = mapped_column(Integer, nullable=False)
+    # El estado incluye los eventos anteriores a este momento
+    time: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+    state: Mapped[Any] = mapped_column(JSON, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<Keyframe(session_id={self.session_id}, event_offset={self.event_offset}, time={self.time})>"
+
+
+class ArchivedSession(Model):
+    """
+    Sesión terminada cuyas interacciones se han movido de la tabla
+    `Interactions` a un archivo columnar comprimido (ver `database.archive`).
+    """
+
+    __tablename__ = "archived_sessions"
+
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("Sessions.id"), primary_key=True
+    )
+    path: Mapped[str] = mapped_column(String, nullable=False)
+    event_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ArchivedSession(session_id={self.session_id}, events={self.event_count}, size={self.size})>"
+
+
+class SessionStats(Model):
+    """
+    Totales de las interacciones de una sesión, mantenidos de forma
+    incremental por la ruta de escritura.
+    """
+
+    __tablename__ = "session_stats"
+
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("Sessions.id"), primary_key=True
+    )
+    event_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_event: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+    last_event: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+
+    def __repr__(self) -> str:
+        return (
+            f"<SessionStats(session_id={self.session_id}, events={self.event_count})>"
+        )
+
+
+class SessionEventCount(Model):
+    """
+    Número de interacciones de cada tipo de una sesión.
+    """
+
+    __tablename__ = "session_event_counts"
+
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("Sessions.id"), primary_key=True
+    )
+    type: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<SessionEventCount(session_id={self.session_id}, type={self.type}, count={self.count})>"
+
+
+class SearchPosting(Model):
+    """
+    Interacciones de una sesión con un término del índice de búsqueda: un tipo
+    de evento, una XPath, una etiqueta o una URL (ver `database.search_index`).
+    """
+
+    __tablename__ = "search_postings"
+    # La clave primaria resuelve las búsquedas por término; el índice por
+    # sesión, el borrado de las entradas de una sesión.
+    __table_args__ = (Index("ix_search_postings_session_id", "session_id"),)
+
+    term_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("strings.id"), primary_key=True
+    )
+    # Campo del término: "type", "path", "target" o "url"
+    field: Mapped[str] = mapped_column(String, primary_key=True)
+    type: Mapped[str] = mapped_column(String, primary_key=True)
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("Sessions.id"), primary_key=True
+    )
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_time: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+    last_time: Mapped[datetime] = mapped_column(EpochMicroseconds, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<SearchPosting(term_id={self.term_id}, field={self.field}, type={self.type}, session_id={self.session_id})>"
+
+
+class EventRecord(NamedTuple):
+    """
+    Interacción leída para listarla o reproducirla, con sus detalles ya
+    reconstruidos.
+    """
+
+    id: int
+    time: datetime
+    type: str
+    details: Any
+
+
+class InteractionRow(NamedTuple):
+    """
+    Representación ligera de una interacción, usada en la ruta de inserción
+    masiva para evitar construir instancias completas del ORM.
+    """
+
+    type: str
+    time: datetime | None
+    details: Any
+    session_id: str
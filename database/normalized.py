@@ -0,0 +1,153 @@
+"""
+Normalización de los detalles de las interacciones.
+
+Los campos de los eventos habituales se guardan en columnas propias de
+`Interactions` en lugar de en el JSON `details`: las coordenadas, tamaños,
+tecla y pestaña como valores, los modificadores de teclado como una máscara de
+bits y las XPath, etiquetas y URL como referencias a la tabla de cadenas
+internadas. El JSON solo conserva los campos restantes y los detalles de los
+eventos desconocidos, y las funciones de este módulo reconstruyen los detalles
+originales a partir de ambos.
+"""
+
+from typing import Any, Mapping
+
+# Campos de texto internados y la columna con la referencia a la cadena
+STRING_FIELDS = {"path": "path_id", "target": "target_id", "url": "url_id"}
+
+# Campos guardados directamente en una columna
+VALUE_FIELDS = {
+    "x": "x",
+    "y": "y",
+    "width": "width",
+    "height": "height",
+    "key": "key",
+    "tabId": "tab_id",
+}
+
+# Modificadores de teclado, guardados como bits de la columna `modifiers`
+MODIFIER_FIELDS = ("modAlt", "modCtrl", "modShift", "modMeta")
+
+# Campos normalizados de cada tipo de evento, en el orden en el que los envía
+# la extensión
+EVENT_FIELDS = {
+    "click": ("path", "target", "x", "y"),
+    "input": ("path", "target", "key", *MODIFIER_FIELDS),
+    "scroll": ("x", "y"),
+    "resize": ("width", "height"),
+    "tab_created": ("tabId", "url"),
+    "tab_updated": ("tabId", "url"),
+    "tab_highlighted": ("tabId", "url"),
+}
+
+VALUE_COLUMNS = (*VALUE_FIELDS.values(), "modifiers")
+
+
+def _fits(field: str, value: Any) -> bool:
+    if field in STRING_FIELDS or field == "key":
+        return isinstance(value, str)
+    # Los booleanos son enteros en Python, pero deben conservarse como tales
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def normalize_details(
+    event: str, details: Any
+) -> tuple[dict[str, Any], dict[str, str], Any]:
+    """
+    Separa los detalles de un evento en columnas normalizadas.
+
+    Solo se normalizan los campos presentes y con el tipo esperado, de forma
+    que los detalles reconstruidos son siempre iguales a los recibidos.
+
+    Parámetros:
+    ------------
+    event: str
+        Tipo del evento.
+    details: Any
+        Detalles recibidos.
+
+    Returns:
+    ---------
+    tuple[dict[str, Any], dict[str, str], Any]
+        Valores de las columnas de `VALUE_COLUMNS`, cadenas a internar por
+        campo (`path`, `target`, `url`) y detalles restantes, o `None` si no
+        queda ninguno.
+    """
+    values = dict.fromkeys(VALUE_COLUMNS)
+    strings: dict[str, str] = {}
+    fields = EVENT_FIELDS.get(event)
+    if fields is None or not isinstance(details, dict):
+        return values, strings, details
+
+    rest = dict(details)
+    for field in fields:
+        if (
+            field in MODIFIER_FIELDS
+            or field not in rest
+            or not _fits(field, rest[field])
+        ):
+            continue
+        value = rest.pop(field)
+        if field in STRING_FIELDS:
+            strings[field] = value
+        else:
+            values[VALUE_FIELDS[field]] = value
+
+    if "modAlt" in fields and all(
+        isinstance(rest.get(field), bool) for field in MODIFIER_FIELDS
+    ):
+        values["modifiers"] = sum(
+            1 << bit for bit, field in enumerate(MODIFIER_FIELDS) if rest.pop(field)
+        )
+
+    if not strings and all(value is None for value in values.values()):
+        return values, strings, details
+    return values, strings, rest or None
+
+
+def denormalize_details(
+    event: str,
+    values: Mapping[str, Any],
+    strings: Mapping[str, str | None],
+    details: Any,
+) -> Any:
+    """
+    Reconstruye los detalles de un evento a partir de sus columnas.
+
+    Parámetros:
+    ------------
+    event: str
+        Tipo del evento.
+    values: Mapping[str, Any]
+        Valores de las columnas de `VALUE_COLUMNS`.
+    strings: Mapping[str, str | None]
+        Cadenas de los campos internados, por campo.
+    details: Any
+        Detalles restantes guardados en JSON.
+
+    Returns:
+    ---------
+    Any
+        Detalles del evento.
+    """
+    fields = EVENT_FIELDS.get(event)
+    if fields is None:
+        return details
+
+    result: dict[str, Any] = {}
+    modifiers = values.get("modifiers")
+    for field in fields:
+        if field in MODIFIER_FIELDS:
+            if modifiers is not None:
+                result[field] = bool(modifiers & (1 << MODIFIER_FIELDS.index(field)))
+        elif field in STRING_FIELDS:
+            if strings.get(field) is not None:
+                result[field] = strings[field]
+        elif values.get(VALUE_FIELDS[field]) is not None:
+            result[field] = values[VALUE_FIELDS[field]]
+
+    if not result:
+        return details
+    if isinstance(details, dict):
+        result.update(details)
+    return result
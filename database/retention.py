@@ -0,0 +1,568 @@
+"""
+Retención de los datos grabados.
+
+Sin una política de retención la base de datos crece indefinidamente. Este
+módulo aplica, de forma incremental, los límites de una `RetentionPolicy`:
+
+- Antigüedad: se borran las sesiones cuya última actividad (su final, su
+  última interacción o su inicio) es anterior a `max_age`, incluidas las que
+  nunca llegaron a terminar.
+- Sesiones por sitio: de cada sitio se conservan las `max_sessions_per_site`
+  sesiones terminadas más recientes; las anteriores se borran enteras.
+- Tamaño de las sesiones: de las sesiones con más de `max_session_events`
+  interacciones en la tabla `Interactions` se borran las más antiguas, y se
+  recalculan sus totales y sus entradas del índice de búsqueda.
+
+Las dos primeras pueden borrar, y la última recortar, sesiones que no han
+terminado. La ruta de escritura guarda en memoria el estado de esas sesiones
+(fotogramas clave, relaciones con los sitios), por lo que `apply_retention`
+avisa de cada sesión borrada o recortada para que se descarte.
+
+Las interacciones se borran por lotes, confirmando cada uno y dejando una
+pausa entre ellos, para no retener el bloqueo de escritura de SQLite mientras
+la etapa de ingesta escribe. Al borrar una sesión se borran también sus
+fotogramas clave, totales, entradas del índice de búsqueda, relaciones con los
+sitios y, si está archivada, su archivo. Las relaciones y totales que hayan
+quedado huérfanos se borran en cada pasada.
+
+En SQLite, el espacio liberado se reutiliza para las nuevas escrituras; si la
+base de datos tiene `auto_vacuum=INCREMENTAL` (el modo que fija la aplicación
+al crearla) además se devuelve al sistema poco a poco. Una base de datos
+creada antes puede convertirse con `--vacuum`, que reescribe el fichero y
+bloquea la escritura mientras tanto:
+
+    python -m database.retention [URI] --max-age-days 90 [--max-sessions-per-site N]
+        [--max-session-events N] [--vacuum]
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from time import sleep
+from typing import Any, Callable, NamedTuple, cast
+
+from sqlalchemy import (
+    ColumnElement,
+    CursorResult,
+    Engine,
+    and_,
+    create_engine,
+    delete,
+    func,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.orm import Session as DatabaseSession
+
+from .aggregates import rebuild_session_aggregates
+from .archive import open_archive
+from .base import DATABASE_URI_ENV, Base
+from .models import (
+    ArchivedSession,
+    Interaction,
+    Keyframe,
+    SearchPosting,
+    Session,
+    SessionEventCount,
+    SessionStats,
+    site_sessions,
+)
+from .search_index import rebuild_session_postings
+from .site_visits import update_session_counts
+
+# Interacciones borradas en cada transacción
+RETENTION_BATCH_SIZE = 1_000
+
+# Tablas con una fila o más por sesión, además de `Interactions`
+SESSION_TABLES = (
+    Keyframe.__table__,
+    SessionStats.__table__,
+    SessionEventCount.__table__,
+    SearchPosting.__table__,
+)
+
+
+class RetentionPolicy(NamedTuple):
+    """
+    Límites de los datos grabados. Los límites sin valor no se aplican.
+
+    Atributos:
+    ------------
+    max_age: timedelta | None
+        Tiempo que se conservan las sesiones desde su última actividad.
+    max_sessions_per_site: int | None
+        Número de sesiones terminadas que se conservan de cada sitio.
+    max_session_events: int | None
+        Número de interacciones que se conservan de cada sesión.
+    """
+
+    max_age: timedelta | None = None
+    max_sessions_per_site: int | None = None
+    max_session_events: int | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return any(limit is not None for limit in self)
+
+
+class RetentionReport(NamedTuple):
+    """
+    Resultado de una pasada de retención.
+
+    Atributos:
+    ------------
+    deleted_sessions: int
+        Sesiones borradas.
+    truncated_sessions: int
+        Sesiones de las que se han borrado las interacciones más antiguas.
+    deleted_interactions: int
+        Interacciones borradas, de unas y otras.
+    orphans: int
+        Filas huérfanas borradas.
+    reclaimed_pages: int
+        Páginas de la base de datos devueltas al sistema.
+    """
+
+    deleted_sessions: int = 0
+    truncated_sessions: int = 0
+    deleted_interactions: int = 0
+    orphans: int = 0
+    reclaimed_pages: int = 0
+
+
+def expired_sessions(
+    session: DatabaseSession, policy: RetentionPolicy, now: datetime, limit: int
+) -> list[str]:
+    """
+    Sesiones que deben borrarse por su antigüedad o por superar su sitio el
+    máximo de sesiones.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que consultar.
+    policy: RetentionPolicy
+        Política a aplicar.
+    now: datetime
+        Momento actual, en UTC sin zona horaria.
+    limit: int
+        Número máximo de sesiones a devolver.
+
+    Returns:
+    ---------
+    list[str]
+        Identificadores de las sesiones, de las más antiguas a las más
+        recientes.
+    """
+    expired: dict[str, None] = {}
+    if policy.max_age is not None:
+        # Última actividad: el final de la sesión o, si no ha terminado, su
+        # última interacción o su inicio
+        last_activity = func.coalesce(
+            Session.end_time, SessionStats.last_event, Session.start_time
+        )
+        inactive = last_activity < now - policy.max_age
+        expired.update(
+            dict.fromkeys(
+                session.scalars(
+                    select(Session.id)
+                    .outerjoin(SessionStats, SessionStats.session_id == Session.id)
+                    .where(inactive)
+                    .order_by(Session.start_time)
+                    .limit(limit)
+                )
+            )
+        )
+
+    if policy.max_sessions_per_site is not None and len(expired) < limit:
+        # Las sesiones en grabación no cuentan, ya que se siguen escribiendo
+        rank = (
+            func.row_number()
+            .over(
+                partition_by=site_sessions.c.site_id, order_by=Session.start_time.desc()
+            )
+            .label("rank")
+        )
+        ranked = (
+            select(site_sessions.c.session_id, Session.start_time, rank)
+            .join(Session, Session.id == site_sessions.c.session_id)
+            .where(Session.end_time.is_not(None))
+            .subquery()
+        )
+        expired.update(
+            dict.fromkeys(
+                session.scalars(
+                    select(ranked.c.session_id)
+                    .where(ranked.c.rank > policy.max_sessions_per_site)
+                    .group_by(ranked.c.session_id)
+                    .order_by(func.min(ranked.c.start_time))
+                    .limit(limit - len(expired))
+                )
+            )
+        )
+    return list(expired)
+
+
+def oversized_sessions(
+    session: DatabaseSession, max_events: int, limit: int
+) -> list[str]:
+    """
+    Sesiones no archivadas con más interacciones de las permitidas.
+    """
+    return list(
+        session.scalars(
+            select(SessionStats.session_id)
+            .outerjoin(
+                ArchivedSession, ArchivedSession.session_id == SessionStats.session_id
+            )
+            .where(
+                SessionStats.event_count > max_events,
+                ArchivedSession.session_id.is_(None),
+            )
+            .order_by(SessionStats.event_count.desc())
+            .limit(limit)
+        )
+    )
+
+
+def delete_interactions(
+    session: DatabaseSession,
+    condition: ColumnElement[bool],
+    batch_size: int = RETENTION_BATCH_SIZE,
+    pause: float = 0.0,
+) -> int:
+    """
+    Borra por lotes las interacciones que cumplen la condición, confirmando
+    cada lote.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que escribir.
+    condition: ColumnElement[bool]
+        Condición sobre `Interaction` de las interacciones a borrar.
+    batch_size: int
+        Interacciones borradas en cada transacción.
+    pause: float
+        Segundos de espera entre lotes, durante los que puede escribir la
+        etapa de ingesta.
+
+    Returns:
+    ---------
+    int
+        Número de interacciones borradas.
+    """
+    deleted = 0
+    while True:
+        ids = select(Interaction.id).where(condition).limit(batch_size)
+        result = cast(
+            CursorResult[Any],
+            session.execute(
+                delete(Interaction)
+                .where(Interaction.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            ),
+        )
+        session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+        if pause:
+            sleep(pause)
+
+
+def delete_session(
+    session: DatabaseSession,
+    session_id: str,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    pause: float = 0.0,
+) -> int:
+    """
+    Borra una sesión con todas sus interacciones y sus datos derivados.
+
+    Las interacciones se borran primero, por lotes; el resto de filas de la
+    sesión, en una última transacción, tras la que se borra su archivo.
+
+    Returns:
+    ---------
+    int
+        Número de interacciones borradas.
+    """
+    deleted = delete_interactions(
+        session, Interaction.session_id == session_id, batch_size, pause
+    )
+
+    archived = session.get(ArchivedSession, session_id)
+    archive_path = archived.path if archived is not None else None
+    site_ids: set[int] = set(
+        session.scalars(
+            select(site_sessions.c.site_id).where(
+                site_sessions.c.session_id == session_id
+            )
+        )
+    )
+    for table in SESSION_TABLES:
+        session.execute(delete(table).where(table.c.session_id == session_id))
+    session.execute(
+        delete(site_sessions).where(site_sessions.c.session_id == session_id)
+    )
+    update_session_counts(session, site_ids)
+    session.execute(
+        delete(ArchivedSession).where(ArchivedSession.session_id == session_id)
+    )
+    session.execute(delete(Session).where(Session.id == session_id))
+    session.commit()
+
+    if archive_path is not None:
+        # El archivo puede seguir abierto en la caché de lecturas
+        open_archive.cache_clear()
+        Path(archive_path).unlink(missing_ok=True)
+    return deleted
+
+
+def truncate_session(
+    session: DatabaseSession,
+    session_id: str,
+    max_events: int,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    pause: float = 0.0,
+) -> int:
+    """
+    Borra las interacciones más antiguas de una sesión, conservando las
+    `max_events` más recientes, y recalcula sus totales y sus entradas del
+    índice de búsqueda.
+
+    Returns:
+    ---------
+    int
+        Número de interacciones borradas.
+    """
+    # Última interacción a borrar, en el orden cronológico de la sesión
+    boundary = session.execute(
+        select(Interaction.time, Interaction.id)
+        .where(Interaction.session_id == session_id)
+        .order_by(Interaction.time.desc(), Interaction.id.desc())
+        .offset(max_events)
+        .limit(1)
+    ).first()
+    if boundary is None:
+        return 0
+
+    # Se compara con una tupla de Python para que los valores se conviertan
+    # con el tipo de cada columna
+    deleted = delete_interactions(
+        session,
+        and_(
+            Interaction.session_id == session_id,
+            tuple_(Interaction.time, Interaction.id) <= tuple(boundary),
+        ),
+        batch_size,
+        pause,
+    )
+    # Los fotogramas clave anteriores ya no tienen eventos sobre los que
+    # aplicarse
+    session.execute(
+        delete(Keyframe).where(
+            Keyframe.session_id == session_id, Keyframe.time <= boundary.time
+        )
+    )
+    rebuild_session_aggregates(session, session_id)
+    rebuild_session_postings(session, session_id)
+    session.execute(
+        update(Session)
+        .where(Session.id == session_id)
+        .values(modified_time=datetime.now(timezone.utc).replace(tzinfo=None))
+    )
+    session.commit()
+    return deleted
+
+
+def delete_orphans(session: DatabaseSession) -> int:
+    """
+    Borra las relaciones con sitios, totales, fotogramas clave y entradas del
+    índice de búsqueda de sesiones que ya no existen (por ejemplo, borradas
+    por otra vía) y actualiza el número de sesiones de los sitios afectados.
+
+    Returns:
+    ---------
+    int
+        Número de filas borradas.
+    """
+    sessions = select(Session.id)
+    site_ids: set[int] = set(
+        session.scalars(
+            select(site_sessions.c.site_id)
+            .distinct()
+            .where(site_sessions.c.session_id.not_in(sessions))
+        )
+    )
+    deleted = cast(
+        CursorResult[Any],
+        session.execute(
+            delete(site_sessions).where(site_sessions.c.session_id.not_in(sessions))
+        ),
+    ).rowcount
+    if site_ids:
+        update_session_counts(session, site_ids)
+    for table in SESSION_TABLES:
+        deleted += cast(
+            CursorResult[Any],
+            session.execute(delete(table).where(table.c.session_id.not_in(sessions))),
+        ).rowcount
+    session.commit()
+    return deleted
+
+
+def reclaim_space(session: DatabaseSession, max_pages: int) -> int:
+    """
+    Devuelve al sistema como mucho `max_pages` páginas libres de una base de
+    datos SQLite con `auto_vacuum=INCREMENTAL`. En el resto de casos no hace
+    nada: SQLite reutiliza las páginas libres y PostgreSQL las recupera con
+    su autovacuum.
+
+    Returns:
+    ---------
+    int
+        Número de páginas devueltas.
+    """
+    if session.get_bind().dialect.name != "sqlite":
+        return 0
+    # 2: INCREMENTAL
+    if session.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+        return 0
+
+    free = session.execute(text("PRAGMA freelist_count")).scalar() or 0
+    pages = min(free, max_pages)
+    if pages:
+        session.execute(text(f"PRAGMA incremental_vacuum({int(pages)})")).all()
+        session.commit()
+    return pages
+
+
+def apply_retention(
+    session: DatabaseSession,
+    policy: RetentionPolicy,
+    now: datetime | None = None,
+    max_sessions: int = 100,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    pause: float = 0.0,
+    max_pages: int = 1_000,
+    forget: Callable[[str], None] | None = None,
+) -> RetentionReport:
+    """
+    Aplica una pasada de la política de retención: borra como mucho
+    `max_sessions` sesiones y recorta otras tantas, borra las filas huérfanas
+    y devuelve espacio al sistema. Las pasadas sucesivas continúan donde lo
+    dejó la anterior.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que escribir.
+    policy: RetentionPolicy
+        Política a aplicar.
+    now: datetime | None
+        Momento actual, en UTC sin zona horaria; el del reloj si no se indica.
+    max_sessions: int
+        Número máximo de sesiones a borrar, y a recortar, en la pasada.
+    batch_size: int
+        Interacciones borradas en cada transacción.
+    pause: float
+        Segundos de espera entre lotes.
+    max_pages: int
+        Número máximo de páginas a devolver al sistema.
+    forget: Callable[[str], None] | None
+        Función a la que se pasa cada sesión borrada o recortada, ya
+        confirmado el cambio, para que se descarte su estado en memoria.
+
+    Returns:
+    ---------
+    RetentionReport
+        Resultado de la pasada.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    deleted_sessions = expired_sessions(session, policy, now, max_sessions)
+    deleted = 0
+    for session_id in deleted_sessions:
+        deleted += delete_session(session, session_id, batch_size, pause)
+        if forget is not None:
+            forget(session_id)
+
+    truncated_sessions = []
+    if policy.max_session_events is not None:
+        truncated_sessions = oversized_sessions(
+            session, policy.max_session_events, max_sessions
+        )
+        for session_id in truncated_sessions:
+            deleted += truncate_session(
+                session, session_id, policy.max_session_events, batch_size, pause
+            )
+            if forget is not None:
+                forget(session_id)
+
+    return RetentionReport(
+        deleted_sessions=len(deleted_sessions),
+        truncated_sessions=len(truncated_sessions),
+        deleted_interactions=deleted,
+        orphans=delete_orphans(session),
+        reclaimed_pages=reclaim_space(session, max_pages),
+    )
+
+
+def vacuum(engine: Engine) -> None:
+    """
+    Reescribe la base de datos SQLite para devolver todo el espacio libre al
+    sistema, pasándola a `auto_vacuum=INCREMENTAL`. Bloquea la escritura
+    mientras tanto.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        connection.execute(text("VACUUM"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Apply a retention policy to the recorded data"
+    )
+    parser.add_argument("uri", nargs="?", default=os.environ.get(DATABASE_URI_ENV))
+    parser.add_argument("--max-age-days", type=float, default=None)
+    parser.add_argument("--max-sessions-per-site", type=int, default=None)
+    parser.add_argument("--max-session-events", type=int, default=None)
+    parser.add_argument(
+        "--vacuum", action="store_true", help="Rewrite the database file afterwards"
+    )
+    args = parser.parse_args()
+    if args.uri is None:
+        sys.exit(f"Usage: python -m database.retention URI (or set {DATABASE_URI_ENV})")
+
+    from .migrations import upgrade
+
+    policy = RetentionPolicy(
+        max_age=None
+        if args.max_age_days is None
+        else timedelta(days=args.max_age_days),
+        max_sessions_per_site=args.max_sessions_per_site,
+        max_session_events=args.max_session_events,
+    )
+    engine = create_engine(args.uri)
+    Base.metadata.create_all(engine)
+    upgrade(engine)
+    with DatabaseSession(engine) as session:
+        total = RetentionReport()
+        while True:
+            report = apply_retention(session, policy)
+            total = RetentionReport(*(sum(pair) for pair in zip(total, report)))
+            if not report.deleted_sessions and not report.truncated_sessions:
+                break
+    if args.vacuum:
+        vacuum(engine)
+    print(
+        f"Deleted {total.deleted_sessions} sessions, truncated {total.truncated_sessions} sessions, "
+        f"deleted {total.deleted_interactions} interactions and {total.orphans} orphaned rows."
+    )
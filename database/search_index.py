@@ -0,0 +1,376 @@
+"""
+Índice invertido de las interacciones entre sesiones.
+
+Para saber qué sesiones han pulsado un elemento, escrito en un campo o visitado
+una URL habría que recorrer las interacciones de todas ellas. En su lugar, la
+ruta de escritura mantiene en `search_postings` una entrada por término, tipo
+de evento y sesión, con el número de interacciones y la primera y la última.
+Los términos son los tipos de evento y las XPath (`path`), etiquetas
+(`target`) y URL de los detalles, guardados en la tabla de cadenas internadas,
+por lo que una búsqueda solo lee las entradas de su término mediante la clave
+primaria, sin importar cuántas interacciones haya grabadas.
+
+Para reconstruir el índice a partir de las interacciones guardadas y de los
+archivos de las sesiones archivadas (por ejemplo, tras importar datos):
+
+    python -m database.search_index [URI]
+"""
+
+import os
+import sys
+from datetime import datetime
+from threading import Lock
+from typing import Iterable
+
+from sqlalchemy import (
+    ColumnElement,
+    create_engine,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+)
+from sqlalchemy.orm import Session as DatabaseSession
+
+from .base import DATABASE_URI_ENV, Base, dialect_insert, greatest, least
+from .models import (
+    ArchivedSession,
+    Interaction,
+    InteractionRow,
+    InternedString,
+    SearchPosting,
+)
+from .normalized import STRING_FIELDS
+from .strings import StringInterner
+from .timestamps import naive_utc
+
+# Campos indexados: el tipo de evento y los campos de texto de los detalles
+SEARCH_FIELDS = ("type", *STRING_FIELDS)
+
+# Interacciones leídas a la vez al indexar los detalles guardados en JSON
+INDEX_BATCH_SIZE = 10_000
+
+
+class PendingPosting:
+    """
+    Interacciones de una sesión con un término acumuladas desde el último
+    volcado.
+
+    Atributos:
+    ------------
+    count: int
+        Número de interacciones pendientes de sumar.
+    first_time: datetime
+        Primera de las interacciones pendientes.
+    last_time: datetime
+        Última de las interacciones pendientes.
+    """
+
+    __slots__ = ("count", "first_time", "last_time")
+
+    def __init__(self, timestamp: datetime) -> None:
+        self.count = 0
+        self.first_time = timestamp
+        self.last_time = timestamp
+
+
+class SearchIndexAggregator:
+    """
+    Agregador en memoria de las entradas del índice de búsqueda.
+
+    Igual que `SessionStatsAggregator`, acumula las interacciones de un lote de
+    operaciones por (campo, término, tipo, sesión) y las vuelca de una vez
+    mediante upserts que suman las nuevas a las guardadas. Los términos se
+    resuelven con el `StringInterner` de la ruta de escritura, por lo que las
+    XPath y URL ya internadas al insertar las interacciones no generan
+    consultas adicionales. Si la transacción falla, `rollback` descarta lo
+    acumulado y el llamante debe volver a registrarlo.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._pending: dict[tuple[str, str, str, str], PendingPosting] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(
+        self, rows: Iterable[InteractionRow], fields: Iterable[str] = SEARCH_FIELDS
+    ) -> None:
+        """
+        Registra un bloque de interacciones que se van a insertar.
+
+        Parámetros:
+        ------------
+        rows: Iterable[InteractionRow]
+            Interacciones del bloque.
+        fields: Iterable[str]
+            Campos de `SEARCH_FIELDS` a indexar.
+        """
+        fields = set(fields)
+        detail_fields = [field for field in STRING_FIELDS if field in fields]
+        with self._lock:
+            for row in rows:
+                if row.time is None:
+                    continue
+                timestamp = naive_utc(row.time)
+                terms = [("type", row.type)] if "type" in fields else []
+                if isinstance(row.details, dict):
+                    for field in detail_fields:
+                        value = row.details.get(field)
+                        if isinstance(value, str):
+                            terms.append((field, value))
+                for field, value in terms:
+                    key = (field, value, row.type, row.session_id)
+                    pending = self._pending.get(key)
+                    if pending is None:
+                        pending = self._pending[key] = PendingPosting(timestamp)
+                    pending.count += 1
+                    if timestamp < pending.first_time:
+                        pending.first_time = timestamp
+                    elif timestamp > pending.last_time:
+                        pending.last_time = timestamp
+
+    def flush(self, session: DatabaseSession, strings: StringInterner) -> int:
+        """
+        Escribe las entradas acumuladas en la transacción de la sesión
+        recibida, sin confirmarla.
+
+        Parámetros:
+        ------------
+        session: DatabaseSession
+            Sesión de SQLAlchemy sobre la que escribir.
+        strings: StringInterner
+            Caché de cadenas internadas con la que resolver los términos.
+
+        Returns:
+        ---------
+        int
+            Número de entradas actualizadas.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        term_ids = strings.resolve(session, {value for _, value, _, _ in pending})
+        table = SearchPosting.__table__
+        statement = dialect_insert(session, table)
+        excluded = statement.excluded
+        # Un lote tiene del orden de una entrada por evento, por lo que se
+        # ejecuta una única sentencia con `executemany` en lugar de una con
+        # varias filas en VALUES, cuya compilación depende del número de filas
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[
+                    table.c.term_id,
+                    table.c.field,
+                    table.c.type,
+                    table.c.session_id,
+                ],
+                set_={
+                    "count": table.c.count + excluded.count,
+                    "first_time": least(table.c.first_time, excluded.first_time),
+                    "last_time": greatest(table.c.last_time, excluded.last_time),
+                },
+            ),
+            [
+                {
+                    "term_id": term_ids[value],
+                    "field": field,
+                    "type": event,
+                    "session_id": session_id,
+                    "count": posting.count,
+                    "first_time": posting.first_time,
+                    "last_time": posting.last_time,
+                }
+                for (field, value, event, session_id), posting in pending.items()
+            ],
+        )
+        return len(pending)
+
+    def commit(self) -> None:
+        """
+        No mantiene cachés, por lo que no hay nada que incorporar; existe para
+        que el agregador se use igual que los demás de la ruta de escritura.
+        """
+
+    def rollback(self) -> None:
+        """
+        Descarta las entradas acumuladas.
+        """
+        with self._lock:
+            self._pending = {}
+
+
+def rebuild_search_index(
+    session: DatabaseSession, include_archived: bool = True
+) -> int:
+    """
+    Recalcula el índice de búsqueda en la transacción de la sesión recibida,
+    sin confirmarla.
+
+    Las entradas de las sesiones con interacciones en la base de datos se
+    calculan con `index_interactions`; las de las sesiones archivadas, leyendo
+    sus archivos.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que escribir.
+    include_archived: bool
+        Si se recalculan también las sesiones archivadas. Si no, se conservan
+        sus entradas guardadas.
+
+    Returns:
+    ---------
+    int
+        Número de entradas del índice.
+    """
+    archived = select(ArchivedSession.session_id)
+    table = SearchPosting.__table__
+    if include_archived:
+        session.execute(delete(table))
+    else:
+        session.execute(delete(table).where(table.c.session_id.not_in(archived)))
+
+    index_interactions(session, Interaction.session_id.not_in(archived))
+
+    if include_archived:
+        # Importado aquí porque `database.archive` depende de las migraciones,
+        # que a su vez usan esta función
+        from .archive import open_session_archive
+
+        aggregator, interner = SearchIndexAggregator(), StringInterner()
+        for session_id in session.scalars(archived).all():
+            archive = open_session_archive(session, session_id)
+            if archive is None:
+                continue
+            aggregator.record(
+                InteractionRow(event.type, event.time, event.details, session_id)
+                for event in archive.events()
+            )
+            aggregator.flush(session, interner)
+
+    return session.scalar(select(func.count()).select_from(table)) or 0
+
+
+def index_interactions(
+    session: DatabaseSession, condition: ColumnElement[bool]
+) -> None:
+    """
+    Añade al índice, sin confirmar la transacción, las entradas de las
+    interacciones guardadas que cumplen la condición, que no deben estar ya
+    indexadas.
+
+    Los tipos de evento y los campos de texto normalizados se indexan mediante
+    consultas agrupadas. Los campos de texto que solo están en el JSON
+    `details` (los de las interacciones anteriores a la normalización y los de
+    los eventos sin columnas propias) se leen por bloques y se suman con
+    `SearchIndexAggregator`, igual que en la ruta de escritura.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que escribir.
+    condition: ColumnElement[bool]
+        Condición sobre `Interaction` de las interacciones a indexar.
+    """
+    # Los tipos de evento no se internan al insertar las interacciones. SQLite
+    # necesita el WHERE para distinguir el ON CONFLICT de un JOIN ... ON
+    strings = InternedString.__table__
+    session.execute(
+        dialect_insert(session, strings)
+        .from_select(["value"], select(Interaction.type).distinct().where(condition))
+        .on_conflict_do_nothing()
+    )
+
+    table = SearchPosting.__table__
+    columns = [
+        "term_id",
+        "field",
+        "type",
+        "session_id",
+        "count",
+        "first_time",
+        "last_time",
+    ]
+    aggregates = (func.count(), func.min(Interaction.time), func.max(Interaction.time))
+    session.execute(
+        insert(table).from_select(
+            columns,
+            select(
+                strings.c.id,
+                literal("type"),
+                Interaction.type,
+                Interaction.session_id,
+                *aggregates,
+            )
+            .join(strings, strings.c.value == Interaction.type)
+            .where(condition)
+            .group_by(strings.c.id, Interaction.type, Interaction.session_id),
+        )
+    )
+    for field, column in STRING_FIELDS.items():
+        term_id = getattr(Interaction, column)
+        session.execute(
+            insert(table).from_select(
+                columns,
+                select(
+                    term_id,
+                    literal(field),
+                    Interaction.type,
+                    Interaction.session_id,
+                    *aggregates,
+                )
+                .where(condition, term_id.is_not(None))
+                .group_by(term_id, Interaction.type, Interaction.session_id),
+            )
+        )
+
+    # Los campos extraídos a columnas ya no están en el JSON, por lo que
+    # ninguna interacción se cuenta dos veces
+    aggregator = SearchIndexAggregator()
+    rows = session.execute(
+        select(
+            Interaction.type,
+            Interaction.time,
+            Interaction.raw_details,
+            Interaction.session_id,
+        )
+        .where(condition, Interaction.raw_details.is_not(None))
+        .execution_options(yield_per=INDEX_BATCH_SIZE)
+    )
+    for batch in rows.partitions():
+        aggregator.record(map(InteractionRow._make, batch), fields=STRING_FIELDS)
+    aggregator.flush(session, StringInterner())
+
+
+def rebuild_session_postings(session: DatabaseSession, session_id: str) -> None:
+    """
+    Recalcula, sin confirmar la transacción, las entradas del índice de una
+    sesión a partir de sus interacciones guardadas (por ejemplo, tras borrar
+    parte de ellas).
+    """
+    table = SearchPosting.__table__
+    session.execute(delete(table).where(table.c.session_id == session_id))
+    index_interactions(session, Interaction.session_id == session_id)
+
+
+if __name__ == "__main__":
+    uri = sys.argv[1] if len(sys.argv) > 1 else os.environ.get(DATABASE_URI_ENV)
+    if uri is None:
+        sys.exit(
+            f"Usage: python -m database.search_index URI (or set {DATABASE_URI_ENV})"
+        )
+
+    from .migrations import upgrade
+
+    engine = create_engine(uri)
+    Base.metadata.create_all(engine)
+    upgrade(engine)
+    with DatabaseSession(engine) as session:
+        postings = rebuild_search_index(session)
+        session.commit()
+    print(f"Rebuilt the search index with {postings} postings.")
@@ -0,0 +1,255 @@
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Any
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session as DatabaseSession
+
+from .base import dialect_insert, greatest, least
+from .models import VisitedSite, site_sessions
+from .timestamps import naive_utc
+
+# Filas por sentencia, para no superar el límite de parámetros de SQLite
+UPSERT_CHUNK_SIZE = 500
+
+
+class PendingVisits:
+    """
+    Visitas a un sitio acumuladas desde el último volcado.
+
+    Atributos:
+    ------------
+    visits: int
+        Número de visitas pendientes de sumar.
+    first_visit: datetime
+        Primera de las visitas pendientes.
+    last_visit: datetime
+        Última de las visitas pendientes.
+    sessions: set[str]
+        Sesiones que han visitado el sitio y cuya relación con él puede no
+        estar guardada aún.
+    """
+
+    __slots__ = ("visits", "first_visit", "last_visit", "sessions")
+
+    def __init__(self, timestamp: datetime) -> None:
+        self.visits = 0
+        self.first_visit = timestamp
+        self.last_visit = timestamp
+        self.sessions: set[str] = set()
+
+
+class SiteVisitAggregator:
+    """
+    Agregador en memoria de las visitas a sitios registradas por los eventos de
+    pestañas.
+
+    En lugar de consultar y actualizar `VisitedSite` por cada evento, las
+    visitas se acumulan por URL y se vuelcan de una vez mediante un upsert de
+    los sitios y una inserción de las relaciones sitio-sesión que aún no se
+    conocen. Se mantiene una caché de URL -> id de sitio y, por sesión, el
+    conjunto de sitios cuya relación ya está guardada, por lo que los eventos
+    repetidos de una misma pestaña no generan ninguna consulta adicional.
+
+    Las cachés solo se actualizan al confirmarse la transacción (`commit`); si
+    falla, `rollback` descarta las visitas acumuladas y el llamante debe
+    volver a registrarlas.
+    """
+
+    def __init__(self, max_cached_sites: int = 100_000) -> None:
+        """
+        Parámetros:
+        ------------
+        max_cached_sites: int
+            Número máximo de URLs cuyo id se mantiene en caché.
+        """
+        self.max_cached_sites = max_cached_sites
+        self._lock = Lock()
+        self._pending: dict[str, PendingVisits] = {}
+        self._flushed: dict[str, PendingVisits] = {}
+        self._flushed_ids: dict[str, int] = {}
+        self._site_ids: OrderedDict[str, int] = OrderedDict()
+        self._members: dict[str, set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, url: str, session_id: str, timestamp: datetime) -> None:
+        """
+        Registra una visita a un sitio.
+
+        Parámetros:
+        ------------
+        url: str
+            URL del sitio visitado.
+        session_id: str
+            Sesión en la que se ha visitado.
+        timestamp: datetime
+            Momento de la visita.
+        """
+        # Las visitas pueden llegar con distintas zonas horarias
+        timestamp = naive_utc(timestamp)
+        with self._lock:
+            pending = self._pending.get(url)
+            if pending is None:
+                pending = self._pending[url] = PendingVisits(timestamp)
+            pending.visits += 1
+            pending.first_visit = min(pending.first_visit, timestamp)
+            pending.last_visit = max(pending.last_visit, timestamp)
+
+            site_id = self._site_ids.get(url)
+            if site_id is None or site_id not in self._members.get(session_id, ()):
+                pending.sessions.add(session_id)
+
+    def flush(self, session: DatabaseSession) -> int:
+        """
+        Escribe las visitas acumuladas en la transacción de la sesión recibida,
+        sin confirmarla.
+
+        Parámetros:
+        ------------
+        session: DatabaseSession
+            Sesión de SQLAlchemy sobre la que escribir.
+
+        Returns:
+        ---------
+        int
+            Número de sitios actualizados.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for url, visits in pending.items():
+                if url in self._flushed:
+                    self._flushed[url].sessions |= visits.sessions
+                else:
+                    self._flushed[url] = visits
+        if not pending:
+            return 0
+
+        table = VisitedSite.__table__
+        items = list(pending.items())
+        for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+            statement = dialect_insert(session, table).values(
+                [
+                    {
+                        "url": url,
+                        "visit_count": visits.visits,
+                        "first_visit": visits.first_visit,
+                        "last_visit": visits.last_visit,
+                    }
+                    for url, visits in items[start : start + UPSERT_CHUNK_SIZE]
+                ]
+            )
+            excluded = statement.excluded
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[table.c.url],
+                    set_={
+                        "visit_count": table.c.visit_count + excluded.visit_count,
+                        "first_visit": least(table.c.first_visit, excluded.first_visit),
+                        "last_visit": greatest(table.c.last_visit, excluded.last_visit),
+                    },
+                )
+            )
+
+        site_ids = self._resolve_ids(
+            session, [url for url, visits in pending.items() if visits.sessions]
+        )
+        memberships: list[dict[str, Any]] = [
+            {"site_id": site_ids[url], "session_id": session_id}
+            for url, visits in pending.items()
+            for session_id in visits.sessions
+        ]
+        if memberships:
+            session.execute(
+                dialect_insert(session, site_sessions).on_conflict_do_nothing(),
+                memberships,
+            )
+            update_session_counts(
+                session, {membership["site_id"] for membership in memberships}
+            )
+        return len(pending)
+
+    def commit(self) -> None:
+        """
+        Incorpora a las cachés los sitios y relaciones escritos por los
+        volcados de la transacción que se acaba de confirmar.
+        """
+        with self._lock:
+            for url, flushed_id in self._flushed_ids.items():
+                self._site_ids[url] = flushed_id
+                self._site_ids.move_to_end(url)
+            for url, visits in self._flushed.items():
+                site_id = self._site_ids.get(url)
+                if site_id is not None:
+                    for session_id in visits.sessions:
+                        self._members.setdefault(session_id, set()).add(site_id)
+            while len(self._site_ids) > self.max_cached_sites:
+                self._site_ids.popitem(last=False)
+            self._flushed, self._flushed_ids = {}, {}
+
+    def rollback(self) -> None:
+        """
+        Descarta las visitas acumuladas y las volcadas en la transacción que se
+        acaba de deshacer.
+        """
+        with self._lock:
+            self._pending, self._flushed, self._flushed_ids = {}, {}, {}
+
+    def forget_session(self, session_id: str) -> None:
+        """
+        Libera la caché de relaciones de una sesión que ha terminado.
+        """
+        with self._lock:
+            self._members.pop(session_id, None)
+
+    def _resolve_ids(self, session: DatabaseSession, urls: list[str]) -> dict[str, int]:
+        site_ids = {url: self._site_ids[url] for url in urls if url in self._site_ids}
+        missing = [url for url in urls if url not in site_ids]
+        for start in range(0, len(missing), UPSERT_CHUNK_SIZE):
+            chunk = missing[start : start + UPSERT_CHUNK_SIZE]
+            for site_id, url in session.execute(
+                select(VisitedSite.id, VisitedSite.url).where(
+                    VisitedSite.url.in_(chunk)
+                )
+            ):
+                site_ids[url] = self._flushed_ids[url] = site_id
+        return site_ids
+
+
+def update_session_counts(
+    session: DatabaseSession, site_ids: set[int] | None = None
+) -> None:
+    """
+    Recalcula el número de sesiones que han visitado cada sitio a partir de
+    las relaciones sitio-sesión guardadas.
+
+    Las relaciones solo se insertan la primera vez que una sesión visita un
+    sitio, por lo que basta con recontar las de los sitios afectados, usando
+    la clave primaria de `site_sessions`.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que escribir.
+    site_ids: set[int] | None
+        Sitios a actualizar, todos si no se indican.
+    """
+    table = VisitedSite.__table__
+    session_count = (
+        select(func.count())
+        .where(site_sessions.c.site_id == table.c.id)
+        .scalar_subquery()
+    )
+    if site_ids is None:
+        session.execute(update(table).values(session_count=session_count))
+        return
+
+    ids = sorted(site_ids)
+    for start in range(0, len(ids), UPSERT_CHUNK_SIZE):
+        session.execute(
+            update(table)
+            .where(table.c.id.in_(ids[start : start + UPSERT_CHUNK_SIZE]))
+            .values(session_count=session_count)
+        )
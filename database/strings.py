@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Sequence
+
+from sqlalchemy import Row, Select, select
+from sqlalchemy.orm import Session as DatabaseSession, aliased
+
+from .base import dialect_insert
+from .models import Interaction, InteractionRow, InternedString
+from .normalized import (
+    STRING_FIELDS,
+    VALUE_COLUMNS,
+    denormalize_details,
+    normalize_details,
+)
+
+# Cadenas por sentencia, para no superar el límite de parámetros de SQLite
+INTERN_CHUNK_SIZE = 500
+
+_STRING_ALIASES = {
+    field: aliased(InternedString, name=f"{field}_strings") for field in STRING_FIELDS
+}
+
+
+class StringInterner:
+    """
+    Caché de la tabla de cadenas internadas para la ruta de escritura.
+
+    Las cadenas conocidas se resuelven en memoria; las nuevas se insertan de
+    una vez por lote (ignorando las que otro proceso haya insertado antes) y
+    se consulta su id. Igual que en `SiteVisitAggregator`, los ids obtenidos
+    en una transacción solo pasan a la caché al confirmarse (`commit`), ya que
+    si se deshace las cadenas insertadas desaparecen.
+    """
+
+    def __init__(self, max_cached_strings: int = 200_000) -> None:
+        """
+        Parámetros:
+        ------------
+        max_cached_strings: int
+            Número máximo de cadenas cuyo id se mantiene en caché.
+        """
+        self.max_cached_strings = max_cached_strings
+        self._lock = Lock()
+        self._ids: OrderedDict[str, int] = OrderedDict()
+        self._pending: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def resolve(self, session: DatabaseSession, values: set[str]) -> dict[str, int]:
+        """
+        Obtiene el id de cada cadena, insertando las que no existan en la
+        transacción de la sesión recibida, sin confirmarla.
+
+        Parámetros:
+        ------------
+        session: DatabaseSession
+            Sesión de SQLAlchemy sobre la que escribir.
+        values: set[str]
+            Cadenas a resolver.
+
+        Returns:
+        ---------
+        dict[str, int]
+            Id de cada cadena.
+        """
+        ids: dict[str, int] = {}
+        missing = []
+        with self._lock:
+            for value in values:
+                string_id = self._ids.get(value) or self._pending.get(value)
+                if string_id is None:
+                    missing.append(value)
+                else:
+                    ids[value] = string_id
+
+        table = InternedString.__table__
+        for start in range(0, len(missing), INTERN_CHUNK_SIZE):
+            chunk = missing[start : start + INTERN_CHUNK_SIZE]
+            session.execute(
+                dialect_insert(session, table)
+                .values([{"value": value} for value in chunk])
+                .on_conflict_do_nothing()
+            )
+            found = {
+                value: string_id
+                for value, string_id in session.execute(
+                    select(InternedString.value, InternedString.id).where(
+                        InternedString.value.in_(chunk)
+                    )
+                )
+            }
+            ids.update(found)
+            with self._lock:
+                self._pending.update(found)
+        return ids
+
+    def commit(self) -> None:
+        """
+        Incorpora a la caché las cadenas resueltas en la transacción que se
+        acaba de confirmar.
+        """
+        with self._lock:
+            for value, string_id in self._pending.items():
+                self._ids[value] = string_id
+                self._ids.move_to_end(value)
+            while len(self._ids) > self.max_cached_strings:
+                self._ids.popitem(last=False)
+            self._pending = {}
+
+    def rollback(self) -> None:
+        """
+        Descarta las cadenas resueltas en la transacción que se acaba de
+        deshacer.
+        """
+        with self._lock:
+            self._pending = {}
+
+    def clear(self) -> None:
+        """
+        Vacía la caché, por ejemplo tras borrar la tabla de cadenas.
+        """
+        with self._lock:
+            self._ids.clear()
+            self._pending = {}
+
+
+def interaction_values(
+    session: DatabaseSession,
+    rows: Sequence[InteractionRow],
+    strings: StringInterner | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Valores de las columnas de `Interactions` para insertar un lote de
+    interacciones. Si se indica un `StringInterner` los detalles se
+    normalizan; si no, se guardan tal cual en `details`.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy de la transacción del lote.
+    rows: Sequence[InteractionRow]
+        Interacciones a insertar.
+    strings: StringInterner | None
+        Caché de cadenas internadas.
+
+    Returns:
+    ---------
+    list[dict[str, Any]]
+        Valores de cada fila, todas con las mismas columnas.
+    """
+    empty = {column: None for column in (*VALUE_COLUMNS, *STRING_FIELDS.values())}
+    if strings is None:
+        return [{**row._asdict(), **empty} for row in rows]
+
+    normalized = [normalize_details(row.type, row.details) for row in rows]
+    ids = strings.resolve(
+        session, {value for _, fields, _ in normalized for value in fields.values()}
+    )
+    return [
+        {
+            **empty,
+            "type": row.type,
+            "time": row.time,
+            "session_id": row.session_id,
+            "details": rest,
+            **values,
+            **{STRING_FIELDS[field]: ids[value] for field, value in fields.items()},
+        }
+        for row, (values, fields, rest) in zip(rows, normalized)
+    ]
+
+
+def select_interactions(*columns: Any) -> Select:
+    """
+    Consulta de las columnas indicadas de `Interactions` junto con las
+    necesarias para reconstruir los detalles mediante `row_details`, que
+    deben incluir `Interaction.type`.
+    """
+    query = select(
+        *columns,
+        Interaction.raw_details.label("detail_raw"),
+        *(
+            getattr(Interaction, column).label(f"detail_{column}")
+            for column in VALUE_COLUMNS
+        ),
+        *(
+            alias.value.label(f"detail_{field}")
+            for field, alias in _STRING_ALIASES.items()
+        ),
+    )
+    for field, alias in _STRING_ALIASES.items():
+        query = query.outerjoin(
+            alias, alias.id == getattr(Interaction, STRING_FIELDS[field])
+        )
+    return query
+
+
+def row_details(row: Row) -> Any:
+    """
+    Reconstruye los detalles de una fila obtenida con `select_interactions`.
+    """
+    mapping = row._mapping
+    return denormalize_details(
+        mapping["type"],
+        {column: mapping[f"detail_{column}"] for column in VALUE_COLUMNS},
+        {field: mapping[f"detail_{field}"] for field in STRING_FIELDS},
+        mapping["detail_raw"],
+    )
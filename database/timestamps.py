@@ -0,0 +1,90 @@
+"""
+Marcas de tiempo de las interacciones.
+
+La extensión envía las marcas de tiempo con `new Date().toISOString()`
+(`2025-01-01T12:00:00.000Z`), que `datetime.fromisoformat` interpreta cientos
+de veces más rápido que `dateutil`; este solo se usa para otros formatos.
+
+Las columnas por las que se ordenan y filtran las interacciones, los
+fotogramas clave y los totales de las sesiones guardan microsegundos desde
+1970 en UTC (`EpochMicroseconds`), que ocupan menos y se comparan más rápido
+que las fechas en texto de SQLite, pero se siguen leyendo y escribiendo como
+`datetime`.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from dateutil.parser import parse as parse_date  # type: ignore[import-untyped]
+from sqlalchemy import BigInteger
+from sqlalchemy.engine import Dialect
+from sqlalchemy.types import TypeDecorator
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Interpreta una marca de tiempo ISO 8601, recurriendo a `dateutil` si no
+    tiene el formato estándar.
+
+    Parámetros:
+    ------------
+    value: str
+        Marca de tiempo a interpretar.
+
+    Returns:
+    ---------
+    datetime
+        Fecha y hora, con zona horaria si la marca de tiempo la indica.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return parse_date(value)
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """
+    Convierte una fecha a UTC sin zona horaria, que es como se guardan las
+    fechas de las interacciones. Las fechas sin zona horaria se consideran ya
+    en UTC.
+    """
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_epoch_us(moment: datetime) -> int:
+    """
+    Microsegundos desde 1970 de una fecha. Las fechas sin zona horaria se
+    consideran en UTC.
+    """
+    return (naive_utc(moment) - EPOCH) // MICROSECOND
+
+
+def from_epoch_us(value: int) -> datetime:
+    """
+    Fecha en UTC, sin zona horaria, de unos microsegundos desde 1970.
+    """
+    return EPOCH + timedelta(microseconds=value)
+
+
+class EpochMicroseconds(TypeDecorator[datetime]):
+    """
+    Fecha guardada como un entero de microsegundos desde 1970 en UTC. Al leerla
+    se obtiene un `datetime` en UTC sin zona horaria, como con `DateTime`.
+    También admite directamente enteros en las consultas.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect: Dialect) -> int | None:
+        if value is None or isinstance(value, int):
+            return value
+        return to_epoch_us(value)
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> datetime | None:
+        return None if value is None else from_epoch_us(value)
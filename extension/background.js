@@ -6,31 +6,70 @@ const INACTIVITY_TIMEOUT = 30 * 60 * 1000;
 const logger = new Logger('background.js');
 let blacklistedSites = [];
 let isTracking = true;
+let currentSessionId = null;
+
+function webSocketUrl() {
+    // El id de la sesión dirige las reconexiones al mismo worker del servidor
+    return currentSessionId ? `${WS_URL}?session=${encodeURIComponent(currentSessionId)}` : WS_URL;
+}
 
 function setupWebSocket() {
     const RECONNECT_DELAY = 5000;
 
+    function connect() {
+        // Los manejadores pertenecen a cada WebSocket, por lo que se vuelven a
+        // registrar en cada reconexión
+        clientWebSocket.connect(webSocketUrl(), resumeMessages);
+        clientWebSocket.onOpen(() => {
+            logger.info('WebSocket connection established');
+        });
+
+        clientWebSocket.onClose(() => {
+            logger.info('WebSocket connection closed, reconnecting in 5s...');
+            setTimeout(attemptReconnect, RECONNECT_DELAY);
+        });
+
+        clientWebSocket.onAnyMessage((message) => {
+            logger.info('Message received:', message);
+        });
+
+        clientWebSocket.onError((error) => {
+            logger.error('WebSocket error:', error);
+        });
+    }
+
     function attemptReconnect() {
         logger.info('Reconnecting to WebSocket...');
-        clientWebSocket.connect(WS_URL);
+        connect();
     }
 
-    clientWebSocket.connect(WS_URL);
-    clientWebSocket.onOpen(() => {
-        logger.info('WebSocket connection established');
-    });
-
-    clientWebSocket.onClose(() => {
-        logger.info('WebSocket connection closed, reconnecting in 5s...');
-        setTimeout(attemptReconnect, RECONNECT_DELAY);
-    });
+    connect();
+}
 
-    clientWebSocket.onAnyMessage((message) => {
-        logger.info('Message received:', message);
-    });
+function resumeMessages() {
+    // Una conexión nueva no conoce la sesión en curso, que puede haberse
+    // iniciado en otra conexión (o en otro worker del servidor). El mensaje que
+    // la retoma se envía antes que los eventos encolados durante la reconexión.
+    return new Promise((resolve) => {
+        chrome.storage.local.get(['sessionId', 'trackingEnabled'], (data) => {
+            if (data.trackingEnabled === false || !data.sessionId) {
+                resolve([]);
+                return;
+            }
 
-    clientWebSocket.onError((error) => {
-        logger.error('WebSocket error:', error);
+            currentSessionId = data.sessionId;
+            logger.info('Resuming session:', { sessionId: data.sessionId });
+            resolve([
+                {
+                    type: 'session_state_changed',
+                    message: {
+                        timestamp: new Date().toISOString(),
+                        sessionId: data.sessionId,
+                        action: 'resume',
+                    },
+                },
+            ]);
+        });
     });
 }
 
@@ -59,6 +98,7 @@ function notifySessionStart(sessionId) {
 function startNewSession() {
     const newSessionId = generateSessionId();
     const now = Date.now();
+    currentSessionId = newSessionId;
 
     chrome.storage.local.set(
         {
@@ -0,0 +1,81 @@
+// Codificador del formato compacto "webchronicle.compact.v1". Su decodificador
+// en el servidor es `CompactDecoder` en `webchronicle/protocol.py`.
+
+export const JSON_SUBPROTOCOL = 'webchronicle.json';
+export const COMPACT_SUBPROTOCOL = 'webchronicle.compact.v1';
+
+// Orden posicional de los campos de `details` para los eventos habituales.
+const EVENT_LAYOUTS = {
+    click: ['path', 'target', 'x', 'y'],
+    input: ['path', 'target', 'key', 'modAlt', 'modCtrl', 'modShift', 'modMeta'],
+    scroll: ['x', 'y'],
+    resize: ['width', 'height'],
+    tab_created: ['tabId', 'url'],
+    tab_updated: ['tabId', 'url'],
+    tab_highlighted: ['tabId', 'url'],
+};
+
+// Campos cuyas cadenas se transmiten una sola vez por conexión.
+const INTERNED_FIELDS = new Set(['path', 'target', 'url']);
+
+const RECORD_TYPES = { event_logged: 'e', tab_event: 't' };
+
+export class CompactEncoder {
+    constructor() {
+        // El estado es propio de cada conexión: debe crearse un codificador nuevo
+        // cada vez que se abre el WebSocket.
+        this.strings = new Map();
+        this.lastTimestamp = 0;
+    }
+
+    intern(value) {
+        if (typeof value !== 'string') {
+            return value;
+        }
+
+        const index = this.strings.get(value);
+        if (index !== undefined) {
+            return index;
+        }
+
+        this.strings.set(value, this.strings.size);
+        return value;
+    }
+
+    encodeDetails(event, details) {
+        const layout = EVENT_LAYOUTS[event];
+        const keys = Object.keys(details);
+
+        // Solo se usa la forma posicional si no se pierde ningún campo.
+        if (!layout || keys.length !== layout.length || !layout.every((field) => field in details)) {
+            return details;
+        }
+
+        return layout.map((field) =>
+            INTERNED_FIELDS.has(field) ? this.intern(details[field]) : details[field]
+        );
+    }
+
+    encodeRecord({ type, message }) {
+        const recordType = RECORD_TYPES[type];
+        const timestamp = message.timestamp ? Date.parse(message.timestamp) : NaN;
+
+        if (!recordType || Number.isNaN(timestamp) || !message.details) {
+            return ['j', type, message];
+        }
+
+        const delta = timestamp - this.lastTimestamp;
+        this.lastTimestamp = timestamp;
+
+        return [
+            recordType,
+            delta,
+            this.intern(message.event),
+            this.encodeDetails(message.event, message.details),
+        ];
+    }
+
+    encode(messages) {
+        return JSON.stringify(messages.map((message) => this.encodeRecord(message)));
+    }
+}
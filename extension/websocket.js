@@ -1,12 +1,22 @@
 import { Logger } from './logger.js';
+import { COMPACT_SUBPROTOCOL, CompactEncoder, JSON_SUBPROTOCOL } from './compact.js';
 
 const logger = new Logger('websocket.js');
+const DEFAULT_BACKPRESSURE_DELAY = 250;
+const BATCHABLE_TYPES = ['event_logged', 'tab_event'];
+const BATCH_MAX_MESSAGES = 50;
+const BATCH_DELAY = 100;
 
 class WebSocketClient {
     constructor() {
         if (!WebSocketClient.instace) {
             this.ws = null;
             this.sendQueue = [];
+            this.pausedUntil = 0;
+            this.held = false;
+            this.pendingBatch = [];
+            this.batchTimer = null;
+            this.encoder = null;
             WebSocketClient.instance = this;
         }
 
@@ -72,14 +82,99 @@ class WebSocketClient {
         return data.hasOwnProperty('type') && data.hasOwnProperty('message');
     }
 
-    connect(url) {
+    connect(url, openingMessages = async () => []) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.close();
             logger.info('WebSocket already openned, closing existing WebSocket connection...');
         }
 
         logger.info('Connecting to WebSocket:', { url });
-        this.ws = new WebSocket(url);
+        // Se ofrece el formato compacto; si el servidor no lo acepta se usa JSON.
+        this.ws = new WebSocket(url, [COMPACT_SUBPROTOCOL, JSON_SUBPROTOCOL]);
+        this.pausedUntil = 0;
+        this.encoder = null;
+        // La cola se retiene hasta obtener los mensajes de apertura (por ejemplo,
+        // el que retoma la sesión), que deben llegar al servidor antes que los
+        // eventos pendientes para que este sepa a qué sesión pertenecen.
+        this.held = true;
+        this.onOpen(async () => {
+            this.encoder = this.ws.protocol === COMPACT_SUBPROTOCOL ? new CompactEncoder() : null;
+            logger.info('WebSocket protocol negotiated:', { protocol: this.ws.protocol || 'json' });
+
+            let opening = [];
+            try {
+                opening = await openingMessages();
+            } catch (error) {
+                logger.error('Error preparing opening messages:', error);
+            }
+            this.held = false;
+            this.sendQueue.unshift(...opening);
+            this.flushQueue();
+        });
+        this.onMessage('backpressure', (message) => this.handleBackpressure(message));
+    }
+
+    handleBackpressure(message) {
+        // El servidor no da abasto para escribir los eventos recibidos, por lo que
+        // se retienen los mensajes localmente durante el tiempo indicado.
+        const delay = message.retryAfter || DEFAULT_BACKPRESSURE_DELAY;
+        this.pausedUntil = Date.now() + delay;
+        logger.warn('Server under backpressure, pausing sends:', {
+            delay,
+            queueDepth: message.queueDepth,
+        });
+        setTimeout(() => this.flushQueue(), delay);
+    }
+
+    isPaused() {
+        return Date.now() < this.pausedUntil;
+    }
+
+    flushQueue() {
+        if (!this.ws || this.ws.readyState !== WebSocket.OPEN || this.held || this.isPaused()) {
+            return;
+        }
+
+        if (this.sendQueue.length > 0) {
+            const messages = this.sendQueue;
+            this.sendQueue = [];
+            this.encodeFrames(messages).forEach((frame) => this.ws.send(frame));
+        }
+    }
+
+    encodeFrames(messages) {
+        // Los mensajes se serializan al enviarse y no al encolarse, porque el
+        // formato compacto depende del estado de la conexión actual.
+        if (this.encoder) {
+            return [this.encoder.encode(messages)];
+        }
+
+        const frames = [];
+        let batch = [];
+        const flush = () => {
+            if (batch.length === 1) {
+                frames.push(JSON.stringify(batch[0]));
+            } else if (batch.length > 1) {
+                frames.push(JSON.stringify({ type: 'batch', message: { messages: batch } }));
+            }
+            batch = [];
+        };
+
+        messages.forEach((message) => {
+            if (!BATCHABLE_TYPES.includes(message.type)) {
+                flush();
+                frames.push(JSON.stringify(message));
+                return;
+            }
+
+            batch.push(message);
+            if (batch.length >= BATCH_MAX_MESSAGES) {
+                flush();
+            }
+        });
+        flush();
+
+        return frames;
     }
 
     close() {
@@ -90,20 +185,45 @@ class WebSocketClient {
     }
 
     send(type, message) {
-        if (this.ws && this.ws.readyState === WebSocket.OPEN) {
-            if (this.sendQueue.length > 0) {
-                this.sendQueue.forEach((data) => {
-                    this.ws.send(data);
-                });
-                this.sendQueue = [];
+        // Los eventos de alta frecuencia se agrupan en mensajes "batch" para no
+        // pagar una trama por evento; el resto de mensajes se envían de inmediato,
+        // vaciando antes el lote pendiente para conservar el orden.
+        if (BATCHABLE_TYPES.includes(type)) {
+            this.pendingBatch.push({ type, message });
+
+            if (this.pendingBatch.length >= BATCH_MAX_MESSAGES) {
+                this.flushBatch();
+            } else if (!this.batchTimer) {
+                this.batchTimer = setTimeout(() => this.flushBatch(), BATCH_DELAY);
             }
+            return;
+        }
+
+        this.flushBatch();
+        this.sendMessages([{ type, message }]);
+    }
 
-            this.ws.send(JSON.stringify({ type, message }));
+    flushBatch() {
+        clearTimeout(this.batchTimer);
+        this.batchTimer = null;
+
+        if (this.pendingBatch.length === 0) {
+            return;
+        }
+
+        const messages = this.pendingBatch;
+        this.pendingBatch = [];
+        this.sendMessages(messages);
+    }
+
+    sendMessages(messages) {
+        this.sendQueue.push(...messages);
+
+        if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+            this.flushQueue();
         } else {
-            this.sendQueue.push(JSON.stringify({ type, message }));
             logger.warn('Could not send message to server, WebSocket is not connected, data:', {
-                type,
-                message,
+                messages,
             });
         }
     }
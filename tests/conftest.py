@@ -0,0 +1,60 @@
+# Configuración común de las pruebas
+import os
+
+import pytest
+
+from database.base import DATABASE_URI_ENV, MEMORY_DATABASE_URI, db
+
+# Las pruebas usan siempre una base de datos en memoria, independiente de la
+# configurada en el entorno, para partir de un estado conocido.
+os.environ[DATABASE_URI_ENV] = MEMORY_DATABASE_URI
+
+
+# Fixture para configurar las pruebas: crea las tablas en el contexto de la
+# aplicación y las borra al terminar. Los módulos que necesitan datos de
+# partida la redefinen a partir de esta.
+@pytest.fixture
+def test_app():
+    from webchronicle.app import app
+
+    app.config.update(TESTING=True)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+# Fixture con un cliente de prueba para hacer solicitudes a la aplicación
+@pytest.fixture
+def test_client(test_app):
+    return test_app.test_client()
+
+
+# `initialize_database` sustituye la sesión global de la base de datos, por lo
+# que se restaura tras cada prueba para no afectar a las siguientes.
+@pytest.fixture(autouse=True)
+def restore_database_session():
+    session = db.session
+    yield
+    db.session = session
+
+
+# La caché de respuestas se comparte entre pruebas que reutilizan los mismos
+# identificadores de sesión, por lo que se vacía tras cada una.
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    yield
+    from webchronicle.app import response_cache
+
+    response_cache.clear()
+
+
+# Las pruebas borran las tablas al terminar, por lo que los ids de las cadenas
+# internadas dejan de ser válidos.
+@pytest.fixture(autouse=True)
+def clear_interned_strings():
+    yield
+    from webchronicle.app import strings
+
+    strings.clear()
@@ -0,0 +1,131 @@
+# Pruebas de los agregados de sesiones y sitios
+from datetime import timedelta
+from dateutil.parser import parse as parse_date
+from webchronicle.app import db, apply_operations
+from webchronicle.ingestion import WriteOperation
+from database.aggregates import rebuild_aggregates
+from database.archive import archive_ended_sessions
+from database.models import (
+    Interaction,
+    InteractionRow,
+    Keyframe,
+    SearchPosting,
+    SessionEventCount,
+    SessionStats,
+    VisitedSite,
+)
+
+START = parse_date("2025-01-01T12:00:00Z")
+
+
+def record_session(session_id: str, events: int, end: bool = False) -> None:
+    rows = [
+        InteractionRow(
+            ["click", "input", "scroll"][index % 3],
+            START + timedelta(seconds=index),
+            {"x": index, "y": 0},
+            session_id,
+        )
+        for index in range(events)
+    ]
+    tab_event = {
+        "event": "tab_updated",
+        "timestamp": "2025-01-01T12:00:00Z",
+        "details": {"tabId": 1, "url": "https://example.com/"},
+    }
+    apply_operations([WriteOperation("session_start", session_id, START)])
+    apply_operations(
+        [WriteOperation("batch", session_id, (rows[: events // 2], [tab_event]))]
+    )
+    apply_operations([WriteOperation("interactions", session_id, rows[events // 2 :])])
+    if end:
+        apply_operations(
+            [WriteOperation("session_end", session_id, START + timedelta(hours=1))]
+        )
+
+
+def snapshot() -> tuple:
+    stats = {
+        row.session_id: (row.event_count, row.first_event, row.last_event)
+        for row in SessionStats.query.all()
+    }
+    counts = {
+        (row.session_id, row.type): row.count for row in SessionEventCount.query.all()
+    }
+    sites = {site.url: site.session_count for site in VisitedSite.query.all()}
+    return stats, counts, sites
+
+
+# Prueba para verificar que la ruta de escritura mantiene los agregados
+def test_incremental_aggregates(test_app):
+    record_session("aggregates-a", 10)
+    record_session("aggregates-b", 4)
+
+    stats, counts, sites = snapshot()
+    first = START.replace(tzinfo=None)
+    assert stats["aggregates-a"] == (10, first, first + timedelta(seconds=9))
+    assert counts[("aggregates-a", "click")] == 4
+    assert counts[("aggregates-b", "scroll")] == 1
+    assert sites == {"https://example.com/": 2}
+
+    response = test_app.test_client().get("/sessions")
+    assert response.status_code == 200
+    assert b"click: 4, input: 3, scroll: 3" in response.data
+    assert b"0:00:09" in response.data
+
+
+# Prueba para verificar que las marcas de tiempo con zona horaria se guardan en
+# UTC en las interacciones y en todos los agregados, aunque se mezclen con
+# marcas de tiempo sin zona horaria
+def test_aggregates_offset_timestamps(test_app):
+    local = parse_date("2025-01-01T12:00:00+02:00")
+    rows = [
+        InteractionRow(
+            "scroll", local + timedelta(seconds=10 * index), {"y": index}, "offset"
+        )
+        for index in range(8)
+    ]
+    tab_events = [
+        {
+            "event": "tab_updated",
+            "timestamp": timestamp,
+            "details": {"tabId": 1, "url": "https://example.com/"},
+        }
+        for timestamp in ("2025-01-01T10:00:00", "2025-01-01T12:30:00+02:00")
+    ]
+    apply_operations([WriteOperation("session_start", "offset", local)])
+    apply_operations([WriteOperation("batch", "offset", (rows, tab_events))])
+
+    first = parse_date("2025-01-01T10:00:00")
+    last = first + timedelta(seconds=70)
+    assert db.session.get(SessionStats, "offset").first_event == first
+    assert db.session.get(SessionStats, "offset").last_event == last
+    times = [row.time for row in Interaction.query.filter_by(session_id="offset")]
+    assert min(times) == first and max(times) == last
+    keyframes = Keyframe.query.filter_by(session_id="offset").all()
+    assert keyframes
+    assert all(first <= keyframe.time <= last for keyframe in keyframes)
+    postings = SearchPosting.query.filter_by(session_id="offset", field="type").all()
+    assert [(posting.first_time, posting.last_time) for posting in postings] == [
+        (first, last)
+    ]
+    site = VisitedSite.query.one()
+    assert (site.first_visit, site.last_visit) == (first, first + timedelta(minutes=30))
+
+
+# Prueba para verificar que la reconstrucción obtiene los mismos agregados,
+# también para las sesiones archivadas
+def test_rebuild_aggregates(test_app, tmp_path):
+    record_session("rebuild-a", 12, end=True)
+    record_session("rebuild-b", 5)
+    expected = snapshot()
+
+    archive_ended_sessions(db.session, tmp_path)
+    db.session.query(SessionStats).delete()
+    db.session.query(SessionEventCount).delete()
+    db.session.query(VisitedSite).update({"session_count": 0})
+    db.session.commit()
+
+    assert rebuild_aggregates(db.session) == 2
+    db.session.commit()
+    assert snapshot() == expected
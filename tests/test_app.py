@@ -1,44 +1,29 @@
-# Clase de pruebas del servidor de la aplicación 
-import pytest
-from flask import Flask
-from webchronicle.app import app, db, add_interaction, process_tab_event
-from database.models import Session, Interaction, VisitedSite
+# Clase de pruebas del servidor de la aplicación
+from webchronicle.app import app, db
+from webchronicle.connection import add_interaction
+from webchronicle.ingestion import FlushPolicy, InteractionBuffer
+from database.models import Session, Interaction
 from dateutil.parser import parse as parse_date
-from json import dumps, loads
-from flask.testing import FlaskClient
-
-# Fixture para configurar las pruebas 
-@pytest.fixture
-def test_app():
-    app.config.update(
-        TESTING=True,  # Habilitar modo de prueba
-        SQLALCHEMY_DATABASE_URI="sqlite:///:memory:", 
-        SQLALCHEMY_TRACK_MODIFICATIONS=False,  
-    )
-    with app.app_context():
-        db.create_all()  
-        yield app  
-        db.session.remove() 
-        db.drop_all() 
 
-# Fixture para crear un cliente de prueba
-@pytest.fixture
-def test_client(test_app) -> FlaskClient:
-    return test_app.test_client()  # Devolver cliente de prueba para hacer solicitudes
 
 # Prueba para verificar la página de sesiones
 def test_sessions_index(test_client):
-    response = test_client.get("/sessions")  # Realizar una solicitud GET a la ruta /sessions
+    # Realizar una solicitud GET a la ruta /sessions
+    response = test_client.get("/sessions")
     assert response.status_code == 200  # Verificar que el código de estado sea 200 (OK)
-    assert b"Sessions" in response.data  # Verifica que la respuesta contenga la palabra "Sessions"
+    # Verifica que la respuesta contenga la palabra "Sessions"
+    assert b"Sessions" in response.data
+
 
 # Prueba para verificar la visualización de eventos
 def test_view_events(test_client, test_app):
     with test_app.app_context():
         # Crear una nueva sesión
-        session = Session(id="test-session", start_time=parse_date("2025-01-01T12:00:00Z"))
-        db.session.add(session) 
-        db.session.commit()  
+        session = Session(
+            id="test-session", start_time=parse_date("2025-01-01T12:00:00Z")
+        )
+        db.session.add(session)
+        db.session.commit()
 
         # Crear una nueva interacción
         interaction = Interaction(
@@ -50,39 +35,172 @@ def test_view_events(test_client, test_app):
         db.session.add(interaction)  # Agregar la interacción a la base de datos
         db.session.commit()  # Confirmar los cambios
 
-        response = test_client.get(f"/events/{session.id}")  # Realizar una solicitud GET a la ruta de eventos
-        assert response.status_code == 200  # Verificar que el código de estado sea 200 (OK)
-        assert b"click" in response.data  # Verificar que la respuesta contenga la palabra "click"
+        # Realizar una solicitud GET a la ruta de eventos
+        response = test_client.get(f"/events/{session.id}")
+        # Verificar que el código de estado sea 200 (OK)
+        assert response.status_code == 200
+        # Verificar que la respuesta contenga la palabra "click"
+        assert b"click" in response.data
+
+
+def add_session_events(session_id: str, count: int) -> None:
+    db.session.add(
+        Session(id=session_id, start_time=parse_date("2025-01-01T12:00:00Z"))
+    )
+    db.session.add_all(
+        Interaction(
+            type="click" if index % 2 else "scroll",
+            # Eventos simultáneos de dos en dos para comprobar el desempate por id
+            time=parse_date(f"2025-01-01T12:{index // 2:02d}:00Z"),
+            details={"index": index},
+            session_id=session_id,
+        )
+        for index in range(count)
+    )
+    db.session.commit()
+
+
+def event_indexes(data: bytes) -> list[int]:
+    return [int(part.split(b"}")[0]) for part in data.split(b"&#39;index&#39;: ")[1:]]
+
+
+# Prueba para verificar la paginación por cursor y los filtros de eventos
+def test_view_events_pages(test_client, test_app):
+    with test_app.app_context():
+        add_session_events("paged-session", 25)
+
+    seen = []
+    url = "/events/paged-session?limit=10"
+    while url:
+        response = test_client.get(url)
+        assert response.status_code == 200
+        seen += event_indexes(response.data)
+        next_link = response.data.split(b'href="/events/')[1:]
+        url = (
+            "/events/" + next_link[0].split(b'"')[0].decode().replace("&amp;", "&")
+            if next_link
+            else None
+        )
+    assert seen == list(range(25))
+
+    response = test_client.get(
+        "/events/paged-session?type=click&from=2025-01-01T12:02:00Z&to=2025-01-01T12:05:00Z"
+    )
+    assert event_indexes(response.data) == [5, 7, 9]
+    assert b"Next page" not in response.data
+
+    assert test_client.get("/events/paged-session?after=invalid").status_code == 400
+    assert test_client.get("/events/paged-session?from=invalid").status_code == 400
+
+
+# Prueba para verificar el modo streaming del listado de eventos
+def test_view_events_stream(test_client, test_app):
+    with test_app.app_context():
+        add_session_events("streamed-session", 25)
+
+    response = test_client.get("/events/streamed-session?stream=1&type=scroll")
+    assert response.is_streamed
+    assert event_indexes(response.data) == list(range(0, 25, 2))
+
 
 # Prueba para verificar la conexión del websocket
 def test_websocket_connection(test_client, test_app):
-    with test_app.test_client() as client:
-        rules = [str(rule) for rule in app.url_map.iter_rules()]  # Obtener las reglas de URL de la aplicación
-        assert '/ws' in rules  # Verificar que la ruta '/ws' esté en las reglas
+    with test_app.test_client():
+        # Obtener las reglas de URL de la aplicación
+        rules = [str(rule) for rule in app.url_map.iter_rules()]
+        assert "/ws" in rules  # Verificar que la ruta '/ws' esté en las reglas
+
 
 # Prueba para agregar una interacción
 def test_add_interaction(test_app):
     with test_app.app_context():
         # Crear una nueva sesión
-        session = Session(id="test-session", start_time=parse_date("2025-01-01T12:00:00Z"))
-        db.session.add(session)  
-        db.session.commit()  
+        session = Session(
+            id="test-session", start_time=parse_date("2025-01-01T12:00:00Z")
+        )
+        db.session.add(session)
+        db.session.commit()
 
-        interaction_buffer = []  # Inicializar buffer para interacciones
+        # Inicializar buffer para interacciones
+        interaction_buffer = InteractionBuffer(FlushPolicy())
         message_data = {
             "event": "click",
             "timestamp": "2025-01-01T12:01:00Z",
             "details": {"x": 100, "y": 200, "target": "button"},
         }
 
-        add_interaction(message_data, session.id, interaction_buffer)  # Agregar la interacción al buffer
-        assert len(interaction_buffer) == 1  # Verificar que el buffer contenga una interacción
-        assert interaction_buffer[0].details == message_data["details"]  # Verificar que los detalles sean correctos
+        # Agregar la interacción al buffer
+        add_interaction(message_data, session.id, interaction_buffer)
+        # Verificar que el buffer contenga una interacción
+        assert len(interaction_buffer) == 1
+        # Verificar que los detalles sean correctos
+        assert interaction_buffer[0].details == message_data["details"]
+
 
 # Prueba para procesar un evento de pestaña
 def test_process_tab_event(test_app):
     with test_app.app_context():
         # Crear una nueva sesión
-        session = Session(id="test-session", start_time=parse_date("2025-01-01T12:00:00Z"))
+        session = Session(
+            id="test-session", start_time=parse_date("2025-01-01T12:00:00Z")
+        )
         db.session.add(session)
-        db.session.commit
\ No newline at end of file
+        db.session.commit
+
+
+# Prueba para verificar el índice y las ventanas de la API de reproducción
+def test_replay_chunks(test_client, test_app):
+    test_app.config["REPLAY_CHUNK_MS"] = 60_000
+    with test_app.app_context():
+        db.session.add(
+            Session(id="replay-session", start_time=parse_date("2025-01-01T12:00:00Z"))
+        )
+        db.session.add_all(
+            Interaction(
+                type=event,
+                time=parse_date(time),
+                details=details,
+                session_id="replay-session",
+            )
+            for event, time, details in [
+                (
+                    "tab_created",
+                    "2025-01-01T12:00:00Z",
+                    {"tabId": 1, "url": "https://example.com"},
+                ),
+                ("click", "2025-01-01T12:00:30Z", {"path": "/html/body"}),
+                ("click", "2025-01-01T12:02:10Z", {"path": "/html/body/div"}),
+                (
+                    "tab_updated",
+                    "2025-01-01T12:02:59.999Z",
+                    {"tabId": 1, "url": "https://example.org"},
+                ),
+            ]
+        )
+        db.session.commit()
+
+    index = test_client.get("/api/sessions/replay-session/replay").get_json()
+    assert index["event_count"] == 4
+    assert [
+        (chunk["index"], chunk["offset"], chunk["count"]) for chunk in index["chunks"]
+    ] == [(0, 0, 2), (2, 2, 2)]
+    assert [
+        (tab["offset"], tab["time_ms"], tab["details"]["url"]) for tab in index["tabs"]
+    ] == [
+        (0, 0, "https://example.com"),
+        (3, 179_999, "https://example.org"),
+    ]
+
+    chunk = test_client.get("/api/sessions/replay-session/replay/2").get_json()
+    assert [(action["time_ms"], action["event"]) for action in chunk["actions"]] == [
+        (130_000, "click"),
+        (179_999, "tab_updated"),
+    ]
+    assert (
+        test_client.get("/api/sessions/replay-session/replay/1").get_json()["actions"]
+        == []
+    )
+
+    assert test_client.get("/api/sessions/missing/replay").status_code == 404
+    assert test_client.get("/api/sessions/missing/replay/0").status_code == 404
+    assert b"Session not found" in test_client.get("/play/missing").data
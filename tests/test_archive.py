@@ -0,0 +1,182 @@
+# Pruebas del archivo columnar de sesiones terminadas
+import time
+from datetime import datetime, timedelta, timezone
+from dateutil.parser import parse as parse_date
+from webchronicle.app import db
+from database.archive import SEGMENT_SIZE, archive_ended_sessions, open_session_archive
+from database.models import ArchivedSession, Interaction, Session
+
+START = parse_date("2025-01-01T12:00:00")
+
+
+def record_session(session_id: str, events: int, ended: bool = True) -> list[tuple]:
+    db.session.add(
+        Session(
+            id=session_id,
+            start_time=START,
+            end_time=START + timedelta(hours=1) if ended else None,
+        )
+    )
+    rows = []
+    for index in range(events):
+        if index % 100 == 0:
+            event, details = (
+                "tab_updated",
+                {"tabId": 1, "url": f"https://example.com/{index // 1000}"},
+            )
+        else:
+            event, details = (
+                "click",
+                {
+                    "path": f"/html/body/div[{index % 7}]",
+                    "target": "DIV",
+                    "x": index,
+                    "y": None,
+                },
+            )
+        # Varios eventos en el mismo momento para comprobar el orden por id
+        rows.append((event, START + timedelta(milliseconds=40 * (index // 3)), details))
+    db.session.execute(
+        Interaction.__table__.insert(),
+        [
+            {"type": event, "time": time, "details": details, "session_id": session_id}
+            for event, time, details in rows
+        ],
+    )
+    db.session.commit()
+    return [
+        (row.id, row.time, row.type, row.details)
+        for row in db.session.execute(
+            db.select(Interaction)
+            .where(Interaction.session_id == session_id)
+            .order_by(Interaction.time, Interaction.id)
+        ).scalars()
+    ]
+
+
+# Prueba para verificar que el archivo conserva los eventos y poda la tabla
+def test_archive_round_trip(test_app, tmp_path):
+    original = record_session("archived", SEGMENT_SIZE * 2 + 10)
+    record_session("recording", 10, ended=False)
+
+    archived = archive_ended_sessions(db.session, tmp_path)
+    assert [record.session_id for record in archived] == ["archived"]
+    assert Interaction.query.filter_by(session_id="archived").count() == 0
+    assert Interaction.query.filter_by(session_id="recording").count() == 10
+    assert db.session.get(ArchivedSession, "archived").event_count == len(original)
+
+    archive = open_session_archive(db.session, "archived")
+    assert len(archive.segments) == 3
+    assert [tuple(event) for event in archive.events()] == original
+
+    start, end = original[5000][1], original[6000][1]
+    assert [tuple(event) for event in archive.events(start, end)] == [
+        event for event in original if start <= event[1] < end
+    ]
+
+    # Las sesiones ya archivadas no se vuelven a archivar
+    assert archive_ended_sessions(db.session, tmp_path) == []
+
+
+# Prueba para verificar que las interacciones que llegan tras archivar una
+# sesión se añaden a su archivo antes de podarlas, y que las que ya estaban en
+# él (por una poda interrumpida) solo se podan
+def test_archive_late_interactions(test_app, tmp_path):
+    original = record_session("late", 500)
+    archive_ended_sessions(db.session, tmp_path)
+
+    # Una poda interrumpida deja en la tabla interacciones ya archivadas
+    id, moment, event, details = original[10]
+    db.session.execute(
+        Interaction.__table__.insert(),
+        [
+            {
+                "id": id,
+                "type": event,
+                "time": moment,
+                "details": details,
+                "session_id": "late",
+            }
+        ],
+    )
+    db.session.commit()
+    assert archive_ended_sessions(db.session, tmp_path) == []
+    assert Interaction.query.filter_by(session_id="late").count() == 0
+
+    # La sesión se retoma y graba nuevos eventos, uno de ellos anterior al
+    # último archivado
+    late = [
+        ("scroll", START + timedelta(hours=2), {"x": 0, "y": 1}),
+        ("scroll", START + timedelta(seconds=1, milliseconds=1), {"x": 0, "y": 2}),
+    ]
+    db.session.execute(
+        Interaction.__table__.insert(),
+        [
+            {"type": event, "time": moment, "details": details, "session_id": "late"}
+            for event, moment, details in late
+        ],
+    )
+    db.session.commit()
+    added = [
+        (row.id, row.time, row.type, row.details)
+        for row in Interaction.query.filter_by(session_id="late")
+    ]
+
+    archived = archive_ended_sessions(db.session, tmp_path)
+    assert [record.session_id for record in archived] == ["late"]
+    assert archived[0].event_count == len(original) + 2
+    assert Interaction.query.filter_by(session_id="late").count() == 0
+
+    archive = open_session_archive(db.session, "late")
+    assert [tuple(event) for event in archive.events()] == sorted(
+        original + added, key=lambda event: (event[1], event[0])
+    )
+
+
+# Prueba para verificar que la antigüedad mínima se mide con la hora UTC, la
+# misma con la que se guardan las sesiones, sea cual sea la zona horaria local
+def test_archive_min_age_utc(test_app, tmp_path, monkeypatch):
+    end = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=30)
+    db.session.add(
+        Session(id="ended", start_time=end - timedelta(hours=1), end_time=end)
+    )
+    db.session.commit()
+
+    monkeypatch.setenv("TZ", "America/Bogota")
+    time.tzset()
+    try:
+        assert (
+            archive_ended_sessions(db.session, tmp_path, min_age=timedelta(hours=1))
+            == []
+        )
+        archived = archive_ended_sessions(
+            db.session, tmp_path, min_age=timedelta(minutes=10)
+        )
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    assert [record.session_id for record in archived] == ["ended"]
+    assert abs(
+        archived[0].archived_at - datetime.now(timezone.utc).replace(tzinfo=None)
+    ) < timedelta(minutes=1)
+
+
+# Prueba para verificar que las vistas y la API de reproducción devuelven lo
+# mismo antes y después de archivar la sesión
+def test_archived_session_views(test_app, tmp_path):
+    record_session("archived-views", 3_000)
+    client = test_app.test_client()
+    urls = [
+        "/events/archived-views?limit=50&type=tab_updated",
+        "/events/archived-views?limit=100&from=2025-01-01T12:00:10&to=2025-01-01T12:00:20",
+        "/events/archived-views?after=2025-01-01T12:00:10_400&limit=20",
+        "/events/archived-views?stream=1&type=tab_updated",
+        "/api/sessions/archived-views/replay",
+        "/api/sessions/archived-views/replay/0",
+        "/api/sessions/archived-views/replay/state?at=30000",
+    ]
+    before = [client.get(url).data for url in urls]
+
+    archive_ended_sessions(db.session, tmp_path)
+    assert Interaction.query.count() == 0
+    assert [client.get(url).data for url in urls] == before
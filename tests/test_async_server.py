@@ -0,0 +1,125 @@
+# Pruebas del servidor de ingesta asíncrono
+import asyncio
+import threading
+import time
+from json import dumps, loads
+
+import pytest
+from simple_websocket import Client, ConnectionError as WebSocketConnectionError
+from webchronicle.app import db, writer as app_writer
+from webchronicle.async_server import handle_client
+from webchronicle.protocol import COMPACT_SUBPROTOCOL, JSON_SUBPROTOCOL
+from database.models import Session, Interaction
+
+
+# Fixture que arranca el servidor en un bucle de eventos en segundo plano, sin
+# el hilo escritor, de forma que las operaciones se aplican a mano
+@pytest.fixture
+def server_url(test_app):
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        asyncio.start_server(handle_client, "127.0.0.1", 0)
+    )
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    yield f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    # Se cancelan las conexiones pendientes antes de cerrar el bucle
+    async def shutdown() -> None:
+        server.close()
+        tasks = [
+            task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def wait_for_operations(count: int, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while app_writer.queue_depth < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def session_message(session_id: str, action: str) -> str:
+    return dumps(
+        {
+            "type": "session_state_changed",
+            "message": {
+                "action": action,
+                "sessionId": session_id,
+                "timestamp": "2025-01-01T12:00:00.000Z",
+            },
+        }
+    )
+
+
+# Prueba para verificar que una sesión grabada por el servidor asíncrono se
+# escribe igual que por la ruta de Flask
+def test_async_session(server_url):
+    session_id = "async-session"
+    client = Client.connect(f"{server_url}/ws")
+    client.send(session_message(session_id, "start"))
+    for i in range(3):
+        client.send(
+            dumps(
+                {
+                    "type": "event_logged",
+                    "message": {
+                        "event": "click",
+                        "timestamp": "2025-01-01T12:00:01.000Z",
+                        "details": {"x": i, "y": i},
+                    },
+                }
+            )
+        )
+    client.send(session_message(session_id, "end"))
+
+    # session_start, interactions y session_end
+    wait_for_operations(3)
+    client.close()
+    assert app_writer.drain() == 3
+
+    assert Interaction.query.filter_by(session_id=session_id).count() == 3
+    assert db.session.get(Session, session_id).end_time is not None
+
+
+# Prueba para verificar la negociación del formato compacto
+def test_async_compact_subprotocol(server_url):
+    client = Client.connect(
+        f"{server_url}/ws", subprotocols=[COMPACT_SUBPROTOCOL, JSON_SUBPROTOCOL]
+    )
+    assert client.subprotocol == COMPACT_SUBPROTOCOL
+
+    client.send(
+        dumps(
+            [
+                [
+                    "j",
+                    "session_state_changed",
+                    loads(session_message("async-compact", "start"))["message"],
+                ],
+                ["e", 1735732860000, "click", ["/html/body", "BODY", 1, 2]],
+                ["e", 10, 0, [1, 2, 3, 4]],
+            ]
+        )
+    )
+    wait_for_operations(1)
+    client.close()
+
+    # Las interacciones pendientes se vuelcan al cerrarse la conexión
+    wait_for_operations(2)
+    assert app_writer.drain() == 2
+    assert Interaction.query.filter_by(session_id="async-compact").count() == 2
+
+
+# Prueba para verificar que solo se acepta la ruta del WebSocket de ingesta
+def test_async_rejects_unknown_path(server_url):
+    with pytest.raises(WebSocketConnectionError):
+        Client.connect(f"{server_url}/other")
@@ -0,0 +1,144 @@
+# Pruebas de las respuestas condicionales y la caché de sesiones terminadas
+from datetime import timedelta
+from dateutil.parser import parse as parse_date
+from sqlalchemy import event
+from webchronicle.app import db, apply_operations, response_cache
+from webchronicle.caching import CachedResponse, ResponseCache
+from webchronicle.ingestion import WriteOperation
+from database.models import InteractionRow
+from database.retention import RetentionPolicy, apply_retention
+
+START = parse_date("2025-01-01T12:00:00Z")
+
+
+def record_session(session_id: str, events: int, offset: int = 0) -> None:
+    rows = [
+        InteractionRow(
+            "scroll", START + timedelta(seconds=index), {"x": 0, "y": index}, session_id
+        )
+        for index in range(offset, offset + events)
+    ]
+    operations = [WriteOperation("interactions", session_id, rows)]
+    if not offset:
+        operations.insert(0, WriteOperation("session_start", session_id, START))
+    apply_operations(operations)
+
+
+def count_statements(client, url: str, **headers) -> tuple:
+    statements = []
+
+    def record(*args) -> None:
+        statements.append(args[2])
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return response, len(statements)
+
+
+# Prueba para verificar que las sesiones terminadas se validan y se sirven desde la caché
+def test_ended_session(test_app):
+    record_session("cached", 20)
+    apply_operations(
+        [WriteOperation("session_end", "cached", START + timedelta(hours=1))]
+    )
+    client = test_app.test_client()
+    hits = response_cache.snapshot()["hits"]
+
+    for url in [
+        "/events/cached?limit=5",
+        "/play/cached",
+        "/api/sessions/cached/replay/0",
+    ]:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.last_modified == START + timedelta(hours=1)
+        assert "no-cache" in response.headers["Cache-Control"]
+        etag = response.headers["ETag"]
+
+        # Las peticiones repetidas solo consultan la versión de la sesión
+        cached, statements = count_statements(client, url)
+        assert (cached.data, cached.headers["ETag"], statements) == (
+            response.data,
+            etag,
+            1,
+        )
+
+        not_modified, statements = count_statements(
+            client, url, **{"If-None-Match": etag}
+        )
+        assert (not_modified.status_code, not_modified.data, statements) == (
+            304,
+            b"",
+            1,
+        )
+        assert not_modified.headers["ETag"] == etag
+
+    assert len(response_cache) == 3
+    assert response_cache.snapshot()["hits"] == hits + 3
+    assert client.get("/events/missing").headers.get("ETag") is None
+
+
+# Prueba para verificar que la versión de las sesiones en grabación cambia con sus eventos
+def test_recording_session(test_app):
+    record_session("recording", 10)
+    client = test_app.test_client()
+
+    response = client.get("/api/sessions/recording/replay")
+    etag = response.headers["ETag"]
+    assert response.last_modified is None
+    assert (
+        client.get(
+            "/api/sessions/recording/replay", headers={"If-None-Match": etag}
+        ).status_code
+        == 304
+    )
+    assert len(response_cache) == 0
+
+    record_session("recording", 5, offset=10)
+    response = client.get(
+        "/api/sessions/recording/replay", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json["event_count"] == 15
+    assert response.headers["ETag"] != etag
+
+
+# Prueba para verificar que la caché descarta las respuestas menos usadas al superar su tamaño
+def test_cache_eviction():
+    cache = ResponseCache(max_bytes=10)
+    cache.put("a", CachedResponse("v1", b"1234", "text/html"))
+    cache.put("b", CachedResponse("v1", b"1234", "text/html"))
+    assert cache.get("a", "v1") is not None
+    cache.put("c", CachedResponse("v1", b"1234", "text/html"))
+    assert (cache.get("b", "v1"), len(cache), cache.size) == (None, 2, 8)
+
+    # Las respuestas mayores que la caché y las de otra versión no se usan
+    cache.put("d", CachedResponse("v1", b"x" * 11, "text/html"))
+    assert cache.get("d", "v1") is None
+    assert cache.get("a", "v2") is None
+
+
+# Prueba para verificar que al recortar una sesión terminada cambia también
+# su fecha de modificación, de forma que los clientes que solo validan por
+# fecha no reciben una respuesta 304 obsoleta
+def test_truncated_session_last_modified(test_app):
+    record_session("trimmed", 10)
+    apply_operations(
+        [WriteOperation("session_end", "trimmed", START + timedelta(hours=1))]
+    )
+    client = test_app.test_client()
+    response = client.get("/events/trimmed")
+    assert response.last_modified == START + timedelta(hours=1)
+    since = response.headers["Last-Modified"]
+    assert (
+        client.get("/events/trimmed", headers={"If-Modified-Since": since}).status_code
+        == 304
+    )
+
+    apply_retention(db.session, RetentionPolicy(max_session_events=4))
+    response = client.get("/events/trimmed", headers={"If-Modified-Since": since})
+    assert response.status_code == 200
+    assert response.last_modified > START + timedelta(hours=1)
@@ -0,0 +1,112 @@
+# Pruebas del reparto de conexiones entre procesos
+import asyncio
+import socket
+import threading
+import time
+from json import dumps
+
+from simple_websocket import Client
+from webchronicle.app import db, apply_operations, writer as app_writer
+from webchronicle.cluster import Router, serve_channel, worker_for
+from webchronicle.ingestion import WriteOperation
+from database.models import Session, Interaction
+from database.timestamps import parse_timestamp
+
+
+# Prueba para verificar que la sesión de la petición fija el worker
+def test_worker_for():
+    assert worker_for("/ws", 4) is None
+    assert worker_for("/ws?session=a", 4) == worker_for("/ws?other=1&session=a", 4)
+    assert {worker_for(f"/ws?session=session-{index}", 4) for index in range(100)} == {
+        0,
+        1,
+        2,
+        3,
+    }
+
+
+# Prueba para verificar que el enrutador pasa la conexión al worker de su
+# sesión, que la atiende igual que el servidor asíncrono
+def test_router_session_affinity(test_app):
+    session_id = "cluster-session"
+    channels = [
+        socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET) for _ in range(3)
+    ]
+    index = worker_for(f"/ws?session={session_id}", len(channels))
+
+    # Solo atiende el worker de la sesión: si la conexión llegara a otro no
+    # se procesaría ningún mensaje
+    loop = asyncio.new_event_loop()
+    router = Router([router_end for router_end, _ in channels])
+    server = loop.run_until_complete(
+        asyncio.start_server(router.handle, "127.0.0.1", 0)
+    )
+    worker = loop.create_task(serve_channel(channels[index][1]))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    port = server.sockets[0].getsockname()[1]
+    client = Client.connect(f"ws://127.0.0.1:{port}/ws?session={session_id}")
+    client.send(
+        dumps(
+            {
+                "type": "session_state_changed",
+                "message": {
+                    "action": "start",
+                    "sessionId": session_id,
+                    "timestamp": "2025-01-01T12:00:00.000Z",
+                },
+            }
+        )
+    )
+    for x in range(3):
+        client.send(
+            dumps(
+                {
+                    "type": "event_logged",
+                    "message": {
+                        "event": "click",
+                        "timestamp": "2025-01-01T12:00:01.000Z",
+                        "details": {"x": x, "y": 0},
+                    },
+                }
+            )
+        )
+    client.close()
+
+    # Al cerrar el canal, el worker termina tras volcar sus conexiones
+    deadline = time.monotonic() + 2
+    while app_writer.queue_depth < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    channels[index][0].close()
+    asyncio.run_coroutine_threadsafe(
+        asyncio.wait_for(asyncio.shield(worker), 2), loop
+    ).result()
+    server.close()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+    app_writer.drain()
+    assert Interaction.query.filter_by(session_id=session_id).count() == 3
+
+
+# Prueba para verificar que retomar una sesión la crea si no llegó a escribirse
+# y no modifica las existentes
+def test_session_resume(test_app):
+    start = parse_timestamp("2025-01-01T12:00:00Z")
+    apply_operations(
+        [
+            WriteOperation("session_start", "resume-existing", start),
+            WriteOperation(
+                "session_resume",
+                "resume-existing",
+                parse_timestamp("2025-01-01T13:00:00Z"),
+            ),
+            WriteOperation("session_resume", "resume-missing", start),
+        ]
+    )
+    assert db.session.get(Session, "resume-existing").start_time == start.replace(
+        tzinfo=None
+    )
+    assert db.session.get(Session, "resume-missing") is not None
@@ -1,38 +1,54 @@
 import pytest
 from flask import Flask
-from sqlalchemy import create_engine
+from types import SimpleNamespace
+from sqlalchemy import create_engine, create_mock_engine, inspect, select, text
+from sqlalchemy.orm import Session as SQLSession
 from datetime import datetime, timedelta
-from database.base import Base, initialize_database, db
-from database.models import Session, Interaction, VisitedSite
+from database.base import (
+    Base,
+    configure_sqlite,
+    engine_options,
+    initialize_database,
+    db,
+)
+from database.models import (
+    Session,
+    SessionStats,
+    Interaction,
+    InteractionRow,
+    VisitedSite,
+)
 from database.manager import DatabaseManager
+from database.migrations import MIGRATIONS, current_version, upgrade
 
-@pytest.fixture(scope='function')
+
+@pytest.fixture(scope="function")
 def setup_tests():
-    '''
+    """
     Método que se llama cada vez que se ejecuta un test y sirve para inicializar
     la base de datos en un estado conocido para ejecutar correctamente los tests.
-    '''
+    """
     # Inicializamos la aplicación Flask
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # En memoria
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"  # En memoria
     db.init_app(app)  # Inicializamos db con Flask
 
     # Crea las tablas
     with app.app_context():
         initialize_database()
-    
+
     yield app  # Esto permite usar la aplicación en el test
 
     # Limpiamos después de ejecutar el test correspondiente.
     with app.app_context():
-        Base.metadata.drop_all(bind=create_engine('sqlite:///:memory:'))
+        Base.metadata.drop_all(bind=create_engine("sqlite:///:memory:"))
 
 
 def test_create_session(setup_tests: None):
-    '''
+    """
     Test que se encarga de comprobar la creación de una sesión de un usuario
     en la base de datos.
-    '''
+    """
     app = setup_tests  # Usamos la app configurada en la fixture
     with app.app_context():  # Aseguramos estar dentro del contexto de la app
         # Inicializamos la conexión con la base de datos y una nueva conexión a la misma.
@@ -40,7 +56,9 @@ def test_create_session(setup_tests: None):
         db_session = db_manager.get_session(db)
 
         new_session = Session(
-            id="session_001", start_time=datetime.now(), end_time=datetime.now() + timedelta(hours=1)
+            id="session_001",
+            start_time=datetime.now(),
+            end_time=datetime.now() + timedelta(hours=1),
         )
 
         # Guardamos en la base de datos, la sesión del usuario creada.
@@ -56,35 +74,41 @@ def test_create_session(setup_tests: None):
 
 
 def test_register_interaction(setup_tests: None):
-    '''
+    """
     Test que se encarga de comprobar la creación y almacenamiento de una interacción
     del usuario en la base de datos.
-    '''
+    """
     app = setup_tests  # Usamos la app configurada en la fixture
-    with app.app_context():  
+    with app.app_context():
         # Inicializamos la conexión con la base de datos y una nueva conexión a la misma.
         db_manager = DatabaseManager(db)
         db_session = db_manager.get_session(db)
 
         # Creamos una nueva sesión del usuario para asociar la interacción.
         new_session = Session(
-            id="session_004", 
-            start_time=datetime.now(), end_time=datetime.now() + timedelta(hours=1),
+            id="session_004",
+            start_time=datetime.now(),
+            end_time=datetime.now() + timedelta(hours=1),
         )
 
         # Guardamos en la base de datos, la sesión del usuario creada.
         db_session.add(new_session)
-        db_session.commit()  
+        db_session.commit()
 
         # Creamos una interacción del usuario en la sesión creada y la guardamos.
-        new_session.register_user_interaction(eventType="Click", eventDetails="Clicked on the signup button")
+        new_session.register_user_interaction(
+            eventType="Click", eventDetails="Clicked on the signup button"
+        )
 
         # Añadimos la interacción a la sesión antes de hacer commit
-        db_session.add(new_session)  # Aseguramos que la sesión con interacciones esté en la base de datos
+        # Aseguramos que la sesión con interacciones esté en la base de datos
+        db_session.add(new_session)
         db_session.commit()
 
         # Comprobamos que la interacción se ha registrado correctamente.
-        saved_interaction = db_session.query(Interaction).filter_by(type="Click").first()
+        saved_interaction = (
+            db_session.query(Interaction).filter_by(type="Click").first()
+        )
         assert saved_interaction is not None
         assert saved_interaction.type == "Click"
         assert saved_interaction.details == "Clicked on the signup button"
@@ -92,20 +116,21 @@ def test_register_interaction(setup_tests: None):
 
 
 def test_get_user_interactions(setup_tests):
-    '''
+    """
     Test para comprobar la obtención de las interacciones asociadas a una sesión del
     usuario.
-    '''
+    """
     app = setup_tests  # Usamos la app configurada en la fixture
-    with app.app_context(): 
+    with app.app_context():
         # Inicializamos la conexión con la base de datos y una nueva conexión a la misma.
         db_manager = DatabaseManager(db)
         db_session = db_manager.get_session(db)
 
         # Creamos una nueva sesión del usuario.
         new_session = Session(
-            id="session_005", 
-            start_time=datetime.now(), end_time=datetime.now() + timedelta(hours=1),
+            id="session_005",
+            start_time=datetime.now(),
+            end_time=datetime.now() + timedelta(hours=1),
         )
 
         # Guardamos la sesión creada y hacemos commit.
@@ -113,27 +138,33 @@ def test_get_user_interactions(setup_tests):
         db_session.commit()
 
         # Guardamos las interacciones del usuario creadas y hacemos commit.
-        new_session.register_user_interaction(eventType="Click", eventDetails="Clicked on the signup button")
-        new_session.register_user_interaction(eventType="Scroll", eventDetails="Scrolled through the homepage")
+        new_session.register_user_interaction(
+            eventType="Click", eventDetails="Clicked on the signup button"
+        )
+        new_session.register_user_interaction(
+            eventType="Scroll", eventDetails="Scrolled through the homepage"
+        )
         db_session.commit()
 
         # Obtenemos la sesión creada.
         saved_session = db_session.query(Session).filter_by(id="session_005").first()
-        
+
         # Ahora, obtenemos las interacciones de la sesión.
         saved_interactions = list(saved_session.get_user_interactions())
 
         # Comprobamos que las interacciones del usuario se obtienen de forma correcta.
         assert len(saved_interactions) == 2
-        assert any(interaction['type'] == "Click" for interaction in saved_interactions)
-        assert any(interaction['type'] == "Scroll" for interaction in saved_interactions)
+        assert any(interaction["type"] == "Click" for interaction in saved_interactions)
+        assert any(
+            interaction["type"] == "Scroll" for interaction in saved_interactions
+        )
 
 
 def test_register_site_visit(setup_tests: None):
-    '''
+    """
     Test que se encarga de comprobar la creación y actualización de un sitio visitado
     al registrar un evento tipo "tab_created".
-    '''
+    """
     app = setup_tests  # Usamos la app configurada en la fixture
     with app.app_context():
         # Inicializamos la conexión con la base de datos y una nueva conexión a la misma.
@@ -142,8 +173,9 @@ def test_register_site_visit(setup_tests: None):
 
         # Creamos una nueva sesión del usuario.
         new_session = Session(
-            id="session_006", 
-            start_time=datetime.now(), end_time=datetime.now() + timedelta(hours=1),
+            id="session_006",
+            start_time=datetime.now(),
+            end_time=datetime.now() + timedelta(hours=1),
         )
 
         # Guardamos la sesión creada y hacemos commit.
@@ -152,10 +184,14 @@ def test_register_site_visit(setup_tests: None):
 
         # Simulamos la visita a un sitio con el evento "tab_created"
         event_details = {"url": "https://example.com"}
-        new_session.register_user_interaction(eventType="tab_created", eventDetails=event_details)
-        
+        new_session.register_user_interaction(
+            eventType="tab_created", eventDetails=event_details
+        )
+
         # Comprobamos que el sitio ha sido registrado correctamente.
-        visited_site = db_session.query(VisitedSite).filter_by(url="https://example.com").first()
+        visited_site = (
+            db_session.query(VisitedSite).filter_by(url="https://example.com").first()
+        )
         assert visited_site is not None
         assert visited_site.url == "https://example.com"
         assert visited_site.visit_count == 1
@@ -167,10 +203,10 @@ def test_register_site_visit(setup_tests: None):
 
 
 def test_update_site_visit(setup_tests: None):
-    '''
+    """
     Test que se encarga de comprobar la actualización de la visita a un sitio
     cuando se registra una visita repetida durante la misma sesión.
-    '''
+    """
     app = setup_tests  # Usamos la app configurada en la fixture
     with app.app_context():
         # Inicializamos la conexión con la base de datos y una nueva conexión a la misma.
@@ -179,8 +215,9 @@ def test_update_site_visit(setup_tests: None):
 
         # Creamos una nueva sesión del usuario.
         new_session = Session(
-            id="session_007", 
-            start_time=datetime.now(), end_time=datetime.now() + timedelta(hours=1),
+            id="session_007",
+            start_time=datetime.now(),
+            end_time=datetime.now() + timedelta(hours=1),
         )
 
         # Guardamos la sesión creada y hacemos commit.
@@ -189,21 +226,27 @@ def test_update_site_visit(setup_tests: None):
 
         # Registramos la visita al mismo sitio dos veces
         event_details = {"url": "https://example.com"}
-        new_session.register_user_interaction(eventType="tab_created", eventDetails=event_details)
-        new_session.register_user_interaction(eventType="tab_created", eventDetails=event_details)
+        new_session.register_user_interaction(
+            eventType="tab_created", eventDetails=event_details
+        )
+        new_session.register_user_interaction(
+            eventType="tab_created", eventDetails=event_details
+        )
 
         db_session.commit()
 
         # Verificamos que el sitio haya sido visitado una vez pero con el contador actualizado
-        visited_site = db_session.query(VisitedSite).filter_by(url="https://example.com").first()
+        visited_site = (
+            db_session.query(VisitedSite).filter_by(url="https://example.com").first()
+        )
         assert visited_site.visit_count == 2
 
 
 def test_get_user_interactions_all(setup_tests: None):
-    '''
+    """
     Test que se encarga de comprobar la obtención de todas las interacciones
     asociadas a una sesión del usuario.
-    '''
+    """
     app = setup_tests  # Usamos la app configurada en la fixture
     with app.app_context():
         # Inicializamos la conexión con la base de datos y una nueva conexión a la misma.
@@ -212,8 +255,9 @@ def test_get_user_interactions_all(setup_tests: None):
 
         # Creamos una nueva sesión del usuario.
         new_session = Session(
-            id="session_008", 
-            start_time=datetime.now(), end_time=datetime.now() + timedelta(hours=1),
+            id="session_008",
+            start_time=datetime.now(),
+            end_time=datetime.now() + timedelta(hours=1),
         )
 
         # Guardamos la sesión creada y hacemos commit.
@@ -221,9 +265,15 @@ def test_get_user_interactions_all(setup_tests: None):
         db_session.commit()
 
         # Registramos varias interacciones en la sesión
-        new_session.register_user_interaction(eventType="Click", eventDetails="Clicked on the signup button")
-        new_session.register_user_interaction(eventType="Scroll", eventDetails="Scrolled through the homepage")
-        new_session.register_user_interaction(eventType="Mouseover", eventDetails="Hovered over a banner")
+        new_session.register_user_interaction(
+            eventType="Click", eventDetails="Clicked on the signup button"
+        )
+        new_session.register_user_interaction(
+            eventType="Scroll", eventDetails="Scrolled through the homepage"
+        )
+        new_session.register_user_interaction(
+            eventType="Mouseover", eventDetails="Hovered over a banner"
+        )
 
         db_session.commit()
 
@@ -234,4 +284,204 @@ def test_get_user_interactions_all(setup_tests: None):
         assert len(interactions) == 3
         assert any(interaction["type"] == "Click" for interaction in interactions)
         assert any(interaction["type"] == "Scroll" for interaction in interactions)
-        assert any(interaction["type"] == "Mouseover" for interaction in interactions)
\ No newline at end of file
+        assert any(interaction["type"] == "Mouseover" for interaction in interactions)
+
+
+def test_bulk_insert_interactions(setup_tests: None):
+    """
+    Test que se encarga de comprobar la inserción masiva de interacciones a
+    partir de tuplas, sin construir instancias del ORM.
+    """
+    app = setup_tests  # Usamos la app configurada en la fixture
+    with app.app_context():
+        # Inicializamos la conexión con la base de datos y una nueva conexión a la misma.
+        db_manager = DatabaseManager(db)
+        db_session = db_manager.get_session(db)
+
+        # Creamos una nueva sesión del usuario.
+        new_session = Session(id="session_009", start_time=datetime.now())
+        db_session.add(new_session)
+        db_session.commit()
+
+        # Insertamos varias interacciones como tuplas en una única sentencia.
+        rows = [
+            InteractionRow("click", datetime.now(), {"x": i, "y": i}, "session_009")
+            for i in range(5)
+        ]
+        assert db_manager.bulk_insert_interactions(db, rows) == 5
+        assert db_manager.bulk_insert_interactions(db, []) == 0
+        db_session.commit()
+
+        # Comprobamos que las interacciones se hayan guardado correctamente
+        saved = db_session.query(Interaction).filter_by(session_id="session_009").all()
+        assert len(saved) == 5
+        assert sorted(interaction.details["x"] for interaction in saved) == list(
+            range(5)
+        )
+
+
+def test_file_database_configuration(tmp_path):
+    """
+    Test que se encarga de comprobar la configuración de una base de datos SQLite
+    en fichero: modo WAL, sincronización NORMAL y tiempo de espera por bloqueo.
+    """
+    uri = f"sqlite:///{tmp_path / 'webchronicle.db'}"
+    engine = create_engine(uri, **engine_options(uri, busy_timeout_ms=2000))
+    configure_sqlite(engine, busy_timeout_ms=2000)
+
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 2000
+    engine.dispose()
+
+    # Las bases de datos en memoria mantienen la configuración de Flask-SQLAlchemy
+    # y las de servidor comprueban las conexiones antes de reutilizarlas.
+    assert engine_options("sqlite:///:memory:") == {}
+    assert engine_options("postgresql://user@localhost/webchronicle")["pool_pre_ping"]
+
+
+def test_unsupported_dialect(monkeypatch):
+    """
+    Test que se encarga de comprobar que el gestor rechaza, antes de crear las
+    tablas, las bases de datos de dialectos sin upserts ni migraciones.
+    """
+    engine = create_mock_engine("mysql://", lambda *args, **kwargs: None)
+    monkeypatch.setattr(DatabaseManager, "_instance", None)
+    with pytest.raises(NotImplementedError, match="mysql"):
+        DatabaseManager(SimpleNamespace(engine=engine))
+    assert DatabaseManager._instance is None
+
+
+def test_upgrade_existing_database():
+    """
+    Test que se encarga de comprobar que las migraciones añaden los índices a una
+    base de datos creada antes de que existieran y que no se aplican dos veces.
+    """
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+
+    # Eliminamos los índices para reproducir el esquema original
+    with engine.begin() as connection:
+        for table in Base.metadata.tables.values():
+            for index in table.indexes:
+                index.drop(connection)
+    assert inspect(engine).get_indexes("Interactions") == []
+
+    assert [migration.version for migration in upgrade(engine)] == [
+        m.version for m in MIGRATIONS
+    ]
+    assert upgrade(engine) == []
+
+    indexes = {
+        index["name"]: index["column_names"]
+        for index in inspect(engine).get_indexes("Interactions")
+    }
+    assert indexes["ix_interactions_session_time"] == ["session_id", "time"]
+    with engine.connect() as connection:
+        assert current_version(connection) == MIGRATIONS[-1].version
+
+        # La consulta de los eventos de una sesión usa el índice compuesto
+        plan = connection.execute(
+            text(
+                "EXPLAIN QUERY PLAN SELECT * FROM Interactions WHERE session_id = 'a' ORDER BY time"
+            )
+        ).all()
+        assert "ix_interactions_session_time" in str(plan)
+
+
+# Esquema con el que se crearon las primeras bases de datos, antes de cualquier
+# migración
+BASELINE_SCHEMA = [
+    """CREATE TABLE "Sessions" (
+        id VARCHAR NOT NULL, start_time DATETIME NOT NULL, end_time DATETIME,
+        window_width INTEGER, window_height INTEGER, PRIMARY KEY (id))""",
+    """CREATE TABLE visited_sites (
+        id INTEGER NOT NULL, url VARCHAR NOT NULL, visit_count INTEGER NOT NULL,
+        first_visit DATETIME NOT NULL, last_visit DATETIME NOT NULL,
+        PRIMARY KEY (id), UNIQUE (url))""",
+    """CREATE TABLE "Interactions" (
+        id INTEGER NOT NULL, type VARCHAR NOT NULL, details JSON, time DATETIME NOT NULL,
+        session_id VARCHAR NOT NULL, PRIMARY KEY (id),
+        FOREIGN KEY(session_id) REFERENCES "Sessions" (id))""",
+    """CREATE TABLE site_sessions (
+        site_id INTEGER NOT NULL, session_id VARCHAR NOT NULL, PRIMARY KEY (site_id, session_id),
+        FOREIGN KEY(site_id) REFERENCES visited_sites (id),
+        FOREIGN KEY(session_id) REFERENCES "Sessions" (id))""",
+]
+
+
+def test_upgrade_baseline_database(tmp_path):
+    """
+    Test que se encarga de comprobar que una base de datos con el esquema original
+    se migra desde la versión 0 igual que al arrancar la aplicación, conservando
+    sus datos.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(
+            text(
+                "INSERT INTO Sessions (id, start_time, end_time) VALUES "
+                "('old', '2025-01-01 12:00:00.000000', '2025-01-01 13:00:00.000000')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO visited_sites VALUES "
+                "(1, 'https://example.com/', 1, '2025-01-01 12:00:00.000000', '2025-01-01 12:00:00.000000')"
+            )
+        )
+        connection.execute(text("INSERT INTO site_sessions VALUES (1, 'old')"))
+        connection.execute(
+            text(
+                "INSERT INTO Interactions (type, details, time, session_id) VALUES "
+                '(\'click\', \'{"path": "/html/body/button", "target": "BUTTON", "x": 1, "y": 2}\', '
+                "'2025-01-01 12:00:01.250000', 'old')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO Interactions (type, details, time, session_id) VALUES "
+                "('click', 'null', '2025-01-01 12:00:02.000000', 'old')"
+            )
+        )
+
+    # La aplicación crea las tablas que falten antes de aplicar las migraciones
+    Base.metadata.create_all(bind=engine)
+    assert [migration.version for migration in upgrade(engine)] == [
+        m.version for m in MIGRATIONS
+    ]
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("Interactions")}
+    assert {
+        "ix_interactions_session_time",
+        "ix_interactions_path",
+        "ix_interactions_url",
+    } <= indexes
+    with SQLSession(engine) as session:
+        interaction, empty = session.scalars(
+            select(Interaction).order_by(Interaction.time)
+        ).all()
+        assert interaction.time == datetime(2025, 1, 1, 12, 0, 1, 250000)
+        assert interaction.details == {
+            "path": "/html/body/button",
+            "target": "BUTTON",
+            "x": 1,
+            "y": 2,
+        }
+        assert empty.raw_details is None
+        assert (
+            session.scalar(
+                text("SELECT COUNT(*) FROM Interactions WHERE details IS NULL")
+            )
+            == 1
+        )
+        assert session.get(SessionStats, "old").event_count == 2
+        assert session.get(Session, "old").end_time == datetime(2025, 1, 1, 13)
+        assert session.get(VisitedSite, 1).first_visit == datetime(2025, 1, 1, 12)
+        assert (
+            session.scalar(text("SELECT typeof(start_time) FROM Sessions")) == "integer"
+        )
+    engine.dispose()
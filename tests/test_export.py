@@ -0,0 +1,132 @@
+# Pruebas de la exportación masiva de sesiones
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+from dateutil.parser import parse as parse_date
+from webchronicle.app import db, apply_operations
+from webchronicle.export import ExportSelection, encode_chunks, selected_sessions
+from webchronicle.ingestion import WriteOperation
+from database.archive import archive_ended_sessions
+from database.models import InteractionRow, VisitedSite
+
+START = parse_date("2025-01-01T12:00:00Z")
+
+
+def record_session(
+    session_id: str, start_offset: timedelta, url: str
+) -> list[InteractionRow]:
+    start = START + start_offset
+    rows = [
+        InteractionRow(
+            "click",
+            start + timedelta(seconds=index),
+            {
+                "path": f"/html/body/div[{index}]",
+                "target": "DIV",
+                "x": index,
+                "y": 0,
+                "id": "b",
+            },
+            session_id,
+        )
+        for index in range(3)
+    ] + [
+        InteractionRow(
+            "scroll", start + timedelta(seconds=5), {"x": 0, "y": 300}, session_id
+        )
+    ]
+    tab_event = {
+        "event": "tab_updated",
+        "timestamp": start.isoformat(),
+        "details": {"tabId": 1, "url": url},
+    }
+    apply_operations([WriteOperation("session_start", session_id, start)])
+    apply_operations([WriteOperation("batch", session_id, (rows, [tab_event]))])
+    apply_operations(
+        [WriteOperation("session_end", session_id, start + timedelta(hours=1))]
+    )
+    return rows
+
+
+def ndjson(response) -> list[dict]:
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+# Prueba para verificar que se exporta una sesión con sus sitios e
+# interacciones, con los detalles tal y como se recibieron
+def test_export_session_ndjson(test_app):
+    rows = record_session("export-1", timedelta(0), "https://example.com/")
+    client = test_app.test_client()
+
+    response = client.get("/api/sessions/export-1/export")
+    assert response.mimetype == "application/x-ndjson"
+    assert "attachment" in response.headers["Content-Disposition"]
+    records = ndjson(response)
+    assert [record["record"] for record in records] == ["session", "site"] + [
+        "event"
+    ] * 4
+    assert records[0]["time"] == START.replace(tzinfo=None).isoformat()
+    assert records[0]["details"]["end_time"] is not None
+    assert records[1]["details"] == {"url": "https://example.com/"}
+    assert [record["details"] for record in records[2:]] == [
+        row.details for row in rows
+    ]
+
+    scrolls = ndjson(client.get("/api/sessions/export-1/export?type=scroll"))
+    assert [record["type"] for record in scrolls[2:]] == ["scroll"]
+
+    assert client.get("/api/sessions/missing/export").status_code == 404
+    assert client.get("/api/sessions/export-1/export?format=xml").status_code == 400
+
+
+# Prueba para verificar la exportación en CSV comprimido de las sesiones de un
+# sitio, incluidas las archivadas
+def test_export_site_csv_gzip(test_app, tmp_path):
+    record_session("export-a", timedelta(0), "https://example.com/")
+    record_session("export-b", timedelta(days=1), "https://example.com/")
+    record_session("export-other", timedelta(days=2), "https://other.example.com/")
+    archive_ended_sessions(db.session, tmp_path)
+    site_id = VisitedSite.query.filter_by(url="https://example.com/").one().id
+
+    response = test_app.test_client().get(
+        f"/api/export?format=csv&gzip=1&site_id={site_id}"
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "application/gzip"
+    rows = list(
+        csv.DictReader(io.StringIO(gzip.decompress(response.get_data()).decode()))
+    )
+    assert [row["session_id"] for row in rows if row["record"] == "session"] == [
+        "export-a",
+        "export-b",
+    ]
+    events = [row for row in rows if row["record"] == "event"]
+    assert len(events) == 8
+    assert json.loads(events[0]["details"])["path"] == "/html/body/div[0]"
+
+
+# Prueba para verificar que las sesiones seleccionadas se recorren por bloques
+# sin omitir ni repetir ninguna
+def test_selected_sessions_batches(test_app):
+    for index in range(5):
+        record_session(
+            f"batch-{index}", timedelta(minutes=index // 2), "https://example.com/"
+        )
+
+    ids = [
+        row.id for row in selected_sessions(db.session, ExportSelection(), batch_size=2)
+    ]
+    assert ids == [f"batch-{index}" for index in range(5)]
+
+
+# Prueba para verificar que la salida se agrupa en bloques del tamaño indicado
+def test_encode_chunks():
+    lines = [f"{index:09d}\n" for index in range(100)]
+    chunks = list(encode_chunks(lines, chunk_bytes=100))
+    assert len(chunks) == 10 and b"".join(chunks).decode() == "".join(lines)
+
+    compressed = b"".join(encode_chunks(lines, compress=True, chunk_bytes=100))
+    assert gzip.decompress(compressed).decode() == "".join(lines)
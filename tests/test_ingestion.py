@@ -0,0 +1,232 @@
+# Pruebas de la etapa de ingesta asíncrona
+import pytest
+from json import dumps
+from dateutil.parser import parse as parse_date
+from webchronicle.app import db, apply_operations, open_connection, writer as app_writer
+from webchronicle.ingestion import (
+    FlushPolicy,
+    IngestionWriter,
+    InteractionBuffer,
+    WriteOperation,
+)
+from database.models import Session, Interaction, InteractionRow, VisitedSite
+
+
+# Fixture para crear un escritor sin hilo en segundo plano, que se vacía a mano
+@pytest.fixture
+def writer(test_app) -> IngestionWriter:
+    return IngestionWriter(
+        test_app, apply_operations, max_queue_size=100, batch_size=10
+    )
+
+
+def make_interaction(session_id: str, event: str = "click") -> InteractionRow:
+    return InteractionRow(
+        type=event,
+        time=parse_date("2025-01-01T12:01:00Z"),
+        details={"x": 100, "y": 200, "target": "button"},
+        session_id=session_id,
+    )
+
+
+# Prueba para verificar que las operaciones se aplican en orden y en lotes
+def test_writer_applies_operations_in_order(writer):
+    session_id = "writer-order"
+    start, end = parse_date("2025-01-01T12:00:00Z"), parse_date("2025-01-01T12:05:00Z")
+    interactions = [make_interaction(session_id) for _ in range(3)]
+
+    writer.submit(WriteOperation("session_start", session_id, start))
+    writer.submit(WriteOperation("window_data", session_id, (1920, 1080)))
+    writer.submit(WriteOperation("interactions", session_id, interactions))
+    writer.submit(WriteOperation("session_end", session_id, end))
+
+    assert writer.queue_depth == 4
+    assert writer.drain() == 4
+    assert writer.queue_depth == 0
+
+    session = db.session.get(Session, session_id)
+    assert session is not None
+    assert session.end_time is not None
+    assert (session.window_width, session.window_height) == (1920, 1080)
+    assert Interaction.query.filter_by(session_id=session_id).count() == 3
+
+
+# Prueba para verificar la contrapresión cuando la cola se llena
+def test_writer_rejects_when_full(test_app):
+    writer = IngestionWriter(test_app, apply_operations, max_queue_size=1)
+
+    assert writer.submit(WriteOperation("session_start", "s1", None), block=False)
+    assert not writer.submit(WriteOperation("session_start", "s2", None), block=False)
+
+
+# Prueba para verificar que una operación errónea no descarta el resto del lote
+def test_writer_isolates_failing_operations(writer):
+    session_id = "writer-isolate"
+    broken = InteractionRow(type="click", time=None, details={}, session_id=session_id)
+
+    writer.submit(
+        WriteOperation("session_start", session_id, parse_date("2025-01-01T12:00:00Z"))
+    )
+    writer.submit(WriteOperation("interactions", session_id, [broken]))
+    writer.submit(
+        WriteOperation("interactions", session_id, [make_interaction(session_id)])
+    )
+    writer.drain()
+
+    assert db.session.get(Session, session_id) is not None
+    assert Interaction.query.filter_by(session_id=session_id).count() == 1
+
+
+# Prueba para verificar que el volcado al terminar el intérprete se registra
+# una sola vez aunque el escritor se arranque varias veces
+def test_writer_registers_exit_hook_once(writer, monkeypatch):
+    hooks = []
+    monkeypatch.setattr("webchronicle.ingestion.atexit.register", hooks.append)
+    for _ in range(3):
+        writer.start()
+        writer.stop()
+
+    assert hooks == [writer.stop]
+
+
+# Reloj manual para controlar la antigüedad de las interacciones en las pruebas
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# Prueba para verificar los umbrales de volcado por número, tamaño y antigüedad
+def test_interaction_buffer_flush_thresholds():
+    clock = FakeClock()
+    policy = FlushPolicy(max_events=3, max_bytes=100, max_age_ms=500)
+
+    buffer = InteractionBuffer(policy, clock)
+    assert buffer.flush_reason() is None
+    assert buffer.time_until_flush() is None
+
+    buffer.append(make_interaction("s1"), 10)
+    buffer.append(make_interaction("s1"), 10)
+    assert buffer.flush_reason() is None
+    buffer.append(make_interaction("s1"), 10)
+    assert buffer.flush_reason() == "events"
+
+    rows = buffer.take()
+    assert len(rows) == 3 and len(buffer) == 0 and buffer.size == 0
+
+    buffer.append(make_interaction("s1"), 150)
+    assert buffer.flush_reason() == "bytes"
+    buffer.take()
+
+    buffer.append(make_interaction("s1"), 10)
+    clock.now = 0.2
+    assert buffer.flush_reason() is None
+    assert buffer.time_until_flush() == pytest.approx(0.3)
+    clock.now = 0.5
+    assert buffer.flush_reason() == "age"
+    assert buffer.time_until_flush() == 0.0
+
+
+# Socket falso que guarda los mensajes enviados por el servidor
+class FakeSocket:
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+
+    def send(self, data: str) -> None:
+        self.sent.append(data)
+
+
+# Prueba para verificar que un mensaje "batch" se escribe en una única operación
+def test_process_batch(test_app):
+    session_id = "batch-session"
+    timestamp = "2025-01-01T12:01:00.000Z"
+    apply_operations(
+        [
+            WriteOperation(
+                "session_start", session_id, parse_date("2025-01-01T12:00:00Z")
+            )
+        ]
+    )
+
+    messages = [
+        {
+            "type": "event_logged",
+            "message": {"event": "click", "timestamp": timestamp, "details": {"x": i}},
+        }
+        for i in range(5)
+    ]
+    messages.append(
+        {
+            "type": "tab_event",
+            "message": {
+                "event": "tab_created",
+                "timestamp": timestamp,
+                "details": {"tabId": 1, "url": "https://batch.example.com"},
+            },
+        }
+    )
+    messages.append({"type": "session_state_changed", "message": {}})
+
+    socket = FakeSocket()
+    connection = open_connection(socket.send)
+    connection.session_id = session_id
+    connection.process_batch(messages)
+
+    assert len(connection.interaction_buffer) == 0
+    assert app_writer.queue_depth == 1
+    assert app_writer.drain() == 1
+
+    assert Interaction.query.filter_by(session_id=session_id).count() == 6
+    assert VisitedSite.query.filter_by(url="https://batch.example.com").count() == 1
+    assert len(socket.sent) == 1 and "Invalid messages in batch: 1" in socket.sent[0]
+
+
+# Prueba para verificar que los mensajes de un "batch" con marcas de tiempo que
+# no pueden interpretarse se cuentan como inválidos y el resto se escriben
+def test_process_batch_invalid_timestamps(test_app):
+    session_id = "batch-timestamps"
+    apply_operations(
+        [
+            WriteOperation(
+                "session_start", session_id, parse_date("2025-01-01T12:00:00Z")
+            )
+        ]
+    )
+
+    messages = [
+        {
+            "type": "event_logged",
+            "message": {"event": "click", "timestamp": timestamp, "details": {"x": i}},
+        }
+        for i, timestamp in enumerate(
+            ["2025-01-01T12:01:00.000Z", "never", "9" * 20, "2025-01-01T12:02:00Z"]
+        )
+    ]
+
+    socket = FakeSocket()
+    connection = open_connection(socket.send)
+    connection.session_id = session_id
+    connection.process_batch(messages)
+    assert app_writer.drain() == 1
+
+    rows = Interaction.query.filter_by(session_id=session_id).all()
+    assert sorted(row.details["x"] for row in rows) == [0, 3]
+    assert len(socket.sent) == 1 and "Invalid messages in batch: 2" in socket.sent[0]
+
+
+# Prueba para verificar que una marca de tiempo que no puede interpretarse se
+# responde como mensaje inválido sin cerrar la conexión
+def test_invalid_timestamp(test_app):
+    socket = FakeSocket()
+    connection = open_connection(socket.send)
+    message = {
+        "type": "session_state_changed",
+        "message": {"action": "start", "sessionId": "bad-time", "timestamp": "soon"},
+    }
+
+    assert connection.handle_frame(dumps(message)) is True
+    assert connection.session_id is None
+    assert app_writer.queue_depth == 0
+    assert len(socket.sent) == 1 and "Invalid message format" in socket.sent[0]
@@ -0,0 +1,109 @@
+# Pruebas de los fotogramas clave de reproducción
+import pytest
+from datetime import timedelta
+from dateutil.parser import parse as parse_date
+from webchronicle.app import db
+from database.keyframes import KeyframeBuilder, apply_event, load_state
+from database.models import Interaction, InteractionRow, Keyframe, Session
+
+START = parse_date("2025-01-01T12:00:00Z")
+
+
+# Fixture para configurar las pruebas con una sesión en la que grabar
+@pytest.fixture
+def test_app(test_app):
+    db.session.add(Session(id="keyframes", start_time=START))
+    db.session.commit()
+    return test_app
+
+
+def session_rows(start: int, count: int) -> list[InteractionRow]:
+    rows = []
+    for index in range(start, start + count):
+        if index % 10 == 0:
+            event, details = (
+                "tab_updated",
+                {"tabId": 1, "url": f"https://example.com/{index}"},
+            )
+        else:
+            event, details = "scroll", {"x": 0, "y": index}
+        rows.append(
+            InteractionRow(
+                event, START + timedelta(seconds=index), details, "keyframes"
+            )
+        )
+    return rows
+
+
+def write(builder: KeyframeBuilder, rows: list[InteractionRow]) -> None:
+    builder.record(db.session, rows)
+    db.session.execute(Interaction.__table__.insert(), [row._asdict() for row in rows])
+    builder.flush(db.session)
+    db.session.commit()
+    builder.commit()
+
+
+def expected_state(rows: list[InteractionRow]) -> dict:
+    state: dict = {}
+    for row in rows:
+        apply_event(state, row.type, row.details)
+    return state
+
+
+# Prueba para verificar que los fotogramas clave permiten reconstruir el estado
+# en cualquier momento aplicando solo los eventos posteriores
+def test_keyframes_seek(test_app):
+    builder = KeyframeBuilder(every_events=25, every_ms=3_600_000)
+    rows = session_rows(0, 100)
+    for start in range(0, 100, 30):
+        write(builder, rows[start : start + 30])
+
+    keyframes = Keyframe.query.order_by(Keyframe.event_offset).all()
+    assert [keyframe.event_offset for keyframe in keyframes] == [25, 50, 75]
+    assert keyframes[1].state == expected_state(rows[:50])
+
+    for index in (0, 24, 25, 60, 99):
+        moment = rows[index].time.replace(tzinfo=None)
+        keyframe, applied, _, state = load_state(db.session, "keyframes", until=moment)
+        assert state == expected_state(rows[: index + 1])
+        assert applied <= 25
+
+
+# Prueba para verificar que el estado de una sesión se reconstruye desde la
+# base de datos cuando no está en memoria (reinicio o transacción deshecha)
+def test_keyframes_resume(test_app):
+    rows = session_rows(0, 60)
+    write(KeyframeBuilder(every_events=20, every_ms=3_600_000), rows[:30])
+
+    builder = KeyframeBuilder(every_events=20, every_ms=3_600_000)
+    builder.record(db.session, rows[30:45])
+    builder.flush(db.session)
+    db.session.rollback()
+    builder.rollback()
+
+    write(builder, rows[30:])
+    assert [
+        keyframe.event_offset
+        for keyframe in Keyframe.query.order_by(Keyframe.event_offset)
+    ] == [20, 40]
+    assert Keyframe.query.filter_by(event_offset=40).one().state == expected_state(
+        rows[:40]
+    )
+
+
+# Prueba para verificar la consulta del estado a través de la API de reproducción
+def test_replay_state(test_app):
+    write(KeyframeBuilder(every_events=10, every_ms=3_600_000), session_rows(0, 35))
+
+    client = test_app.test_client()
+    data = client.get("/api/sessions/keyframes/replay/state?at=25000").get_json()
+    assert data["keyframe_ms"] == 20_000
+    assert data["delta_events"] == 6
+    assert data["state"] == {
+        "tab": 2,
+        "url": "https://example.com/20",
+        "scroll": {"x": 0, "y": 25},
+    }
+
+    assert client.get("/api/sessions/keyframes/replay/state").status_code == 400
+    assert client.get("/api/sessions/missing/replay/state?at=0").status_code == 404
@@ -0,0 +1,102 @@
+# Pruebas de los listados paginados de sitios y sesiones
+import pytest
+from datetime import timedelta
+from dateutil.parser import parse as parse_date
+from sqlalchemy import event, insert
+from webchronicle.app import db
+from database.models import (
+    Session,
+    SessionEventCount,
+    SessionStats,
+    VisitedSite,
+    site_sessions,
+)
+
+START = parse_date("2025-01-01T12:00:00")
+
+
+# Fixture para configurar las pruebas con sesiones y sitios que listar
+@pytest.fixture
+def test_app(test_app):
+    sessions = [f"listing-{index:03d}" for index in range(60)]
+    for index, session_id in enumerate(sessions):
+        moment = START + timedelta(minutes=index)
+        db.session.add(Session(id=session_id, start_time=moment))
+        db.session.add(
+            SessionStats(
+                session_id=session_id,
+                event_count=3,
+                first_event=moment,
+                last_event=moment,
+            )
+        )
+        db.session.add_all(
+            [
+                SessionEventCount(session_id=session_id, type="click", count=2),
+                SessionEventCount(session_id=session_id, type="scroll", count=1),
+            ]
+        )
+    for index in range(60):
+        db.session.add(
+            VisitedSite(
+                url=f"https://site{index}.example.com/",
+                visit_count=index,
+                session_count=2,
+                first_visit=START,
+                last_visit=START,
+            )
+        )
+    db.session.flush()
+    db.session.execute(
+        insert(site_sessions),
+        [
+            {"site_id": site_id, "session_id": session_id}
+            for site_id in (1, 2)
+            for session_id in sessions
+        ],
+    )
+    db.session.commit()
+    return test_app
+
+
+def count_statements(client, url: str) -> int:
+    statements = []
+
+    def record(*args) -> None:
+        statements.append(args[2])
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    return len(statements)
+
+
+# Prueba para verificar que el número de consultas no depende del tamaño de la página
+@pytest.mark.parametrize("endpoint", ["/", "/sessions", "/sessions?site_id=1"])
+def test_constant_statements(test_app, endpoint):
+    client = test_app.test_client()
+    separator = "&" if "?" in endpoint else "?"
+    small = count_statements(client, f"{endpoint}{separator}per_page=5")
+    large = count_statements(client, f"{endpoint}{separator}per_page=50")
+    assert small == large
+    assert large <= 4
+
+
+# Prueba para verificar el contenido y la navegación de las páginas
+def test_listing_pages(test_app):
+    client = test_app.test_client()
+    response = client.get("/sessions?site_id=1&per_page=25&page=3")
+    assert response.status_code == 200
+    assert response.data.count(b"<td>listing-") == 10
+    assert b"listing-009" in response.data and b"listing-010" not in response.data
+    assert b"click: 2, scroll: 1" in response.data
+    assert b"page=2&amp;per_page=25&amp;site_id=1" in response.data
+
+    response = client.get("/?per_page=10")
+    assert response.data.count(b'target="_blank"') == 10
+    assert b"https://site59.example.com/" in response.data
+    assert client.get("/?page=9").status_code == 404
+    assert client.get("/sessions?site_id=999").status_code == 404
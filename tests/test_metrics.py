@@ -0,0 +1,122 @@
+# Pruebas de las métricas de ejecución y de la ruta /metrics
+import logging
+import pytest
+from json import dumps
+from webchronicle.app import metrics, open_connection, writer
+from webchronicle.logs import SampledLogger
+from webchronicle.metrics import (
+    ACTIVE_SESSIONS,
+    COMMIT_SECONDS,
+    INVALID_MESSAGES,
+    MESSAGES_RECEIVED,
+    OPEN_SOCKETS,
+    MetricsRegistry,
+)
+
+
+# Fixture para configurar las pruebas con las métricas a cero
+@pytest.fixture
+def test_app(test_app):
+    metrics.reset()
+    yield test_app
+    metrics.enabled = True
+
+
+def frame(message_type: str, message: dict) -> str:
+    return dumps({"type": message_type, "message": message})
+
+
+# Prueba para verificar el formato de texto de las métricas
+def test_render_format():
+    registry = MetricsRegistry(prefix="test_")
+    counter = registry.counter("messages_total", "Messages.", ("type",))
+    histogram = registry.histogram("size", "Sizes.", (1, 10))
+    registry.callback_gauge("depth", "Depth.", lambda: 3)
+
+    counter.inc('say "hi"')
+    counter.inc("click", amount=2)
+    for value in (0.5, 5, 50):
+        histogram.observe(value)
+
+    text = registry.render()
+    assert "# TYPE test_messages_total counter" in text
+    assert 'test_messages_total{type="click"} 2' in text
+    assert 'test_messages_total{type="say \\"hi\\""} 1' in text
+    assert 'test_size_bucket{le="1"} 1' in text
+    assert 'test_size_bucket{le="10"} 2' in text
+    assert 'test_size_bucket{le="+Inf"} 3' in text
+    assert "test_size_sum 55.5" in text and "test_size_count 3" in text
+    assert "test_depth 3" in text
+
+
+# Prueba para verificar que las métricas deshabilitadas no registran nada
+def test_disabled_registry():
+    registry = MetricsRegistry(enabled=False)
+    counter = registry.counter("messages_total", "Messages.")
+    histogram = registry.histogram("size", "Sizes.", (1,))
+    counter.inc()
+    histogram.observe(1)
+    assert counter.value() == 0 and histogram.count == 0
+
+
+# Prueba para verificar que los logs muestreados solo emiten uno de cada N
+def test_sampled_logger(caplog):
+    logger = logging.getLogger("webchronicle.tests")
+    sampled = SampledLogger(logger, every=10)
+    with caplog.at_level(logging.DEBUG, logger="webchronicle.tests"):
+        for index in range(25):
+            sampled.debug("message %d", index)
+    assert [record.getMessage() for record in caplog.records] == [
+        "message 0",
+        "message 10",
+        "message 20",
+    ]
+
+
+# Prueba para verificar las métricas de una conexión de grabación y su exposición
+def test_connection_metrics(test_app):
+    sent: list[str] = []
+    connection = open_connection(sent.append)
+    timestamp = "2025-01-01T12:00:00.000Z"
+    event = {"event": "click", "timestamp": timestamp, "details": {"x": 1}}
+
+    connection.handle_frame(
+        frame(
+            "session_state_changed",
+            {"action": "start", "sessionId": "metrics", "timestamp": timestamp},
+        )
+    )
+    assert OPEN_SOCKETS.value() == 1 and ACTIVE_SESSIONS.value() == 1
+
+    connection.handle_frame(frame("event_logged", event))
+    connection.handle_frame(
+        frame(
+            "batch",
+            {"messages": [{"type": "event_logged", "message": event}, {"type": "x"}]},
+        )
+    )
+    connection.handle_frame("not json")
+    for index in range(3):
+        connection.handle_frame(frame(f"custom_{index}", {}))
+    connection.close()
+    writer.drain()
+
+    assert MESSAGES_RECEIVED.value("event_logged") == 2
+    assert MESSAGES_RECEIVED.value("batch") == 1
+    assert MESSAGES_RECEIVED.value("unknown") == 3
+    assert MESSAGES_RECEIVED.value("custom_0") == 0
+    assert INVALID_MESSAGES.value() == 2
+    assert OPEN_SOCKETS.value() == 0 and ACTIVE_SESSIONS.value() == 0
+    assert COMMIT_SECONDS.count >= 1
+
+    response = test_app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert (
+        b'webchronicle_messages_received_total{type="event_logged"} 2' in response.data
+    )
+    assert b"webchronicle_ingestion_queue_depth 0" in response.data
+
+    metrics.enabled = False
+    connection.handle_frame("not json")
+    assert INVALID_MESSAGES.value() == 2
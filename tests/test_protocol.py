@@ -0,0 +1,164 @@
+# Pruebas del decodificador de mensajes del WebSocket
+from json import dumps
+from webchronicle.protocol import CompactDecoder, DecodeError, Message, decode_message
+
+
+# Prueba para verificar la decodificación de un mensaje válido
+def test_decode_valid_message():
+    frame = dumps(
+        {
+            "type": "event_logged",
+            "message": {
+                "event": "click",
+                "timestamp": "2025-01-01T12:01:00.000Z",
+                "details": {"x": 100, "y": 200, "target": "BUTTON"},
+            },
+        }
+    )
+
+    message = decode_message(frame)
+    assert isinstance(message, Message)
+    assert message.type == "event_logged"
+    assert message.data["details"]["target"] == "BUTTON"
+    assert message.size == len(frame)
+
+
+# Prueba para verificar que las tramas mal formadas se rechazan
+def test_decode_malformed_frames():
+    assert isinstance(decode_message("not json"), DecodeError)
+    assert isinstance(decode_message(None), DecodeError)
+    assert isinstance(decode_message(dumps([1, 2, 3])), DecodeError)
+    assert isinstance(decode_message(dumps({"type": 1, "message": {}})), DecodeError)
+    assert isinstance(
+        decode_message(dumps({"type": "event_logged", "message": "x"})), DecodeError
+    )
+
+
+# Prueba para verificar la validación de los campos según el esquema del tipo
+def test_decode_validates_schema():
+    missing = decode_message(
+        dumps({"type": "event_logged", "message": {"event": "click"}})
+    )
+    assert isinstance(missing, DecodeError)
+    assert "details" in missing.reason
+
+    wrong_type = decode_message(
+        dumps({"type": "window_data", "message": {"width": "wide", "height": 1080}})
+    )
+    assert isinstance(wrong_type, DecodeError)
+
+    session = decode_message(
+        dumps({"type": "session_state_changed", "message": {"action": "start"}})
+    )
+    assert isinstance(session, DecodeError)
+
+    # Sin marca de tiempo la interacción no podría guardarse
+    for message_type in ("event_logged", "tab_event"):
+        untimed = decode_message(
+            dumps({"type": message_type, "message": {"event": "click", "details": {}}})
+        )
+        assert isinstance(untimed, DecodeError)
+        assert "timestamp" in untimed.reason
+
+    # Las marcas de tiempo que no pueden interpretarse también se rechazan
+    for timestamp in ("yesterday", "9999-99-99T00:00:00Z", "9" * 20):
+        invalid = decode_message(
+            dumps(
+                {
+                    "type": "session_state_changed",
+                    "message": {
+                        "action": "start",
+                        "sessionId": "s",
+                        "timestamp": timestamp,
+                    },
+                }
+            )
+        )
+        assert isinstance(invalid, DecodeError)
+        assert "timestamp" in invalid.reason
+
+
+# Prueba para verificar que los tipos sin esquema se delegan al manejador
+def test_decode_unknown_type():
+    message = decode_message(
+        dumps({"type": "tracking_state_changed", "message": {"state": True}})
+    )
+    assert isinstance(message, Message)
+    assert message.type == "tracking_state_changed"
+
+
+# Prueba para verificar la decodificación de tramas compactas con cadenas
+# internadas y marcas de tiempo diferenciales
+def test_compact_decoder_round_trip():
+    decoder = CompactDecoder()
+    first = dumps(
+        [
+            [
+                "j",
+                "session_state_changed",
+                {
+                    "action": "start",
+                    "sessionId": "s",
+                    "timestamp": "2025-01-01T12:00:00Z",
+                },
+            ],
+            ["e", 1735732860000, "click", ["/html/body/div", "DIV", 100, 120]],
+            ["e", 250, 0, [1, 2, 300, 40]],
+        ]
+    )
+    second = dumps(
+        [
+            ["t", 1000, "tab_created", [7, "https://example.com"]],
+            ["e", 5, 0, [1, 2, 1, 1]],
+        ]
+    )
+
+    messages = decoder.decode(first)
+    assert isinstance(messages, list)
+    assert [message.type for message in messages] == [
+        "session_state_changed",
+        "event_logged",
+        "event_logged",
+    ]
+    assert messages[1].data == {
+        "event": "click",
+        "timestamp": "2025-01-01T12:01:00.000Z",
+        "details": {"path": "/html/body/div", "target": "DIV", "x": 100, "y": 120},
+    }
+    assert messages[2].data["timestamp"] == "2025-01-01T12:01:00.250Z"
+    assert messages[2].data["details"]["path"] == "/html/body/div"
+
+    # La tabla de cadenas y la marca de tiempo se conservan entre tramas
+    tab, click = decoder.decode(second)
+    assert tab.type == "tab_event"
+    assert tab.data["details"] == {"tabId": 7, "url": "https://example.com"}
+    assert click.data["event"] == "click"
+    assert click.data["timestamp"] == "2025-01-01T12:01:01.255Z"
+
+
+# Prueba para verificar que los eventos sin disposición conocida conservan
+# el objeto `details` completo
+def test_compact_decoder_unknown_layout():
+    messages = CompactDecoder().decode(dumps([["e", 0, "focus", {"target": "INPUT"}]]))
+    assert isinstance(messages, list)
+    assert messages[0].data["details"] == {"target": "INPUT"}
+
+
+# Prueba para verificar que los registros compactos mal formados se rechazan
+def test_compact_decoder_malformed_frames():
+    assert isinstance(CompactDecoder().decode(dumps({"type": "batch"})), DecodeError)
+    assert isinstance(CompactDecoder().decode(dumps([["x", 0]])), DecodeError)
+    assert isinstance(
+        CompactDecoder().decode(dumps([["e", 0, 3, [1, 2]]])), DecodeError
+    )
+    assert isinstance(
+        CompactDecoder().decode(dumps([["e", 0, "click", [1, 2]]])), DecodeError
+    )
+    assert isinstance(CompactDecoder().decode('[["e"'), DecodeError)
+    assert isinstance(
+        CompactDecoder().decode(dumps([["e", 10**20, "scroll", [0, 0]]])), DecodeError
+    )
+    assert isinstance(
+        CompactDecoder().decode(dumps([["e", -(10**15), "scroll", [0, 0]]])),
+        DecodeError,
+    )
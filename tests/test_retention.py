@@ -0,0 +1,187 @@
+# Pruebas de la política de retención de los datos grabados
+from datetime import datetime, timedelta
+from pathlib import Path
+from dateutil.parser import parse as parse_date
+from sqlalchemy import func, select
+from webchronicle.app import app, db, apply_operations, retention_job
+from webchronicle.ingestion import WriteOperation
+from webchronicle.metrics import RETENTION_DELETED
+from database.archive import archive_ended_sessions
+from database.models import (
+    ArchivedSession,
+    Interaction,
+    InteractionRow,
+    Keyframe,
+    SearchPosting,
+    Session,
+    SessionEventCount,
+    SessionStats,
+    VisitedSite,
+    site_sessions,
+)
+from database.retention import RetentionPolicy, apply_retention
+
+START = parse_date("2025-01-01T12:00:00Z")
+NOW = datetime(2025, 3, 1)
+
+
+def record_session(
+    session_id: str, start: datetime, events: int, end: bool = True
+) -> None:
+    rows = []
+    for index in range(events):
+        time = start + timedelta(seconds=index)
+        if index % 2:
+            rows.append(
+                InteractionRow("scroll", time, {"x": 0, "y": index}, session_id)
+            )
+        else:
+            details = {
+                "path": f"/html/body/div[{index}]",
+                "target": "DIV",
+                "x": index,
+                "y": 0,
+            }
+            rows.append(InteractionRow("click", time, details, session_id))
+    tab_event = {
+        "event": "tab_updated",
+        "timestamp": start.isoformat(),
+        "details": {"tabId": 1, "url": "https://example.com/"},
+    }
+    apply_operations([WriteOperation("session_start", session_id, start)])
+    apply_operations([WriteOperation("batch", session_id, (rows, [tab_event]))])
+    if end:
+        apply_operations(
+            [WriteOperation("session_end", session_id, start + timedelta(hours=1))]
+        )
+
+
+def rows_of(session_id: str) -> dict[str, int]:
+    tables = {
+        "sessions": Session.id,
+        "interactions": Interaction.session_id,
+        "stats": SessionStats.session_id,
+        "event_counts": SessionEventCount.session_id,
+        "postings": SearchPosting.session_id,
+        "sites": site_sessions.c.session_id,
+    }
+    return {
+        name: db.session.scalar(select(func.count()).where(column == session_id))
+        for name, column in tables.items()
+    }
+
+
+# Prueba para verificar que se borran las sesiones antiguas con todos sus
+# datos, incluidas las que no llegaron a terminar, y se conservan las recientes
+def test_retention_by_age(test_app):
+    record_session("age-old", START, 6)
+    record_session("age-abandoned", START, 3, end=False)
+    record_session("age-recent", START + timedelta(days=50), 4)
+
+    report = apply_retention(
+        db.session, RetentionPolicy(max_age=timedelta(days=30)), now=NOW, batch_size=2
+    )
+    assert report.deleted_sessions == 2
+    assert report.deleted_interactions == 9
+    assert set(rows_of("age-old").values()) == {0}
+    assert set(rows_of("age-abandoned").values()) == {0}
+    assert rows_of("age-recent")["interactions"] == 4
+    assert VisitedSite.query.one().session_count == 1
+
+    assert (
+        apply_retention(
+            db.session, RetentionPolicy(max_age=timedelta(days=30)), now=NOW
+        ).deleted_sessions
+        == 0
+    )
+
+
+# Prueba para verificar que de cada sitio se conservan las sesiones terminadas
+# más recientes
+def test_retention_per_site(test_app):
+    for day in range(3):
+        record_session(f"site-{day}", START + timedelta(days=day), 2)
+    record_session("site-recording", START - timedelta(days=1), 2, end=False)
+
+    report = apply_retention(
+        db.session, RetentionPolicy(max_sessions_per_site=2), now=NOW
+    )
+    assert report.deleted_sessions == 1
+    assert rows_of("site-0")["sessions"] == 0
+    assert rows_of("site-recording")["sessions"] == 1
+    assert VisitedSite.query.one().session_count == 3
+
+
+# Prueba para verificar que de las sesiones demasiado grandes se borran las
+# interacciones más antiguas y se recalculan sus totales e índice
+def test_truncate_session(test_app):
+    app.config["REPLAY_KEYFRAME_EVENTS"] = 500
+    record_session("large", START, 10)
+    record_session("small", START, 3)
+
+    report = apply_retention(db.session, RetentionPolicy(max_session_events=4), now=NOW)
+    assert report.truncated_sessions == 1 and report.deleted_interactions == 6
+    stats = db.session.get(SessionStats, "large")
+    assert stats.event_count == 4
+    assert stats.first_event == START.replace(tzinfo=None) + timedelta(seconds=6)
+    assert {
+        row.type: row.count
+        for row in SessionEventCount.query.filter_by(session_id="large")
+    } == {
+        "click": 2,
+        "scroll": 2,
+    }
+    assert SearchPosting.query.filter_by(session_id="large", field="path").count() == 2
+    assert (
+        Keyframe.query.filter(
+            Keyframe.session_id == "large", Keyframe.time <= stats.first_event
+        ).count()
+        == 0
+    )
+    assert rows_of("small")["interactions"] == 3
+
+
+# Prueba para verificar que al borrar una sesión archivada se borra su archivo
+def test_delete_archived_session(test_app, tmp_path):
+    record_session("archived-old", START, 5)
+    archive_ended_sessions(db.session, tmp_path)
+    path = Path(db.session.get(ArchivedSession, "archived-old").path)
+
+    apply_retention(db.session, RetentionPolicy(max_age=timedelta(days=30)), now=NOW)
+    assert not path.exists()
+    assert db.session.get(ArchivedSession, "archived-old") is None
+
+
+# Prueba para verificar que la tarea de retención publica su progreso
+def test_retention_job(test_app):
+    record_session("job-old", START, 2)
+    deleted = RETENTION_DELETED.value("sessions")
+    app.config["RETENTION_MAX_AGE_DAYS"] = 30
+    try:
+        report = retention_job.run_once()
+    finally:
+        app.config["RETENTION_MAX_AGE_DAYS"] = None
+
+    assert report is not None and report.deleted_sessions == 1
+    assert RETENTION_DELETED.value("sessions") == deleted + 1
+    stats = test_app.test_client().get("/stats/retention").get_json()
+    assert stats["job"]["last_report"]["deleted_interactions"] == 2
+    assert stats["policy"]["max_age"] is None
+
+
+# Prueba para verificar que al borrar una sesión que no ha terminado se
+# descarta su estado en memoria, de forma que si se retoma vuelve a
+# relacionarse con sus sitios
+def test_retention_forgets_recording_session(test_app):
+    record_session("forgotten", START, 4, end=False)
+    app.config["RETENTION_MAX_AGE_DAYS"] = 30
+    try:
+        report = retention_job.run_once()
+    finally:
+        app.config["RETENTION_MAX_AGE_DAYS"] = None
+    assert report is not None and report.deleted_sessions == 1
+    assert set(rows_of("forgotten").values()) == {0}
+
+    record_session("forgotten", START + timedelta(days=60), 2, end=False)
+    assert rows_of("forgotten")["sites"] == 1
+    assert VisitedSite.query.one().session_count == 1
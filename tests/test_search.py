@@ -0,0 +1,248 @@
+# Pruebas del índice de búsqueda entre sesiones
+from datetime import timedelta
+from dateutil.parser import parse as parse_date
+from webchronicle.app import db, apply_operations
+from webchronicle.ingestion import WriteOperation
+from database.archive import archive_ended_sessions
+from database.models import Interaction, InteractionRow, SearchPosting
+from database.search_index import (
+    SEARCH_FIELDS,
+    SearchIndexAggregator,
+    rebuild_search_index,
+)
+
+START = parse_date("2025-01-01T12:00:00Z")
+BUTTON = "/html/body/div[1]/button"
+FIELD = "/html/body/form/input"
+
+
+def record_session(
+    session_id: str, clicks: int, inputs: int, end: bool = False
+) -> None:
+    rows = [
+        InteractionRow(
+            "click",
+            START + timedelta(seconds=index),
+            {"path": BUTTON, "target": "BUTTON", "x": index, "y": 0},
+            session_id,
+        )
+        for index in range(clicks)
+    ] + [
+        InteractionRow(
+            "input",
+            START + timedelta(minutes=1, seconds=index),
+            {"path": FIELD, "target": "INPUT", "key": "a"},
+            session_id,
+        )
+        for index in range(inputs)
+    ]
+    tab_event = {
+        "event": "tab_updated",
+        "timestamp": "2025-01-01T12:00:00Z",
+        "details": {"tabId": 1, "url": f"https://example.com/{session_id}"},
+    }
+    rows.append(InteractionRow("tab_updated", START, tab_event["details"], session_id))
+    apply_operations([WriteOperation("session_start", session_id, START)])
+    apply_operations([WriteOperation("batch", session_id, (rows[:2], [tab_event]))])
+    apply_operations([WriteOperation("interactions", session_id, rows[2:])])
+    if end:
+        apply_operations(
+            [WriteOperation("session_end", session_id, START + timedelta(hours=1))]
+        )
+
+
+def search(client, **arguments) -> dict:
+    response = client.get("/api/search", query_string=arguments)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+# Prueba para verificar que la ruta de escritura mantiene el índice y que la
+# búsqueda encuentra las sesiones por elemento, etiqueta, URL y tipo de evento
+def test_search_sessions(test_app):
+    record_session("search-a", clicks=3, inputs=2)
+    record_session("search-b", clicks=0, inputs=4)
+    client = test_app.test_client()
+
+    results = search(client, field="path", q=BUTTON, type="click")["results"]
+    assert results == [
+        {
+            "session_id": "search-a",
+            "count": 3,
+            "first_time": "2025-01-01T12:00:00",
+            "last_time": "2025-01-01T12:00:02",
+        }
+    ]
+    assert [
+        result["session_id"]
+        for result in search(client, field="target", q="INPUT")["results"]
+    ] == [
+        "search-b",
+        "search-a",
+    ]
+    assert (
+        search(client, field="url", q="https://example.com/search-b")["results"][0][
+            "count"
+        ]
+        == 1
+    )
+    assert (
+        len(search(client, field="url", q="https://example.com/", prefix=1)["results"])
+        == 2
+    )
+    assert (
+        search(client, field="type", q="click")["results"][0]["session_id"]
+        == "search-a"
+    )
+    assert search(client, field="path", q=BUTTON, type="input")["results"] == []
+
+    page = search(client, field="path", q=FIELD, limit=1)
+    assert len(page["results"]) == 1 and page["next_offset"] == 1
+    assert (
+        search(client, field="path", q=FIELD, limit=1, offset=1)["next_offset"] is None
+    )
+    assert (
+        search(client, field="path", q=FIELD, to="2025-01-01T12:00:30Z")["results"]
+        == []
+    )
+
+    assert (
+        client.get(
+            "/api/search", query_string={"field": "details", "q": "x"}
+        ).status_code
+        == 400
+    )
+    assert client.get("/api/search").status_code == 400
+    response = client.get("/search", query_string={"field": "path", "q": BUTTON})
+    assert response.status_code == 200
+    assert b"search-a" in response.data
+
+
+# Prueba para verificar que un prefijo que abarca más términos de los que se
+# buscan usa siempre los primeros en orden alfabético y lo indica
+def test_search_prefix_truncated(test_app, monkeypatch):
+    for session_id in ("prefix-c", "prefix-a", "prefix-b"):
+        record_session(session_id, clicks=1, inputs=0)
+    client = test_app.test_client()
+
+    found = search(client, field="url", q="https://example.com/prefix-", prefix=1)
+    assert len(found["results"]) == 3 and found["truncated"] is False
+
+    monkeypatch.setitem(test_app.config, "SEARCH_MAX_TERMS", 2)
+    found = search(client, field="url", q="https://example.com/prefix-", prefix=1)
+    assert sorted(result["session_id"] for result in found["results"]) == [
+        "prefix-a",
+        "prefix-b",
+    ]
+    assert found["truncated"] is True
+    assert (
+        search(client, field="url", q="https://example.com/prefix-a")["truncated"]
+        is False
+    )
+
+    response = client.get(
+        "/search", query_string={"field": "url", "q": "https://", "prefix": 1}
+    )
+    assert b"only the first ones" in response.data
+
+
+# Prueba para verificar que la reconstrucción obtiene el mismo índice, también
+# para las sesiones archivadas
+def test_rebuild_search_index(test_app, tmp_path):
+    record_session("rebuild-a", clicks=4, inputs=3, end=True)
+    record_session("rebuild-b", clicks=2, inputs=1)
+
+    def snapshot() -> set:
+        return {
+            (
+                row.term_id,
+                row.field,
+                row.type,
+                row.session_id,
+                row.count,
+                row.first_time,
+                row.last_time,
+            )
+            for row in SearchPosting.query.all()
+        }
+
+    expected = snapshot()
+    archive_ended_sessions(db.session, tmp_path)
+    db.session.query(SearchPosting).delete()
+    db.session.commit()
+
+    assert rebuild_search_index(db.session) == len(expected)
+    db.session.commit()
+    assert snapshot() == expected
+
+
+# Prueba para verificar que la reconstrucción indexa los campos de texto que
+# solo están en el JSON `details`, como los de las interacciones anteriores a
+# la normalización o los de los eventos sin columnas propias
+def test_rebuild_search_index_json_details(test_app):
+    record_session("legacy", clicks=3, inputs=2)
+    extra = [
+        InteractionRow(
+            "click",
+            START,
+            {"path": BUTTON, "url": "https://example.com/form"},
+            "legacy",
+        ),
+        InteractionRow(
+            "navigate", START, {"url": "https://example.com/form"}, "legacy"
+        ),
+    ]
+    apply_operations([WriteOperation("interactions", "legacy", extra)])
+    expected = {
+        (row.term_id, row.field, row.type, row.count, row.first_time, row.last_time)
+        for row in SearchPosting.query.all()
+    }
+
+    for interaction in Interaction.query.all():
+        interaction.raw_details = interaction.details
+        interaction.path_id = interaction.target_id = interaction.url_id = None
+    db.session.query(SearchPosting).delete()
+    db.session.commit()
+
+    rebuild_search_index(db.session)
+    db.session.commit()
+    assert {
+        (row.term_id, row.field, row.type, row.count, row.first_time, row.last_time)
+        for row in SearchPosting.query.all()
+    } == expected
+
+
+# Prueba para verificar que la reconstrucción solo lee del JSON `details` las
+# interacciones que conservan campos en él, y no todas las de la sesión
+def test_rebuild_search_index_scanned_rows(test_app, monkeypatch):
+    record_session("scanned", clicks=20, inputs=10)
+    apply_operations(
+        [
+            WriteOperation(
+                "interactions",
+                "scanned",
+                [
+                    InteractionRow(
+                        "navigate", START, {"url": "https://example.com/"}, "scanned"
+                    )
+                ],
+            )
+        ]
+    )
+    db.session.query(SearchPosting).delete()
+    db.session.commit()
+
+    scanned = []
+    record = SearchIndexAggregator.record
+
+    def count_rows(self, rows, fields=SEARCH_FIELDS) -> None:
+        rows = list(rows)
+        scanned.extend(rows)
+        record(self, rows, fields)
+
+    monkeypatch.setattr(SearchIndexAggregator, "record", count_rows)
+    rebuild_search_index(db.session)
+    db.session.commit()
+
+    assert Interaction.query.count() == 32
+    assert [row.type for row in scanned] == ["navigate"]
@@ -0,0 +1,100 @@
+# Pruebas del agregador de visitas a sitios
+import pytest
+from dateutil.parser import parse as parse_date
+from sqlalchemy import event
+from webchronicle.app import db
+from database.models import Session, VisitedSite
+from database.site_visits import SiteVisitAggregator
+
+
+# Fixture para configurar las pruebas con las sesiones de las visitas
+@pytest.fixture
+def test_app(test_app):
+    db.session.add_all(
+        [
+            Session(id="visits-a", start_time=parse_date("2025-01-01T12:00:00Z")),
+            Session(id="visits-b", start_time=parse_date("2025-01-01T12:00:00Z")),
+        ]
+    )
+    db.session.commit()
+    return test_app
+
+
+def count_statements(aggregator: SiteVisitAggregator) -> int:
+    statements = []
+
+    def record(*args) -> None:
+        statements.append(args[2])
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        aggregator.flush(db.session)
+        db.session.commit()
+        aggregator.commit()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+# Prueba para verificar que las visitas se acumulan y se escriben de una vez
+def test_flush_visits(test_app):
+    aggregator = SiteVisitAggregator()
+    aggregator.record(
+        "https://a.example.com", "visits-a", parse_date("2025-01-01T12:05:00Z")
+    )
+    aggregator.record(
+        "https://a.example.com", "visits-a", parse_date("2025-01-01T12:01:00Z")
+    )
+    aggregator.record(
+        "https://a.example.com", "visits-b", parse_date("2025-01-01T12:03:00Z")
+    )
+    aggregator.record(
+        "https://b.example.com", "visits-b", parse_date("2025-01-01T12:02:00Z")
+    )
+    assert len(aggregator) == 2
+
+    # Upsert de los sitios, consulta de sus ids, inserción de las relaciones y
+    # recuento de las sesiones de los sitios
+    assert count_statements(aggregator) == 4
+
+    site = VisitedSite.query.filter_by(url="https://a.example.com").one()
+    assert site.visit_count == 3
+    assert site.first_visit == parse_date("2025-01-01T12:01:00").replace(tzinfo=None)
+    assert site.last_visit == parse_date("2025-01-01T12:05:00").replace(tzinfo=None)
+    assert sorted(session.id for session in site.sessions) == ["visits-a", "visits-b"]
+    assert site.session_count == 2
+
+    # Las visitas repetidas solo actualizan los contadores del sitio
+    aggregator.record(
+        "https://a.example.com", "visits-a", parse_date("2025-01-01T12:10:00Z")
+    )
+    assert count_statements(aggregator) == 1
+
+    db.session.expire_all()
+    site = db.session.get(VisitedSite, site.id)
+    assert site.visit_count == 4
+    assert site.last_visit == parse_date("2025-01-01T12:10:00").replace(tzinfo=None)
+    assert len(site.sessions) == 2
+
+
+# Prueba para verificar que al deshacer la transacción no se guardan en caché
+# relaciones que no se han escrito
+def test_rollback_visits(test_app):
+    aggregator = SiteVisitAggregator()
+    aggregator.record(
+        "https://c.example.com", "visits-a", parse_date("2025-01-01T12:00:00Z")
+    )
+    aggregator.flush(db.session)
+    db.session.rollback()
+    aggregator.rollback()
+
+    assert VisitedSite.query.count() == 0
+
+    aggregator.record(
+        "https://c.example.com", "visits-a", parse_date("2025-01-01T12:00:00Z")
+    )
+    assert count_statements(aggregator) == 4
+    assert (
+        len(VisitedSite.query.filter_by(url="https://c.example.com").one().sessions)
+        == 1
+    )
@@ -0,0 +1,140 @@
+# Pruebas del almacenamiento normalizado de los detalles de las interacciones
+import pytest
+from dateutil.parser import parse as parse_date
+from sqlalchemy import event, func, select, text
+from webchronicle.app import db
+from database.models import Interaction, InteractionRow, InternedString, Session
+from database.normalized import normalize_details
+from database.strings import (
+    StringInterner,
+    interaction_values,
+    row_details,
+    select_interactions,
+)
+
+SESSION_ID = "strings-session"
+
+
+# Fixture para configurar las pruebas con la sesión de las interacciones
+@pytest.fixture
+def test_app(test_app):
+    db.session.add(
+        Session(id=SESSION_ID, start_time=parse_date("2025-01-01T12:00:00Z"))
+    )
+    db.session.commit()
+    return test_app
+
+
+def insert_rows(rows: list[InteractionRow], strings: StringInterner) -> int:
+    statements = []
+
+    def record(*args) -> None:
+        statements.append(args[2])
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        db.session.execute(
+            Interaction.__table__.insert(),
+            interaction_values(db.session, rows, strings),
+        )
+        db.session.commit()
+        strings.commit()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return sum(
+        statement.lstrip().upper().startswith("INSERT INTO STRINGS")
+        for statement in statements
+    )
+
+
+DETAILS = [
+    ("click", {"path": "/html/body/button", "target": "BUTTON", "x": 10, "y": 20}),
+    (
+        "input",
+        {
+            "path": "/html/body/input",
+            "target": "INPUT",
+            "key": "a",
+            "modAlt": False,
+            "modCtrl": True,
+            "modShift": False,
+            "modMeta": False,
+        },
+    ),
+    ("scroll", {"x": 0, "y": 300}),
+    ("tab_updated", {"tabId": 3, "url": "https://example.com/", "title": "Example"}),
+    (
+        "click",
+        {"path": "/html/body/button", "target": "BUTTON", "x": True, "extra": [1, 2]},
+    ),
+    ("custom", {"path": "/html/body/div", "x": 1}),
+    ("click", "Clicked on the signup button"),
+]
+
+
+# Prueba para verificar que los detalles se reconstruyen igual que se recibieron
+def test_details_round_trip(test_app):
+    strings = StringInterner()
+    rows = [
+        InteractionRow(
+            kind, parse_date(f"2025-01-01T12:00:0{index}Z"), details, SESSION_ID
+        )
+        for index, (kind, details) in enumerate(DETAILS)
+    ]
+    insert_rows(rows, strings)
+
+    read = db.session.execute(
+        select_interactions(Interaction.type).order_by(Interaction.time)
+    ).all()
+    assert [row_details(row) for row in read] == [details for _, details in DETAILS]
+    assert [
+        interaction.details
+        for interaction in Interaction.query.order_by(Interaction.time)
+    ] == [details for _, details in DETAILS]
+
+    # Los campos habituales se guardan en columnas y no en el JSON
+    click = Interaction.query.order_by(Interaction.time).first()
+    assert click.raw_details is None
+    assert db.session.scalar(
+        text("SELECT details IS NULL FROM Interactions WHERE id = :id"),
+        {"id": click.id},
+    )
+    assert (click.path.value, click.target.value, click.x, click.y) == (
+        "/html/body/button",
+        "BUTTON",
+        10,
+        20,
+    )
+    assert normalize_details("custom", DETAILS[5][1])[2] == DETAILS[5][1]
+
+
+# Prueba para verificar que las cadenas conocidas no vuelven a consultarse ni insertarse
+def test_interner_cache(test_app):
+    strings = StringInterner()
+    row = InteractionRow(
+        "click", parse_date("2025-01-01T12:00:00Z"), DETAILS[0][1], SESSION_ID
+    )
+    assert insert_rows([row, row], strings) == 1
+    assert len(strings) == 2
+
+    assert insert_rows([row], strings) == 0
+    assert db.session.scalar(select(func.count()).select_from(InternedString)) == 2
+
+    # Otro proceso con la caché vacía reutiliza las cadenas ya insertadas
+    assert insert_rows([row], StringInterner()) == 1
+    assert db.session.scalar(select(func.count()).select_from(InternedString)) == 2
+
+
+# Prueba para verificar que las cadenas de una transacción deshecha no quedan en caché
+def test_interner_rollback(test_app):
+    strings = StringInterner()
+    row = InteractionRow(
+        "click", parse_date("2025-01-01T12:00:00Z"), DETAILS[0][1], SESSION_ID
+    )
+    interaction_values(db.session, [row], strings)
+    db.session.rollback()
+    strings.rollback()
+    assert len(strings) == 0
+
+    insert_rows([row], strings)
+    assert Interaction.query.one().details == DETAILS[0][1]
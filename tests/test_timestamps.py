@@ -0,0 +1,94 @@
+# Pruebas de las marcas de tiempo y de su almacenamiento como enteros
+from datetime import datetime, timedelta, timezone
+from dateutil.parser import parse as parse_date
+from sqlalchemy import create_engine, select, text
+from database.base import Base
+from database.migrations import current_version, schema_version, upgrade
+from database.models import Interaction, Session, SessionStats
+from database.timestamps import from_epoch_us, parse_timestamp, to_epoch_us
+
+
+# Prueba para verificar que el análisis rápido coincide con dateutil
+def test_parse_timestamp():
+    for value in [
+        "2025-01-01T12:01:00.000Z",
+        "2025-01-01T12:01:00.123456+02:00",
+        "2025-01-01 12:01:00",
+        "Wed, 01 Jan 2025 12:01:00 GMT",
+    ]:
+        assert parse_timestamp(value) == parse_date(value)
+
+
+# Prueba para verificar la conversión a microsegundos desde 1970
+def test_epoch_microseconds():
+    moment = datetime(2025, 1, 1, 12, 0, 0, 123456)
+    assert to_epoch_us(moment) == 1735732800123456
+    assert (
+        to_epoch_us(moment.replace(tzinfo=timezone(timedelta(hours=1))))
+        == 1735729200123456
+    )
+    assert from_epoch_us(to_epoch_us(moment)) == moment
+    assert from_epoch_us(-1) == datetime(1969, 12, 31, 23, 59, 59, 999999)
+
+
+# Prueba para verificar que la migración convierte las fechas guardadas como texto
+def test_integer_timestamps_migration():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        # Base de datos en la versión 5, con las fechas en texto como las
+        # guardaba la columna `DateTime`
+        current_version(connection)
+        connection.execute(schema_version.insert().values(version=5))
+        connection.execute(
+            text(
+                "INSERT INTO Sessions (id, start_time) VALUES ('old', '2025-01-01 12:00:00.000000')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO Interactions (type, time, session_id) VALUES "
+                "('click', '2025-01-01 12:00:01.250000', 'old'), "
+                "('click', '2025-01-01 12:00:00', 'old')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO session_stats VALUES "
+                "('old', 2, '2025-01-01 12:00:00', '2025-01-01 12:00:01.250000')"
+            )
+        )
+
+    assert [migration.version for migration in upgrade(engine)] == [6, 7, 8, 9, 10]
+    with engine.connect() as connection:
+        assert current_version(connection) == 10
+        assert connection.execute(
+            text("SELECT typeof(time) FROM Interactions")
+        ).scalars().all() == [
+            "integer",
+            "integer",
+        ]
+        times = (
+            connection.execute(
+                select(Interaction.time).where(
+                    Interaction.time > datetime(2025, 1, 1, 12, 0, 1)
+                )
+            )
+            .scalars()
+            .all()
+        )
+        assert times == [datetime(2025, 1, 1, 12, 0, 1, 250000)]
+        stats = connection.execute(
+            select(SessionStats.first_event, SessionStats.last_event)
+        ).one()
+        assert stats == (
+            datetime(2025, 1, 1, 12),
+            datetime(2025, 1, 1, 12, 0, 1, 250000),
+        )
+        assert connection.execute(select(Session.start_time)).scalar() == datetime(
+            2025, 1, 1, 12
+        )
+        assert (
+            connection.execute(text("SELECT typeof(start_time) FROM Sessions")).scalar()
+            == "integer"
+        )
@@ -1,78 +1,182 @@
-from typing import NoReturn, no_type_check
-from flask import Flask, render_template, request
+import logging
+import os
+from datetime import timedelta
+from typing import Any, Callable, no_type_check
+from flask import (
+    Flask,
+    Response,
+    abort,
+    jsonify,
+    render_template,
+    request,
+    stream_template,
+    stream_with_context,
+    url_for,
+)
 from flask_sock import Sock
-from time import sleep
-from dateutil.parser import parse as parse_date
-from json import loads, dumps, JSONDecodeError
-from database.base import db
+from sqlalchemy.orm import joinedload, selectinload, undefer
+from json import dumps
+from database.base import (
+    DATABASE_URI_ENV,
+    DEFAULT_DATABASE_URI,
+    configure_sqlite,
+    db,
+    engine_options,
+)
 from database.manager import DatabaseManager
-from database.models import Session, Interaction, VisitedSite
+from database.aggregates import SessionStatsAggregator
+from database.models import Session, VisitedSite, site_sessions
+from database.keyframes import KeyframeBuilder
+from database.retention import RetentionPolicy, RetentionReport, apply_retention
+from database.search_index import SearchIndexAggregator
+from database.site_visits import SiteVisitAggregator
+from database.strings import StringInterner
+from database.timestamps import parse_timestamp
+from webchronicle.caching import ResponseCache
+from webchronicle.connection import RecordingConnection, message_log
+from webchronicle.events import (
+    EventCursor,
+    fetch_event_page,
+    page_arguments,
+    parse_event_filters,
+    stream_events,
+)
+from webchronicle.export import (
+    EXPORT_FORMATS,
+    ExportSelection,
+    export_sessions,
+    parse_export_selection,
+)
+from webchronicle.search import parse_search_query, search_sessions
+from webchronicle.replay import build_replay_index, fetch_replay_chunk, replay_state_at
+from webchronicle.ingestion import (
+    FlushPolicy,
+    FlushStats,
+    IngestionWriter,
+    WriteOperation,
+)
+from webchronicle.logs import DEFAULT_LOG_LEVEL, LOG_LEVEL_ENV, configure_logging
+from webchronicle.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    registry as metrics,
+)
+from webchronicle.protocol import SUBPROTOCOLS, DecodeError, decode_message
+from webchronicle.retention import RetentionJob
 
 ### Configuración de la aplicación ###
 
 app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    DATABASE_URI_ENV, DEFAULT_DATABASE_URI
+)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLITE_JOURNAL_MODE"] = "WAL"
+app.config["SQLITE_SYNCHRONOUS"] = "NORMAL"
+app.config["SQLITE_AUTO_VACUUM"] = "INCREMENTAL"
+app.config["DATABASE_BUSY_TIMEOUT_MS"] = 5000
+app.config["DATABASE_POOL_SIZE"] = 10
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"],
+    busy_timeout_ms=app.config["DATABASE_BUSY_TIMEOUT_MS"],
+    pool_size=app.config["DATABASE_POOL_SIZE"],
+)
+app.config["SOCK_SERVER_OPTIONS"] = {"subprotocols": SUBPROTOCOLS}
 
 sock = Sock(app)
 
 db.init_app(app)
 
 with app.app_context():
-    from database.models import Session, Interaction
-
-    DatabaseManager(db)
-
-INTERACTION_BUFFER_SIZE = 10
+    from database.models import Session
+
+    configure_sqlite(
+        db.engine,
+        journal_mode=app.config["SQLITE_JOURNAL_MODE"],
+        synchronous=app.config["SQLITE_SYNCHRONOUS"],
+        busy_timeout_ms=app.config["DATABASE_BUSY_TIMEOUT_MS"],
+        auto_vacuum=app.config["SQLITE_AUTO_VACUUM"],
+    )
+    db_manager = DatabaseManager(db)
+
+app.config["INTERACTION_FLUSH_MAX_EVENTS"] = 100
+app.config["INTERACTION_FLUSH_MAX_BYTES"] = 256 * 1024
+app.config["INTERACTION_FLUSH_MAX_AGE_MS"] = 500
+app.config["INGESTION_QUEUE_SIZE"] = 10_000
+app.config["INGESTION_BATCH_SIZE"] = 1_000
+app.config["INGESTION_BACKPRESSURE_RETRY_MS"] = 250
+app.config["SITES_PAGE_SIZE"] = 50
+app.config["SESSIONS_PAGE_SIZE"] = 50
+app.config["LISTING_MAX_PAGE_SIZE"] = 500
+app.config["EVENTS_PAGE_SIZE"] = 500
+app.config["EVENTS_MAX_PAGE_SIZE"] = 5_000
+app.config["REPLAY_CHUNK_MS"] = 60_000
+app.config["REPLAY_KEYFRAME_EVENTS"] = 500
+app.config["REPLAY_KEYFRAME_MS"] = 30_000
+app.config["RESPONSE_CACHE_MAX_BYTES"] = 64 * 1024 * 1024
+app.config["SEARCH_INDEX_ENABLED"] = True
+app.config["SEARCH_PAGE_SIZE"] = 50
+app.config["SEARCH_MAX_TERMS"] = 1_000
+app.config["EXPORT_CHUNK_BYTES"] = 64 * 1024
+# Límites de retención de los datos grabados (ver `database.retention`); la
+# tarea de retención solo se arranca si se fija alguno
+app.config["RETENTION_MAX_AGE_DAYS"] = None
+app.config["RETENTION_MAX_SESSIONS_PER_SITE"] = None
+app.config["RETENTION_MAX_SESSION_EVENTS"] = None
+app.config["RETENTION_INTERVAL_S"] = 300
+app.config["RETENTION_MAX_SESSIONS_PER_RUN"] = 100
+app.config["RETENTION_BATCH_SIZE"] = 1_000
+app.config["RETENTION_BATCH_PAUSE_MS"] = 50
+app.config["RETENTION_RECLAIM_PAGES"] = 1_000
+app.config["LOG_LEVEL"] = os.environ.get(LOG_LEVEL_ENV, DEFAULT_LOG_LEVEL).upper()
+app.config["LOG_SAMPLE_EVERY"] = 100
+app.config["METRICS_ENABLED"] = True
+
+configure_logging(app.config["LOG_LEVEL"])
+message_log.every = app.config["LOG_SAMPLE_EVERY"]
+metrics.enabled = app.config["METRICS_ENABLED"]
+
+logger = logging.getLogger(__name__)
 
 ### Funciones auxiliares ###
 
+# Visitas a sitios acumuladas por los eventos de pestañas, que se escriben una
+# vez por lote de operaciones de la etapa de ingesta.
+site_visits = SiteVisitAggregator()
 
-def add_interaction(
-    message_data: dict, session_id: str, interaction_buffer: list[Interaction]
-) -> None:
-    timestamp = message_data.get("timestamp")
-    parsed_time = parse_date(timestamp) if timestamp else None
-
-    if "details" not in message_data:
-        return
-
-    interaction = Interaction(
-        type=message_data["event"],
-        time=parsed_time,
-        details=message_data["details"],
-        session_id=session_id,
-    )
-
-    interaction_buffer.append(interaction)
-    if len(interaction_buffer) >= INTERACTION_BUFFER_SIZE:
-        db.session.add_all(interaction_buffer)
-        db.session.commit()
-        interaction_buffer.clear()
+# Totales de las interacciones de cada sesión, que se suman a los guardados una
+# vez por lote de operaciones.
+session_stats = SessionStatsAggregator()
 
+# Entradas del índice de búsqueda entre sesiones, que se suman a las guardadas
+# una vez por lote de operaciones.
+search_index = SearchIndexAggregator()
 
-def is_valid_message(message: str) -> bool:
-    try:
-        message_dict = loads(message)
-    except JSONDecodeError:
-        return False
+# Ids de las XPath, etiquetas y URL ya internadas, para no consultarlos en cada
+# inserción de interacciones.
+strings = StringInterner()
 
-    if not isinstance(message_dict, dict):
-        return False
+# Estado de reproducción de las sesiones en grabación, del que se generan los
+# fotogramas clave a medida que se escriben sus interacciones.
+keyframes = KeyframeBuilder(
+    every_events=app.config["REPLAY_KEYFRAME_EVENTS"],
+    every_ms=app.config["REPLAY_KEYFRAME_MS"],
+)
 
-    if "type" not in message_dict or "message" not in message_dict:
-        return False
+# Páginas y datos de reproducción de las sesiones terminadas, que ya no
+# cambian y suelen consultarse repetidamente.
+response_cache = ResponseCache(app.config["RESPONSE_CACHE_MAX_BYTES"])
 
-    if not isinstance(message_dict["type"], str) or not isinstance(
-        message_dict["message"], dict
-    ):
-        return False
 
-    return True
+def is_valid_message(message: str) -> bool:
+    return not isinstance(decode_message(message), DecodeError)
 
 
 def process_tab_event(message_data: dict, session_id: str) -> None:
-    """Process tab events and update visited sites"""
+    """
+    Procesa los eventos de pestañas, registrando la visita al sitio en el
+    agregador de visitas. Las visitas se escriben al volcarse el agregador,
+    siendo responsabilidad del llamante volcarlo y confirmar la transacción.
+    """
     if (
         message_data.get("event") == "tab_created"
         or message_data.get("event") == "tab_updated"
@@ -80,26 +184,193 @@ def process_tab_event(message_data: dict, session_id: str) -> None:
     ):
         details = message_data["details"]
         if "url" in details:
-            url = details["url"]
-            timestamp = parse_date(message_data["timestamp"])
+            site_visits.record(
+                details["url"], session_id, parse_timestamp(message_data["timestamp"])
+            )
+
+
+def apply_operations(operations: list[WriteOperation]) -> None:
+    """
+    Aplica un lote de operaciones de escritura en una única transacción.
+
+    Parámetros:
+    ------------
+    operations: list[WriteOperation]
+        Operaciones a aplicar, en el orden en el que fueron encoladas.
+    """
+    try:
+        for operation in operations:
+            match operation.kind:
+                case "session_start":
+                    db.session.add(
+                        Session(
+                            id=operation.session_id,
+                            start_time=operation.payload,
+                            end_time=None,
+                            window_width=None,
+                            window_height=None,
+                        )
+                    )
+                    db.session.flush()
+                case "session_resume":
+                    # La sesión puede no existir si su inicio no llegó a
+                    # escribirse, en cuyo caso se crea al retomarla
+                    if db.session.get(Session, operation.session_id) is None:
+                        db.session.add(
+                            Session(
+                                id=operation.session_id, start_time=operation.payload
+                            )
+                        )
+                        db.session.flush()
+                case "session_end":
+                    session = db.session.get(Session, operation.session_id)
+                    if session is not None:
+                        session.end_time = operation.payload
+                    site_visits.forget_session(operation.session_id)
+                    keyframes.forget_session(operation.session_id)
+                case "window_data":
+                    session = db.session.get(Session, operation.session_id)
+                    if session is not None:
+                        session.window_width, session.window_height = operation.payload
+                case "interactions":
+                    session_stats.record(operation.payload)
+                    if app.config["SEARCH_INDEX_ENABLED"]:
+                        search_index.record(operation.payload)
+                    keyframes.record(db.session(), operation.payload)
+                    db_manager.bulk_insert_interactions(db, operation.payload, strings)
+                case "tab_event":
+                    process_tab_event(operation.payload, operation.session_id)
+                case "batch":
+                    rows, tab_events = operation.payload
+                    session_stats.record(rows)
+                    if app.config["SEARCH_INDEX_ENABLED"]:
+                        search_index.record(rows)
+                    keyframes.record(db.session(), rows)
+                    db_manager.bulk_insert_interactions(db, rows, strings)
+                    for tab_event in tab_events:
+                        process_tab_event(tab_event, operation.session_id)
+                case _:
+                    logger.error("Unknown write operation: '%s'", operation.kind)
+        site_visits.flush(db.session())
+        session_stats.flush(db.session())
+        search_index.flush(db.session(), strings)
+        keyframes.flush(db.session())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        site_visits.rollback()
+        session_stats.rollback()
+        search_index.rollback()
+        keyframes.rollback()
+        strings.rollback()
+        raise
+    site_visits.commit()
+    session_stats.commit()
+    search_index.commit()
+    keyframes.commit()
+    strings.commit()
+
+
+### Ingesta ###
+
+writer = IngestionWriter(
+    app,
+    apply_operations,
+    max_queue_size=app.config["INGESTION_QUEUE_SIZE"],
+    batch_size=app.config["INGESTION_BATCH_SIZE"],
+)
+
+
+flush_stats = FlushStats()
+
+
+def retention_policy() -> RetentionPolicy:
+    max_age_days = app.config["RETENTION_MAX_AGE_DAYS"]
+    return RetentionPolicy(
+        max_age=None if max_age_days is None else timedelta(days=max_age_days),
+        max_sessions_per_site=app.config["RETENTION_MAX_SESSIONS_PER_SITE"],
+        max_session_events=app.config["RETENTION_MAX_SESSION_EVENTS"],
+    )
+
+
+def forget_session_state(session_id: str) -> None:
+    """
+    Descarta el estado en memoria de la ruta de escritura de una sesión
+    borrada o recortada por la política de retención, que se vuelve a leer de
+    la base de datos si la sesión sigue grabando.
+    """
+    site_visits.forget_session(session_id)
+    keyframes.forget_session(session_id)
+
+
+def enforce_retention() -> RetentionReport:
+    """
+    Aplica una pasada de la política de retención con la configuración de la
+    aplicación.
+    """
+    return apply_retention(
+        db.session(),
+        retention_policy(),
+        max_sessions=app.config["RETENTION_MAX_SESSIONS_PER_RUN"],
+        batch_size=app.config["RETENTION_BATCH_SIZE"],
+        pause=app.config["RETENTION_BATCH_PAUSE_MS"] / 1000,
+        max_pages=app.config["RETENTION_RECLAIM_PAGES"],
+        forget=forget_session_state,
+    )
 
-            # Check if site exists
-            site = VisitedSite.query.filter_by(url=url).first()
-            session = Session.query.get(session_id)
 
-            if site:
-                site.visit_count += 1
-                site.last_visit = timestamp
-                if session not in site.sessions:
-                    site.sessions.append(session)
-            else:
-                site = VisitedSite(
-                    url=url, visit_count=1, first_visit=timestamp, last_visit=timestamp
-                )
-                db.session.add(site)
-                site.sessions.append(session)
+retention_job = RetentionJob(
+    app, enforce_retention, interval=app.config["RETENTION_INTERVAL_S"]
+)
 
-            db.session.commit()
+
+def start_background_jobs() -> None:
+    """
+    Arranca la etapa de ingesta y, si hay una política de retención, la tarea
+    que la aplica.
+    """
+    writer.start()
+    if retention_policy().enabled:
+        retention_job.start()
+
+
+metrics.callback_gauge(
+    "ingestion_queue_depth",
+    "Write operations waiting in the ingestion queue.",
+    lambda: writer.queue_depth,
+)
+
+
+def flush_policy() -> FlushPolicy:
+    return FlushPolicy(
+        max_events=app.config["INTERACTION_FLUSH_MAX_EVENTS"],
+        max_bytes=app.config["INTERACTION_FLUSH_MAX_BYTES"],
+        max_age_ms=app.config["INTERACTION_FLUSH_MAX_AGE_MS"],
+    )
+
+
+def open_connection(
+    send: Callable[[str], Any], subprotocol: str | None = None
+) -> RecordingConnection:
+    """
+    Crea el estado de una nueva conexión de grabación con la configuración de
+    la aplicación.
+
+    Parámetros:
+    ------------
+    send: Callable[[str], Any]
+        Función que envía una trama de texto al cliente.
+    subprotocol: str | None
+        Subprotocolo negociado al abrir el WebSocket.
+    """
+    return RecordingConnection(
+        send,
+        writer,
+        flush_policy(),
+        flush_stats,
+        backpressure_retry_ms=app.config["INGESTION_BACKPRESSURE_RETRY_MS"],
+        subprotocol=subprotocol,
+    )
 
 
 ### Rutas ###
@@ -110,57 +381,257 @@ def shutdown_session(exception=None) -> None:
     db.session.remove()
 
 
+@app.route("/stats/ingestion")
+def ingestion_stats() -> Response:
+    return jsonify(
+        {
+            "flush_policy": flush_policy()._asdict(),
+            "flushes": flush_stats.snapshot(),
+            "writer": writer.snapshot(),
+        }
+    )
+
+
+@app.route("/stats/retention")
+def retention_stats() -> Response:
+    return jsonify(
+        {"policy": retention_policy()._asdict(), "job": retention_job.snapshot()}
+    )
+
+
+@app.route("/stats/cache")
+def cache_stats() -> Response:
+    return jsonify(response_cache.snapshot())
+
+
+@app.route("/metrics")
+def metrics_page() -> Response:
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
 @app.route("/")
-def sites_page():
-    sites = VisitedSite.query.order_by(VisitedSite.visit_count.desc()).all()
+def sites_page() -> str:
+    # El número de sesiones de cada sitio es una columna mantenida al grabar,
+    # por lo que la página no carga la colección de sesiones
+    sites = db.paginate(
+        db.select(VisitedSite).order_by(VisitedSite.visit_count.desc(), VisitedSite.id),
+        per_page=request.args.get("per_page", app.config["SITES_PAGE_SIZE"], type=int),
+        max_per_page=app.config["LISTING_MAX_PAGE_SIZE"],
+    )
     return render_template("sites.html", sites=sites)
 
 
 @app.route("/sessions")
-def sessions_index():
+def sessions_index() -> str:
     site_id = request.args.get("site_id", type=int)
+    # Cada página se obtiene con un número fijo de consultas: el recuento, las
+    # sesiones con sus totales y número de sitios, y los eventos por tipo
+    query = db.select(Session).options(
+        joinedload(Session.stats),
+        selectinload(Session.event_counts),
+        undefer(Session.site_count),
+    )
     if site_id:
-        site = VisitedSite.query.get_or_404(site_id)
-        sessions = site.sessions
-    else:
-        sessions = Session.query.order_by(Session.start_time.desc()).all()
-    return render_template("sessions.html", sessions=sessions)
+        db.get_or_404(VisitedSite, site_id)
+        query = query.join(site_sessions).where(site_sessions.c.site_id == site_id)
+    sessions = db.paginate(
+        query.order_by(Session.start_time.desc(), Session.id),
+        per_page=request.args.get(
+            "per_page", app.config["SESSIONS_PAGE_SIZE"], type=int
+        ),
+        max_per_page=app.config["LISTING_MAX_PAGE_SIZE"],
+    )
+    return render_template("sessions.html", sessions=sessions, site_id=site_id)
 
 
-@app.route("/events/<session_id>")
-def view_events(session_id: str) -> str:
-    events = Interaction.query.filter_by(session_id=session_id).all()
-    return render_template("events.html", events=events, session_id=session_id)
+def search_window() -> tuple[int, int]:
+    """
+    Tamaño y posición de la página de resultados pedida.
+    """
+    limit = min(
+        request.args.get("limit", app.config["SEARCH_PAGE_SIZE"], type=int),
+        app.config["LISTING_MAX_PAGE_SIZE"],
+    )
+    offset = request.args.get("offset", 0, type=int)
+    if limit < 1 or offset < 0:
+        abort(400)
+    return limit, offset
 
 
-@app.route("/play/<session_id>")
-def play_session(session_id: str) -> str:
-    session = Session.query.get(session_id)
-    if not session:
-        return render_template(
-            "player.html",
+@app.route("/search")
+def search_page() -> str:
+    try:
+        query = parse_search_query(request.args)
+    except (ValueError, OverflowError):
+        abort(400)
+
+    page, next_url = None, None
+    if query is not None:
+        limit, offset = search_window()
+        page = search_sessions(query, limit, offset, app.config["SEARCH_MAX_TERMS"])
+        if page.next_offset is not None:
+            next_url = url_for(
+                "search_page", **page_arguments(request.args, offset=page.next_offset)
+            )
+    return render_template("search.html", query=query, page=page, next_url=next_url)
+
+
+@app.route("/api/search")
+def search_api() -> Any:
+    try:
+        query = parse_search_query(request.args)
+    except (ValueError, OverflowError):
+        abort(400)
+    if query is None:
+        abort(400)
+
+    limit, offset = search_window()
+    page = search_sessions(query, limit, offset, app.config["SEARCH_MAX_TERMS"])
+    return jsonify(
+        {
+            "results": [result.to_json() for result in page.results],
+            "next_offset": page.next_offset,
+            "truncated": page.truncated,
+        }
+    )
+
+
+def export_response(selection: ExportSelection) -> Response:
+    """
+    Respuesta con la exportación de las sesiones seleccionadas en el formato
+    de los parámetros `format` ("ndjson" o "csv") y `gzip`, filtrando sus
+    interacciones con los mismos parámetros que el listado de eventos. Se
+    envía por bloques a medida que se leen de la base de datos.
+    """
+    try:
+        filters = parse_event_filters(request.args)
+    except (ValueError, OverflowError):
+        abort(400)
+    format = request.args.get("format", "ndjson")
+    if format not in EXPORT_FORMATS:
+        abort(400)
+    compress = bool(request.args.get("gzip", type=int))
+
+    filename = f"webchronicle-export.{format}" + (".gz" if compress else "")
+    chunks = export_sessions(
+        db.session(),
+        selection,
+        filters,
+        format,
+        compress,
+        app.config["EXPORT_CHUNK_BYTES"],
+    )
+    return Response(
+        stream_with_context(chunks),
+        content_type="application/gzip"
+        if compress
+        else f"{EXPORT_FORMATS[format]}; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.route("/api/export")
+def export_api() -> Response:
+    try:
+        selection = parse_export_selection(request.args)
+    except (ValueError, OverflowError):
+        abort(400)
+    return export_response(selection)
+
+
+@app.route("/api/sessions/<session_id>/export")
+def export_session(session_id: str) -> Response:
+    if db.session.get(Session, session_id) is None:
+        abort(404)
+    return export_response(ExportSelection(session_ids=(session_id,)))
+
+
+@app.route("/events/<session_id>")
+@response_cache.session_response
+def view_events(session_id: str) -> Any:
+    try:
+        filters = parse_event_filters(request.args)
+        after = request.args.get("after")
+        cursor = EventCursor.decode(after) if after else None
+    except (ValueError, OverflowError):
+        abort(400)
+
+    # En modo streaming se recorren todos los eventos y las filas se envían a
+    # medida que se leen de la base de datos.
+    if request.args.get("stream", type=int):
+        return stream_template(
+            "events.html",
+            events=stream_events(session_id, filters),
             session_id=session_id,
-            actions=[],
-            tabs=[],
-            error="Session not found",
+            filters=filters,
+            next_url=None,
         )
 
-    interactions = Interaction.query.filter_by(session_id=session_id).all()
-    actions = [
-        {"event": interaction.type, "details": interaction.details}
-        for interaction in interactions
-    ]
+    limit = min(
+        request.args.get("limit", app.config["EVENTS_PAGE_SIZE"], type=int),
+        app.config["EVENTS_MAX_PAGE_SIZE"],
+    )
+    if limit < 1:
+        abort(400)
+    page = fetch_event_page(session_id, filters, after=cursor, limit=limit)
+    next_url = None
+    if page.next_cursor is not None:
+        next_url = url_for(
+            "view_events",
+            session_id=session_id,
+            **page_arguments(request.args, after=page.next_cursor.encode()),
+        )
+    return render_template(
+        "events.html",
+        events=page.events,
+        session_id=session_id,
+        filters=filters,
+        next_url=next_url,
+    )
 
-    tabs = []
-    for action in actions:
-        if action["event"] in ["tab_created", "tab_updated"]:
-            tabs.append(action["details"])
 
+@app.route("/play/<session_id>")
+@response_cache.session_response
+def play_session(session_id: str) -> str:
+    # Los eventos no se incluyen en la página: el reproductor los descarga por
+    # ventanas de tiempo desde la API de reproducción.
+    session = db.session.get(Session, session_id)
     return render_template(
-        "player.html", session_id=session_id, actions=actions, tabs=tabs, error=None
+        "player.html",
+        session_id=session_id,
+        error=None if session else "Session not found",
     )
 
 
+@app.route("/api/sessions/<session_id>/replay")
+@response_cache.session_response
+def replay_index(session_id: str) -> Any:
+    if db.session.get(Session, session_id) is None:
+        abort(404)
+    return jsonify(build_replay_index(session_id, app.config["REPLAY_CHUNK_MS"]))
+
+
+@app.route("/api/sessions/<session_id>/replay/<int:chunk>")
+@response_cache.session_response
+def replay_chunk(session_id: str, chunk: int) -> Any:
+    data = fetch_replay_chunk(session_id, chunk, app.config["REPLAY_CHUNK_MS"])
+    if data is None:
+        abort(404)
+    return jsonify(data)
+
+
+@app.route("/api/sessions/<session_id>/replay/state")
+@response_cache.session_response
+def replay_state(session_id: str) -> Any:
+    at_ms = request.args.get("at", type=int)
+    if at_ms is None or at_ms < 0:
+        abort(400)
+    data = replay_state_at(session_id, at_ms)
+    if data is None:
+        abort(404)
+    return jsonify(data)
+
+
 # Formato de ejemplo de los mensajes recibidos:
 #
 # base: {type: "tipo", message: {detalles}}
@@ -177,92 +648,36 @@ def play_session(session_id: str) -> str:
 #
 # session: {type: "session_state_changed", message: {timestamp: "2021-09-01 12:00:00", sessionId: 1, action: "end"}}
 #
+# lote: {type: "batch", message: {messages: [{type: "event_logged", message: {...}}, {type: "tab_event", message: {...}}]}}
+#
+# Si el cliente negocia el subprotocolo "webchronicle.compact.v1" las tramas usan
+# el formato compacto descrito en `webchronicle.protocol.CompactDecoder`:
+#
+# compacto: [["j", "session_state_changed", {...}], ["e", 1735732860000, "click", ["/html/body/div", "DIV", 100, 120]], ["e", 250, 0, [1, 2, 300, 40]]]
+#
 
 
 @sock.route("/ws")
 @no_type_check
-def ws(ws) -> NoReturn:
-    current_session: Session = None
-    interaction_buffer: list[Interaction] = []
+def ws(ws) -> None:
+    connection = open_connection(ws.send, ws.subprotocol)
 
-    ws.send(dumps({"type": "connected", "message": "Hello, World!"}))
-    while True:
-        message = ws.receive()
-
-        if not is_valid_message(message):
-            ws.send(dumps({"type": "error", "message": "Invalid message format"}))
-            print(f"Invalid message received: {message}")
-            continue
-
-        message = loads(message)
-        message_type: dict = message["type"]
-        message_data: dict = message["message"]
-
-        match message_type:
-            case "event_logged":
-                if current_session is None:
-                    print("No session started, event message ignored.")
-                    ws.send(dumps({"type": "error", "message": "No session started"}))
-                    continue
-                if "event" not in message_data or "details" not in message_data:
-                    print("Error: 'event' or 'details' not found in message_data")
-                    continue
-                add_interaction(message_data, current_session.id, interaction_buffer)
-                print(f"Event message received: {message['message']}")
-
-            case "tab_event":
-                if current_session is None:
-                    print("No session started, tab event message ignored.")
-                    ws.send(dumps({"type": "error", "message": "No session started"}))
-                    continue
-                add_interaction(message_data, current_session.id, interaction_buffer)
-                process_tab_event(message_data, current_session.id)
-                print(f"Tab event message received: {message['message']}")
-
-            case "window_data":
-                if current_session is None:
-                    print("No session started, window data message ignored.")
-                    continue
-
-                current_session.window_width = message_data.get("width", 480)
-                current_session.window_height = message_data.get("height", 360)
-                db.session.commit()
-
-                print(f"Window data message received: {message['message']}")
-
-            case "update_blacklist":
-                print(f"Blaclist update message received: {message["message"]}")
-
-            case "session_state_changed":
-                if message_data["action"] == "start":
-                    current_session = Session(
-                        id=message_data["sessionId"],
-                        start_time=parse_date(message_data["timestamp"]),
-                        end_time=None,
-                        window_width=None,
-                        window_height=None,
-                    )
-                    db.session.add(current_session)
-                    db.session.commit()
-
-                    print(f"Session started: {message['message']}")
-                elif message_data["action"] == "end":
-                    if (
-                        current_session is not None
-                    ):  # Asegúrate de que current_session no sea None
-                        current_session.end_time = parse_date(message_data["timestamp"])
-                        db.session.add_all(interaction_buffer)
-                        db.session.commit()
-                        interaction_buffer.clear()
-                        current_session = None
-                        print(f"Session ended: {message['message']}")
-                    else:
-                        print("No active session to end.")
-                else:
-                    print(
-                        f"Unknown session action received: '{message_data['action']}'"
-                    )
-            case _:
-                print(f"Unknown message type received: '{message['type']}'")
+    start_background_jobs()
 
-        sleep(1e-3)
+    ws.send(dumps({"type": "connected", "message": "Hello, World!"}))
+    try:
+        while True:
+            # Se espera como mucho hasta que venza la antigüedad máxima del
+            # búfer, de forma que una sesión inactiva no retenga interacciones.
+            frame = ws.receive(timeout=connection.time_until_flush())
+
+            if frame is None:
+                connection.flush_if_due()
+                continue
+
+            if not connection.handle_frame(frame):
+                break
+    finally:
+        # Se garantiza que las interacciones pendientes se escriben aunque la
+        # conexión se cierre o se produzca un error durante su procesamiento.
+        connection.close()
@@ -0,0 +1,297 @@
+"""
+Servidor de ingesta asíncrono.
+
+Atiende el WebSocket de grabación (`/ws`) sobre `asyncio` y `wsproto`, de forma
+que todas las conexiones abiertas comparten un único hilo en lugar de ocupar un
+hilo bloqueado cada una, como ocurre con `flask_sock`. El procesamiento de los
+mensajes es el mismo que el de la ruta `/ws` de Flask (`RecordingConnection`) y
+las escrituras en la base de datos se delegan en la etapa de ingesta
+(`IngestionWriter`), por lo que el bucle de eventos nunca accede a la base de
+datos.
+
+Las rutas HTML se siguen sirviendo con Flask, bien en otro proceso o en este
+mismo mediante `--http-port`, lo que permite compartir la base de datos en
+memoria:
+
+    python -m webchronicle.async_server --port 5001 --http-port 5000
+"""
+
+import argparse
+import asyncio
+import logging
+import threading
+from asyncio import StreamReader, StreamWriter
+from collections import deque
+from typing import Any
+from urllib.parse import urlsplit
+
+from werkzeug.serving import make_server
+from wsproto import ConnectionType, WSConnection
+from wsproto.connection import ConnectionState
+from wsproto.events import (
+    AcceptConnection,
+    BytesMessage,
+    CloseConnection,
+    Ping,
+    RejectConnection,
+    Request,
+    TextMessage,
+)
+from wsproto.extensions import PerMessageDeflate
+from wsproto.utilities import RemoteProtocolError
+
+from webchronicle.app import (
+    app,
+    flush_policy,
+    flush_stats,
+    retention_job,
+    start_background_jobs,
+    writer,
+)
+from webchronicle.connection import RecordingConnection
+from webchronicle.ingestion import WriteOperation
+from webchronicle.protocol import SUBPROTOCOLS
+
+logger = logging.getLogger(__name__)
+
+WS_PATH = "/ws"
+READ_SIZE = 64 * 1024
+
+
+class AsyncRecordingConnection(RecordingConnection):
+    """
+    Conexión de grabación que nunca bloquea el bucle de eventos.
+
+    Si la cola de la etapa de ingesta está llena, las operaciones se retienen en
+    la propia conexión, en orden, y se deja de leer del socket hasta que
+    `drain_pending` consigue encolarlas. Así la contrapresión llega al cliente
+    tanto por el aviso `backpressure` como por el control de flujo de TCP.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.pending: deque[WriteOperation] = deque()
+
+    def enqueue(self, operation: WriteOperation, notify: bool = True) -> None:
+        if not self.pending and self.writer.submit(operation, block=False):
+            return
+
+        if not self.pending and notify:
+            self.notify_backpressure()
+        self.pending.append(operation)
+
+    async def drain_pending(self) -> None:
+        """
+        Encola en la etapa de ingesta las operaciones retenidas, esperando de
+        forma asíncrona a que haya hueco en la cola.
+        """
+        while self.pending:
+            if self.writer.submit(self.pending[0], block=False):
+                self.pending.popleft()
+            else:
+                await asyncio.sleep(self.writer.poll_interval)
+
+
+def open_async_connection(
+    stream: StreamWriter, protocol: WSConnection, subprotocol: str | None
+) -> AsyncRecordingConnection:
+    """
+    Crea el estado de una nueva conexión de grabación con la configuración de
+    la aplicación.
+
+    Parámetros:
+    ------------
+    stream: StreamWriter
+        Flujo de escritura del socket.
+    protocol: WSConnection
+        Máquina de estados del WebSocket.
+    subprotocol: str | None
+        Subprotocolo negociado al abrir el WebSocket.
+    """
+
+    def send(text: str) -> None:
+        stream.write(protocol.send(TextMessage(data=text)))
+
+    return AsyncRecordingConnection(
+        send,
+        writer,
+        flush_policy(),
+        flush_stats,
+        backpressure_retry_ms=app.config["INGESTION_BACKPRESSURE_RETRY_MS"],
+        subprotocol=subprotocol,
+    )
+
+
+async def handle_client(
+    reader: StreamReader, stream: StreamWriter, initial_data: bytes = b""
+) -> None:
+    """
+    Atiende una conexión TCP: realiza el handshake del WebSocket y procesa las
+    tramas recibidas hasta que el cliente cierra la conexión.
+
+    Parámetros:
+    ------------
+    reader: StreamReader
+        Lector del socket.
+    stream: StreamWriter
+        Escritor del socket.
+    initial_data: bytes
+        Datos ya leídos del socket por otro proceso, como la petición del
+        handshake que lee el enrutador de `webchronicle.cluster`.
+    """
+    protocol = WSConnection(ConnectionType.SERVER)
+    connection: AsyncRecordingConnection | None = None
+    parts: list[Any] = []
+    closed = False
+
+    try:
+        while not closed:
+            if initial_data:
+                data, initial_data = initial_data, b""
+            else:
+                # Igual que en la ruta de Flask, se espera como mucho hasta que
+                # venza la antigüedad máxima del búfer de interacciones.
+                timeout = connection.time_until_flush() if connection else None
+                try:
+                    async with asyncio.timeout(timeout):
+                        data = await reader.read(READ_SIZE)
+                except TimeoutError:
+                    if connection is not None:
+                        connection.flush_if_due()
+                        await connection.drain_pending()
+                    continue
+
+            try:
+                protocol.receive_data(data or None)
+            except RemoteProtocolError as error:
+                logger.warning("Invalid WebSocket data received: %s", error)
+                break
+
+            for event in protocol.events():
+                match event:
+                    case Request():
+                        # La consulta puede llevar la sesión con la que el
+                        # enrutador elige el proceso (ver `webchronicle.cluster`)
+                        if urlsplit(event.target).path != WS_PATH:
+                            stream.write(
+                                protocol.send(RejectConnection(status_code=404))
+                            )
+                            closed = True
+                            break
+
+                        subprotocol = next(
+                            (
+                                name
+                                for name in event.subprotocols
+                                if name in SUBPROTOCOLS
+                            ),
+                            None,
+                        )
+                        stream.write(
+                            protocol.send(
+                                AcceptConnection(
+                                    subprotocol=subprotocol,
+                                    extensions=[PerMessageDeflate()],
+                                )
+                            )
+                        )
+                        connection = open_async_connection(
+                            stream, protocol, subprotocol
+                        )
+                        # El saludo se envía una vez entregada la respuesta del
+                        # handshake, ya que algunos clientes descartan los datos
+                        # que llegan en la misma lectura que esta.
+                        await stream.drain()
+                        connection.send_message("connected", "Hello, World!")
+
+                    case TextMessage() | BytesMessage() if connection is not None:
+                        parts.append(event.data)
+                        if not event.message_finished:
+                            continue
+
+                        frame: str | bytes = (
+                            "".join(parts)
+                            if isinstance(event, TextMessage)
+                            else b"".join(parts)
+                        )
+                        parts = []
+                        if not connection.handle_frame(frame):
+                            stream.write(protocol.send(CloseConnection(code=1008)))
+                            closed = True
+                            break
+
+                    case Ping():
+                        stream.write(protocol.send(event.response()))
+
+                    case CloseConnection():
+                        if protocol.state is ConnectionState.REMOTE_CLOSING:
+                            stream.write(protocol.send(event.response()))
+                        closed = True
+
+            if not data:
+                closed = True
+
+            await stream.drain()
+            if connection is not None:
+                await connection.drain_pending()
+    except ConnectionError:
+        pass
+    finally:
+        # Se garantiza que las interacciones pendientes se escriben aunque la
+        # conexión se cierre o se produzca un error durante su procesamiento.
+        if connection is not None:
+            connection.close()
+            await connection.drain_pending()
+        stream.close()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 5001) -> asyncio.Server:
+    """
+    Arranca el servidor de ingesta, la etapa de escritura y la tarea de
+    retención.
+
+    Parámetros:
+    ------------
+    host: str
+        Dirección en la que escuchar.
+    port: int
+        Puerto en el que escuchar (0 para elegir uno libre).
+
+    Returns:
+    ---------
+    asyncio.Server
+        Servidor ya a la escucha.
+    """
+    start_background_jobs()
+    return await asyncio.start_server(handle_client, host, port, limit=READ_SIZE)
+
+
+async def main(host: str, port: int, http_port: int | None) -> None:
+    if http_port is not None:
+        http_server = make_server(host, http_port, app, threaded=True)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        print(f"HTTP routes served on http://{host}:{http_port}")
+
+    server = await serve(host, port)
+    print(f"Ingestion WebSocket served on ws://{host}:{port}{WS_PATH}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de ingesta asíncrono")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument(
+        "--http-port",
+        type=int,
+        default=None,
+        help="Si se indica, sirve también las rutas HTML de Flask en este puerto",
+    )
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.host, args.port, args.http_port))
+    except KeyboardInterrupt:
+        retention_job.stop()
+        writer.stop()
@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from hashlib import sha256
+from threading import Lock
+from typing import Any, Callable, NamedTuple
+
+from flask import Response, make_response, request
+from sqlalchemy import select
+from werkzeug.http import is_resource_modified
+
+from database.base import db
+from database.models import Session, SessionStats
+
+
+class SessionVersion(NamedTuple):
+    """
+    Versión de los datos de una sesión, de la que se derivan las cabeceras de
+    validación de las respuestas.
+
+    Atributos:
+    ------------
+    etag: str
+        Etiqueta que cambia con el final de la sesión y con sus interacciones.
+    last_modified: datetime | None
+        Si la sesión ha terminado, el último de su final, su última
+        interacción y su último cambio posterior (por ejemplo, al recortarla
+        la retención). Las sesiones en grabación solo se validan por su
+        etiqueta, ya que pueden cambiar varias veces en un mismo segundo.
+    ended: bool
+        Si la sesión ha terminado, en cuyo caso ya no cambia.
+    """
+
+    etag: str
+    last_modified: datetime | None
+    ended: bool
+
+
+class CachedResponse(NamedTuple):
+    """
+    Respuesta guardada en la caché.
+
+    Atributos:
+    ------------
+    etag: str
+        Versión de la sesión con la que se generó.
+    body: bytes
+        Cuerpo de la respuesta.
+    content_type: str
+        Tipo de contenido de la respuesta.
+    """
+
+    etag: str
+    body: bytes
+    content_type: str
+
+
+def session_version(session_id: str) -> SessionVersion | None:
+    """
+    Obtiene la versión de una sesión a partir de su final, de su último cambio
+    y de los totales de sus interacciones (ver `database.aggregates`), con una
+    sola consulta que no recorre las interacciones.
+
+    Returns:
+    ---------
+    SessionVersion | None
+        Versión de la sesión, o `None` si no existe.
+    """
+    row = db.session.execute(
+        select(
+            Session.end_time,
+            Session.modified_time,
+            SessionStats.event_count,
+            SessionStats.last_event,
+        )
+        .outerjoin(SessionStats, SessionStats.session_id == Session.id)
+        .where(Session.id == session_id)
+    ).first()
+    if row is None:
+        return None
+
+    end_time, modified_time, event_count, last_event = row
+    fingerprint = (
+        f"{session_id}\0{end_time}\0{modified_time}\0{event_count or 0}\0{last_event}"
+    )
+    last_modified = None
+    if end_time is not None:
+        # Las fechas se guardan en UTC sin zona horaria
+        last_modified = max(
+            moment for moment in (end_time, modified_time, last_event) if moment
+        ).replace(tzinfo=timezone.utc)
+    return SessionVersion(
+        sha256(fingerprint.encode()).hexdigest()[:32],
+        last_modified,
+        end_time is not None,
+    )
+
+
+class ResponseCache:
+    """
+    Caché LRU en memoria de las respuestas de las sesiones terminadas,
+    limitada por el tamaño total de los cuerpos guardados.
+
+    Las entradas se indexan por la ruta completa de la petición y guardan la
+    versión de la sesión con la que se generaron, por lo que si la sesión
+    cambia (por ejemplo, al borrar sus interacciones) la entrada deja de
+    usarse y acaba descartándose.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Parámetros:
+        ------------
+        max_bytes: int
+            Tamaño máximo de la suma de los cuerpos guardados. Las respuestas
+            mayores no se guardan.
+        """
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, etag: str) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.etag != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Devuelve las estadísticas de uso de la caché.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+            }
+
+    def session_response(self, view: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        Decorador de las vistas de una sesión (con el argumento `session_id`)
+        que añade las cabeceras `ETag` y `Last-Modified`, responde 304 si el
+        cliente ya tiene la versión actual sin ejecutar la vista y, si la sesión
+        ha terminado, sirve las respuestas repetidas desde la caché.
+        """
+
+        @wraps(view)
+        def wrapper(session_id: str, **kwargs: Any) -> Any:
+            version = session_version(session_id)
+            if version is None:
+                return view(session_id=session_id, **kwargs)
+
+            if not is_resource_modified(
+                request.environ, etag=version.etag, last_modified=version.last_modified
+            ):
+                with self._lock:
+                    self.not_modified += 1
+                response = Response(status=304)
+            else:
+                key = request.full_path
+                entry = self.get(key, version.etag) if version.ended else None
+                if entry is not None:
+                    response = Response(entry.body, content_type=entry.content_type)
+                else:
+                    response = make_response(view(session_id=session_id, **kwargs))
+                    if (
+                        version.ended
+                        and response.status_code == 200
+                        and not response.is_streamed
+                    ):
+                        self.put(
+                            key,
+                            CachedResponse(
+                                version.etag, response.get_data(), response.content_type
+                            ),
+                        )
+
+            if response.status_code in (200, 304):
+                response.set_etag(version.etag)
+                if version.last_modified is not None:
+                    response.last_modified = version.last_modified
+                # El navegador debe revalidar, lo que cuesta una respuesta 304
+                response.cache_control.no_cache = True
+            return response
+
+        return wrapper
@@ -0,0 +1,310 @@
+"""
+Despliegue multiproceso de la ingesta.
+
+Un único proceso de Python no puede usar más de un núcleo para decodificar los
+mensajes del WebSocket, por lo que este módulo reparte las conexiones entre
+varios procesos:
+
+- El proceso principal escucha en `--port`, lee la petición del handshake de
+  cada conexión y pasa el socket (`SCM_RIGHTS`) a uno de los workers, sin
+  intervenir más en la conexión. Si la petición indica la sesión del cliente
+  (`/ws?session=<id>`) el worker se elige a partir de ella, de forma que las
+  reconexiones de una misma sesión llegan siempre al mismo proceso; si no, por
+  turnos. Con `--http-port` sirve además las rutas HTML de Flask.
+- Cada worker atiende sus conexiones igual que `webchronicle.async_server` y
+  envía los lotes de operaciones de escritura al proceso escritor.
+- El proceso escritor es el único que escribe en la base de datos, por lo que
+  los workers no compiten por su bloqueo de escritura. Recibe las operaciones
+  de cada worker por su propia tubería, en orden, y las aplica en lotes con
+  la etapa de ingesta habitual. Si no da abasto, su cola se llena y la
+  contrapresión llega a los workers y de ellos a los clientes.
+
+Si un cliente se reconecta a otro worker (por ejemplo, tras reiniciarse el
+servicio), retoma su sesión con el mensaje `session_state_changed` de acción
+"resume", que admite cualquier worker.
+
+Las métricas (`/metrics`) y las estadísticas de la ingesta (`/stats/ingestion`)
+se guardan en la memoria de cada proceso y no se agregan entre ellos. Las
+rutas HTTP de `--http-port` las sirve el proceso principal, que no decodifica
+mensajes ni escribe en la base de datos, por lo que en este despliegue no
+reflejan la ingesta de los workers ni del escritor.
+
+Las bases de datos en memoria no se comparten entre procesos, por lo que se
+necesita un fichero SQLite u otro servidor de base de datos:
+
+    python -m webchronicle.cluster --workers 4 --port 5001 --http-port 5000
+"""
+
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import signal
+import socket
+import sys
+import threading
+from multiprocessing.connection import Connection, wait
+from typing import cast
+from urllib.parse import parse_qs, urlsplit
+from zlib import crc32
+
+from werkzeug.serving import make_server
+
+from database.base import is_memory_database
+from webchronicle.app import app, retention_job, start_background_jobs, writer
+from webchronicle.async_server import READ_SIZE, handle_client
+from webchronicle.ingestion import WriteOperation
+
+# Tamaño máximo de la petición del handshake
+MAX_REQUEST_SIZE = 16 * 1024
+
+
+def worker_for(target: str, workers: int) -> int | None:
+    """
+    Worker que debe atender la conexión de la sesión indicada en la petición.
+
+    Parámetros:
+    ------------
+    target: str
+        Ruta de la petición del handshake, con su consulta.
+    workers: int
+        Número de workers.
+
+    Returns:
+    ---------
+    int | None
+        Índice del worker, o `None` si la petición no indica la sesión.
+    """
+    sessions = parse_qs(urlsplit(target).query).get("session")
+    if not sessions:
+        return None
+    return crc32(sessions[0].encode()) % workers
+
+
+class Router:
+    """
+    Reparte las conexiones aceptadas entre los workers, pasándoles el socket y
+    la petición del handshake ya leída.
+    """
+
+    def __init__(self, channels: list[socket.socket]) -> None:
+        """
+        Parámetros:
+        ------------
+        channels: list[socket.socket]
+            Socket Unix (`SOCK_SEQPACKET`) de cada worker.
+        """
+        self.channels = channels
+        self._turns = itertools.cycle(range(len(channels)))
+
+    async def handle(
+        self, reader: asyncio.StreamReader, stream: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            ConnectionError,
+        ):
+            stream.close()
+            return
+
+        # Línea de la petición: "GET /ws?session=... HTTP/1.1"
+        request_line = request.split(b"\r\n", 1)[0].decode("latin-1").split(" ")
+        target = request_line[1] if len(request_line) == 3 else "/"
+        index = worker_for(target, len(self.channels))
+        if index is None:
+            index = next(self._turns)
+
+        # El worker recibe un duplicado del descriptor, por lo que cerrar aquí
+        # el socket no cierra la conexión. El envío bloquea si el canal del
+        # worker está lleno, por lo que se hace fuera del bucle de eventos para
+        # no detener el reparto de las demás conexiones.
+        client = stream.get_extra_info("socket")
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                socket.send_fds,
+                self.channels[index],
+                [request],
+                [client.fileno()],
+            )
+        finally:
+            stream.close()
+
+
+class OperationForwarder:
+    """
+    Función de escritura de la etapa de ingesta de los workers: en lugar de
+    aplicar los lotes, los envía al proceso escritor.
+    """
+
+    def __init__(self, pipe: Connection) -> None:
+        self.pipe = pipe
+        self._lock = threading.Lock()
+
+    def __call__(self, batch: list[WriteOperation]) -> None:
+        with self._lock:
+            self.pipe.send(batch)
+
+
+async def serve_channel(channel: socket.socket) -> None:
+    """
+    Atiende las conexiones que el enrutador pasa al worker hasta que cierra
+    su canal, y entonces cierra las que sigan abiertas.
+    """
+    loop = asyncio.get_running_loop()
+    closed = loop.create_future()
+    clients: set[asyncio.Task] = set()
+
+    async def adopt(fd: int, request: bytes) -> None:
+        reader, stream = await asyncio.open_connection(
+            sock=socket.socket(fileno=fd), limit=READ_SIZE
+        )
+        await handle_client(reader, stream, request)
+
+    def receive() -> None:
+        try:
+            request, fds, _, _ = socket.recv_fds(channel, MAX_REQUEST_SIZE, 1)
+        except BlockingIOError:
+            return
+        if not request and not fds:
+            loop.remove_reader(channel.fileno())
+            closed.set_result(None)
+            return
+        for fd in fds:
+            task = loop.create_task(adopt(fd, request))
+            clients.add(task)
+            task.add_done_callback(clients.discard)
+
+    channel.setblocking(False)
+    loop.add_reader(channel.fileno(), receive)
+    await closed
+
+    # Al cancelarse, cada conexión vuelca sus interacciones pendientes
+    for task in list(clients):
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+
+
+def run_worker(channel: socket.socket, pipe: Connection) -> None:
+    """
+    Proceso worker: atiende las conexiones recibidas por `channel` y envía las
+    escrituras al proceso escritor por `pipe`.
+    """
+    # El proceso principal coordina la parada
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    writer.apply = OperationForwarder(pipe)
+    writer.start()
+    try:
+        asyncio.run(serve_channel(channel))
+    finally:
+        writer.stop()
+        pipe.close()
+
+
+def run_writer(pipes: list[Connection]) -> None:
+    """
+    Proceso escritor: aplica las operaciones recibidas de todos los workers
+    hasta que estos terminan, y la política de retención.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    start_background_jobs()
+    pending = list(pipes)
+    while pending:
+        # `wait` devuelve los objetos recibidos, aquí siempre extremos de pipe
+        for pipe in cast(list[Connection], wait(pending)):
+            try:
+                batch = pipe.recv()
+            except EOFError:
+                pending.remove(pipe)
+                continue
+            for operation in batch:
+                # Espera si la cola está llena, lo que frena al worker
+                writer.submit(operation)
+    retention_job.stop()
+    writer.stop()
+
+
+async def route(host: str, port: int, channels: list[socket.socket]) -> None:
+    router = Router(channels)
+    server = await asyncio.start_server(
+        router.handle, host, port, limit=MAX_REQUEST_SIZE
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+
+    print(
+        f"Ingestion WebSocket served on ws://{host}:{port}/ws ({len(channels)} workers)"
+    )
+    async with server:
+        await stop.wait()
+
+
+def main(host: str, port: int, http_port: int | None, workers: int) -> None:
+    if is_memory_database(app.config["SQLALCHEMY_DATABASE_URI"]):
+        sys.exit("A file or server database is required to run several processes")
+
+    # Los procesos hijos se crean desde cero, sin heredar los hilos ni las
+    # conexiones a la base de datos de este proceso
+    context = multiprocessing.get_context("spawn")
+    channels, pipes, processes = [], [], []
+    for _ in range(workers):
+        router_end, worker_end = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_SEQPACKET
+        )
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=run_worker, args=(worker_end, sender))
+        processes.append((process, worker_end, sender))
+        channels.append(router_end)
+        pipes.append(receiver)
+    writer_process = context.Process(target=run_writer, args=(pipes,))
+
+    writer_process.start()
+    for process, worker_end, sender in processes:
+        process.start()
+        # Los extremos de cada worker solo deben quedar abiertos en él, para
+        # que el escritor detecte su final
+        worker_end.close()
+        sender.close()
+
+    if http_port is not None:
+        http_server = make_server(host, http_port, app, threaded=True)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        print(f"HTTP routes served on http://{host}:{http_port}")
+
+    try:
+        asyncio.run(route(host, port, channels))
+    finally:
+        # Al cerrar los canales los workers cierran sus conexiones, vuelcan sus
+        # escrituras y terminan, tras lo que termina el escritor
+        for channel in channels:
+            channel.close()
+        for process, _, _ in processes:
+            process.join()
+        writer_process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Multi-process WebChronicle ingestion server"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument(
+        "--http-port",
+        type=int,
+        default=None,
+        help="Serve the Flask routes on this port too",
+    )
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+    main(args.host, args.port, args.http_port, args.workers)
@@ -0,0 +1,401 @@
+import logging
+from json import dumps
+from typing import Any, Callable
+
+from database.models import InteractionRow
+from database.timestamps import parse_timestamp
+from webchronicle.ingestion import (
+    FlushPolicy,
+    FlushStats,
+    IngestionWriter,
+    InteractionBuffer,
+    WriteOperation,
+)
+from webchronicle.logs import SampledLogger
+from webchronicle.metrics import (
+    ACTIVE_SESSIONS,
+    FLUSH_EVENTS,
+    INVALID_MESSAGES,
+    MESSAGES_RECEIVED,
+    OPEN_SOCKETS,
+)
+from webchronicle.protocol import (
+    BATCHABLE_TYPES,
+    COMPACT_SUBPROTOCOL,
+    MESSAGE_SCHEMAS,
+    CompactDecoder,
+    DecodeError,
+    Message,
+    decode_message,
+    validate_message,
+)
+
+logger = logging.getLogger(__name__)
+
+# Registro de los mensajes recibidos, del que solo se emite una muestra para
+# no penalizar la ingesta (ver `LOG_SAMPLE_EVERY` en la configuración).
+message_log = SampledLogger(logger, every=100)
+
+
+def message_type_label(message_type: str) -> str:
+    """
+    Etiqueta de métricas de un tipo de mensaje. Los tipos sin esquema los
+    elige el cliente, por lo que se agrupan en "unknown" para no crear una
+    serie por cada valor recibido.
+    """
+    return message_type if message_type in MESSAGE_SCHEMAS else "unknown"
+
+
+def add_interaction(
+    message_data: dict,
+    session_id: str,
+    interaction_buffer: InteractionBuffer,
+    size: int = 0,
+) -> None:
+    if "details" not in message_data:
+        return
+
+    # El esquema de los mensajes de eventos exige la marca de tiempo, que es
+    # obligatoria en la tabla de interacciones
+    interaction_buffer.append(
+        InteractionRow(
+            type=message_data["event"],
+            time=parse_timestamp(message_data["timestamp"]),
+            details=message_data["details"],
+            session_id=session_id,
+        ),
+        size,
+    )
+
+
+class RecordingConnection:
+    """
+    Estado y lógica de una conexión de grabación, independiente del transporte
+    del WebSocket: decodifica las tramas recibidas, mantiene la sesión activa y
+    el búfer de interacciones, y encola las escrituras en la etapa de ingesta.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Any],
+        writer: IngestionWriter,
+        flush_policy: FlushPolicy,
+        flush_stats: FlushStats,
+        backpressure_retry_ms: int = 250,
+        subprotocol: str | None = None,
+    ) -> None:
+        """
+        Parámetros:
+        ------------
+        send: Callable[[str], Any]
+            Función que envía una trama de texto al cliente.
+        writer: IngestionWriter
+            Etapa de ingesta en la que se encolan las escrituras.
+        flush_policy: FlushPolicy
+            Umbrales de volcado del búfer de interacciones.
+        flush_stats: FlushStats
+            Estadísticas compartidas de los volcados.
+        backpressure_retry_ms: int
+            Tiempo que se pide al cliente que espere cuando la cola está llena.
+        subprotocol: str | None
+            Subprotocolo negociado al abrir el WebSocket.
+        """
+        self.send = send
+        self.writer = writer
+        self.flush_stats = flush_stats
+        self.backpressure_retry_ms = backpressure_retry_ms
+        self.session_id: str | None = None
+        self.interaction_buffer = InteractionBuffer(flush_policy)
+        self.compact_decoder = (
+            CompactDecoder() if subprotocol == COMPACT_SUBPROTOCOL else None
+        )
+        OPEN_SOCKETS.inc()
+
+    def send_message(self, message_type: str, message: Any) -> None:
+        self.send(dumps({"type": message_type, "message": message}))
+
+    def time_until_flush(self) -> float | None:
+        """
+        Tiempo máximo, en segundos, que puede esperarse a la siguiente trama
+        antes de volcar el búfer por antigüedad.
+        """
+        return self.interaction_buffer.time_until_flush()
+
+    def enqueue(self, operation: WriteOperation, notify: bool = True) -> None:
+        """
+        Encola una operación de escritura. Si la cola está llena se avisa al
+        cliente para que reduzca el ritmo de envío y se espera a que haya hueco,
+        de forma que nunca se descartan datos.
+
+        Parámetros:
+        ------------
+        operation: WriteOperation
+            Operación a encolar.
+        notify: bool
+            Si es falso (por ejemplo, porque la conexión ya se ha cerrado) no
+            se avisa al cliente y simplemente se espera.
+        """
+        if self.writer.submit(operation, block=False):
+            return
+
+        if notify:
+            self.notify_backpressure()
+        self.writer.submit(operation)
+
+    def notify_backpressure(self) -> None:
+        """
+        Avisa al cliente de que la cola de escritura está llena y de cuánto
+        tiempo debe esperar antes de seguir enviando.
+        """
+        self.send_message(
+            "backpressure",
+            {
+                "queueDepth": self.writer.queue_depth,
+                "retryAfter": self.backpressure_retry_ms,
+            },
+        )
+
+    def flush(
+        self, reason: str, tab_events: list[dict] | None = None, notify: bool = True
+    ) -> None:
+        """
+        Vuelca las interacciones del búfer a la etapa de ingesta, registrando el
+        tamaño del volcado y el tiempo que han esperado en el búfer. Si se
+        indican eventos de pestañas, se escriben en la misma transacción que
+        las interacciones.
+        """
+        buffer = self.interaction_buffer
+        if self.session_id is None or (not len(buffer) and not tab_events):
+            return
+
+        events, size, latency = len(buffer), buffer.size, buffer.age()
+        rows = buffer.take()
+        if tab_events:
+            operation = WriteOperation("batch", self.session_id, (rows, tab_events))
+        else:
+            operation = WriteOperation("interactions", self.session_id, rows)
+
+        self.enqueue(operation, notify)
+        self.flush_stats.record(reason, events, size, latency)
+        FLUSH_EVENTS.observe(events)
+
+    def flush_if_due(self) -> None:
+        """
+        Vuelca el búfer si se ha alcanzado alguno de los umbrales de volcado.
+        """
+        reason = self.interaction_buffer.flush_reason()
+        if reason is not None:
+            self.flush(reason)
+
+    def close(self) -> None:
+        """
+        Vuelca las interacciones pendientes al cerrarse la conexión, tanto de
+        forma ordenada como por un error.
+        """
+        self.flush("close", notify=False)
+        if self.session_id is not None:
+            ACTIVE_SESSIONS.dec()
+        OPEN_SOCKETS.dec()
+
+    def handle_frame(self, frame: str | bytes) -> bool:
+        """
+        Decodifica y procesa una trama recibida.
+
+        Returns:
+        ---------
+        bool
+            Falso si la conexión debe cerrarse porque el cliente ha roto el
+            protocolo de forma irrecuperable.
+        """
+        if self.compact_decoder is None:
+            message = decode_message(frame)
+            if isinstance(message, DecodeError):
+                self.send_message("error", "Invalid message format")
+                INVALID_MESSAGES.inc()
+                logger.warning("Invalid message received: %s", message.reason)
+            else:
+                self.handle_message(message)
+            return True
+
+        messages = self.compact_decoder.decode(frame)
+        if isinstance(messages, DecodeError):
+            # La tabla de cadenas ya no coincide con la del cliente, por lo que
+            # se cierra la conexión para que vuelva a conectarse desde cero.
+            self.send_message("error", "Invalid message format")
+            INVALID_MESSAGES.inc()
+            logger.warning("Invalid compact frame received: %s", messages.reason)
+            return False
+
+        events: list[Message] = []
+        for message in messages:
+            if message.type in BATCHABLE_TYPES:
+                events.append(message)
+                continue
+            if events:
+                self.process_events(events)
+                events = []
+            self.handle_message(message)
+        if events:
+            self.process_events(events)
+        return True
+
+    def process_events(self, messages: list[Message]) -> None:
+        """
+        Procesa en una sola pasada varios mensajes de eventos y pestañas y los
+        vuelca en una única operación de escritura junto con las interacciones
+        pendientes de la conexión.
+        """
+        for message in messages:
+            MESSAGES_RECEIVED.inc(message.type)
+
+        if self.session_id is None:
+            logger.warning("No session started, batched messages ignored.")
+            self.send_message("error", "No session started")
+            return
+
+        tab_events: list[dict] = []
+        for message in messages:
+            add_interaction(
+                message.data, self.session_id, self.interaction_buffer, message.size
+            )
+            if message.type == "tab_event":
+                tab_events.append(message.data)
+
+        self.flush("batch", tab_events)
+
+    def process_batch(self, entries: list, size: int = 0) -> None:
+        """
+        Procesa un mensaje "batch", cuyos mensajes agrupados tienen el formato
+        base `{type, message}`. Cada uno se valida por separado, incluida su
+        marca de tiempo: los inválidos se cuentan y se notifican al cliente, y
+        el resto se procesan igualmente.
+
+        Parámetros:
+        ------------
+        entries: list
+            Mensajes agrupados.
+        size: int
+            Tamaño de la trama recibida.
+        """
+        message_size = size // max(len(entries), 1)
+        messages: list[Message] = []
+        invalid = 0
+
+        for entry in entries:
+            message = (
+                validate_message(entry.get("type"), entry.get("message"), message_size)
+                if isinstance(entry, dict)
+                else DecodeError("Batched message must be an object")
+            )
+            if isinstance(message, DecodeError) or message.type not in BATCHABLE_TYPES:
+                invalid += 1
+                continue
+            messages.append(message)
+
+        self.process_events(messages)
+
+        if invalid:
+            self.send_message("error", f"Invalid messages in batch: {invalid}")
+            INVALID_MESSAGES.inc(amount=invalid)
+            logger.warning("Invalid messages in batch: %d of %d", invalid, len(entries))
+
+    def handle_message(self, message: Message) -> None:
+        """
+        Procesa un mensaje individual según su tipo.
+        """
+        message_type, message_data, message_size = message
+        MESSAGES_RECEIVED.inc(message_type_label(message_type))
+
+        match message_type:
+            case "event_logged":
+                if self.session_id is None:
+                    logger.warning("No session started, event message ignored.")
+                    self.send_message("error", "No session started")
+                    return
+                add_interaction(
+                    message_data, self.session_id, self.interaction_buffer, message_size
+                )
+                message_log.debug("Event message received: %s", message_data)
+
+            case "tab_event":
+                if self.session_id is None:
+                    logger.warning("No session started, tab event message ignored.")
+                    self.send_message("error", "No session started")
+                    return
+                add_interaction(
+                    message_data, self.session_id, self.interaction_buffer, message_size
+                )
+                self.enqueue(WriteOperation("tab_event", self.session_id, message_data))
+                message_log.debug("Tab event message received: %s", message_data)
+
+            case "batch":
+                self.process_batch(message_data["messages"], message_size)
+                message_log.debug(
+                    "Batch message received: %d messages", len(message_data["messages"])
+                )
+
+            case "window_data":
+                if self.session_id is None:
+                    logger.warning("No session started, window data message ignored.")
+                    return
+
+                self.enqueue(
+                    WriteOperation(
+                        "window_data",
+                        self.session_id,
+                        (
+                            message_data.get("width", 480),
+                            message_data.get("height", 360),
+                        ),
+                    )
+                )
+                logger.debug("Window data message received: %s", message_data)
+
+            case "update_blacklist":
+                logger.debug("Blacklist update message received: %s", message_data)
+
+            case "session_state_changed":
+                # "resume" retoma en una nueva conexión, que puede atender otro
+                # proceso, la sesión en curso del cliente tras reconectarse
+                if message_data["action"] in ("start", "resume"):
+                    self.flush("session_start")
+                    if self.session_id is None:
+                        ACTIVE_SESSIONS.inc()
+                    session_id: str = message_data["sessionId"]
+                    self.session_id = session_id
+                    self.enqueue(
+                        WriteOperation(
+                            f"session_{message_data['action']}",
+                            session_id,
+                            parse_timestamp(message_data["timestamp"]),
+                        )
+                    )
+                    logger.info(
+                        "Session %s: %s",
+                        "started" if message_data["action"] == "start" else "resumed",
+                        session_id,
+                    )
+                elif message_data["action"] == "end":
+                    if self.session_id is not None:
+                        self.flush("session_end")
+                        self.enqueue(
+                            WriteOperation(
+                                "session_end",
+                                self.session_id,
+                                parse_timestamp(message_data["timestamp"]),
+                            )
+                        )
+                        logger.info("Session ended: %s", self.session_id)
+                        self.session_id = None
+                        ACTIVE_SESSIONS.dec()
+                    else:
+                        logger.warning("No active session to end.")
+                else:
+                    logger.warning(
+                        "Unknown session action received: '%s'", message_data["action"]
+                    )
+
+            case _:
+                logger.warning("Unknown message type received: '%s'", message_type)
+
+        self.flush_if_due()
@@ -0,0 +1,238 @@
+from datetime import datetime
+from itertools import islice
+from typing import Any, Iterator, NamedTuple
+
+from sqlalchemy import Row, Select, tuple_
+from werkzeug.datastructures import MultiDict
+
+from database.archive import SessionArchive, open_session_archive
+from database.base import db
+from database.models import EventRecord, Interaction
+from database.strings import row_details, select_interactions
+from database.timestamps import naive_utc, parse_timestamp
+
+# Filas que se leen de cada vez del cursor de la base de datos al recorrer
+# todos los eventos de una sesión.
+STREAM_CHUNK_SIZE = 1_000
+
+
+class EventCursor(NamedTuple):
+    """
+    Posición de un evento en el orden cronológico de una sesión, usada como
+    cursor de paginación por clave (keyset).
+
+    Atributos:
+    ------------
+    time: datetime
+        Momento del evento.
+    id: int
+        Identificador del evento, que desempata los eventos simultáneos.
+    """
+
+    time: datetime
+    id: int
+
+    def encode(self) -> str:
+        return f"{self.time.isoformat()}_{self.id}"
+
+    @classmethod
+    def decode(cls, value: str) -> "EventCursor":
+        time, id = value.rsplit("_", 1)
+        return cls(datetime.fromisoformat(time), int(id))
+
+
+class EventFilters(NamedTuple):
+    """
+    Filtros aplicables al listado de eventos de una sesión.
+
+    Atributos:
+    ------------
+    types: tuple[str, ...]
+        Tipos de evento a incluir (todos si está vacío).
+    start: datetime | None
+        Momento a partir del cual incluir eventos (inclusive).
+    end: datetime | None
+        Momento hasta el cual incluir eventos (exclusive).
+    """
+
+    types: tuple[str, ...] = ()
+    start: datetime | None = None
+    end: datetime | None = None
+
+
+class EventPage(NamedTuple):
+    """
+    Página de eventos de una sesión.
+
+    Atributos:
+    ------------
+    events: list[EventRecord]
+        Eventos de la página, en orden cronológico.
+    next_cursor: EventCursor | None
+        Cursor de la página siguiente, o `None` si es la última.
+    """
+
+    events: list[EventRecord]
+    next_cursor: EventCursor | None
+
+
+def parse_event_filters(args: MultiDict[str, str]) -> EventFilters:
+    """
+    Obtiene los filtros de los parámetros de la petición: `type` (repetible o
+    separado por comas), `from` y `to` (fechas ISO 8601).
+
+    Raises:
+    ---------
+    ValueError
+        Si alguna de las fechas no es válida.
+    """
+    types = tuple(
+        value.strip()
+        for argument in args.getlist("type")
+        for value in argument.split(",")
+        if value.strip()
+    )
+    start, end = args.get("from"), args.get("to")
+    return EventFilters(
+        types=types,
+        start=naive_utc(parse_timestamp(start)) if start else None,
+        end=naive_utc(parse_timestamp(end)) if end else None,
+    )
+
+
+def event_query(session_id: str, filters: EventFilters = EventFilters()) -> Select:
+    """
+    Consulta de los eventos de una sesión en orden cronológico, resuelta por el
+    índice (session_id, time). Solo selecciona las columnas necesarias para
+    listarlos (ver `database.strings.select_interactions`), sin construir
+    objetos del ORM.
+
+    Parámetros:
+    ------------
+    session_id: str
+        Sesión cuyos eventos se consultan.
+    filters: EventFilters
+        Filtros a aplicar.
+
+    Returns:
+    ---------
+    Select
+        Consulta con las columnas `id`, `time` y `type` y las de los detalles.
+    """
+    query = (
+        select_interactions(Interaction.id, Interaction.time, Interaction.type)
+        .where(Interaction.session_id == session_id)
+        .order_by(Interaction.time, Interaction.id)
+    )
+    if filters.types:
+        query = query.where(Interaction.type.in_(filters.types))
+    if filters.start is not None:
+        query = query.where(Interaction.time >= filters.start)
+    if filters.end is not None:
+        query = query.where(Interaction.time < filters.end)
+    return query
+
+
+def event_record(row: Row) -> EventRecord:
+    return EventRecord(row.id, row.time, row.type, row_details(row))
+
+
+def archived_events(
+    archive: SessionArchive,
+    filters: EventFilters = EventFilters(),
+    after: EventCursor | None = None,
+) -> Iterator[EventRecord]:
+    """
+    Recorre los eventos de una sesión archivada aplicando los filtros y el
+    cursor. Solo se leen los segmentos del archivo a partir del cursor.
+    """
+    start = filters.start
+    if after is not None and (start is None or after.time > start):
+        start = after.time
+    for event in archive.events(start, filters.end):
+        if after is not None and (event.time, event.id) <= after:
+            continue
+        if filters.types and event.type not in filters.types:
+            continue
+        yield event
+
+
+def fetch_event_page(
+    session_id: str,
+    filters: EventFilters = EventFilters(),
+    after: EventCursor | None = None,
+    limit: int = 500,
+) -> EventPage:
+    """
+    Obtiene una página de eventos a partir de un cursor. El coste de cada
+    página es independiente de su posición en la sesión.
+
+    Parámetros:
+    ------------
+    session_id: str
+        Sesión cuyos eventos se consultan.
+    filters: EventFilters
+        Filtros a aplicar.
+    after: EventCursor | None
+        Cursor del último evento de la página anterior.
+    limit: int
+        Número máximo de eventos de la página.
+
+    Returns:
+    ---------
+    EventPage
+        Eventos de la página y cursor de la siguiente.
+    """
+    events: list[EventRecord]
+    archive = open_session_archive(db.session(), session_id)
+    if archive is not None:
+        events = list(islice(archived_events(archive, filters, after), limit + 1))
+    else:
+        query = event_query(session_id, filters)
+        if after is not None:
+            query = query.where(
+                tuple_(Interaction.time, Interaction.id) > (after.time, after.id)
+            )
+        events = [
+            event_record(row) for row in db.session.execute(query.limit(limit + 1))
+        ]
+
+    if len(events) <= limit:
+        return EventPage(events, None)
+
+    last = events[limit - 1]
+    return EventPage(events[:limit], EventCursor(last.time, last.id))
+
+
+def stream_events(
+    session_id: str, filters: EventFilters = EventFilters()
+) -> Iterator[EventRecord]:
+    """
+    Recorre todos los eventos de una sesión leyéndolos por bloques de un
+    cursor de la base de datos (o por segmentos de su archivo), de forma que
+    la memoria usada no depende de la longitud de la sesión.
+    """
+    archive = open_session_archive(db.session(), session_id)
+    if archive is not None:
+        yield from archived_events(archive, filters)
+        return
+
+    query = event_query(session_id, filters).execution_options(
+        yield_per=STREAM_CHUNK_SIZE
+    )
+    for row in db.session.execute(query):
+        yield event_record(row)
+
+
+def page_arguments(args: MultiDict[str, str], **overrides: Any) -> dict[str, Any]:
+    """
+    Parámetros de la petición actual con los cambios indicados, para construir
+    los enlaces entre páginas conservando los filtros.
+    """
+    arguments: dict[str, Any] = args.to_dict(flat=False)
+    for key, value in overrides.items():
+        if value is None:
+            arguments.pop(key, None)
+        else:
+            arguments[key] = value
+    return arguments
@@ -0,0 +1,490 @@
+"""
+Exportación masiva de sesiones grabadas.
+
+Las sesiones se exportan como una secuencia de registros, uno por línea:
+
+- `session`: datos de la sesión (inicio en `time`; final y tamaño de la
+  ventana en `details`).
+- `site`: sitio visitado durante la sesión (su id en `id` y su URL en
+  `details`).
+- `event`: interacción de la sesión, con sus detalles tal y como se
+  recibieron.
+
+En formato NDJSON cada registro es un objeto JSON con las columnas de
+`CSV_COLUMNS`; en CSV, una fila con esas columnas y los detalles codificados
+como JSON. Las sesiones se recorren por bloques ordenados por su inicio y las
+interacciones de cada una con un cursor de la base de datos (o por segmentos
+de su archivo), y la salida se produce por bloques de bytes, opcionalmente
+comprimidos con gzip, por lo que la memoria usada no depende del tamaño de la
+exportación:
+
+    python -m webchronicle.export [URI] [--session ID ...] [--site-id N] [--type TYPE ...]
+        [--from ISO] [--to ISO] [--format ndjson|csv] [--gzip] [--output FILE]
+"""
+
+import argparse
+import csv
+import os
+import sys
+import zlib
+from datetime import datetime
+from json import JSONEncoder
+from typing import Any, Iterable, Iterator, NamedTuple
+
+from sqlalchemy import Row, create_engine, or_, select, tuple_
+from sqlalchemy.orm import Session as DatabaseSession
+from werkzeug.datastructures import MultiDict
+
+from database.archive import open_session_archive
+from database.base import DATABASE_URI_ENV
+from database.models import Session, VisitedSite, site_sessions
+from database.timestamps import naive_utc, parse_timestamp
+from webchronicle.events import (
+    STREAM_CHUNK_SIZE,
+    EventFilters,
+    archived_events,
+    event_query,
+    event_record,
+)
+
+# Tipo de contenido de cada formato de exportación
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Columnas de los registros exportados
+CSV_COLUMNS = ("record", "session_id", "id", "time", "type", "details")
+
+# Sesiones que se leen de cada vez al recorrer las seleccionadas
+SESSION_BATCH_SIZE = 1_000
+
+# Tamaño aproximado de los bloques de bytes de la salida
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Codificador JSON compacto, que `json.dumps` crearía de nuevo en cada llamada
+_encoder = JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+class ExportRecord(NamedTuple):
+    """
+    Registro de una exportación.
+
+    Atributos:
+    ------------
+    record: str
+        Tipo de registro: "session", "site" o "event".
+    session_id: str
+        Sesión a la que pertenece el registro.
+    id: int | None
+        Identificador del sitio o de la interacción.
+    time: datetime | None
+        Inicio de la sesión o momento de la interacción.
+    type: str | None
+        Tipo de la interacción.
+    details: Any
+        Detalles del registro, serializables como JSON.
+    """
+
+    record: str
+    session_id: str
+    id: int | None
+    time: datetime | None
+    type: str | None
+    details: Any
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "record": self.record,
+            "session_id": self.session_id,
+            "id": self.id,
+            "time": None if self.time is None else self.time.isoformat(),
+            "type": self.type,
+            "details": self.details,
+        }
+
+
+class ExportSelection(NamedTuple):
+    """
+    Sesiones a exportar. Sin criterios se exportan todas.
+
+    Atributos:
+    ------------
+    session_ids: tuple[str, ...]
+        Sesiones concretas a exportar.
+    site_id: int | None
+        Sitio cuyas sesiones se exportan.
+    """
+
+    session_ids: tuple[str, ...] = ()
+    site_id: int | None = None
+
+
+def parse_export_selection(args: MultiDict[str, str]) -> ExportSelection:
+    """
+    Obtiene las sesiones a exportar de los parámetros de la petición:
+    `session_id` (repetible o separado por comas) y `site_id`.
+
+    Raises:
+    ---------
+    ValueError
+        Si el sitio no es un número.
+    """
+    session_ids = tuple(
+        value.strip()
+        for argument in args.getlist("session_id")
+        for value in argument.split(",")
+        if value.strip()
+    )
+    site_id = args.get("site_id")
+    return ExportSelection(session_ids, int(site_id) if site_id else None)
+
+
+def selected_sessions(
+    session: DatabaseSession,
+    selection: ExportSelection,
+    filters: EventFilters = EventFilters(),
+    batch_size: int = SESSION_BATCH_SIZE,
+) -> Iterator[Row]:
+    """
+    Recorre las sesiones seleccionadas por orden de inicio, leyéndolas por
+    bloques con paginación por clave. Si los filtros acotan el periodo se
+    omiten las sesiones que no se solapan con él.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que leer.
+    selection: ExportSelection
+        Sesiones a exportar.
+    filters: EventFilters
+        Filtros de las interacciones exportadas.
+    batch_size: int
+        Número de sesiones que se leen de cada vez.
+
+    Returns:
+    ---------
+    Iterator[Row]
+        Filas con las columnas `id`, `start_time`, `end_time`, `window_width`
+        y `window_height` de cada sesión.
+    """
+    query = select(
+        Session.id,
+        Session.start_time,
+        Session.end_time,
+        Session.window_width,
+        Session.window_height,
+    ).order_by(Session.start_time, Session.id)
+    if selection.session_ids:
+        query = query.where(Session.id.in_(selection.session_ids))
+    if selection.site_id is not None:
+        query = query.join(site_sessions).where(
+            site_sessions.c.site_id == selection.site_id
+        )
+    if filters.end is not None:
+        query = query.where(Session.start_time < filters.end)
+    if filters.start is not None:
+        query = query.where(
+            or_(Session.end_time.is_(None), Session.end_time >= filters.start)
+        )
+
+    after = None
+    while True:
+        page = (
+            query
+            if after is None
+            else query.where(tuple_(Session.start_time, Session.id) > after)
+        )
+        rows = session.execute(page.limit(batch_size)).all()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1].start_time, rows[-1].id)
+
+
+def session_records(
+    session: DatabaseSession, row: Row, filters: EventFilters = EventFilters()
+) -> Iterator[ExportRecord]:
+    """
+    Recorre los registros de una sesión: sus datos, los sitios visitados y
+    sus interacciones en orden cronológico.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que leer.
+    row: Row
+        Sesión a exportar, obtenida con `selected_sessions`.
+    filters: EventFilters
+        Filtros de las interacciones exportadas.
+
+    Returns:
+    ---------
+    Iterator[ExportRecord]
+        Registros de la sesión.
+    """
+    yield ExportRecord(
+        "session",
+        row.id,
+        None,
+        row.start_time,
+        None,
+        {
+            "end_time": None if row.end_time is None else row.end_time.isoformat(),
+            "window_width": row.window_width,
+            "window_height": row.window_height,
+        },
+    )
+
+    sites = session.execute(
+        select(VisitedSite.id, VisitedSite.url)
+        .join(site_sessions)
+        .where(site_sessions.c.session_id == row.id)
+        .order_by(VisitedSite.id)
+    ).all()
+    for site in sites:
+        yield ExportRecord("site", row.id, site.id, None, None, {"url": site.url})
+
+    archive = open_session_archive(session, row.id)
+    if archive is not None:
+        for event in archived_events(archive, filters):
+            yield ExportRecord(
+                "event", row.id, event.id, event.time, event.type, event.details
+            )
+        return
+
+    result = session.execute(
+        event_query(row.id, filters).execution_options(yield_per=STREAM_CHUNK_SIZE)
+    )
+    try:
+        for event in map(event_record, result):
+            yield ExportRecord(
+                "event", row.id, event.id, event.time, event.type, event.details
+            )
+    finally:
+        result.close()
+
+
+def export_records(
+    session: DatabaseSession,
+    selection: ExportSelection,
+    filters: EventFilters = EventFilters(),
+) -> Iterator[ExportRecord]:
+    """
+    Recorre los registros de las sesiones seleccionadas.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que leer.
+    selection: ExportSelection
+        Sesiones a exportar.
+    filters: EventFilters
+        Filtros de las interacciones exportadas.
+
+    Returns:
+    ---------
+    Iterator[ExportRecord]
+        Registros de todas las sesiones, sesión a sesión.
+    """
+    for row in selected_sessions(session, selection, filters):
+        yield from session_records(session, row, filters)
+        # Terminar la transacción de lectura tras cada sesión evita que una
+        # exportación larga impida a SQLite reciclar su WAL
+        session.commit()
+
+
+class _LineBuffer:
+    """
+    Destino de `csv.writer` que acumula las líneas escritas.
+    """
+
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+
+    def write(self, line: str) -> None:
+        self.lines.append(line)
+
+
+def format_records(records: Iterable[ExportRecord], format: str) -> Iterator[str]:
+    """
+    Convierte los registros en las líneas del formato indicado.
+
+    Parámetros:
+    ------------
+    records: Iterable[ExportRecord]
+        Registros a exportar.
+    format: str
+        Formato de la exportación: "ndjson" o "csv".
+
+    Returns:
+    ---------
+    Iterator[str]
+        Líneas de la exportación, con su salto de línea.
+
+    Raises:
+    ---------
+    ValueError
+        Si el formato no existe.
+    """
+    if format == "ndjson":
+        for record in records:
+            yield _encoder.encode(record.to_json()) + "\n"
+        return
+    if format != "csv":
+        raise ValueError(f"Unknown export format: {format}")
+
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_COLUMNS)
+    for record in records:
+        writer.writerow(
+            (
+                record.record,
+                record.session_id,
+                "" if record.id is None else record.id,
+                "" if record.time is None else record.time.isoformat(),
+                record.type or "",
+                "" if record.details is None else _encoder.encode(record.details),
+            )
+        )
+        yield from buffer.lines
+        buffer.lines.clear()
+    yield from buffer.lines
+
+
+def encode_chunks(
+    lines: Iterable[str],
+    compress: bool = False,
+    chunk_bytes: int = EXPORT_CHUNK_BYTES,
+    level: int = 6,
+) -> Iterator[bytes]:
+    """
+    Agrupa las líneas en bloques de bytes de unos `chunk_bytes`, de forma que
+    la respuesta se envía por bloques de un tamaño razonable en lugar de línea
+    a línea.
+
+    Parámetros:
+    ------------
+    lines: Iterable[str]
+        Líneas a codificar.
+    compress: bool
+        Si los bloques forman un flujo gzip.
+    chunk_bytes: int
+        Tamaño de los bloques antes de comprimirlos.
+    level: int
+        Nivel de compresión de gzip.
+
+    Returns:
+    ---------
+    Iterator[bytes]
+        Bloques de la salida.
+    """
+    compressor = (
+        zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if compress
+        else None
+    )
+    buffer: list[bytes] = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size < chunk_bytes:
+            continue
+        chunk = b"".join(buffer)
+        buffer.clear()
+        size = 0
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+    chunk = b"".join(buffer)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_sessions(
+    session: DatabaseSession,
+    selection: ExportSelection,
+    filters: EventFilters = EventFilters(),
+    format: str = "ndjson",
+    compress: bool = False,
+    chunk_bytes: int = EXPORT_CHUNK_BYTES,
+) -> Iterator[bytes]:
+    """
+    Exporta las sesiones seleccionadas como bloques de bytes.
+
+    Parámetros:
+    ------------
+    session: DatabaseSession
+        Sesión de SQLAlchemy sobre la que leer.
+    selection: ExportSelection
+        Sesiones a exportar.
+    filters: EventFilters
+        Filtros de las interacciones exportadas.
+    format: str
+        Formato de la exportación: "ndjson" o "csv".
+    compress: bool
+        Si la salida se comprime con gzip.
+    chunk_bytes: int
+        Tamaño aproximado de los bloques de la salida.
+
+    Returns:
+    ---------
+    Iterator[bytes]
+        Bloques de la exportación.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {format}")
+    lines = format_records(export_records(session, selection, filters), format)
+    return encode_chunks(lines, compress, chunk_bytes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export recorded sessions as NDJSON or CSV"
+    )
+    parser.add_argument("uri", nargs="?", default=os.environ.get(DATABASE_URI_ENV))
+    parser.add_argument(
+        "--session", action="append", default=[], help="Session to export (repeatable)"
+    )
+    parser.add_argument("--site-id", type=int, default=None)
+    parser.add_argument(
+        "--type", action="append", default=[], help="Event type to export (repeatable)"
+    )
+    parser.add_argument(
+        "--from", dest="start", default=None, help="ISO 8601 start of the events"
+    )
+    parser.add_argument(
+        "--to", dest="end", default=None, help="ISO 8601 end of the events"
+    )
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument(
+        "--output", default=None, help="Output file (standard output by default)"
+    )
+    args = parser.parse_args()
+    if args.uri is None:
+        sys.exit(
+            f"Usage: python -m webchronicle.export URI (or set {DATABASE_URI_ENV})"
+        )
+
+    filters = EventFilters(
+        types=tuple(args.type),
+        start=naive_utc(parse_timestamp(args.start)) if args.start else None,
+        end=naive_utc(parse_timestamp(args.end)) if args.end else None,
+    )
+    selection = ExportSelection(tuple(args.session), args.site_id)
+    engine = create_engine(args.uri)
+    output = sys.stdout.buffer if args.output is None else open(args.output, "wb")
+    try:
+        with DatabaseSession(engine) as session:
+            for chunk in export_sessions(
+                session, selection, filters, args.format, args.gzip
+            ):
+                output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
@@ -0,0 +1,411 @@
+import atexit
+import logging
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, NamedTuple
+
+from flask import Flask
+
+from database.models import InteractionRow
+from webchronicle.metrics import COMMIT_SECONDS, WRITE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class WriteOperation(NamedTuple):
+    """
+    Operación de escritura pendiente de aplicarse sobre la base de datos.
+
+    Atributos:
+    ------------
+    kind: str
+        Tipo de la operación ("session_start", "interactions", "tab_event"...).
+    session_id: str
+        Identificador de la sesión a la que afecta la operación.
+    payload: Any
+        Datos asociados a la operación, dependientes de su tipo.
+    """
+
+    kind: str
+    session_id: str
+    payload: Any
+
+
+class FlushPolicy(NamedTuple):
+    """
+    Umbrales a partir de los cuales se vuelca el búfer de interacciones de una
+    conexión. Se vuelca en cuanto se alcanza el primero de ellos.
+
+    Atributos:
+    ------------
+    max_events: int
+        Número máximo de interacciones en el búfer.
+    max_bytes: int
+        Tamaño máximo, en bytes, de los mensajes acumulados en el búfer.
+    max_age_ms: int
+        Tiempo máximo, en milisegundos, que puede permanecer en el búfer la
+        interacción más antigua.
+    """
+
+    max_events: int = 100
+    max_bytes: int = 256 * 1024
+    max_age_ms: int = 500
+
+
+class FlushStats:
+    """
+    Estadísticas acumuladas de los volcados de los búferes de interacciones,
+    compartidas por todas las conexiones.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.flushes = 0
+        self.events = 0
+        self.bytes = 0
+        self.max_events = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.reasons: dict[str, int] = {}
+
+    def record(self, reason: str, events: int, size: int, latency: float) -> None:
+        """
+        Registra un volcado.
+
+        Parámetros:
+        ------------
+        reason: str
+            Motivo del volcado ("events", "bytes", "age", "session_end"...).
+        events: int
+            Número de interacciones volcadas.
+        size: int
+            Tamaño, en bytes, de los mensajes volcados.
+        latency: float
+            Tiempo, en segundos, que ha permanecido en el búfer la interacción
+            más antigua.
+        """
+        with self._lock:
+            self.flushes += 1
+            self.events += events
+            self.bytes += size
+            self.max_events = max(self.max_events, events)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Devuelve una copia de las estadísticas actuales.
+        """
+        with self._lock:
+            return {
+                "flushes": self.flushes,
+                "events": self.events,
+                "bytes": self.bytes,
+                "avg_events": self.events / self.flushes if self.flushes else 0.0,
+                "max_events": self.max_events,
+                "avg_latency_ms": (
+                    1000 * self.total_latency / self.flushes if self.flushes else 0.0
+                ),
+                "max_latency_ms": 1000 * self.max_latency,
+                "reasons": dict(self.reasons),
+            }
+
+
+class InteractionBuffer:
+    """
+    Búfer de interacciones de una conexión, que decide cuándo deben volcarse a
+    la etapa de ingesta según una política de volcado.
+    """
+
+    def __init__(
+        self, policy: FlushPolicy, clock: Callable[[], float] = monotonic
+    ) -> None:
+        """
+        Parámetros:
+        ------------
+        policy: FlushPolicy
+            Umbrales de volcado del búfer.
+        clock: Callable[[], float]
+            Reloj monotónico, en segundos, usado para medir la antigüedad de
+            las interacciones.
+        """
+        self.policy = policy
+        self.clock = clock
+        self._rows: list[InteractionRow] = []
+        self.size = 0
+        self.oldest: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index: int) -> InteractionRow:
+        return self._rows[index]
+
+    def append(self, row: InteractionRow, size: int = 0) -> None:
+        """
+        Añade una interacción al búfer.
+
+        Parámetros:
+        ------------
+        row: InteractionRow
+            Interacción a añadir.
+        size: int
+            Tamaño, en bytes, del mensaje del que procede la interacción.
+        """
+        if self.oldest is None:
+            self.oldest = self.clock()
+        self._rows.append(row)
+        self.size += size
+
+    def age(self) -> float:
+        """
+        Tiempo, en segundos, que lleva en el búfer la interacción más antigua.
+        """
+        return 0.0 if self.oldest is None else self.clock() - self.oldest
+
+    def flush_reason(self) -> str | None:
+        """
+        Devuelve el motivo por el que el búfer debe volcarse o `None` si aún no
+        se ha alcanzado ninguno de los umbrales.
+        """
+        if not self._rows:
+            return None
+        if len(self._rows) >= self.policy.max_events:
+            return "events"
+        if self.size >= self.policy.max_bytes:
+            return "bytes"
+        if self.age() * 1000 >= self.policy.max_age_ms:
+            return "age"
+        return None
+
+    def time_until_flush(self) -> float | None:
+        """
+        Tiempo, en segundos, hasta que la interacción más antigua alcance la
+        antigüedad máxima, o `None` si el búfer está vacío.
+        """
+        if self.oldest is None:
+            return None
+        return max(0.0, self.policy.max_age_ms / 1000 - self.age())
+
+    def take(self) -> list[InteractionRow]:
+        """
+        Extrae todas las interacciones del búfer, dejándolo vacío.
+        """
+        rows = self._rows
+        self._rows = []
+        self.size = 0
+        self.oldest = None
+        return rows
+
+
+class IngestionWriter:
+    """
+    Escritor en segundo plano (write-behind) que desacopla la recepción de
+    mensajes por el WebSocket de su persistencia en la base de datos.
+
+    Los manejadores de los sockets se limitan a encolar operaciones en una cola
+    acotada, compartida por todas las conexiones, y un único hilo se encarga de
+    vaciarla aplicando las operaciones en lotes, cada uno de ellos en una sola
+    transacción.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        apply: Callable[[list[WriteOperation]], None],
+        max_queue_size: int = 10_000,
+        batch_size: int = 1_000,
+        poll_interval: float = 0.05,
+    ) -> None:
+        """
+        Parámetros:
+        ------------
+        app: Flask
+            Aplicación en cuyo contexto se aplican las operaciones.
+        apply: Callable[[list[WriteOperation]], None]
+            Función que aplica y confirma un lote de operaciones. Debe deshacer
+            la transacción y relanzar la excepción si el lote falla.
+        max_queue_size: int
+            Número máximo de operaciones pendientes antes de aplicar
+            contrapresión sobre los productores.
+        batch_size: int
+            Número máximo de operaciones aplicadas en una misma transacción.
+        poll_interval: float
+            Tiempo máximo, en segundos, que el hilo espera por nuevas
+            operaciones antes de comprobar si debe detenerse.
+        """
+        self.app = app
+        self.apply = apply
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._queue: Queue[WriteOperation] = Queue(maxsize=max_queue_size)
+        self._stop_event = Event()
+        self._start_lock = Lock()
+        self._thread: Thread | None = None
+        self._exit_hook = False
+        self.batches = 0
+        self.operations = 0
+        self.total_write_time = 0.0
+        self.max_write_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Número aproximado de operaciones pendientes de escribir.
+        """
+        return self._queue.qsize()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Devuelve las estadísticas de escritura acumuladas por el escritor.
+        """
+        return {
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "operations": self.operations,
+            "avg_batch_ms": (
+                1000 * self.total_write_time / self.batches if self.batches else 0.0
+            ),
+            "max_batch_ms": 1000 * self.max_write_time,
+        }
+
+    def start(self) -> None:
+        """
+        Arranca el hilo escritor si no se encuentra ya en ejecución. Las
+        operaciones pendientes se vuelcan al terminar el intérprete.
+        """
+        with self._start_lock:
+            if self.is_running:
+                return
+
+            self._stop_event.clear()
+            self._thread = Thread(
+                target=self._run, name="webchronicle-ingestion-writer", daemon=True
+            )
+            self._thread.start()
+            # El escritor puede detenerse y volver a arrancarse, pero basta con
+            # volcar sus operaciones una vez al terminar el intérprete
+            if not self._exit_hook:
+                atexit.register(self.stop)
+                self._exit_hook = True
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Detiene el hilo escritor y aplica las operaciones que sigan pendientes.
+
+        Parámetros:
+        ------------
+        timeout: float | None
+            Tiempo máximo, en segundos, que se espera a que el hilo termine.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.drain()
+
+    def submit(
+        self,
+        operation: WriteOperation,
+        block: bool = True,
+        timeout: float | None = None,
+    ) -> bool:
+        """
+        Encola una operación de escritura.
+
+        Parámetros:
+        ------------
+        operation: WriteOperation
+            Operación a encolar.
+        block: bool
+            Si es falso y la cola está llena, la operación no se encola.
+        timeout: float | None
+            Tiempo máximo de espera cuando `block` es verdadero.
+
+        Returns:
+        ---------
+        bool
+            Verdadero si la operación se ha encolado, falso si la cola estaba
+            llena.
+        """
+        try:
+            self._queue.put(operation, block=block, timeout=timeout)
+        except Full:
+            return False
+        return True
+
+    def drain(self) -> int:
+        """
+        Aplica de forma síncrona todas las operaciones pendientes en el hilo
+        actual.
+
+        Returns:
+        ---------
+        int
+            Número de operaciones aplicadas.
+        """
+        applied = 0
+        while batch := self._take_batch():
+            self._write(batch)
+            applied += len(batch)
+        return applied
+
+    def _take_batch(self, first: WriteOperation | None = None) -> list[WriteOperation]:
+        batch = [] if first is None else [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=self.poll_interval)
+            except Empty:
+                continue
+            self._write(self._take_batch(first))
+
+    def _write(self, batch: list[WriteOperation]) -> None:
+        started = monotonic()
+        try:
+            self._apply_batch(batch)
+        finally:
+            elapsed = monotonic() - started
+            self.batches += 1
+            self.operations += len(batch)
+            self.total_write_time += elapsed
+            self.max_write_time = max(self.max_write_time, elapsed)
+            COMMIT_SECONDS.observe(elapsed)
+
+    def _apply_batch(self, batch: list[WriteOperation]) -> None:
+        with self.app.app_context():
+            try:
+                self.apply(batch)
+                return
+            except Exception as error:
+                if len(batch) == 1:
+                    WRITE_ERRORS.inc()
+                    logger.error("Error writing operation %r: %s", batch[0].kind, error)
+                    return
+                logger.warning(
+                    "Error writing batch of %d operations: %s", len(batch), error
+                )
+
+            # Si el lote completo falla se reintenta cada operación por separado
+            # para que un único mensaje erróneo no descarte el resto del lote.
+            for operation in batch:
+                try:
+                    self.apply([operation])
+                except Exception as error:
+                    WRITE_ERRORS.inc()
+                    logger.error(
+                        "Error writing operation %r: %s", operation.kind, error
+                    )
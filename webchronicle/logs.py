@@ -0,0 +1,64 @@
+"""
+Registro de la aplicación con el módulo `logging`.
+
+Los mensajes por cada trama recibida se registran con un `SampledLogger`, que
+solo emite uno de cada N para que el registro no limite el ritmo de ingesta.
+"""
+
+import logging
+from itertools import count
+
+# Variable de entorno con el nivel de registro ("DEBUG", "INFO", "WARNING"...)
+LOG_LEVEL_ENV = "WEBCHRONICLE_LOG_LEVEL"
+DEFAULT_LOG_LEVEL = "INFO"
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure_logging(level: str | int) -> None:
+    """
+    Fija el nivel de registro de la aplicación y, si el proceso no ha
+    configurado ya el registro, muestra los mensajes por la salida de error.
+
+    Parámetros:
+    ------------
+    level: str | int
+        Nivel mínimo de los mensajes registrados.
+    """
+    for name in ("webchronicle", "database"):
+        logging.getLogger(name).setLevel(level)
+    if not logging.getLogger().handlers:
+        logging.basicConfig(format=LOG_FORMAT)
+
+
+class SampledLogger:
+    """
+    Envoltorio de un `logging.Logger` que solo emite uno de cada `every`
+    mensajes. Si el nivel del mensaje no está habilitado no se cuenta ni se
+    formatea, por lo que su coste se reduce a esa comprobación.
+    """
+
+    def __init__(self, logger: logging.Logger, every: int = 1) -> None:
+        """
+        Parámetros:
+        ------------
+        logger: logging.Logger
+            Logger en el que se emiten los mensajes.
+        every: int
+            Se emite uno de cada `every` mensajes; 1 para emitirlos todos.
+        """
+        self.logger = logger
+        self.every = max(every, 1)
+        self._counter = count()
+
+    def log(self, level: int, message: str, *args: object) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        if next(self._counter) % self.every == 0:
+            self.logger.log(level, message, *args)
+
+    def debug(self, message: str, *args: object) -> None:
+        self.log(logging.DEBUG, message, *args)
+
+    def info(self, message: str, *args: object) -> None:
+        self.log(logging.INFO, message, *args)
@@ -0,0 +1,314 @@
+"""
+Métricas de ejecución de la ingesta, expuestas en el formato de texto de
+Prometheus por la ruta `/metrics`.
+
+Las métricas se registran en un `MetricsRegistry`; si este se deshabilita,
+cada operación sobre ellas se reduce a comprobar un atributo, por lo que la
+instrumentación de la ruta de recepción de mensajes no tiene coste apreciable.
+"""
+
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Callable, Iterator, TypeVar
+
+LabelValues = tuple[str, ...]
+
+# Tipo de contenido del formato de texto de Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_sample(
+    name: str, label_names: tuple[str, ...], labels: LabelValues, value: float
+) -> str:
+    if label_names:
+        pairs = ",".join(
+            f'{key}="{escape_label(str(label))}"'
+            for key, label in zip(label_names, labels)
+        )
+        name = f"{name}{{{pairs}}}"
+    text = str(int(value)) if float(value).is_integer() else repr(float(value))
+    return f"{name} {text}"
+
+
+class Metric:
+    """
+    Métrica con nombre, descripción y, opcionalmente, etiquetas.
+    """
+
+    kind = "untyped"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+    ) -> None:
+        """
+        Parámetros:
+        ------------
+        registry: MetricsRegistry
+            Registro al que pertenece la métrica, que indica si está habilitada.
+        name: str
+            Nombre de la métrica, sin el prefijo del registro.
+        documentation: str
+            Descripción de la métrica.
+        labels: tuple[str, ...]
+            Nombres de las etiquetas de la métrica.
+        """
+        self.registry = registry
+        self.name = f"{registry.prefix}{name}"
+        self.documentation = documentation
+        self.label_names = labels
+        self._lock = Lock()
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Contador que solo crece, con un valor por combinación de etiquetas.
+    """
+
+    kind = "counter"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.label_names:
+            values = [((), 0)]
+        for labels, value in values:
+            yield format_sample(self.name, self.label_names, labels, value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    """
+    Valor que puede subir y bajar, como el número de conexiones abiertas.
+    """
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class CallbackGauge(Metric):
+    """
+    Valor que se obtiene al exponer las métricas, como la profundidad de la
+    cola de escritura, sin coste alguno en la ruta de recepción.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        callback: Callable[[], float],
+    ) -> None:
+        super().__init__(registry, name, documentation)
+        self.callback = callback
+
+    def samples(self) -> Iterator[str]:
+        yield format_sample(self.name, (), (), self.callback())
+
+    def reset(self) -> None:
+        pass
+
+
+class Histogram(Metric):
+    """
+    Distribución de unos valores en intervalos acumulativos, con su suma y su
+    número de observaciones.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        buckets: tuple[float, ...],
+    ) -> None:
+        """
+        Parámetros:
+        ------------
+        buckets: tuple[float, ...]
+            Límites superiores de los intervalos, en orden creciente. El
+            intervalo `+Inf` se añade siempre.
+        """
+        super().__init__(registry, name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        if not self.registry.enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            counts, total, count = list(self._counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            yield format_sample(f"{self.name}_bucket", ("le",), (le,), cumulative)
+        yield format_sample(f"{self.name}_sum", (), (), total)
+        yield format_sample(f"{self.name}_count", (), (), count)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self.sum = 0.0
+            self.count = 0
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class MetricsRegistry:
+    """
+    Conjunto de métricas de la aplicación.
+    """
+
+    def __init__(self, prefix: str = "", enabled: bool = True) -> None:
+        """
+        Parámetros:
+        ------------
+        prefix: str
+            Prefijo de los nombres de todas las métricas.
+        enabled: bool
+            Si es falso, las métricas no registran ninguna observación.
+        """
+        self.prefix = prefix
+        self.enabled = enabled
+        self._metrics: list[Metric] = []
+
+    def _add(self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labels: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._add(Counter(self, name, documentation, labels))
+
+    def gauge(
+        self, name: str, documentation: str, labels: tuple[str, ...] = ()
+    ) -> Gauge:
+        return self._add(Gauge(self, name, documentation, labels))
+
+    def callback_gauge(
+        self, name: str, documentation: str, callback: Callable[[], float]
+    ) -> CallbackGauge:
+        return self._add(CallbackGauge(self, name, documentation, callback))
+
+    def histogram(
+        self, name: str, documentation: str, buckets: tuple[float, ...]
+    ) -> Histogram:
+        return self._add(Histogram(self, name, documentation, buckets))
+
+    def reset(self) -> None:
+        """
+        Pone a cero todas las métricas.
+        """
+        for metric in self._metrics:
+            metric.reset()
+
+    def render(self) -> str:
+        """
+        Devuelve todas las métricas en el formato de texto de Prometheus.
+        """
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+### Métricas de la ingesta ###
+
+registry = MetricsRegistry(prefix="webchronicle_")
+
+MESSAGES_RECEIVED = registry.counter(
+    "messages_received_total", "Messages received, by type.", ("type",)
+)
+INVALID_MESSAGES = registry.counter(
+    "invalid_messages_total", "Frames and batched messages rejected as invalid."
+)
+FLUSH_EVENTS = registry.histogram(
+    "buffer_flush_events",
+    "Interactions per connection buffer flush.",
+    (1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+COMMIT_SECONDS = registry.histogram(
+    "commit_duration_seconds",
+    "Time to apply and commit a batch of write operations.",
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+WRITE_ERRORS = registry.counter(
+    "write_errors_total", "Write operations that could not be applied."
+)
+OPEN_SOCKETS = registry.gauge("open_sockets", "Open recording WebSocket connections.")
+ACTIVE_SESSIONS = registry.gauge("active_sessions", "Sessions being recorded.")
+RETENTION_RUNS = registry.counter(
+    "retention_runs_total", "Retention passes, by outcome.", ("outcome",)
+)
+RETENTION_RUN_SECONDS = registry.histogram(
+    "retention_run_duration_seconds",
+    "Time to apply a retention pass.",
+    (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+RETENTION_DELETED = registry.counter(
+    "retention_deleted_total",
+    "Rows removed by the retention job, by kind (sessions, truncated_sessions, interactions, orphans).",
+    ("kind",),
+)
+RETENTION_RECLAIMED_PAGES = registry.counter(
+    "retention_reclaimed_pages_total",
+    "Free database pages returned to the operating system.",
+)
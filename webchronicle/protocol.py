@@ -0,0 +1,301 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple
+
+from database.timestamps import parse_timestamp
+
+# Los errores de decodificación de ambos módulos son subclases de ValueError,
+# por lo que basta con capturar esta.
+try:
+    # Si está instalado se usa orjson, un decodificador JSON bastante más rápido
+    # que el de la biblioteca estándar.
+    from orjson import loads
+
+    JSON_BACKEND = "orjson"
+except ImportError:
+    from json import loads
+
+    JSON_BACKEND = "json"
+
+
+# Subprotocolos negociados al abrir el WebSocket. Si el cliente no solicita
+# ninguno se usa el formato JSON, un objeto por mensaje.
+JSON_SUBPROTOCOL = "webchronicle.json"
+COMPACT_SUBPROTOCOL = "webchronicle.compact.v1"
+SUBPROTOCOLS = [COMPACT_SUBPROTOCOL, JSON_SUBPROTOCOL]
+
+# Esquema de un tipo de mensaje: campo -> (tipos aceptados, obligatorio)
+MessageSchema = dict[str, tuple[type | tuple[type, ...], bool]]
+
+MESSAGE_SCHEMAS: dict[str, MessageSchema] = {
+    "event_logged": {
+        "event": (str, True),
+        "details": (dict, True),
+        "timestamp": (str, True),
+    },
+    "tab_event": {
+        "event": (str, True),
+        "details": (dict, False),
+        "timestamp": (str, True),
+    },
+    "window_data": {
+        "width": ((int, float), False),
+        "height": ((int, float), False),
+        "zoom": ((int, float), False),
+    },
+    "update_blacklist": {},
+    "batch": {
+        "messages": (list, True),
+    },
+    "session_state_changed": {
+        "action": (str, True),
+        "sessionId": (str, True),
+        "timestamp": (str, True),
+    },
+}
+
+
+# Tipos de mensaje que pueden agruparse dentro de un mensaje "batch"
+BATCHABLE_TYPES = frozenset({"event_logged", "tab_event"})
+
+
+class Message(NamedTuple):
+    """
+    Mensaje recibido por el WebSocket, ya decodificado y validado.
+
+    Atributos:
+    ------------
+    type: str
+        Tipo del mensaje.
+    data: dict[str, Any]
+        Contenido del mensaje (campo `message` del formato base).
+    size: int
+        Tamaño, en caracteres o bytes, de la trama recibida.
+    """
+
+    type: str
+    data: dict[str, Any]
+    size: int
+
+
+class DecodeError(NamedTuple):
+    """
+    Resultado de decodificar una trama que no respeta el protocolo.
+
+    Atributos:
+    ------------
+    reason: str
+        Descripción del motivo por el que la trama no es válida.
+    """
+
+    reason: str
+
+
+def validate_message(
+    message_type: Any, message_data: Any, size: int = 0
+) -> Message | DecodeError:
+    """
+    Valida un mensaje ya decodificado contra la tabla de esquemas.
+
+    Los tipos de mensaje sin esquema se aceptan sin comprobar su contenido, de
+    forma que sea el manejador quien decida qué hacer con ellos. Las marcas de
+    tiempo se interpretan aquí, ya que el manejador las convierte sin capturar
+    errores.
+
+    Parámetros:
+    ------------
+    message_type: Any
+        Tipo del mensaje (campo `type` del formato base).
+    message_data: Any
+        Contenido del mensaje (campo `message` del formato base).
+    size: int
+        Tamaño de la trama de la que procede el mensaje.
+
+    Returns:
+    ---------
+    Message | DecodeError
+        El mensaje validado o el motivo por el que no es válido.
+    """
+    if not isinstance(message_type, str) or not isinstance(message_data, dict):
+        return DecodeError("'type' must be a string and 'message' an object")
+
+    schema = MESSAGE_SCHEMAS.get(message_type)
+    if schema:
+        for field, (expected, required) in schema.items():
+            value = message_data.get(field)
+            if value is None:
+                if required:
+                    return DecodeError(f"'{message_type}' requires field '{field}'")
+            elif not isinstance(value, expected):
+                return DecodeError(f"Invalid type for field '{field}'")
+
+        timestamp = message_data.get("timestamp")
+        if "timestamp" in schema and timestamp is not None:
+            try:
+                parse_timestamp(timestamp)
+            except (OverflowError, ValueError):
+                return DecodeError(f"Invalid timestamp '{timestamp}'")
+
+    return Message(message_type, message_data, size)
+
+
+def decode_message(raw: str | bytes | None) -> Message | DecodeError:
+    """
+    Decodifica y valida en una sola pasada una trama recibida por el WebSocket.
+
+    Parámetros:
+    ------------
+    raw: str | bytes | None
+        Trama recibida.
+
+    Returns:
+    ---------
+    Message | DecodeError
+        El mensaje decodificado o el motivo por el que no es válido.
+    """
+    if raw is None:
+        return DecodeError("Empty frame")
+
+    try:
+        decoded = loads(raw)
+    except ValueError:
+        return DecodeError("Malformed JSON")
+
+    if not isinstance(decoded, dict):
+        return DecodeError("Message must be a JSON object")
+
+    return validate_message(decoded.get("type"), decoded.get("message"), len(raw))
+
+
+# Orden posicional de los campos de `details` para los eventos habituales en el
+# formato compacto. Debe coincidir con `EVENT_LAYOUTS` de `extension/compact.js`.
+EVENT_LAYOUTS: dict[str, tuple[str, ...]] = {
+    "click": ("path", "target", "x", "y"),
+    "input": ("path", "target", "key", "modAlt", "modCtrl", "modShift", "modMeta"),
+    "scroll": ("x", "y"),
+    "resize": ("width", "height"),
+    "tab_created": ("tabId", "url"),
+    "tab_updated": ("tabId", "url"),
+    "tab_highlighted": ("tabId", "url"),
+}
+
+# Campos cuyas cadenas se transmiten una sola vez por conexión
+INTERNED_FIELDS = frozenset({"path", "target", "url"})
+
+COMPACT_RECORD_TYPES = {"e": "event_logged", "t": "tab_event"}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def format_timestamp(milliseconds: int) -> str:
+    """
+    Formatea un instante en milisegundos desde la época igual que
+    `new Date().toISOString()`.
+    """
+    moment = EPOCH + timedelta(milliseconds=milliseconds)
+    return f"{moment:%Y-%m-%dT%H:%M:%S}.{moment.microsecond // 1000:03d}Z"
+
+
+class CompactDecoder:
+    """
+    Decodificador del formato compacto (`webchronicle.compact.v1`).
+
+    Cada trama es un array JSON de registros, por lo que agrupa varios mensajes
+    de forma natural:
+
+    - `["e", dt, evento, valores]`: mensaje "event_logged".
+    - `["t", dt, evento, valores]`: mensaje "tab_event".
+    - `["j", tipo, mensaje]`: cualquier otro mensaje, en el formato base.
+
+    `dt` es la diferencia en milisegundos con la marca de tiempo del registro
+    anterior de la conexión (el primero la lleva completa) y `valores` es la
+    lista de campos de `details` en el orden de `EVENT_LAYOUTS`, o el propio
+    objeto `details` si el evento no tiene disposición conocida.
+
+    El nombre del evento y los campos de `INTERNED_FIELDS` se envían como cadena
+    la primera vez y como índice en la tabla de cadenas de la conexión el resto,
+    por lo que ambos extremos deben procesar todas las tramas en orden.
+    """
+
+    def __init__(self) -> None:
+        self.strings: list[str] = []
+        self.last_timestamp = 0
+
+    def _string(self, value: Any) -> Any:
+        if isinstance(value, str):
+            self.strings.append(value)
+            return value
+        if isinstance(value, int) and not isinstance(value, bool):
+            return self.strings[value]
+        return value
+
+    def _decode_record(self, record: list, size: int) -> Message | DecodeError:
+        kind = record[0]
+        if kind == "j":
+            return validate_message(record[1], record[2], size)
+
+        message_type = COMPACT_RECORD_TYPES.get(kind)
+        if message_type is None:
+            return DecodeError(f"Unknown compact record '{kind}'")
+
+        _, delta, event, values = record
+        self.last_timestamp += delta
+        event = self._string(event)
+
+        if isinstance(values, list):
+            details = {
+                field: self._string(value) if field in INTERNED_FIELDS else value
+                for field, value in zip(EVENT_LAYOUTS[event], values, strict=True)
+            }
+        else:
+            details = values
+
+        return validate_message(
+            message_type,
+            {
+                "event": event,
+                "timestamp": format_timestamp(self.last_timestamp),
+                "details": details,
+            },
+            size,
+        )
+
+    def decode(self, raw: str | bytes | None) -> list[Message] | DecodeError:
+        """
+        Decodifica una trama en formato compacto.
+
+        Parámetros:
+        ------------
+        raw: str | bytes | None
+            Trama recibida.
+
+        Returns:
+        ---------
+        list[Message] | DecodeError
+            Los mensajes de la trama, en orden, o el motivo por el que no es
+            válida. Tras un error la tabla de cadenas puede quedar
+            desincronizada, por lo que la conexión debe cerrarse.
+        """
+        if raw is None:
+            return DecodeError("Empty frame")
+
+        try:
+            records = loads(raw)
+        except ValueError:
+            return DecodeError("Malformed JSON")
+
+        if not isinstance(records, list):
+            return DecodeError("Compact frame must be a JSON array")
+
+        size = len(raw) // max(len(records), 1)
+        messages = []
+        for record in records:
+            # OverflowError: diferencias de tiempo que llevan la marca de tiempo
+            # fuera del rango de `datetime`
+            try:
+                message = self._decode_record(record, size)
+            except (IndexError, KeyError, OverflowError, TypeError, ValueError):
+                return DecodeError("Malformed compact record")
+            if isinstance(message, DecodeError):
+                return message
+            messages.append(message)
+        return messages
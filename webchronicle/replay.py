@@ -0,0 +1,240 @@
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple
+
+from sqlalchemy import func, select
+
+from database.archive import open_session_archive
+from database.base import db
+from database.keyframes import load_state
+from database.models import Interaction
+from database.strings import row_details, select_interactions
+from webchronicle.events import STREAM_CHUNK_SIZE
+
+# Eventos que cambian la pestaña reproducida
+TAB_EVENTS = ("tab_created", "tab_updated")
+
+
+class ReplayChunk(NamedTuple):
+    """
+    Ventana de tiempo de una sesión que el reproductor descarga de una vez.
+
+    Atributos:
+    ------------
+    index: int
+        Número de la ventana desde el inicio de la sesión.
+    start_ms: int
+        Inicio de la ventana, en milisegundos desde el primer evento.
+    end_ms: int
+        Fin de la ventana (exclusive), en milisegundos desde el primer evento.
+    offset: int
+        Posición en la sesión del primer evento de la ventana.
+    count: int
+        Número de eventos de la ventana.
+    """
+
+    index: int  # type: ignore[assignment]
+    start_ms: int
+    end_ms: int
+    offset: int
+    count: int  # type: ignore[assignment]
+
+
+class TabChange(NamedTuple):
+    """
+    Creación o actualización de una pestaña durante la sesión.
+
+    Atributos:
+    ------------
+    offset: int
+        Posición del evento en la sesión.
+    time_ms: int
+        Momento del evento, en milisegundos desde el primer evento.
+    event: str
+        Tipo del evento.
+    details: dict
+        Detalles del evento (identificador y URL de la pestaña).
+    """
+
+    offset: int
+    time_ms: int
+    event: str
+    details: dict
+
+
+def elapsed_ms(start: datetime, moment: datetime) -> int:
+    return (moment - start) // timedelta(milliseconds=1)
+
+
+def first_event_time(session_id: str) -> datetime | None:
+    """
+    Momento del primer evento de la sesión, obtenido del índice
+    (session_id, time) o de la cabecera de su archivo.
+    """
+    archive = open_session_archive(db.session(), session_id)
+    if archive is not None:
+        return archive.base_time
+    return db.session.execute(
+        select(func.min(Interaction.time)).where(Interaction.session_id == session_id)
+    ).scalar()
+
+
+def build_replay_index(session_id: str, chunk_ms: int) -> dict[str, Any]:
+    """
+    Construye el índice de reproducción de una sesión: las ventanas de tiempo
+    que contienen eventos y los cambios de pestaña.
+
+    Se recorre la sesión una sola vez, sin construir objetos del ORM y
+    reconstruyendo solo los detalles de los cambios de pestaña, por lo que el
+    tamaño del índice depende del número de ventanas y pestañas, no del de
+    eventos.
+
+    Parámetros:
+    ------------
+    session_id: str
+        Sesión a reproducir.
+    chunk_ms: int
+        Duración de cada ventana en milisegundos.
+
+    Returns:
+    ---------
+    dict[str, Any]
+        Índice serializable a JSON.
+    """
+    archive = open_session_archive(db.session(), session_id)
+    events: Any
+    if archive is not None:
+        events = ((event.time, event.type, event.details) for event in archive.events())
+    else:
+        rows = db.session.execute(
+            select_interactions(Interaction.time, Interaction.type)
+            .where(Interaction.session_id == session_id)
+            .order_by(Interaction.time, Interaction.id)
+            .execution_options(yield_per=STREAM_CHUNK_SIZE)
+        )
+        events = (
+            (row.time, row.type, row_details(row) if row.type in TAB_EVENTS else None)
+            for row in rows
+        )
+
+    start = None
+    chunks: list[ReplayChunk] = []
+    tabs: list[TabChange] = []
+    offset = 0
+    for offset, (time, event, details) in enumerate(events):
+        if start is None:
+            start = time
+        time_ms = elapsed_ms(start, time)
+
+        index = time_ms // chunk_ms
+        if chunks and chunks[-1].index == index:
+            chunks[-1] = chunks[-1]._replace(count=chunks[-1].count + 1)
+        else:
+            chunks.append(
+                ReplayChunk(index, index * chunk_ms, (index + 1) * chunk_ms, offset, 1)
+            )
+
+        if event in TAB_EVENTS:
+            tabs.append(TabChange(offset, time_ms, event, details))
+
+    return {
+        "session_id": session_id,
+        "start_time": start.isoformat() if start else None,
+        "event_count": offset + 1 if chunks else 0,
+        "chunk_ms": chunk_ms,
+        "chunks": [chunk._asdict() for chunk in chunks],
+        "tabs": [tab._asdict() for tab in tabs],
+    }
+
+
+def fetch_replay_chunk(
+    session_id: str, index: int, chunk_ms: int
+) -> dict[str, Any] | None:
+    """
+    Obtiene los eventos de una ventana de la sesión.
+
+    Parámetros:
+    ------------
+    session_id: str
+        Sesión a reproducir.
+    index: int
+        Número de la ventana, tal y como aparece en el índice.
+    chunk_ms: int
+        Duración de cada ventana en milisegundos.
+
+    Returns:
+    ---------
+    dict[str, Any] | None
+        Eventos de la ventana serializables a JSON, o `None` si la sesión no
+        tiene eventos.
+    """
+    start = first_event_time(session_id)
+    if start is None:
+        return None
+
+    window_start = start + timedelta(milliseconds=index * chunk_ms)
+    window_end = window_start + timedelta(milliseconds=chunk_ms)
+    archive = open_session_archive(db.session(), session_id)
+    rows: Any
+    if archive is not None:
+        rows = (
+            (event.time, event.type, event.details)
+            for event in archive.events(window_start, window_end)
+        )
+    else:
+        rows = (
+            (row.time, row.type, row_details(row))
+            for row in db.session.execute(
+                select_interactions(Interaction.time, Interaction.type)
+                .where(
+                    Interaction.session_id == session_id,
+                    Interaction.time >= window_start,
+                    Interaction.time < window_end,
+                )
+                .order_by(Interaction.time, Interaction.id)
+            )
+        )
+    return {
+        "index": index,
+        "start_ms": index * chunk_ms,
+        "end_ms": (index + 1) * chunk_ms,
+        "actions": [
+            {"time_ms": elapsed_ms(start, time), "event": event, "details": details}
+            for time, event, details in rows
+        ],
+    }
+
+
+def replay_state_at(session_id: str, at_ms: int) -> dict[str, Any] | None:
+    """
+    Obtiene el estado de la reproducción (pestaña activa, desplazamiento y
+    tamaño de la ventana) en un momento de la sesión, partiendo del fotograma
+    clave anterior y aplicando solo los eventos posteriores a él.
+
+    Parámetros:
+    ------------
+    session_id: str
+        Sesión a reproducir.
+    at_ms: int
+        Momento, en milisegundos desde el primer evento.
+
+    Returns:
+    ---------
+    dict[str, Any] | None
+        Estado serializable a JSON, o `None` si la sesión no tiene eventos.
+    """
+    start = first_event_time(session_id)
+    if start is None:
+        return None
+
+    keyframe, applied, _, state = load_state(
+        db.session(),
+        session_id,
+        until=start + timedelta(milliseconds=at_ms),
+        archive=open_session_archive(db.session(), session_id),
+    )
+    return {
+        "at_ms": at_ms,
+        "keyframe_ms": None if keyframe is None else elapsed_ms(start, keyframe.time),
+        "delta_events": applied,
+        "state": state,
+    }
@@ -0,0 +1,146 @@
+import logging
+from datetime import datetime
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable
+
+from flask import Flask
+
+from database.retention import RetentionReport
+from webchronicle.metrics import (
+    RETENTION_DELETED,
+    RETENTION_RECLAIMED_PAGES,
+    RETENTION_RUN_SECONDS,
+    RETENTION_RUNS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionJob:
+    """
+    Tarea en segundo plano que aplica periódicamente la política de retención
+    (ver `database.retention`).
+
+    Cada pasada trabaja sobre un número acotado de sesiones y borra sus
+    interacciones por lotes, por lo que la etapa de ingesta sigue escribiendo
+    entre lote y lote. Si una pasada termina con trabajo pendiente, la
+    siguiente empieza sin esperar al intervalo.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        apply: Callable[[], RetentionReport],
+        interval: float = 300.0,
+    ) -> None:
+        """
+        Parámetros:
+        ------------
+        app: Flask
+            Aplicación en cuyo contexto se aplica la política.
+        apply: Callable[[], RetentionReport]
+            Función que aplica una pasada de la política.
+        interval: float
+            Segundos entre pasadas.
+        """
+        self.app = app
+        self.apply = apply
+        self.interval = interval
+        self._stop_event = Event()
+        self._start_lock = Lock()
+        self._thread: Thread | None = None
+        self.runs = 0
+        self.last_run: datetime | None = None
+        self.last_report: RetentionReport | None = None
+        self.total = RetentionReport()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Devuelve el progreso acumulado de la tarea.
+        """
+        return {
+            "running": self.is_running,
+            "interval_s": self.interval,
+            "runs": self.runs,
+            "last_run": None if self.last_run is None else self.last_run.isoformat(),
+            "last_report": None
+            if self.last_report is None
+            else self.last_report._asdict(),
+            "total": self.total._asdict(),
+        }
+
+    def start(self) -> None:
+        """
+        Arranca el hilo de la tarea si no se encuentra ya en ejecución.
+        """
+        with self._start_lock:
+            if self.is_running:
+                return
+
+            self._stop_event.clear()
+            self._thread = Thread(
+                target=self._run, name="webchronicle-retention", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Detiene el hilo de la tarea tras la pasada en curso.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> RetentionReport | None:
+        """
+        Aplica una pasada de la política en el hilo actual.
+
+        Returns:
+        ---------
+        RetentionReport | None
+            Resultado de la pasada, o `None` si ha fallado.
+        """
+        started = monotonic()
+        try:
+            with self.app.app_context():
+                report = self.apply()
+        except Exception as error:
+            RETENTION_RUNS.inc("error")
+            logger.error("Error applying the retention policy: %s", error)
+            return None
+        finally:
+            RETENTION_RUN_SECONDS.observe(monotonic() - started)
+            self.runs += 1
+            self.last_run = datetime.now()
+
+        RETENTION_RUNS.inc("success")
+        RETENTION_DELETED.inc("sessions", amount=report.deleted_sessions)
+        RETENTION_DELETED.inc("truncated_sessions", amount=report.truncated_sessions)
+        RETENTION_DELETED.inc("interactions", amount=report.deleted_interactions)
+        RETENTION_DELETED.inc("orphans", amount=report.orphans)
+        RETENTION_RECLAIMED_PAGES.inc(amount=report.reclaimed_pages)
+        self.last_report = report
+        self.total = RetentionReport(*(sum(pair) for pair in zip(self.total, report)))
+        if report.deleted_sessions or report.truncated_sessions:
+            logger.info(
+                "Retention: deleted %d sessions, truncated %d, removed %d interactions",
+                report.deleted_sessions,
+                report.truncated_sessions,
+                report.deleted_interactions,
+            )
+        return report
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            report = self.run_once()
+            # Si la pasada ha borrado sesiones puede quedar trabajo pendiente
+            pending = report is not None and (
+                report.deleted_sessions or report.truncated_sessions
+            )
+            self._stop_event.wait(0 if pending else self.interval)
@@ -0,0 +1,232 @@
+from datetime import datetime
+from typing import Any, NamedTuple
+
+from sqlalchemy import Select, func, select
+from werkzeug.datastructures import MultiDict
+
+from database.base import db
+from database.models import InternedString, SearchPosting
+from database.search_index import SEARCH_FIELDS
+from database.timestamps import naive_utc, parse_timestamp
+
+# Carácter mayor que cualquier otro, que acota las cadenas con un prefijo
+MAX_CHARACTER = "\U0010ffff"
+
+
+class SearchQuery(NamedTuple):
+    """
+    Búsqueda de las sesiones con interacciones sobre un término.
+
+    Atributos:
+    ------------
+    field: str
+        Campo del término: "type", "path", "target" o "url".
+    value: str
+        Término buscado, o su prefijo si `prefix` es cierto.
+    type: str | None
+        Tipo de evento de las interacciones (todos si no se indica).
+    prefix: bool
+        Si se buscan todos los términos que empiezan por `value`.
+    start: datetime | None
+        Momento a partir del cual buscar interacciones (inclusive).
+    end: datetime | None
+        Momento hasta el cual buscar interacciones (exclusive).
+    """
+
+    field: str
+    value: str
+    type: str | None = None
+    prefix: bool = False
+    start: datetime | None = None
+    end: datetime | None = None
+
+
+class SearchResult(NamedTuple):
+    """
+    Sesión encontrada por una búsqueda.
+
+    Atributos:
+    ------------
+    session_id: str
+        Sesión con interacciones sobre el término.
+    count: int
+        Número de interacciones de la sesión sobre el término.
+    first_time: datetime
+        Primera de esas interacciones.
+    last_time: datetime
+        Última de esas interacciones.
+    """
+
+    session_id: str
+    count: int  # type: ignore[assignment]
+    first_time: datetime
+    last_time: datetime
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "count": self.count,
+            "first_time": self.first_time.isoformat(),
+            "last_time": self.last_time.isoformat(),
+        }
+
+
+class SearchPage(NamedTuple):
+    """
+    Página de resultados de una búsqueda.
+
+    Atributos:
+    ------------
+    results: list[SearchResult]
+        Sesiones de la página, de la más reciente a la más antigua según su
+        última interacción sobre el término.
+    next_offset: int | None
+        Posición de la siguiente página, o `None` si es la última.
+    truncated: bool
+        Si el prefijo buscado abarca más términos de los que se buscan, por lo
+        que los resultados pueden estar incompletos.
+    """
+
+    results: list[SearchResult]
+    next_offset: int | None
+    truncated: bool = False
+
+
+def parse_search_query(args: MultiDict[str, str]) -> SearchQuery | None:
+    """
+    Obtiene la búsqueda de los parámetros de la petición: `field`, `q` (el
+    término), `type`, `prefix` y `from` y `to` (fechas ISO 8601).
+
+    Returns:
+    ---------
+    SearchQuery | None
+        Búsqueda indicada, o `None` si no se indica ningún término.
+
+    Raises:
+    ---------
+    ValueError
+        Si el campo no existe o alguna de las fechas no es válida.
+    """
+    value = args.get("q", "")
+    if not value:
+        return None
+
+    field = args.get("field", "path")
+    if field not in SEARCH_FIELDS:
+        raise ValueError(f"Unknown search field: {field}")
+    start, end = args.get("from"), args.get("to")
+    return SearchQuery(
+        field=field,
+        value=value,
+        type=args.get("type") or None,
+        prefix=bool(args.get("prefix", type=int)),
+        start=naive_utc(parse_timestamp(start)) if start else None,
+        end=naive_utc(parse_timestamp(end)) if end else None,
+    )
+
+
+def prefix_terms(value: str, limit: int) -> Select:
+    """
+    Consulta de los ids de, como mucho, los `limit` primeros términos en orden
+    alfabético que empiezan por un prefijo. El orden, que sigue el índice
+    único de la tabla de cadenas, hace que el recorte sea siempre el mismo.
+    """
+    strings = InternedString.__table__
+    return (
+        select(strings.c.id)
+        .where(strings.c.value >= value, strings.c.value < value + MAX_CHARACTER)
+        .order_by(strings.c.value)
+        .limit(limit)
+    )
+
+
+def search_statement(query: SearchQuery, max_terms: int) -> Select:
+    """
+    Consulta de las sesiones que cumplen una búsqueda, con sus totales sobre
+    los términos buscados.
+
+    El término (o los que empiezan por el prefijo, como mucho los `max_terms`
+    primeros en orden alfabético) se resuelve por el índice único de la tabla de cadenas, y sus entradas del
+    índice de búsqueda por la clave primaria de `search_postings`, por lo que
+    el coste depende del número de sesiones encontradas y no del de
+    interacciones grabadas.
+
+    Parámetros:
+    ------------
+    query: SearchQuery
+        Búsqueda a realizar.
+    max_terms: int
+        Número máximo de términos que se buscan con un prefijo.
+
+    Returns:
+    ---------
+    Select
+        Consulta con las columnas de `SearchResult`, de la sesión más reciente
+        a la más antigua.
+    """
+    if query.prefix:
+        terms = prefix_terms(query.value, max_terms)
+    else:
+        strings = InternedString.__table__
+        terms = select(strings.c.id).where(strings.c.value == query.value)
+
+    conditions = [
+        SearchPosting.term_id.in_(terms.scalar_subquery()),
+        SearchPosting.field == query.field,
+    ]
+    if query.type:
+        conditions.append(SearchPosting.type == query.type)
+    if query.start is not None:
+        conditions.append(SearchPosting.last_time >= query.start)
+    if query.end is not None:
+        conditions.append(SearchPosting.first_time < query.end)
+
+    last_time = func.max(SearchPosting.last_time)
+    return (
+        select(
+            SearchPosting.session_id,
+            func.sum(SearchPosting.count),
+            func.min(SearchPosting.first_time),
+            last_time,
+        )
+        .where(*conditions)
+        .group_by(SearchPosting.session_id)
+        .order_by(last_time.desc(), SearchPosting.session_id)
+    )
+
+
+def search_sessions(
+    query: SearchQuery, limit: int, offset: int = 0, max_terms: int = 1_000
+) -> SearchPage:
+    """
+    Obtiene una página de las sesiones que cumplen una búsqueda.
+
+    Parámetros:
+    ------------
+    query: SearchQuery
+        Búsqueda a realizar.
+    limit: int
+        Número máximo de sesiones de la página.
+    offset: int
+        Número de sesiones anteriores a la página.
+    max_terms: int
+        Número máximo de términos que se buscan con un prefijo.
+
+    Returns:
+    ---------
+    SearchPage
+        Sesiones de la página, posición de la siguiente y si se ha recortado
+        el número de términos del prefijo.
+    """
+    rows = db.session.execute(
+        search_statement(query, max_terms).limit(limit + 1).offset(offset)
+    ).all()
+    results = [SearchResult._make(row) for row in rows[:limit]]
+
+    truncated = False
+    if query.prefix:
+        # Basta con contar hasta un término más de los que se buscan
+        terms = prefix_terms(query.value, max_terms + 1).subquery()
+        count = db.session.execute(select(func.count()).select_from(terms))
+        truncated = count.scalar_one() > max_terms
+    return SearchPage(results, offset + limit if len(rows) > limit else None, truncated)